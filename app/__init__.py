@@ -4,15 +4,30 @@ Inicialização da aplicação Flask DOC2PDF
 Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
 """
 import time
-from flask import Flask, request
+import atexit
+from flask import Flask, request, g
 from flask_cors import CORS
 from app.utils.logger import logger
+from app.utils.metrics import (
+    registry,
+    http_requests,
+    http_request_duration,
+    http_request_bytes,
+    http_response_bytes,
+    http_requests_in_flight
+)
+from app.utils import tracing
 from config.settings import (
     API_NAME,
     CORS_ORIGINS,
     SECURITY_HEADERS,
     HEALTH_CHECK_PATH,
-    FILTER_HEALTH_LOGS
+    FILTER_HEALTH_LOGS,
+    MAX_CONTENT_LENGTH,
+    METRICS_ENABLED,
+    METRICS_PATH,
+    REQUEST_ID_HEADER,
+    CONVERSION_DAEMON_STARTUP_TIMEOUT
 )
 from version import __version__, __author__, __company__
 
@@ -26,6 +41,9 @@ def create_app():
     """
     app = Flask(__name__)
 
+    # Limite do corpo das requisições (corpos chunked sem Content-Length também são cortados)
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+
     # Configuração CORS
     CORS(app, origins=CORS_ORIGINS)
 
@@ -35,40 +53,91 @@ def create_app():
     logger.info(f"Desenvolvido por: {__author__} - {__company__}")
     logger.info("="*60)
 
-    # Middleware para logging de requisições (otimizado para Render)
+    # Id da requisição e span raiz do trace (antes dos demais hooks)
     @app.before_request
-    def log_request():
-        """Log detalhado de cada requisição (filtra health checks)"""
-        request.start_time = time.time()
+    def start_trace():
+        """Atribui o id da requisição e abre o span raiz, corrente até o teardown"""
+        g.request_id = tracing.new_request_id(request.headers.get(REQUEST_ID_HEADER))
+        rule = request.url_rule.rule if request.url_rule is not None else request.path
+        g.trace_span = tracing.start_span(
+            f'{request.method} {rule}',
+            traceparent=request.headers.get('traceparent'),
+            request_id=g.request_id,
+            server=True,
+            **{'http.method': request.method, 'http.route': rule,
+               'http.request_content_length': request.content_length or 0}
+        )
+        g.trace_scope = tracing.use_span(g.trace_span, g.request_id)
+        g.trace_scope.__enter__()
 
-        # Ignora logs detalhados de health checks para reduzir ruído no Render
-        if FILTER_HEALTH_LOGS and request.path == HEALTH_CHECK_PATH:
-            return  # Não loga health checks
+    @app.after_request
+    def tag_response(response):
+        """Devolve o id da requisição e registra o resultado no span raiz"""
+        response.headers[REQUEST_ID_HEADER] = g.get('request_id', '')
+        if g.get('trace_span') is not None:
+            g.trace_span.set_attribute('http.status_code', response.status_code)
+            g.trace_span.set_attribute('http.response_content_length', response.content_length or 0)
+            if response.status_code >= 500:
+                g.trace_span.error = f'HTTP {response.status_code}'
+        return response
 
-        logger.info(f">>> NOVA REQUISIÇÃO")
-        logger.info(f"Método: {request.method}")
-        logger.info(f"Endpoint: {request.path}")
-        logger.info(f"IP Cliente: {request.remote_addr}")
-        logger.info(f"User-Agent: {request.headers.get('User-Agent', 'N/A')[:100]}")
+    @app.teardown_request
+    def end_trace(error=None):
+        """Encerra o span raiz"""
+        scope = g.pop('trace_scope', None)
+        if scope is not None:
+            scope.__exit__(None, None, None)
+        tracing.end_span(g.pop('trace_span', None), error)
 
-        if request.method in ['POST', 'PUT', 'PATCH']:
-            content_length = request.headers.get('Content-Length', 0)
-            logger.info(f"Tamanho do payload: {content_length} bytes")
+    # Middleware para logging de requisições (otimizado para Render)
+    @app.before_request
+    def start_timer():
+        request.start_time = time.time()
 
     @app.after_request
-    def log_response(response):
-        """Log da resposta e tempo de processamento (filtra health checks)"""
-        # Ignora logs detalhados de health checks
-        if FILTER_HEALTH_LOGS and request.path == HEALTH_CHECK_PATH:
+    def log_access(response):
+        """Um único registro de acesso por requisição (filtra health checks)"""
+        # Ignora logs de health checks (e scrapes) para reduzir ruído no Render
+        if FILTER_HEALTH_LOGS and request.path in (HEALTH_CHECK_PATH, METRICS_PATH):
             return response
 
+        duration = time.time() - request.start_time
+        logger.info(
+            "%s %s %s %.3fs in=%sB out=%sB",
+            request.method, request.path, response.status_code, duration,
+            request.content_length or 0, response.content_length or 0,
+            extra={
+                'event': 'request',
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration': round(duration, 6),
+                'request_bytes': request.content_length or 0,
+                'response_bytes': response.content_length or 0,
+                'remote_addr': request.remote_addr,
+                'user_agent': request.headers.get('User-Agent', 'N/A')[:100],
+            }
+        )
+        return response
+
+    # Métricas HTTP por endpoint (regra da rota, não a URL: cardinalidade limitada)
+    @app.before_request
+    def track_in_flight():
+        http_requests_in_flight.inc()
+
+    @app.teardown_request
+    def untrack_in_flight(error=None):
+        http_requests_in_flight.dec()
+
+    @app.after_request
+    def record_metrics(response):
+        """Contabiliza a requisição, sua duração e os bytes recebidos e enviados"""
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        http_request_bytes.inc(request.content_length or 0, endpoint=endpoint)
+        http_response_bytes.inc(response.content_length or 0, endpoint=endpoint)
         if hasattr(request, 'start_time'):
-            duration = time.time() - request.start_time
-            logger.info(f"<<< RESPOSTA ENVIADA")
-            logger.info(f"Status: {response.status_code}")
-            logger.info(f"Tempo de processamento: {duration:.3f}s")
-            logger.info(f"Tamanho da resposta: {response.content_length or 0} bytes")
-            logger.info(f"-"*60)
+            http_request_duration.observe(time.time() - request.start_time, endpoint=endpoint)
         return response
 
     # Headers de segurança
@@ -84,16 +153,64 @@ def create_app():
     from app.routes.convert import convert_bp
     from app.routes.convert_file import convert_file_bp
     from app.routes.process import process_bp
+    from app.routes.templates import templates_bp
+    from app.routes.batch import batch_bp
+    from app.routes.jobs import jobs_bp
+    from app.routes.estimate import estimate_bp
+    from app.routes.metrics import metrics_bp
     from app.routes.swagger import swagger_bp, swaggerui_blueprint
 
     app.register_blueprint(health_bp)
     app.register_blueprint(convert_bp)
     app.register_blueprint(convert_file_bp)
     app.register_blueprint(process_bp)
+    app.register_blueprint(templates_bp)
+    app.register_blueprint(batch_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(estimate_bp)
+    if METRICS_ENABLED:
+        app.register_blueprint(metrics_bp)
+        registry.start()
+    if tracing.exporter is not None:
+        tracing.exporter.start()
     app.register_blueprint(swagger_bp)
     app.register_blueprint(swaggerui_blueprint)
 
-    logger.info("✓ Blueprints registrados: health, convert, convert_file, process, swagger")
+    logger.info(
+        "✓ Blueprints registrados: health, convert, convert_file, process, templates, batch, jobs, "
+        "estimate, metrics, swagger"
+    )
+
+    # Com o daemon de conversão, o LibreOffice e a fila global ficam com ele
+    from app.services.conversion_client import get_conversion_daemon
+    daemon = get_conversion_daemon()
+    if daemon is not None:
+        if daemon.wait_until_ready(CONVERSION_DAEMON_STARTUP_TIMEOUT):
+            logger.info(f"✓ Conversões enviadas ao daemon em {daemon.socket_path}")
+        else:
+            logger.warning(f"⚠ Daemon de conversão não respondeu em {daemon.socket_path}; "
+                           f"conversões retornarão 503 até ele subir")
+    else:
+        # Cria e inicializa os perfis LibreOffice isolados por slot de concorrência
+        from app.services.profile_pool import get_profile_pool, shutdown_profile_pool
+        get_profile_pool()
+        atexit.register(shutdown_profile_pool)
+
+        # Aquece o pool de workers LibreOffice (se habilitado e disponível)
+        from app.services.libreoffice_pool import get_libreoffice_pool, shutdown_libreoffice_pool
+        if get_libreoffice_pool() is None:
+            logger.info("Pool LibreOffice inativo - conversões usarão --convert-to")
+        atexit.register(shutdown_libreoffice_pool)
+
+    # Processos da etapa DOCX (DOCX_EXECUTOR=process)
+    from app.services.docx_process_pool import get_docx_process_pool, shutdown_docx_process_pool
+    if get_docx_process_pool() is not None:
+        atexit.register(shutdown_docx_process_pool)
+
+    # Threads de background da fila de jobs assíncronos
+    from app.services.job_service import get_job_manager
+    get_job_manager()
+
     logger.info("✓ Documentação Swagger disponível em: /api/docs")
     logger.info("✓ Aplicação pronta para receber requisições")
 
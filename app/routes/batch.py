@@ -0,0 +1,280 @@
+"""
+Rota /batch - Mail merge: um template, vários conjuntos de replacements
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import json
+import tempfile
+import time
+import uuid
+import zipfile
+from typing import Any, Dict, Iterator
+from flask import Blueprint, Response, request, jsonify, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.utils.logger import logger, stage_logger
+from app.utils.ingestion import read_render_request, read_priority, payload_too_large_response
+from app.utils.encoders import encode_base64_file
+from app.utils.responses import json_head, iter_base64_json, overloaded_response
+from app.utils.validators import validate_quality, validate_engine, validate_filename
+from app.utils.zip_utils import zip_compression
+from app.utils.tracing import current_span
+from app.services.batch_service import BatchService
+from app.services.admission import ServerOverloadedError, get_conversion_limiter
+from app.services.template_registry import template_registry, Template, UnknownTemplateError
+from app.routes.templates import unknown_template_response
+from config.settings import ERROR_MESSAGES, PIPELINE_TMP_DIR, BATCH_ZIP_SPOOL_MAX_BYTES, BULK_LANE
+
+batch_bp = Blueprint('batch', __name__)
+
+BATCH_OUTPUT_TYPES = ['zip', 'base64_pdf', 'ndjson', 'multipart', 'merged_pdf']
+
+
+def _item_filename(prefix: str, index: int, width: int) -> str:
+    """Nome do PDF de um item do lote (ex.: certificado_0001.pdf)"""
+    return validate_filename(f"{prefix}_{index + 1:0{width}d}", '.pdf')
+
+
+def _compact_json(obj: Any) -> str:
+    """JSON sem espaços (uma linha por objeto no NDJSON)"""
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def _summary(counts: Dict[str, int], start: float) -> Dict[str, Any]:
+    """Totais do lote enviados no fim das respostas em streaming"""
+    return {
+        'total': counts['succeeded'] + counts['failed'],
+        'succeeded': counts['succeeded'],
+        'failed': counts['failed'],
+        'processing_time': round(time.time() - start, 3)
+    }
+
+
+def _iter_ndjson(results: Iterator[Dict[str, Any]], prefix: str, width: int, start: float) -> Iterator[bytes]:
+    """
+    Uma linha JSON por documento, na ordem de conclusão, e uma linha final de totais
+
+    O PDF vai em Base64 no campo "pdf", codificado em blocos; cada resultado
+    é descartado logo após ser enviado.
+    """
+    counts = {'succeeded': 0, 'failed': 0}
+    for result in results:
+        pdf_bytes = result.pop('pdf', None)
+        if pdf_bytes is None:
+            counts['failed'] += 1
+            yield _compact_json(result).encode('utf-8') + b'\n'
+            continue
+        counts['succeeded'] += 1
+        result['filename'] = _item_filename(prefix, result['index'], width)
+        yield from iter_base64_json(json_head(result, 'pdf', _compact_json), pdf_bytes)
+        yield b'\n'
+        del pdf_bytes, result
+    yield _compact_json(_summary(counts, start)).encode('utf-8') + b'\n'
+
+
+def _iter_multipart(
+    results: Iterator[Dict[str, Any]],
+    prefix: str,
+    width: int,
+    start: float,
+    boundary: str
+) -> Iterator[bytes]:
+    """
+    Uma parte multipart/mixed por documento, na ordem de conclusão, e uma parte final de totais
+
+    Documentos gerados vão como application/pdf binário, com índice e
+    estatísticas nos headers X-Index e X-Stats; falhas vão como
+    application/json. Cada resultado é descartado logo após ser enviado.
+    """
+    counts = {'succeeded': 0, 'failed': 0}
+    delimiter = f'--{boundary}\r\n'.encode('ascii')
+    for result in results:
+        pdf_bytes = result.pop('pdf', None)
+        if pdf_bytes is None:
+            counts['failed'] += 1
+            body = _compact_json(result).encode('utf-8')
+            headers = f'Content-Type: application/json\r\nX-Index: {result["index"]}\r\n'
+        else:
+            counts['succeeded'] += 1
+            body = pdf_bytes
+            filename = _item_filename(prefix, result['index'], width)
+            headers = (
+                f'Content-Type: application/pdf\r\n'
+                f'Content-Disposition: attachment; filename="{filename}"\r\n'
+                f'X-Index: {result["index"]}\r\n'
+                f'X-Stats: {_compact_json(result["stats"])}\r\n'
+            )
+        yield delimiter + headers.encode('utf-8') + f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii')
+        yield body
+        yield b'\r\n'
+        del body, pdf_bytes, result
+
+    summary = _compact_json(_summary(counts, start)).encode('utf-8')
+    yield delimiter + b'Content-Type: application/json\r\n\r\n' + summary + b'\r\n'
+    yield f'--{boundary}--\r\n'.encode('ascii')
+
+
+@batch_bp.route('/batch', methods=['POST'])
+def batch():
+    """
+    Renderiza um PDF por registro a partir de um único template
+
+    Request JSON:
+        {
+            "document": "BASE64_ENCODED_DOCX",
+            "template_id": "SHA256_DO_TEMPLATE" (alternativa a "document"),
+            "records": [{"NOME": "Ana"}, {"NOME": "Bruno"}],
+            "output_type": "zip" (opcional: zip|base64_pdf|ndjson|multipart|merged_pdf),
+            "filename": "certificado" (opcional, prefixo dos arquivos),
+            "quality": "high" (opcional),
+            "engine": "docx" (opcional: docx|xml),
+            "priority": "bulk" (opcional: interactive|bulk, ou header X-Priority)
+        }
+
+    Também aceita multipart/form-data e o DOCX bruto no corpo, com
+    "records" como string JSON.
+
+    Response (output_type zip): arquivo ZIP com um PDF por registro bem-sucedido
+    (certificado_0001.pdf, ...) e manifest.json com o resultado de cada item.
+
+    Response (output_type ndjson, application/x-ndjson): uma linha por documento
+    assim que fica pronto ({"index", "success", "filename", "stats", "pdf"} ou
+    {"index", "success", "error"}) e uma última linha com os totais.
+
+    Response (output_type multipart, multipart/mixed): uma parte application/pdf
+    por documento assim que fica pronto (headers X-Index e X-Stats), partes
+    application/json para as falhas e uma parte final com os totais.
+
+    Response (output_type merged_pdf): um único PDF com todos os registros em
+    sequência, cada um a partir de uma nova página (conversão única; todos os
+    registros precisam ser válidos).
+
+    Response JSON (output_type base64_pdf):
+        {
+            "success": true,
+            "total": 2,
+            "succeeded": 2,
+            "failed": 0,
+            "processing_time": 3.21,
+            "results": [
+                {"index": 0, "success": true, "pdf": "BASE64", "stats": {...}},
+                {"index": 1, "success": false, "error": "..."}
+            ]
+        }
+    """
+    try:
+        data, doc_bytes = read_render_request()
+
+        if doc_bytes is None and 'template_id' not in data:
+            return jsonify({'error': ERROR_MESSAGES['missing_document']}), 400
+
+        records = BatchService.validate_records(data.get('records'))
+        output_type = str(data.get('output_type', 'zip')).lower()
+        prefix = str(data.get('filename') or 'documento')
+        quality = validate_quality(data.get('quality', 'high'))
+        engine = validate_engine(data.get('engine'))
+        priority = read_priority(data, BULK_LANE)
+
+        if output_type not in BATCH_OUTPUT_TYPES:
+            return jsonify({'error': f'output_type inválido. Use: {", ".join(BATCH_OUTPUT_TYPES)}'}), 400
+
+        if 'template_id' in data:
+            stage_logger.info("Etapa 1/4: Carregando template registrado...")
+            template = template_registry.get(data['template_id'])
+        else:
+            # Parseado e indexado uma única vez; cada registro recebe uma cópia,
+            # como um template registrado (sem gravar no armazenamento)
+            stage_logger.info("Etapa 1/4: Carregando documento enviado...")
+            template = Template(doc_bytes, registered=True)
+            template.index  # Valida o DOCX antes de distribuir os registros
+
+        start = getattr(request, 'start_time', time.time())
+
+        # Os itens do lote esperam por slots sem serem recusados: o lote só é
+        # aceito se ainda houver lugar na sala de espera
+        get_conversion_limiter().admit(priority)
+
+        if output_type == 'merged_pdf':
+            pdf_bytes, stats = BatchService.render_merged(template, records, quality, priority)
+            stage_logger.info("✅ LOTE CONCLUÍDO: PDF único com %s registros em %.3fs", len(records), time.time() - start)
+            response = send_file(io.BytesIO(pdf_bytes), mimetype='application/pdf', as_attachment=True,
+                                 download_name=validate_filename(prefix, '.pdf'))
+            response.headers['X-Batch-Total'] = str(len(records))
+            response.headers['X-Conversion-Time'] = str(stats['conversion_time'])
+            return response
+
+        results = BatchService.iter_results(template, records, quality, engine, priority, current_span())
+        width = len(str(len(records)))
+
+        # Streaming: cada documento é enviado assim que fica pronto e liberado em seguida
+        if output_type == 'ndjson':
+            response = Response(_iter_ndjson(results, prefix, width, start), mimetype='application/x-ndjson')
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+
+        if output_type == 'multipart':
+            boundary = uuid.uuid4().hex
+            response = Response(_iter_multipart(results, prefix, width, start, boundary),
+                                content_type=f'multipart/mixed; boundary={boundary}')
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+
+        if output_type == 'base64_pdf':
+            items = []
+            for result in results:
+                if result['success']:
+                    result['pdf'] = encode_base64_file(result['pdf'])
+                items.append(result)
+            items.sort(key=lambda item: item['index'])
+
+            succeeded = sum(1 for item in items if item['success'])
+            total_time = time.time() - start
+            stage_logger.info("✅ LOTE CONCLUÍDO: %s/%s documentos em %.3fs", succeeded, len(items), total_time)
+
+            return jsonify({
+                'success': True,
+                'total': len(items),
+                'succeeded': succeeded,
+                'failed': len(items) - succeeded,
+                'processing_time': round(total_time, 3),
+                'results': items
+            }), 200
+
+        # ZIP montado à medida que os PDFs ficam prontos (cada PDF é liberado após gravado)
+        archive = tempfile.SpooledTemporaryFile(max_size=BATCH_ZIP_SPOOL_MAX_BYTES, dir=PIPELINE_TMP_DIR or None)
+        compression, compresslevel = zip_compression('stored')  # PDFs já são comprimidos
+        manifest = []
+        with zipfile.ZipFile(archive, 'w', compression=compression, compresslevel=compresslevel) as zf:
+            for result in results:
+                item = {key: value for key, value in result.items() if key != 'pdf'}
+                if result['success']:
+                    item['filename'] = _item_filename(prefix, result['index'], width)
+                    zf.writestr(item['filename'], result.pop('pdf'))
+                manifest.append(item)
+            manifest.sort(key=lambda item: item['index'])
+            zf.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+
+        succeeded = sum(1 for item in manifest if item['success'])
+        total_time = time.time() - start
+        stage_logger.info("✅ LOTE CONCLUÍDO: %s/%s documentos em %.3fs", succeeded, len(manifest), total_time)
+
+        archive.seek(0)
+        response = send_file(archive, mimetype='application/zip', as_attachment=True,
+                             download_name=validate_filename(prefix, '.zip'))
+        response.headers['X-Batch-Total'] = str(len(manifest))
+        response.headers['X-Batch-Succeeded'] = str(succeeded)
+        response.headers['X-Batch-Failed'] = str(len(manifest) - succeeded)
+        return response
+
+    except UnknownTemplateError as e:
+        return unknown_template_response(e)
+    except RequestEntityTooLarge as e:
+        return payload_too_large_response(e)
+    except ServerOverloadedError as e:
+        return overloaded_response(e)
+    except ValueError as e:
+        logger.error(f"Erro de validação: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erro no lote: {str(e)}")
+        return jsonify({'error': f'Erro ao processar lote: {str(e)}'}), 500
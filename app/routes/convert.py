@@ -3,16 +3,22 @@ Rota /convert - Converte DOCX para PDF e retorna em Base64
 
 Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
 """
-import os
+import logging
 import time
-import tempfile
 from flask import Blueprint, request, jsonify
-from app.utils.logger import logger
-from app.utils.encoders import decode_base64_file, encode_base64_file
-from app.utils.validators import validate_replacements, validate_quality
-from app.services.docx_service import DocxService
-from app.services.pdf_service import PdfService
-from config.settings import ERROR_MESSAGES
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.utils.logger import logger, stage_logger
+from app.utils.ingestion import read_render_request, read_priority, payload_too_large_response
+from app.utils.encoders import base64_length
+from app.utils.responses import base64_json_response, overloaded_response
+from app.utils.validators import (
+    validate_replacements, validate_quality, validate_engine, validate_boolean
+)
+from app.services.render_service import RenderService
+from app.services.admission import ServerOverloadedError, priority_lane
+from app.services.template_registry import template_registry, Template, UnknownTemplateError
+from app.routes.templates import unknown_template_response
+from config.settings import ERROR_MESSAGES, INTERACTIVE_LANE
 
 # Cria blueprint
 convert_bp = Blueprint('convert', __name__)
@@ -26,10 +32,19 @@ def convert():
     Request JSON:
         {
             "document": "BASE64_ENCODED_DOCX",
+            "template_id": "SHA256_DO_TEMPLATE" (alternativa a "document"),
             "replacements": {"TAG": "valor"},
-            "quality": "high" (opcional: high|medium|low)
+            "quality": "high" (opcional: high|medium|low),
+            "engine": "docx" (opcional: docx|xml),
+            "priority": "interactive" (opcional: interactive|bulk, ou header X-Priority),
+            "split": false (opcional: divide documentos grandes e converte as partes em paralelo)
         }
 
+    Também aceita multipart/form-data (arquivo "document" + campos, com
+    "replacements" como string JSON) e o DOCX bruto no corpo
+    (Content-Type application/vnd.openxmlformats-officedocument.wordprocessingml.document),
+    com os parâmetros na query string.
+
     Response JSON:
         {
             "success": true,
@@ -39,102 +54,79 @@ def convert():
             "stats": {
                 "input_size": 12345,
                 "output_size": 54321,
-                "quality": "high"
+                "quality": "high",
+                "replacements_count": 3,
+                "cache": {"enabled": true, "hit": false, "hits": 10, "misses": 4, ...}
             }
         }
     """
     try:
         # Valida requisição
-        if not request.is_json:
-            return jsonify({'error': ERROR_MESSAGES['invalid_json']}), 400
-
-        data = request.get_json()
+        data, doc_bytes = read_render_request()
 
         # Valida campos obrigatórios
-        if 'document' not in data:
+        if doc_bytes is None and 'template_id' not in data:
             return jsonify({'error': ERROR_MESSAGES['missing_document']}), 400
 
         if 'replacements' not in data:
             return jsonify({'error': ERROR_MESSAGES['missing_replacements']}), 400
 
-        document_base64 = data['document']
         replacements = data['replacements']
         quality = validate_quality(data.get('quality', 'high'))
+        engine = validate_engine(data.get('engine'))
+        split = validate_boolean(data.get('split'))
+        priority = read_priority(data, INTERACTIVE_LANE)
 
         # Valida replacements
         is_valid, error_msg = validate_replacements(replacements)
         if not is_valid:
             return jsonify({'error': error_msg}), 400
 
-        logger.info(f"✓ Validação OK - {len(replacements)} substituições encontradas")
-        logger.info(f"Tags a substituir: {list(replacements.keys())}")
-        logger.info(f"Qualidade do PDF: {quality}")
-
-        # Decodifica o documento
-        logger.info("Etapa 1/4: Decodificando documento Base64...")
-        start_decode = time.time()
-        doc_bytes = decode_base64_file(document_base64)
-        logger.info(f"✓ Documento decodificado ({len(doc_bytes)} bytes) em {time.time() - start_decode:.3f}s")
-
-        # Substitui as tags no documento
-        logger.info("Etapa 2/4: Substituindo tags no documento...")
-        start_replace = time.time()
-        modified_doc = DocxService.replace_tags_in_doc(doc_bytes, replacements)
-        logger.info(f"✓ Tags substituídas em {time.time() - start_replace:.3f}s")
-
-        # Cria arquivos temporários
-        with tempfile.TemporaryDirectory() as temp_dir:
-            logger.info(f"Diretório temporário: {temp_dir}")
-            docx_path = os.path.join(temp_dir, 'document.docx')
-            pdf_path = os.path.join(temp_dir, 'document.pdf')
-
-            # Salva o documento modificado
-            logger.info("Etapa 3/4: Salvando documento DOCX...")
-            start_save = time.time()
-            modified_doc.save(docx_path)
-            doc_size = os.path.getsize(docx_path)
-            logger.info(f"✓ DOCX salvo ({doc_size} bytes) em {time.time() - start_save:.3f}s")
-
-            # Converte para PDF
-            logger.info("Etapa 4/4: Convertendo DOCX para PDF...")
-            start_convert = time.time()
-            PdfService.convert_docx_to_pdf(docx_path, pdf_path, quality=quality)
-
-            # Verifica se o PDF foi gerado
-            if not os.path.exists(pdf_path):
-                logger.error("ERRO: PDF não foi gerado pelo LibreOffice")
-                raise Exception(ERROR_MESSAGES['pdf_not_generated'])
-
-            pdf_size = os.path.getsize(pdf_path)
-            logger.info(f"✓ PDF gerado ({pdf_size} bytes) em {time.time() - start_convert:.3f}s")
-
-            # Lê o PDF e converte para Base64
-            logger.info("Codificando PDF para Base64...")
-            start_encode = time.time()
-            with open(pdf_path, 'rb') as pdf_file:
-                pdf_bytes = pdf_file.read()
-                pdf_base64 = encode_base64_file(pdf_bytes)
-            logger.info(f"✓ PDF codificado em Base64 ({len(pdf_base64)} chars) em {time.time() - start_encode:.3f}s")
+        stage_logger.info("✓ Validação OK - %s substituições encontradas", len(replacements))
+        if stage_logger.isEnabledFor(logging.DEBUG):
+            stage_logger.debug("Tags a substituir: %s", list(replacements))
+        stage_logger.info("Qualidade do PDF: %s", quality)
+
+        if 'template_id' in data:
+            # Template previamente registrado via POST /templates
+            stage_logger.info("Etapa 1/4: Carregando template registrado...")
+            template = template_registry.get(data['template_id'])
+        else:
+            # Documento enviado na requisição (Base64 já decodificado, multipart ou DOCX bruto)
+            stage_logger.info("Etapa 1/4: Carregando documento enviado...")
+            template = Template(doc_bytes)
+            stage_logger.info("✓ Documento recebido (%s bytes)", template.size)
+
+        # Substitui as tags e converte (ou serve do cache de resultados)
+        with priority_lane(priority):
+            pdf_bytes, stats = RenderService.render_pdf(
+                template, replacements, quality, engine, split
+            )
 
         # Calcula tempo total
         total_time = time.time() - request.start_time if hasattr(request, 'start_time') else 0
-        logger.info(f"✅ CONVERSÃO CONCLUÍDA COM SUCESSO")
-        logger.info(f"Resumo: DOCX ({doc_size}b) -> PDF ({pdf_size}b) -> Base64 ({len(pdf_base64)} chars)")
-        logger.info(f"Tempo total de conversão: {total_time:.3f}s")
-
-        return jsonify({
+        pdf_base64_length = base64_length(len(pdf_bytes))
+        stage_logger.info("✅ CONVERSÃO CONCLUÍDA COM SUCESSO")
+        stage_logger.info(
+            "Resumo: DOCX (%sb) -> PDF (%sb) -> Base64 (%s chars)",
+            stats['input_size'], stats['output_size'], pdf_base64_length
+        )
+        stage_logger.info("Tempo total de conversão: %.3fs", total_time)
+
+        # PDF em Base64 no campo "pdf" (codificado em blocos durante o envio se for grande)
+        return base64_json_response({
             'success': True,
-            'pdf': pdf_base64,
             'message': 'Documento convertido com sucesso',
             'processing_time': round(total_time, 3),
-            'stats': {
-                'input_size': doc_size,
-                'output_size': pdf_size,
-                'quality': quality,
-                'replacements_count': len(replacements)
-            }
-        }), 200
-
+            'stats': stats
+        }, 'pdf', pdf_bytes)
+
+    except UnknownTemplateError as e:
+        return unknown_template_response(e)
+    except RequestEntityTooLarge as e:
+        return payload_too_large_response(e)
+    except ServerOverloadedError as e:
+        return overloaded_response(e)
     except ValueError as e:
         logger.error(f"Erro de validação: {str(e)}")
         return jsonify({'error': str(e)}), 400
@@ -3,16 +3,18 @@ Rota /convert-file - Converte DOCX para PDF e retorna arquivo
 
 Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
 """
-import os
-import time
-import tempfile
-from flask import Blueprint, request, jsonify, send_file
-from app.utils.logger import logger
-from app.utils.encoders import decode_base64_file
-from app.utils.validators import validate_replacements, validate_quality, validate_filename
-from app.services.docx_service import DocxService
-from app.services.pdf_service import PdfService
-from config.settings import ERROR_MESSAGES
+import io
+from flask import Blueprint, jsonify, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.utils.logger import logger, stage_logger
+from app.utils.ingestion import read_render_request, read_priority, payload_too_large_response
+from app.utils.responses import overloaded_response
+from app.utils.validators import validate_replacements, validate_quality, validate_engine, validate_boolean, validate_filename
+from app.services.render_service import RenderService
+from app.services.admission import ServerOverloadedError, priority_lane
+from app.services.template_registry import template_registry, Template, UnknownTemplateError
+from app.routes.templates import unknown_template_response
+from config.settings import ERROR_MESSAGES, INTERACTIVE_LANE
 
 convert_file_bp = Blueprint('convert_file', __name__)
 
@@ -25,74 +27,78 @@ def convert_file():
     Request JSON:
         {
             "document": "BASE64_ENCODED_DOCX",
+            "template_id": "SHA256_DO_TEMPLATE" (alternativa a "document"),
             "replacements": {"TAG": "valor"},
             "filename": "documento.pdf" (opcional),
-            "quality": "high" (opcional)
+            "quality": "high" (opcional),
+            "engine": "docx" (opcional: docx|xml),
+            "priority": "interactive" (opcional: interactive|bulk, ou header X-Priority),
+            "split": false (opcional: divide documentos grandes e converte as partes em paralelo)
         }
 
+    Também aceita multipart/form-data (arquivo "document" + campos, com
+    "replacements" como string JSON) e o DOCX bruto no corpo
+    (Content-Type application/vnd.openxmlformats-officedocument.wordprocessingml.document),
+    com os parâmetros na query string.
+
     Response: Arquivo PDF para download
+        (header X-Cache: HIT|MISS indica uso do cache de resultados)
     """
-    temp_dir = None
     try:
-        if not request.is_json:
-            return jsonify({'error': ERROR_MESSAGES['invalid_json']}), 400
-
-        data = request.get_json()
+        data, doc_bytes = read_render_request()
 
-        if 'document' not in data:
+        if doc_bytes is None and 'template_id' not in data:
             return jsonify({'error': ERROR_MESSAGES['missing_document']}), 400
 
         if 'replacements' not in data:
             return jsonify({'error': ERROR_MESSAGES['missing_replacements']}), 400
 
-        document_base64 = data['document']
         replacements = data['replacements']
         filename = validate_filename(data.get('filename', 'documento.pdf'))
         quality = validate_quality(data.get('quality', 'high'))
+        engine = validate_engine(data.get('engine'))
+        split = validate_boolean(data.get('split'))
+        priority = read_priority(data, INTERACTIVE_LANE)
 
         is_valid, error_msg = validate_replacements(replacements)
         if not is_valid:
             return jsonify({'error': error_msg}), 400
 
-        logger.info(f"✓ Validação OK - {len(replacements)} substituições")
-        logger.info(f"Arquivo de saída: {filename}")
-        logger.info(f"Qualidade: {quality}")
+        stage_logger.info("✓ Validação OK - %s substituições", len(replacements))
+        stage_logger.info("Arquivo de saída: %s", filename)
+        stage_logger.info("Qualidade: %s", quality)
 
         # Processa documento
-        logger.info("Etapa 1/4: Decodificando documento...")
-        doc_bytes = decode_base64_file(document_base64)
-
-        logger.info("Etapa 2/4: Substituindo tags...")
-        modified_doc = DocxService.replace_tags_in_doc(doc_bytes, replacements)
-
-        temp_dir = tempfile.mkdtemp()
-        docx_path = os.path.join(temp_dir, 'document.docx')
-        pdf_path = os.path.join(temp_dir, 'document.pdf')
-
-        logger.info("Etapa 3/4: Salvando DOCX...")
-        modified_doc.save(docx_path)
-
-        logger.info("Etapa 4/4: Convertendo para PDF...")
-        PdfService.convert_docx_to_pdf(docx_path, pdf_path, quality=quality)
-
-        if not os.path.exists(pdf_path):
-            raise Exception(ERROR_MESSAGES['pdf_not_generated'])
-
-        pdf_size = os.path.getsize(pdf_path)
-        logger.info(f"✅ PDF gerado: {pdf_size / 1024:.2f} KB")
-
-        return send_file(
-            pdf_path,
+        if 'template_id' in data:
+            stage_logger.info("Etapa 1/4: Carregando template registrado...")
+            template = template_registry.get(data['template_id'])
+        else:
+            stage_logger.info("Etapa 1/4: Carregando documento enviado...")
+            template = Template(doc_bytes)
+
+        with priority_lane(priority):
+            pdf_bytes, stats = RenderService.render_pdf(template, replacements, quality, engine, split)
+        stage_logger.info("✅ PDF gerado: %.2f KB", stats['output_size'] / 1024)
+
+        response = send_file(
+            io.BytesIO(pdf_bytes),
             mimetype='application/pdf',
             as_attachment=True,
             download_name=filename
         )
-
+        response.headers['X-Cache'] = 'HIT' if stats['cache'].get('hit') else 'MISS'
+        if 'split' in stats:
+            response.headers['X-Split-Chunks'] = str(stats['split']['chunks'])
+        return response
+
+    except UnknownTemplateError as e:
+        return unknown_template_response(e)
+    except RequestEntityTooLarge as e:
+        return payload_too_large_response(e)
+    except ServerOverloadedError as e:
+        return overloaded_response(e)
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Erro: {str(e)}")
         return jsonify({'error': f'Erro ao processar: {str(e)}'}), 500
-    finally:
-        # Cleanup é feito pelo send_file após envio
-        pass
@@ -0,0 +1,84 @@
+"""
+Rota /estimate - Estimativa de custo de uma conversão (dry run)
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+from flask import Blueprint, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.utils.logger import logger
+from app.utils.ingestion import read_render_request, read_priority, payload_too_large_response
+from app.utils.validators import validate_docx_format
+from app.services.admission import get_conversion_limiter
+from app.services.cost_model import cost_model
+from app.services.template_registry import template_registry, Template, UnknownTemplateError
+from app.routes.templates import unknown_template_response
+from config.settings import ERROR_MESSAGES, INTERACTIVE_LANE
+
+estimate_bp = Blueprint('estimate', __name__)
+
+
+@estimate_bp.route('/estimate', methods=['POST'])
+def estimate():
+    """
+    Estima o custo de converter um documento, sem convertê-lo
+
+    Request JSON (mesmos campos de /convert; replacements é opcional):
+        {
+            "document": "BASE64_ENCODED_DOCX",
+            "template_id": "SHA256_DO_TEMPLATE" (alternativa a "document"),
+            "priority": "interactive" (opcional: interactive|bulk, ou header X-Priority)
+        }
+
+    Também aceita multipart/form-data e o DOCX bruto no corpo.
+
+    Response JSON:
+        {
+            "success": true,
+            "template_id": "9f86d081884c7d65...",
+            "priority": "interactive",
+            "estimated_seconds": 1.8,
+            "timeout": 30.0,
+            "basis": "features",
+            "samples": 0,
+            "features": {"size": 48213, "paragraphs": 120, "tables": 2, ...},
+            "estimated_wait": 0.0
+        }
+    """
+    try:
+        data, doc_bytes = read_render_request()
+
+        if doc_bytes is None and 'template_id' not in data:
+            return jsonify({'error': ERROR_MESSAGES['missing_document']}), 400
+
+        priority = read_priority(data, INTERACTIVE_LANE)
+        if 'template_id' in data:
+            template = template_registry.get(data['template_id'])
+        else:
+            # Mesma validação das rotas de renderização: um arquivo que não é DOCX
+            # seria recusado na conversão e não deve receber uma estimativa
+            is_valid, error_msg = validate_docx_format(doc_bytes)
+            if not is_valid:
+                return jsonify({'error': error_msg}), 400
+            template = Template(doc_bytes)
+
+        cost = cost_model.estimate(template.features, template.template_id)
+        wait = get_conversion_limiter().estimated_wait(cost.seconds, priority)
+        logger.info(f"✓ Estimativa: {cost.seconds:.2f}s ({cost.basis}), espera {wait:.2f}s")
+
+        return jsonify({
+            'success': True,
+            'template_id': template.template_id,
+            'priority': priority,
+            **cost.info(),
+            'estimated_wait': round(wait, 3)
+        }), 200
+
+    except UnknownTemplateError as e:
+        return unknown_template_response(e)
+    except RequestEntityTooLarge as e:
+        return payload_too_large_response(e)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erro ao estimar custo: {str(e)}")
+        return jsonify({'error': f'Erro ao estimar custo: {str(e)}'}), 500
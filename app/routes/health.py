@@ -6,6 +6,15 @@ Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
 from flask import Blueprint, jsonify
 from version import __version__, __author__, __email__, __company__, __linkedin__
 from config.settings import API_NAME, API_DESCRIPTION
+from app.services.libreoffice_pool import get_libreoffice_pool
+from app.services.profile_pool import get_profile_pool
+from app.services.docx_process_pool import get_docx_process_pool
+from app.services.job_service import get_job_manager
+from app.services.admission import get_conversion_limiter, ServerOverloadedError
+from app.services.conversion_client import get_conversion_daemon
+from app.services.cost_model import cost_model
+from app.utils import tracing
+from app.utils.logger import logging_status
 
 # Cria blueprint
 health_bp = Blueprint('health', __name__)
@@ -14,13 +23,63 @@ health_bp = Blueprint('health', __name__)
 @health_bp.route('/health', methods=['GET'])
 def health_check():
     """Endpoint para verificação de saúde da API"""
+    docx_pool = get_docx_process_pool()
+    daemon = get_conversion_daemon()
+    if daemon is not None:
+        # LibreOffice e controle de admissão vivem no daemon de conversão
+        try:
+            daemon_status = daemon.health()
+        except ServerOverloadedError:
+            daemon_status = {'available': False}
+        conversion = {
+            'libreoffice_pool': daemon_status.pop('libreoffice_pool', None),
+            'libreoffice_profiles': daemon_status.pop('libreoffice_profiles', None),
+            'admission': daemon_status.pop('admission', None),
+        }
+        conversion['conversion_daemon'] = {
+            'enabled': True, 'socket': daemon.socket_path, 'available': True, **daemon_status
+        }
+    else:
+        pool = get_libreoffice_pool()
+        conversion = {
+            'conversion_daemon': {'enabled': False},
+            'libreoffice_pool': pool.status() if pool is not None else None,
+            'libreoffice_profiles': get_profile_pool().status(),
+            'admission': get_conversion_limiter().status(),
+        }
     return jsonify({
         'status': 'healthy',
         'service': API_NAME,
-        'version': __version__
+        'version': __version__,
+        **conversion,
+        'docx_process_pool': docx_pool.status() if docx_pool is not None else {'enabled': False},
+        'cost_model': cost_model.status(),
+        'jobs': get_job_manager().status(),
+        'tracing': (
+            tracing.exporter.status() if tracing.exporter is not None else {'enabled': False}
+        ),
+        'logging': logging_status()
     }), 200
 
 
+@health_bp.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Prontidão para novas conversões (para balanceadores de carga)
+
+    Retorna 503 com Retry-After quando não há slot para a faixa interativa e
+    sua sala de espera está cheia, de modo que o balanceador desvie o tráfego.
+    """
+    limiter = get_conversion_limiter()
+    saturated = limiter.saturated()
+    load = limiter.status()
+    response = jsonify({'ready': not saturated, **load})
+    if saturated:
+        response.status_code = 503
+        response.headers['Retry-After'] = str(load['retry_after'])
+    return response
+
+
 @health_bp.route('/', methods=['GET'])
 def index():
     """Endpoint raiz com informações da API"""
@@ -38,6 +97,11 @@ def index():
                 'method': 'GET',
                 'description': 'Verificação de saúde'
             },
+            'ready': {
+                'path': '/ready',
+                'method': 'GET',
+                'description': 'Prontidão: ocupação das conversões (503 quando saturado)'
+            },
             'convert': {
                 'path': '/convert',
                 'method': 'POST',
@@ -52,6 +116,43 @@ def index():
                 'path': '/process',
                 'method': 'POST',
                 'description': 'Processamento flexível com múltiplas opções de entrada/saída'
+            },
+            'templates': {
+                'path': '/templates',
+                'method': 'POST',
+                'description': (
+                    'Registra um template DOCX e retorna o template_id '
+                    '(GET/DELETE /templates/<id>)'
+                )
+            },
+            'batch': {
+                'path': '/batch',
+                'method': 'POST',
+                'description': (
+                    'Mail merge: um PDF por registro (ZIP, Base64, NDJSON, '
+                    'multipart) ou PDF único'
+                )
+            },
+            'jobs': {
+                'path': '/jobs',
+                'method': 'POST',
+                'description': (
+                    'Renderização assíncrona: retorna o job_id (GET /jobs/<id>, '
+                    'GET /jobs/<id>/result)'
+                )
+            },
+            'estimate': {
+                'path': '/estimate',
+                'method': 'POST',
+                'description': 'Dry run: custo estimado, timeout e espera prevista de uma conversão'
+            },
+            'metrics': {
+                'path': '/metrics',
+                'method': 'GET',
+                'description': (
+                    'Métricas no formato Prometheus (latência por etapa, bytes, '
+                    'conversões, filas)'
+                )
             }
         },
         'documentation': {
@@ -0,0 +1,181 @@
+"""
+Rotas /jobs - Renderização assíncrona com fila de background
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+from flask import Blueprint, jsonify, send_file, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.utils.logger import logger
+from app.utils.ingestion import read_render_request, read_priority, payload_too_large_response
+from app.utils.validators import (
+    validate_replacements, validate_quality, validate_engine, validate_boolean, validate_filename, validate_callback_url
+)
+from app.services.render_service import RenderService
+from app.services.template_registry import template_registry, Template, UnknownTemplateError
+from app.services.job_service import get_job_manager, Job, UnknownJobError, JobQueueFullError
+from app.routes.templates import unknown_template_response
+from config.settings import ERROR_MESSAGES, BULK_LANE
+
+jobs_bp = Blueprint('jobs', __name__)
+
+JOB_OUTPUT_TYPES = {
+    'pdf': ('application/pdf', '.pdf'),
+    'doc': ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', '.docx'),
+}
+
+
+def unknown_job_response(error: UnknownJobError):
+    """Resposta padrão para job inexistente ou expirado"""
+    return jsonify({
+        'error': str(error),
+        'code': 'unknown_job',
+        'job_id': error.job_id
+    }), 404
+
+
+def _job_response(job: Job, status: int = 200):
+    response = jsonify({
+        'success': True,
+        **job.info(),
+        'status_url': url_for('jobs.get_job', job_id=job.job_id, _external=True)
+    })
+    response.status_code = status
+    return response
+
+
+@jobs_bp.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Enfileira uma renderização e retorna imediatamente o id do job
+
+    Request JSON (mesmos campos de /process, além de callback_url):
+        {
+            "document": "BASE64_ENCODED_DOCX",
+            "template_id": "SHA256_DO_TEMPLATE" (alternativa a "document"),
+            "replacements": {"TAG": "valor"},
+            "output_type": "pdf" (opcional: pdf|doc),
+            "filename": "documento" (opcional),
+            "quality": "high" (opcional),
+            "engine": "docx" (opcional: docx|xml),
+            "priority": "bulk" (opcional: interactive|bulk, ou header X-Priority),
+            "split": false (opcional: divide documentos grandes e converte as partes em paralelo),
+            "callback_url": "https://cliente/hooks/doc2pdf" (opcional)
+        }
+
+    Também aceita multipart/form-data e o DOCX bruto no corpo.
+
+    Response JSON (202):
+        {
+            "success": true,
+            "job_id": "3f2c...",
+            "status": "queued",
+            "status_url": "https://.../jobs/3f2c...",
+            ...
+        }
+
+    Ao final, se informado, callback_url recebe um POST com o estado do job
+    (mesmo corpo de GET /jobs/<job_id>, com result_url para download).
+    """
+    try:
+        data, doc_bytes = read_render_request(allow_raw_document=True)
+
+        if (doc_bytes is None and 'template_id' not in data) or 'replacements' not in data:
+            return jsonify({'error': 'Campos "document" (ou "template_id") e "replacements" são obrigatórios'}), 400
+
+        replacements = data['replacements']
+        output_type = str(data.get('output_type', 'pdf')).lower()
+        quality = validate_quality(data.get('quality', 'high'))
+        engine = validate_engine(data.get('engine'))
+        split = validate_boolean(data.get('split'))
+        callback_url = data.get('callback_url')
+        priority = read_priority(data, BULK_LANE)
+
+        if output_type not in JOB_OUTPUT_TYPES:
+            return jsonify({'error': f'output_type inválido. Use: {", ".join(JOB_OUTPUT_TYPES)}'}), 400
+
+        is_valid, error_msg = validate_replacements(replacements)
+        if not is_valid:
+            return jsonify({'error': error_msg}), 400
+
+        if callback_url is not None:
+            is_valid, error_msg = validate_callback_url(callback_url)
+            if not is_valid:
+                return jsonify({'error': error_msg}), 400
+
+        # Templates registrados já estão em memória; um documento avulso aguarda
+        # na fila em disco e só vira Template quando o job roda
+        registered = template_registry.get(data['template_id']) if 'template_id' in data else None
+
+        def task(document):
+            template = registered if registered is not None else Template(document)
+            if output_type == 'pdf':
+                return RenderService.render_pdf(template, replacements, quality, engine, split)
+            return RenderService.render_docx(template, replacements, engine)
+
+        mimetype, extension = JOB_OUTPUT_TYPES[output_type]
+        job = Job(task, mimetype, validate_filename(data.get('filename', 'documento'), extension), callback_url,
+                  priority=priority, document=doc_bytes if registered is None else None)
+        job.result_url = url_for('jobs.get_job_result', job_id=job.job_id, _external=True)
+        get_job_manager().submit(job)
+
+        response = _job_response(job, 202)
+        response.headers['Location'] = url_for('jobs.get_job', job_id=job.job_id)
+        return response
+
+    except UnknownTemplateError as e:
+        return unknown_template_response(e)
+    except JobQueueFullError as e:
+        response = jsonify({'error': str(e), 'code': 'job_queue_full', 'retry_after': e.retry_after})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    except RequestEntityTooLarge as e:
+        return payload_too_large_response(e)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erro ao criar job: {str(e)}")
+        return jsonify({'error': f'Erro ao criar job: {str(e)}'}), 500
+
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Retorna o estado de um job (queued, running, done, failed)"""
+    try:
+        return _job_response(get_job_manager().get(job_id))
+    except UnknownJobError as e:
+        return unknown_job_response(e)
+
+
+@jobs_bp.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Baixa o resultado de um job concluído (409 enquanto não estiver pronto ou se falhou)"""
+    try:
+        job = get_job_manager().get(job_id)
+    except UnknownJobError as e:
+        return unknown_job_response(e)
+
+    if job.status != 'done' or job.result_path is None:
+        return jsonify({
+            'error': job.error or ERROR_MESSAGES['job_not_ready'],
+            'code': 'job_not_ready' if job.status in ('queued', 'running') else f'job_{job.status}',
+            'status': job.status
+        }), 409
+
+    # Um DELETE ou a expiração podem remover o arquivo a qualquer momento; depois
+    # de aberto, o download continua mesmo que ele seja apagado
+    try:
+        result = open(job.result_path, 'rb')
+    except FileNotFoundError:
+        return unknown_job_response(UnknownJobError(job_id))
+    return send_file(result, mimetype=job.mimetype, as_attachment=True, download_name=job.filename)
+
+
+@jobs_bp.route('/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """Remove um job e seu resultado (jobs ainda na fila são cancelados)"""
+    try:
+        job = get_job_manager().delete(job_id)
+        return jsonify({'success': True, 'job_id': job.job_id, 'status': job.status}), 200
+    except UnknownJobError as e:
+        return unknown_job_response(e)
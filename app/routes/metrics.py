@@ -0,0 +1,24 @@
+"""
+Rota /metrics - Métricas no formato de texto do Prometheus
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+from flask import Blueprint, Response
+from app.utils.metrics import registry, CONTENT_TYPE
+from config.settings import METRICS_PATH
+
+# Cria blueprint
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route(METRICS_PATH, methods=['GET'])
+def metrics():
+    """
+    Exposição das métricas para o scrape do Prometheus
+
+    Histogramas de latência por etapa do pipeline e por endpoint, bytes
+    recebidos e enviados, conversões por qualidade e resultado, códigos de
+    saída e timeouts do LibreOffice, profundidade das filas e conversões em
+    andamento. Com METRICS_MULTIPROC_DIR, soma todos os workers gunicorn.
+    """
+    return Response(registry.expose(), content_type=CONTENT_TYPE)
@@ -0,0 +1,91 @@
+"""
+Rotas /templates - Registro de templates DOCX reutilizáveis
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+from flask import Blueprint, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.utils.logger import logger
+from app.utils.ingestion import read_render_request, payload_too_large_response
+from app.services.template_registry import template_registry, UnknownTemplateError
+from config.settings import ERROR_MESSAGES
+
+templates_bp = Blueprint('templates', __name__)
+
+
+def unknown_template_response(error: UnknownTemplateError):
+    """Resposta padrão para template_id não registrado (cliente deve reenviar)"""
+    return jsonify({
+        'error': str(error),
+        'code': 'unknown_template',
+        'template_id': error.template_id
+    }), 404
+
+
+@templates_bp.route('/templates', methods=['POST'])
+def register_template():
+    """
+    Registra um template DOCX e retorna seu id (hash SHA-256 do conteúdo)
+
+    Request JSON:
+        {
+            "document": "BASE64_ENCODED_DOCX"
+        }
+
+    Também aceita o arquivo via multipart/form-data (campo "document") ou o
+    DOCX bruto no corpo.
+
+    Response JSON (201 se criado, 200 se já existia):
+        {
+            "success": true,
+            "template_id": "9f86d081884c7d65...",
+            "size": 12345,
+            "tags": ["CPF", "NOME"],
+            "created": true
+        }
+    """
+    try:
+        _, doc_bytes = read_render_request()
+
+        if doc_bytes is None:
+            return jsonify({'error': 'Campo "document" é obrigatório'}), 400
+
+        template, created = template_registry.register(doc_bytes)
+
+        return jsonify({
+            'success': True,
+            **template.info(),
+            'created': created
+        }), 201 if created else 200
+
+    except RequestEntityTooLarge as e:
+        return payload_too_large_response(e)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erro ao registrar template: {str(e)}")
+        return jsonify({'error': f'Erro ao registrar template: {str(e)}'}), 500
+
+
+@templates_bp.route('/templates/<template_id>', methods=['GET'])
+def get_template(template_id):
+    """Retorna os metadados de um template registrado"""
+    try:
+        template = template_registry.get(template_id)
+        return jsonify({'success': True, **template.info()}), 200
+    except UnknownTemplateError as e:
+        return unknown_template_response(e)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@templates_bp.route('/templates/<template_id>', methods=['DELETE'])
+def delete_template(template_id):
+    """Remove um template registrado"""
+    if not template_registry.is_valid_id(template_id):
+        return jsonify({'error': ERROR_MESSAGES['invalid_template_id']}), 400
+
+    if not template_registry.delete(template_id):
+        return unknown_template_response(UnknownTemplateError(template_id))
+
+    return jsonify({'success': True, 'template_id': template_id}), 200
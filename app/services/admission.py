@@ -0,0 +1,400 @@
+"""
+Controle de admissão das conversões LibreOffice
+
+Limita as conversões simultâneas à capacidade real (workers do pool ou slots
+de perfil) com uma sala de espera limitada. Quando a espera está cheia, ou
+demora demais, a requisição é recusada na hora com um Retry-After estimado
+a partir dos tempos recentes de conversão, em vez de acumular threads,
+memória e timeouts. Os slots são divididos entre faixas de prioridade
+(interativa e bulk) por pesos, com slots reservados à faixa interativa, e
+cada fila é ordenada pelo custo estimado das conversões.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from app.utils.logger import logger
+from app.utils.tracing import span
+from app.utils.metrics import (
+    admission_wait,
+    admission_rejected,
+    conversions_in_flight,
+    conversion_queue_depth,
+    conversion_capacity
+)
+from app.services.libreoffice_pool import get_libreoffice_pool
+from app.services.profile_pool import get_profile_pool
+from config.settings import (
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_WAITING,
+    ADMISSION_WAIT_TIMEOUT,
+    ADMISSION_SAMPLE_SIZE,
+    ADMISSION_DEFAULT_CONVERSION_TIME,
+    INTERACTIVE_LANE,
+    PRIORITY_LANE_WEIGHTS,
+    PRIORITY_INTERACTIVE_RESERVED_SLOTS,
+    SCHEDULER_AGING_RATE,
+    ERROR_MESSAGES
+)
+
+# Trabalho de background (jobs, itens de lote) já limitado pela própria fila:
+# espera por um slot sem ocupar a sala de espera e sem ser recusado
+_background = contextvars.ContextVar('admission_background', default=False)
+
+# Faixa de prioridade das conversões da thread atual (ver priority_lane)
+_lane = contextvars.ContextVar('admission_lane', default=INTERACTIVE_LANE)
+
+
+class ServerOverloadedError(Exception):
+    """Capacidade de conversão esgotada (429: espera cheia, 503: espera expirou)"""
+
+    def __init__(self, message: str, retry_after: int, status_code: int, load: Dict[str, Any]):
+        self.retry_after = retry_after
+        self.status_code = status_code
+        self.load = load  # Ocupação no momento da recusa
+        super().__init__(message)
+
+
+@contextmanager
+def background_work() -> Iterator[None]:
+    """Marca as conversões da thread atual como trabalho de background"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+@contextmanager
+def priority_lane(lane: str) -> Iterator[None]:
+    """
+    Define a faixa de prioridade das conversões da thread atual
+
+    Args:
+        lane: Uma das PRIORITY_LANES (já validada)
+    """
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> str:
+    """Faixa de prioridade das conversões da thread atual"""
+    return _lane.get()
+
+
+def is_background() -> bool:
+    """Indica se as conversões da thread atual são trabalho de background"""
+    return _background.get()
+
+
+class _Ticket:
+    """Uma conversão aguardando slot na fila da sua faixa"""
+
+    __slots__ = ('lane', 'background', 'cost', 'enqueued_at', 'granted')
+
+    def __init__(self, lane: str, background: bool, cost: float):
+        self.lane = lane
+        self.background = background
+        self.cost = cost
+        self.enqueued_at = time.time()
+        self.granted = False
+
+    def rank(self, now: float) -> float:
+        """Menor trabalho primeiro, com envelhecimento para não haver inanição"""
+        return self.cost - SCHEDULER_AGING_RATE * (now - self.enqueued_at)
+
+
+class ConversionLimiter:
+    """
+    Escalonador de conversões por faixas de prioridade, com sala de espera limitada
+
+    Cada faixa tem sua fila. Quando um slot fica livre, ele vai para a faixa
+    com menor "passo" acumulado (stride scheduling): cada conversão concedida
+    avança o passo da faixa em custo/peso, de modo que, com as duas faixas
+    disputando, a interativa recebe peso_interativa/(soma dos pesos) do tempo
+    de conversão. Além disso, `reserved` slots ficam fora do alcance das
+    demais faixas enquanto houver requisições interativas na fila, o que
+    garante capacidade mínima a elas mesmo durante lotes; sem interativas
+    aguardando, os lotes usam também os slots reservados. Dentro da faixa,
+    vai primeiro a conversão de menor custo estimado, com envelhecimento
+    pelo tempo de espera.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        max_waiting: int,
+        wait_timeout: float,
+        weights: Optional[Dict[str, int]] = None,
+        reserved: int = 0
+    ):
+        self.capacity = max(1, capacity)
+        self.max_waiting = max(0, max_waiting)
+        self.wait_timeout = wait_timeout
+        self.weights = {lane: max(1, weight) for lane, weight in (weights or {INTERACTIVE_LANE: 1}).items()}
+        # Ao menos um slot continua acessível às demais faixas
+        self.reserved = min(max(0, reserved), self.capacity - 1)
+        self.in_flight = 0
+        self.rejected = 0
+        self._lane_in_flight = {lane: 0 for lane in self.weights}
+        self._queues: Dict[str, List[_Ticket]] = {lane: [] for lane in self.weights}
+        self._passes = {lane: 0.0 for lane in self.weights}
+        self._virtual_time = 0.0
+        self._durations = deque(maxlen=ADMISSION_SAMPLE_SIZE)
+        self._condition = threading.Condition()
+
+    @property
+    def waiting(self) -> int:
+        """Requisições (não background) aguardando um slot, em todas as faixas"""
+        return sum(self._waiting(lane) for lane in self._queues)
+
+    @property
+    def background_waiting(self) -> int:
+        """Jobs e itens de lote aguardando um slot, em todas as faixas"""
+        return sum(ticket.background for queue in self._queues.values() for ticket in queue)
+
+    def _waiting(self, lane: str) -> int:
+        return sum(not ticket.background for ticket in self._queues[lane])
+
+    def _has_room(self, lane: str) -> bool:
+        """Há slot livre para a faixa (os reservados só servem à interativa quando ela tem fila)"""
+        if self.in_flight >= self.capacity:
+            return False
+        if lane == INTERACTIVE_LANE or not self._queues.get(INTERACTIVE_LANE):
+            # Sem interativas aguardando, os reservados ficariam ociosos: as demais faixas os usam
+            return True
+        shared_in_use = self.in_flight - self._lane_in_flight.get(INTERACTIVE_LANE, 0)
+        return shared_in_use < self.capacity - self.reserved
+
+    def _dispatch(self) -> None:
+        """Concede os slots livres às filas, pela faixa de menor passo (chamado com o lock)"""
+        granted = False
+        now = time.time()
+        while self.in_flight < self.capacity:
+            eligible = [lane for lane, queue in self._queues.items() if queue and self._has_room(lane)]
+            if not eligible:
+                break
+            lane = min(eligible, key=lambda name: self._passes[name])
+            queue = self._queues[lane]
+            ticket = queue.pop(min(range(len(queue)), key=lambda i: queue[i].rank(now)))
+            self._virtual_time = self._passes[lane]
+            self._passes[lane] += ticket.cost / self.weights[lane]
+            self.in_flight += 1
+            self._lane_in_flight[lane] += 1
+            ticket.granted = granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def average_conversion_time(self) -> float:
+        """Média dos tempos de conversão recentes (ou o valor padrão sem amostras)"""
+        with self._condition:
+            if not self._durations:
+                return ADMISSION_DEFAULT_CONVERSION_TIME
+            return sum(self._durations) / len(self._durations)
+
+    def retry_after(self, queued: Optional[int] = None) -> int:
+        """
+        Segundos estimados até haver capacidade para uma nova conversão
+
+        Args:
+            queued: Trabalhos à frente (padrão: em espera + em andamento)
+
+        Returns:
+            Estimativa arredondada para cima (mínimo 1s)
+        """
+        if queued is None:
+            with self._condition:
+                queued = self.waiting + self.background_waiting + self.in_flight
+        rounds = (queued + 1) / self.capacity
+        return max(1, math.ceil(rounds * self.average_conversion_time()))
+
+    def estimated_wait(self, cost: float, lane: str = INTERACTIVE_LANE) -> float:
+        """
+        Espera estimada até uma conversão de custo `cost` receber um slot
+
+        Soma o custo das conversões da faixa que passariam à frente dela e o
+        divide pelos slots; aproximada, pois ignora a disputa entre faixas.
+
+        Args:
+            cost: Custo estimado da conversão em segundos
+            lane: Faixa de prioridade
+
+        Returns:
+            Segundos estimados (0 se houver slot livre)
+        """
+        with self._condition:
+            if lane not in self._queues:
+                lane = INTERACTIVE_LANE
+            if self._has_room(lane) and not self._queues[lane]:
+                return 0.0
+            now = time.time()
+            ahead = sum(ticket.cost for ticket in self._queues[lane] if ticket.rank(now) <= cost)
+            # Conversões em andamento: em média, metade do tempo ainda por vir
+            running = self.in_flight * self.average_conversion_time() / 2
+            return (ahead + running) / self.capacity
+
+    def _overloaded(self, status_code: int, lane: str) -> ServerOverloadedError:
+        self.rejected += 1
+        admission_rejected.inc(lane=lane, status=status_code)
+        return ServerOverloadedError(ERROR_MESSAGES['server_busy'], self.retry_after(), status_code, self.status())
+
+    def saturated(self, lane: str = INTERACTIVE_LANE) -> bool:
+        """Sem slot livre para a faixa e com sua sala de espera cheia"""
+        with self._condition:
+            return not self._has_room(lane) and self._waiting(lane) >= self.max_waiting
+
+    def admit(self, lane: Optional[str] = None) -> None:
+        """
+        Recusa de imediato se a sala de espera da faixa estiver cheia (sem reservar slot)
+
+        Args:
+            lane: Faixa de prioridade (padrão: a da thread atual)
+
+        Raises:
+            ServerOverloadedError: 429 com Retry-After
+        """
+        lane = lane if lane in self._queues else _lane.get()
+        with self._condition:
+            if not self._has_room(lane) and self._waiting(lane) >= self.max_waiting:
+                raise self._overloaded(429, lane)
+
+    @contextmanager
+    def slot(self, cost: Optional[float] = None) -> Iterator[None]:
+        """
+        Reserva um slot de conversão durante o bloco, na faixa da thread atual
+
+        Args:
+            cost: Custo estimado em segundos (padrão: média das conversões recentes)
+
+        Raises:
+            ServerOverloadedError: 429 se a sala de espera da faixa estiver cheia,
+                503 se o slot não ficar livre em wait_timeout
+        """
+        lane = _lane.get()
+        if lane not in self._queues:
+            lane = INTERACTIVE_LANE
+        ticket = _Ticket(lane, _background.get(), cost if cost is not None else self.average_conversion_time())
+
+        with span('admission.wait', lane=lane, background=ticket.background, cost=round(ticket.cost, 3)) as wait_span, \
+                self._condition:
+            queue = self._queues[lane]
+            if not queue:
+                # Faixa ociosa não acumula crédito: retoma do ponto atual do escalonador
+                self._passes[lane] = max(self._passes[lane], self._virtual_time)
+
+            if not ticket.background and not self._has_room(lane) and self._waiting(lane) >= self.max_waiting:
+                logger.warning(f"⚠ Conversão recusada ({lane}): {self.in_flight} em andamento, "
+                               f"{self._waiting(lane)} aguardando")
+                raise self._overloaded(429, lane)
+
+            wait_span.set_attribute('queue.ahead', len(queue))
+            queue.append(ticket)
+            self._dispatch()
+            if not ticket.granted:
+                timeout = None if ticket.background else self.wait_timeout
+                if not self._condition.wait_for(lambda: ticket.granted, timeout=timeout):
+                    queue.remove(ticket)
+                    logger.warning(f"⚠ Conversão recusada ({lane}) após aguardar {self.wait_timeout}s por um slot")
+                    raise self._overloaded(503, lane)
+
+        start = time.time()
+        admission_wait.observe(start - ticket.enqueued_at, lane=lane)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._lane_in_flight[lane] -= 1
+                self._durations.append(time.time() - start)
+                self._dispatch()
+
+    def status(self) -> Dict[str, Any]:
+        """Retorna a ocupação atual (para health check e balanceadores)"""
+        with self._condition:
+            lanes = {
+                lane: {
+                    'weight': self.weights[lane],
+                    'in_flight': self._lane_in_flight[lane],
+                    'waiting': self._waiting(lane),
+                    'background_waiting': sum(ticket.background for ticket in queue),
+                }
+                for lane, queue in self._queues.items()
+            }
+            return {
+                'capacity': self.capacity,
+                'reserved_interactive': self.reserved,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'background_waiting': self.background_waiting,
+                'max_waiting': self.max_waiting,
+                'rejected': self.rejected,
+                'average_conversion_time': round(self.average_conversion_time(), 3),
+                'retry_after': self.retry_after(),
+                'lanes': lanes,
+            }
+
+
+_limiter: Optional[ConversionLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_conversion_limiter() -> ConversionLimiter:
+    """
+    Retorna o limitador global, criando-o na primeira chamada
+
+    A capacidade é ADMISSION_MAX_CONCURRENCY ou, se 0, o número de workers do
+    pool LibreOffice (ou de slots de perfil do --convert-to, sem o pool).
+    Com o daemon de conversão, retorna o limitador remoto: as consultas de
+    ocupação são respondidas pelo limitador único do daemon.
+    """
+    global _limiter
+
+    # Import tardio: o cliente do daemon usa este módulo
+    from app.services.conversion_client import get_conversion_daemon
+    daemon = get_conversion_daemon()
+    if daemon is not None:
+        return daemon.limiter
+
+    with _limiter_lock:
+        if _limiter is None:
+            capacity = ADMISSION_MAX_CONCURRENCY
+            if capacity <= 0:
+                pool = get_libreoffice_pool()
+                capacity = pool.size if pool is not None else get_profile_pool().slots
+            _limiter = ConversionLimiter(
+                capacity, ADMISSION_MAX_WAITING, ADMISSION_WAIT_TIMEOUT,
+                PRIORITY_LANE_WEIGHTS, PRIORITY_INTERACTIVE_RESERVED_SLOTS
+            )
+            logger.info(f"✓ Controle de admissão: {capacity} conversões simultâneas "
+                        f"({_limiter.reserved} reservadas à faixa interativa), "
+                        f"até {ADMISSION_MAX_WAITING} aguardando por faixa")
+        return _limiter
+
+
+def _limiter_in_flight() -> Dict[tuple, float]:
+    if _limiter is None:
+        return {}
+    return {(lane,): info['in_flight'] for lane, info in _limiter.status()['lanes'].items()}
+
+
+def _limiter_queue_depth() -> Dict[tuple, float]:
+    if _limiter is None:
+        return {}
+    depth = {}
+    for lane, info in _limiter.status()['lanes'].items():
+        depth[(lane, 'request')] = info['waiting']
+        depth[(lane, 'background')] = info['background_waiting']
+    return depth
+
+
+conversions_in_flight.set_function(_limiter_in_flight)
+conversion_queue_depth.set_function(_limiter_queue_depth)
+conversion_capacity.set_function(lambda: _limiter.capacity if _limiter is not None else 0)
@@ -0,0 +1,239 @@
+"""
+Renderização em lote (mail merge)
+
+Um template, vários conjuntos de replacements: o template é parseado uma
+única vez e cada registro é renderizado em paralelo, limitado à capacidade
+de conversão do LibreOffice. Falhas são reportadas por item, sem derrubar o lote.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.utils.logger import logger, stage_logger
+from app.utils.metrics import stage_duration
+from app.utils.tracing import Span, span, current_span
+from app.utils.validators import validate_replacements
+from app.services.admission import background_work, priority_lane
+from app.services.cost_model import cost_model, extract_features
+from app.services.docx_service import DocxService
+from app.services.pdf_service import PdfService
+from app.services.render_service import RenderService
+from app.services.template_registry import Template
+from config.settings import (
+    BATCH_MAX_RECORDS,
+    BATCH_MAX_WORKERS,
+    BATCH_MERGE_TIMEOUT,
+    INTERMEDIATE_DOCX_COMPRESSION,
+    BULK_LANE,
+    ERROR_MESSAGES
+)
+
+
+class BatchService:
+    """Serviço de renderização de vários documentos a partir de um template"""
+
+    @staticmethod
+    def validate_records(records: Any) -> List[Dict[str, Any]]:
+        """
+        Valida a lista de registros do lote
+
+        A validação de cada registro é feita na renderização, para que um
+        registro inválido falhe apenas o próprio item.
+
+        Args:
+            records: Valor do campo "records"
+
+        Returns:
+            Lista de registros
+
+        Raises:
+            ValueError: Se não for uma lista não vazia ou exceder BATCH_MAX_RECORDS
+        """
+        if not isinstance(records, list) or not records:
+            raise ValueError(ERROR_MESSAGES['missing_records'])
+        if len(records) > BATCH_MAX_RECORDS:
+            raise ValueError(ERROR_MESSAGES['too_many_records'])
+        return records
+
+    @staticmethod
+    def worker_count(total: int) -> int:
+        """
+        Número de renderizações simultâneas de um lote
+
+        Args:
+            total: Número de registros do lote
+
+        Returns:
+            BATCH_MAX_WORKERS (se definido) ou a capacidade de conversão, limitado ao total
+        """
+        workers = BATCH_MAX_WORKERS if BATCH_MAX_WORKERS > 0 else PdfService.conversion_capacity()
+        return max(1, min(workers, total))
+
+    @staticmethod
+    def render_item(
+        template: Template,
+        index: int,
+        replacements: Any,
+        quality: str,
+        engine: str,
+        lane: str = BULK_LANE,
+        trace_parent: Optional[Span] = None
+    ) -> Dict[str, Any]:
+        """
+        Renderiza um registro do lote, capturando o erro no próprio item
+
+        Args:
+            template: Template compartilhado pelo lote
+            index: Posição do registro em "records"
+            replacements: Dicionário com tags e valores do registro
+            quality: Qualidade do PDF já validada
+            engine: Engine de substituição já validada
+            lane: Faixa de prioridade das conversões
+            trace_parent: Span da requisição do lote (o item roda em outra thread)
+
+        Returns:
+            {"index", "success", "pdf", "stats"} ou {"index", "success", "error"}
+        """
+        is_valid, error_msg = validate_replacements(replacements)
+        if not is_valid:
+            return {'index': index, 'success': False, 'error': error_msg}
+
+        try:
+            with background_work(), priority_lane(lane), span('batch.item', trace_parent, index=index):
+                pdf_bytes, stats = RenderService.render_pdf(template, replacements, quality, engine)
+            return {'index': index, 'success': True, 'pdf': pdf_bytes, 'stats': stats}
+        except Exception as e:
+            logger.error(f"Erro no item {index} do lote: {str(e)}")
+            return {'index': index, 'success': False, 'error': str(e)}
+
+    @staticmethod
+    def iter_results(
+        template: Template,
+        records: List[Dict[str, Any]],
+        quality: str,
+        engine: str,
+        lane: str = BULK_LANE,
+        trace_parent: Optional[Span] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Renderiza os registros em paralelo e entrega os resultados à medida que ficam prontos
+
+        No máximo o dobro do número de workers fica em andamento ou pronto
+        aguardando consumo, de modo que a memória ocupada pelos PDFs não
+        cresce com o tamanho do lote.
+
+        Args:
+            template: Template compartilhado pelo lote
+            records: Lista de dicionários de replacements
+            quality: Qualidade do PDF já validada
+            engine: Engine de substituição já validada
+            lane: Faixa de prioridade das conversões
+            trace_parent: Span da requisição (as respostas em streaming são
+                consumidas depois que ela deixa de ser a corrente)
+
+        Yields:
+            Resultados de render_item, em ordem de conclusão
+        """
+        workers = BatchService.worker_count(len(records))
+        window = workers * 2
+        trace_parent = trace_parent or current_span()
+        stage_logger.info("Lote: %s registros, %s conversões simultâneas", len(records), workers)
+
+        start = time.time()
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch')
+        pending = set()
+        next_index = 0
+        try:
+            while next_index < len(records) or pending:
+                while next_index < len(records) and len(pending) < window:
+                    pending.add(executor.submit(
+                        BatchService.render_item, template, next_index, records[next_index], quality, engine, lane,
+                        trace_parent
+                    ))
+                    next_index += 1
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                while done:
+                    # Sem referência guardada: o PDF é liberado assim que o consumidor o descarta
+                    yield done.pop().result()
+        finally:
+            # Consumidor interrompido (ex.: cliente desconectou): descarta o que não começou
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        stage_logger.info("✓ Lote de %s registros renderizado em %.3fs", len(records), time.time() - start)
+
+    @staticmethod
+    def render_merged(
+        template: Template,
+        records: List[Dict[str, Any]],
+        quality: str,
+        lane: str = BULK_LANE
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Gera um único PDF com todos os registros, um após o outro
+
+        Cada registro é preenchido a partir do template e os corpos são
+        concatenados em um único DOCX, com quebras de seção (nova página)
+        entre eles; o LibreOffice carrega e converte um só documento.
+
+        Args:
+            template: Template compartilhado pelo lote
+            records: Lista de dicionários de replacements (todos devem ser válidos)
+            quality: Qualidade do PDF já validada
+            lane: Faixa de prioridade da conversão
+
+        Returns:
+            Tupla (pdf_bytes, stats)
+
+        Raises:
+            ValueError: Se algum registro for inválido (o PDF ficaria incompleto)
+            Exception: Se houver erro na conversão
+        """
+        invalid = [
+            str(index) for index, record in enumerate(records)
+            if not validate_replacements(record)[0]
+        ]
+        if invalid:
+            raise ValueError(
+                f'{ERROR_MESSAGES["invalid_replacements"]} (registros {", ".join(invalid[:20])})'
+            )
+
+        stage_logger.info("Etapa 2/4: Preenchendo e concatenando %s registros...", len(records))
+        start_merge = time.time()
+        with span('batch.merge', records=len(records)) as merge_span:
+            merged = template.fill(records[0])
+            for record in records[1:]:
+                DocxService.append_document(merged, template.fill(record))
+
+            buffer = io.BytesIO()
+            DocxService.save_document(merged, buffer, INTERMEDIATE_DOCX_COMPRESSION, template.doc_bytes)
+            docx_bytes = buffer.getvalue()
+            merge_span.set_attribute('document.size', len(docx_bytes))
+        merge_time = time.time() - start_merge
+        stage_duration.observe(merge_time, stage='merge')
+        stage_logger.info("✓ DOCX concatenado (%s bytes) em %.3fs", len(docx_bytes), merge_time)
+        del merged, buffer
+
+        stage_logger.info("Etapa 4/4: Convertendo DOCX concatenado para PDF...")
+        start_convert = time.time()
+        with priority_lane(lane):
+            pdf_bytes = PdfService.convert_docx_bytes_to_pdf(
+                docx_bytes, quality=quality, timeout=BATCH_MERGE_TIMEOUT,
+                estimate=cost_model.estimate(extract_features(docx_bytes))
+            )
+        if not pdf_bytes:
+            raise Exception(ERROR_MESSAGES['pdf_not_generated'])
+        convert_time = time.time() - start_convert
+        stage_duration.observe(convert_time, stage='convert')
+        stage_logger.info("✓ PDF único gerado (%s bytes) em %.3fs", len(pdf_bytes), convert_time)
+
+        return pdf_bytes, {
+            'records': len(records),
+            'input_size': len(docx_bytes),
+            'output_size': len(pdf_bytes),
+            'quality': quality,
+            'merge_time': round(merge_time, 3),
+            'conversion_time': round(convert_time, 3)
+        }
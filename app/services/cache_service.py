@@ -0,0 +1,232 @@
+"""
+Cache de resultados endereçado por conteúdo
+
+Evita re-renderizar o mesmo documento com os mesmos dados (retries,
+submissões duplicadas). A chave é o hash do DOCX, dos replacements
+normalizados e da qualidade. Dois níveis: LRU em memória e, opcionalmente,
+disco; ambos com limite de tamanho e TTL.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.utils.logger import logger
+from config.settings import (
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MEMORY_MAX_BYTES,
+    RESULT_CACHE_MEMORY_TTL,
+    RESULT_CACHE_DISK_ENABLED,
+    RESULT_CACHE_DISK_DIR,
+    RESULT_CACHE_DISK_MAX_BYTES,
+    RESULT_CACHE_DISK_TTL
+)
+
+
+class MemoryLRUCache:
+    """Cache LRU em memória com limite de bytes e TTL"""
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.time() >= expires_at:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return  # Maior que o cache inteiro: não armazena
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time() + self.ttl)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def _remove(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self.size -= len(value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    """Cache em disco com limite de bytes e TTL (LRU pelo mtime dos arquivos)"""
+
+    def __init__(self, directory: str, max_bytes: int, ttl: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory)
+            if not name.endswith('.tmp')
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            mtime = os.path.getmtime(path)
+            if time.time() - mtime >= self.ttl:
+                self._delete(path)
+                return None
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path)  # Marca como usado recentemente (LRU)
+            return value
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(value)
+        with self._lock:
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            os.replace(tmp_path, path)  # Escrita atômica
+            self.size += len(value)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _delete(self, path: str) -> None:
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.size -= size
+            except FileNotFoundError:
+                pass
+
+    def _evict(self) -> None:
+        """Remove expirados e, se necessário, os menos usados até caber no limite"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if self.size <= self.max_bytes and now - mtime < self.ttl:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except FileNotFoundError:
+                pass
+
+
+class ResultCache:
+    """Cache de resultados em dois níveis (memória + disco opcional)"""
+
+    def __init__(self):
+        self.memory = MemoryLRUCache(RESULT_CACHE_MEMORY_MAX_BYTES, RESULT_CACHE_MEMORY_TTL)
+        self.disk: Optional[DiskCache] = None
+        if RESULT_CACHE_DISK_ENABLED:
+            try:
+                self.disk = DiskCache(RESULT_CACHE_DISK_DIR, RESULT_CACHE_DISK_MAX_BYTES, RESULT_CACHE_DISK_TTL)
+            except OSError as e:
+                logger.warning(f"⚠ Cache em disco indisponível: {str(e)}")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(doc_hash: str, replacements: Dict[str, Any], quality: str, kind: str = 'pdf') -> str:
+        """
+        Gera a chave de cache para um resultado
+
+        Os replacements são normalizados como na substituição de tags: chaves
+        em maiúsculas (a primeira ocorrência vence) e valores convertidos para
+        string, de modo que requisições equivalentes compartilhem a entrada.
+
+        Args:
+            doc_hash: Hash SHA-256 do DOCX de entrada (o template_id)
+            replacements: Dicionário com tags e valores
+            quality: Qualidade do PDF já validada
+            kind: Tipo de resultado ('pdf' ou 'docx')
+
+        Returns:
+            Hash SHA-256 hexadecimal
+        """
+        normalized = {}
+        for tag, value in replacements.items():
+            normalized.setdefault(tag.upper(), str(value))
+
+        digest = hashlib.sha256()
+        digest.update(doc_hash.encode('utf-8'))
+        digest.update(json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        digest.update(f"|{quality}|{kind}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Busca um resultado (memória, depois disco); conta hit/miss"""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)  # Promove para o nível em memória
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        """Armazena um resultado em todos os níveis"""
+        self.memory.put(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, value)
+            except OSError as e:
+                logger.warning(f"⚠ Falha ao gravar no cache em disco: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores do cache para o campo `stats` das respostas"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'memory_entries': len(self.memory),
+            'memory_bytes': self.memory.size,
+            'disk_bytes': self.disk.size if self.disk is not None else None,
+        }
+
+
+# Cache global da aplicação (None quando desabilitado)
+result_cache: Optional[ResultCache] = ResultCache() if RESULT_CACHE_ENABLED else None
@@ -0,0 +1,254 @@
+"""
+Cliente do daemon de conversão compartilhado
+
+Com CONVERSION_DAEMON_ENABLED, os workers web não convertem: gravam o DOCX em
+CONVERSION_DAEMON_SHM_DIR (tmpfs) e enviam o pedido ao daemon pelo socket
+Unix - uma linha JSON por pedido e uma por resposta. O daemon aplica o
+controle de admissão global (faixas, menor trabalho primeiro) e grava o PDF
+no mesmo diretório. As consultas de ocupação (/ready, /estimate, capacidade,
+Retry-After) também são respondidas pelo daemon.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from app.utils.logger import logger
+from app.utils.tracing import current_request_id, current_span
+from app.services.admission import ServerOverloadedError, current_lane, is_background
+from config.settings import (
+    CONVERSION_DAEMON_ENABLED,
+    CONVERSION_DAEMON_SOCKET,
+    CONVERSION_DAEMON_SHM_DIR,
+    CONVERSION_DAEMON_CONNECT_TIMEOUT,
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_WAIT_TIMEOUT,
+    INTERACTIVE_LANE,
+    ERROR_MESSAGES
+)
+
+# Métodos do ConversionLimiter que o daemon executa a pedido dos workers web
+LIMITER_METHODS = frozenset({'status', 'saturated', 'admit', 'estimated_wait', 'retry_after'})
+
+# Retry-After (segundos) quando o daemon não responde
+UNAVAILABLE_RETRY_AFTER = 5
+
+
+def raise_for_response(response: Dict[str, Any]) -> None:
+    """
+    Recria no worker web a exceção levantada no daemon
+
+    Raises:
+        ServerOverloadedError: Capacidade esgotada (429/503)
+        ValueError: Pedido inválido (400)
+        Exception: Erro na conversão
+    """
+    if response.get('ok'):
+        return
+    kind = response.get('type')
+    message = response.get('error', '')
+    if kind == 'ServerOverloadedError':
+        raise ServerOverloadedError(message, response['retry_after'], response['status'], response.get('load', {}))
+    if kind == 'ValueError':
+        raise ValueError(message)
+    raise Exception(message)
+
+
+class RemoteConversionLimiter:
+    """
+    Mesma interface de consulta do ConversionLimiter, respondida pelo daemon
+
+    Não há slot(): as conversões vão inteiras ao daemon, que reserva o slot.
+    """
+
+    def __init__(self, client: "ConversionDaemonClient"):
+        self._client = client
+        self._capacity: Optional[int] = None
+
+    def _call(self, method: str, *args: Any) -> Any:
+        response = self._client.request({'op': 'limiter', 'method': method, 'args': list(args)})
+        return response['result']
+
+    @property
+    def capacity(self) -> int:
+        """Capacidade do daemon (ADMISSION_MAX_CONCURRENCY enquanto ele não responde)"""
+        if self._capacity is None:
+            try:
+                self._capacity = self._call('status')['capacity']
+            except ServerOverloadedError:
+                return max(1, ADMISSION_MAX_CONCURRENCY)
+        return self._capacity
+
+    def status(self) -> Dict[str, Any]:
+        try:
+            return self._call('status')
+        except ServerOverloadedError:
+            return {'available': False, 'retry_after': UNAVAILABLE_RETRY_AFTER}
+
+    def saturated(self, lane: str = INTERACTIVE_LANE) -> bool:
+        try:
+            return self._call('saturated', lane)
+        except ServerOverloadedError:
+            return True  # Daemon fora do ar: o balanceador deve desviar o tráfego
+
+    def admit(self, lane: Optional[str] = None) -> None:
+        self._call('admit', lane or current_lane())
+
+    def estimated_wait(self, cost: float, lane: str = INTERACTIVE_LANE) -> float:
+        return self._call('estimated_wait', cost, lane)
+
+    def retry_after(self, queued: Optional[int] = None) -> int:
+        try:
+            return self._call('retry_after', queued)
+        except ServerOverloadedError:
+            return UNAVAILABLE_RETRY_AFTER
+
+
+class ConversionDaemonClient:
+    """Envia conversões e consultas ao daemon pelo socket Unix"""
+
+    def __init__(self, socket_path: str = CONVERSION_DAEMON_SOCKET, shm_dir: str = CONVERSION_DAEMON_SHM_DIR):
+        self.socket_path = socket_path
+        self.shm_dir = shm_dir
+        self.limiter = RemoteConversionLimiter(self)
+        os.makedirs(shm_dir, exist_ok=True)
+
+    def _unavailable(self, reason: Any) -> ServerOverloadedError:
+        logger.error(f"❌ Daemon de conversão indisponível ({self.socket_path}): {reason}")
+        return ServerOverloadedError(ERROR_MESSAGES['conversion_daemon_unavailable'], UNAVAILABLE_RETRY_AFTER, 503, {})
+
+    def request(self, payload: Dict[str, Any], timeout: Optional[float] = CONVERSION_DAEMON_CONNECT_TIMEOUT) -> Dict[str, Any]:
+        """
+        Envia um pedido e aguarda a resposta (uma conexão por pedido)
+
+        Args:
+            payload: Pedido (campo `op` e parâmetros)
+            timeout: Segundos aguardando a resposta (None = sem limite)
+
+        Returns:
+            Resposta do daemon
+
+        Raises:
+            ServerOverloadedError: 503 se o daemon não responder; 429/503 do daemon
+            ValueError: Pedido recusado pelo daemon
+            Exception: Erro na conversão ou timeout aguardando a resposta
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.settimeout(CONVERSION_DAEMON_CONNECT_TIMEOUT)
+                sock.connect(self.socket_path)
+            except OSError as e:
+                raise self._unavailable(e)
+            try:
+                sock.settimeout(timeout)
+                sock.sendall(json.dumps(payload).encode() + b'\n')
+                with sock.makefile('rb') as reader:
+                    line = reader.readline()
+            except socket.timeout:
+                if payload.get('op') == 'convert':
+                    raise Exception(ERROR_MESSAGES['conversion_timeout'])
+                raise self._unavailable('sem resposta')
+            except OSError as e:
+                raise self._unavailable(e)
+        if not line:
+            raise self._unavailable('conexão encerrada sem resposta')
+        response = json.loads(line)
+        raise_for_response(response)
+        return response
+
+    def convert(self, docx_bytes: bytes, quality: str, timeout: float, cost: Optional[float] = None) -> Tuple[bytes, float]:
+        """
+        Converte no daemon, trocando os arquivos pelo tmpfs
+
+        A faixa de prioridade, o tipo de trabalho (background ou não) e o
+        contexto do trace da thread atual seguem junto com o pedido.
+
+        Args:
+            docx_bytes: Bytes do DOCX
+            quality: Qualidade do PDF
+            timeout: Tempo máximo da conversão em segundos
+            cost: Custo estimado em segundos (ordena a fila do daemon)
+
+        Returns:
+            Tupla (pdf_bytes, segundos de conversão, sem a espera na fila)
+        """
+        fd, input_path = tempfile.mkstemp(suffix='.docx', dir=self.shm_dir)
+        output_path = input_path[:-len('.docx')] + '.pdf'
+        try:
+            with os.fdopen(fd, 'wb') as docx_file:
+                docx_file.write(docx_bytes)
+
+            background = is_background()
+            parent = current_span()
+            response = self.request({
+                'op': 'convert',
+                'input': input_path,
+                'output': output_path,
+                'quality': quality,
+                'timeout': timeout,
+                'cost': cost,
+                'lane': current_lane(),
+                'background': background,
+                'request_id': current_request_id(),
+                'traceparent': parent.traceparent if parent is not None else None,
+            }, timeout=None if background else ADMISSION_WAIT_TIMEOUT + timeout + CONVERSION_DAEMON_CONNECT_TIMEOUT)
+
+            with open(output_path, 'rb') as pdf_file:
+                return pdf_file.read(), response['seconds']
+        finally:
+            for path in (input_path, output_path):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def health(self) -> Dict[str, Any]:
+        """Estado do daemon (pool, perfis e controle de admissão)"""
+        response = self.request({'op': 'health'})
+        response.pop('ok', None)
+        return response
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        """Aguarda o daemon aceitar pedidos (no boot, quando sobem juntos)"""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.request({'op': 'ping'})
+                return True
+            except ServerOverloadedError:
+                if time.time() >= deadline:
+                    return False
+                time.sleep(0.5)
+
+
+_client: Optional[ConversionDaemonClient] = None
+_client_lock = threading.Lock()
+_serving = False
+
+
+def mark_as_daemon() -> None:
+    """Chamado pelo próprio daemon: neste processo as conversões são locais"""
+    global _serving
+    _serving = True
+
+
+def get_conversion_daemon() -> Optional[ConversionDaemonClient]:
+    """
+    Retorna o cliente global do daemon, criando-o na primeira chamada
+
+    Returns:
+        Cliente, ou None se desabilitado (ou se este processo é o daemon)
+    """
+    global _client
+
+    if not CONVERSION_DAEMON_ENABLED or _serving:
+        return None
+
+    with _client_lock:
+        if _client is None:
+            _client = ConversionDaemonClient()
+        return _client
@@ -0,0 +1,250 @@
+"""
+Daemon de conversão compartilhado
+
+Processo único dono do LibreOffice (pool de workers ou perfis do
+--convert-to), do controle de admissão e das filas de conversão. Os workers
+gunicorn enviam os pedidos pelo socket Unix CONVERSION_DAEMON_SOCKET (ver
+conversion_client): uma linha JSON por pedido e uma por resposta, com o DOCX
+e o PDF trocados por arquivos em CONVERSION_DAEMON_SHM_DIR (tmpfs). Assim o
+número de workers web escala independentemente da capacidade de conversão e
+um único limite vale para o container inteiro.
+
+Uso:
+    python conversion_daemon.py
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import json
+import os
+import select
+import signal
+import socket
+import socketserver
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict
+from app.utils.logger import logger
+from app.utils import tracing
+from app.utils.metrics import registry
+from app.services.admission import ServerOverloadedError, get_conversion_limiter, priority_lane, background_work
+from app.services.conversion_client import LIMITER_METHODS, mark_as_daemon
+from app.services.libreoffice_pool import get_libreoffice_pool, shutdown_libreoffice_pool
+from app.services.profile_pool import get_profile_pool, shutdown_profile_pool
+from app.services.pdf_service import PdfService
+from config.settings import (
+    CONVERSION_DAEMON_SOCKET,
+    CONVERSION_DAEMON_SHM_DIR,
+    CONVERSION_DAEMON_ORPHAN_MAX_AGE,
+    CONVERSION_DAEMON_ORPHAN_SWEEP_INTERVAL,
+    CONVERSION_TIMEOUT,
+    METRICS_ENABLED,
+    PRIORITY_LANES,
+    INTERACTIVE_LANE
+)
+
+MAX_REQUEST_LINE = 64 * 1024  # Pedidos só trazem caminhos e parâmetros
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Uma conexão = um pedido e uma resposta"""
+
+    def handle(self) -> None:
+        line = self.rfile.readline(MAX_REQUEST_LINE)
+        if not line:
+            return
+        try:
+            response = self.server.conversion_daemon.dispatch(json.loads(line), self._client_connected)
+        except ServerOverloadedError as e:
+            response = {'ok': False, 'type': 'ServerOverloadedError', 'error': str(e),
+                        'status': e.status_code, 'retry_after': e.retry_after, 'load': e.load}
+        except ValueError as e:
+            response = {'ok': False, 'type': 'ValueError', 'error': str(e)}
+        except Exception as e:
+            response = {'ok': False, 'type': 'Exception', 'error': str(e)}
+        try:
+            self.wfile.write(json.dumps(response, default=str).encode() + b'\n')
+        except OSError:
+            logger.warning("⚠ Worker web desconectou antes da resposta do daemon")
+
+    def _client_connected(self) -> bool:
+        """O worker web ainda aguarda a resposta (ele só fecha a conexão ao desistir)"""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return not readable or self.connection.recv(1, socket.MSG_PEEK) != b''
+        except OSError:
+            return False
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128  # Todas as threads de todos os workers web podem conectar ao mesmo tempo
+
+
+class ConversionDaemon:
+    """Servidor do socket Unix que executa as conversões dos workers web"""
+
+    def __init__(self, socket_path: str = CONVERSION_DAEMON_SOCKET, shm_dir: str = CONVERSION_DAEMON_SHM_DIR):
+        self.socket_path = socket_path
+        self.shm_dir = os.path.realpath(shm_dir)
+        self.started_at = time.time()
+        self.conversions = 0
+        self._server = None
+
+    def _exchange_path(self, path: Any) -> str:
+        """Aceita apenas arquivos do diretório de troca (o socket não lê nem grava em outro lugar)"""
+        real = os.path.realpath(str(path))
+        if os.path.dirname(real) != self.shm_dir:
+            raise ValueError(f"Caminho fora do diretório de troca do daemon: {path}")
+        return real
+
+    def dispatch(self, request: Dict[str, Any], connected: Callable[[], bool] = lambda: True) -> Dict[str, Any]:
+        """
+        Executa um pedido
+
+        Operações: convert, limiter (consulta ao controle de admissão), health e ping
+
+        Args:
+            request: Pedido decodificado
+            connected: Indica se o worker web ainda aguarda a resposta
+
+        Raises:
+            ServerOverloadedError: Capacidade esgotada (429/503)
+            ValueError: Pedido inválido
+            Exception: Erro na conversão
+        """
+        op = request.get('op')
+        if op == 'convert':
+            return self._convert(request, connected)
+        if op == 'limiter':
+            method = request.get('method')
+            if method not in LIMITER_METHODS:
+                raise ValueError(f"Método do limitador não permitido: {method}")
+            return {'ok': True, 'result': getattr(get_conversion_limiter(), method)(*request.get('args', []))}
+        if op == 'health':
+            return {'ok': True, **self.status()}
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid()}
+        raise ValueError(f"Operação desconhecida: {op}")
+
+    def _convert(self, request: Dict[str, Any], connected: Callable[[], bool]) -> Dict[str, Any]:
+        input_path = self._exchange_path(request['input'])
+        output_path = self._exchange_path(request['output'])
+        lane = request.get('lane') if request.get('lane') in PRIORITY_LANES else INTERACTIVE_LANE
+        background = bool(request.get('background'))
+        request_id = request.get('request_id')
+
+        with open(input_path, 'rb') as docx_file:
+            docx_bytes = docx_file.read()
+
+        root = tracing.start_span('daemon.convert', traceparent=request.get('traceparent'), request_id=request_id,
+                                  server=True, **{'document.size': len(docx_bytes), 'lane': lane, 'background': background})
+        try:
+            with tracing.use_span(root, request_id), priority_lane(lane), \
+                    background_work() if background else nullcontext():
+                pdf_bytes, seconds = PdfService.convert_locally(
+                    docx_bytes, request.get('quality', 'high'),
+                    float(request.get('timeout') or CONVERSION_TIMEOUT), request.get('cost'))
+        except BaseException as e:
+            tracing.end_span(root, e)
+            raise
+        tracing.end_span(root)
+
+        with open(output_path, 'wb') as pdf_file:
+            pdf_file.write(pdf_bytes)
+        self.conversions += 1
+        # Verificado após gravar: se o worker desistiu antes, ele já removeu seus arquivos
+        if not connected():
+            os.unlink(output_path)
+            logger.warning(f"⚠ Worker web desistiu da conversão após {seconds:.1f}s; PDF descartado")
+        return {'ok': True, 'size': len(pdf_bytes), 'seconds': seconds}
+
+    def status(self) -> Dict[str, Any]:
+        """Estado do daemon, no formato do /health"""
+        pool = get_libreoffice_pool()
+        return {
+            'pid': os.getpid(),
+            'uptime': round(time.time() - self.started_at, 1),
+            'conversions': self.conversions,
+            'libreoffice_pool': pool.status() if pool is not None else None,
+            'libreoffice_profiles': get_profile_pool().status(),
+            'admission': get_conversion_limiter().status(),
+        }
+
+    def _remove_orphans(self) -> None:
+        """Remove arquivos de troca esquecidos por workers que morreram no meio de uma conversão"""
+        cutoff = time.time() - CONVERSION_DAEMON_ORPHAN_MAX_AGE
+        for entry in os.scandir(self.shm_dir):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def _sweep_loop(self) -> None:
+        while True:
+            time.sleep(CONVERSION_DAEMON_ORPHAN_SWEEP_INTERVAL)
+            try:
+                self._remove_orphans()
+            except OSError as e:
+                logger.warning(f"⚠ Falha ao limpar o diretório de troca: {str(e)}")
+
+    def _claim_socket(self) -> None:
+        """Remove o socket de uma execução anterior (falha se outro daemon estiver ativo)"""
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+                return
+        raise RuntimeError(f"Já existe um daemon de conversão ativo em {self.socket_path}")
+
+    def serve(self) -> None:
+        """Inicia o LibreOffice e atende os pedidos até SIGTERM/SIGINT"""
+        os.makedirs(self.shm_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(self.socket_path) or '.', exist_ok=True)
+        self._remove_orphans()
+        self._claim_socket()
+
+        # LibreOffice e controle de admissão prontos antes de aceitar pedidos
+        get_profile_pool()
+        if get_libreoffice_pool() is None:
+            logger.info("Pool LibreOffice inativo - conversões usarão --convert-to")
+        get_conversion_limiter()
+
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.conversion_daemon = self
+        os.chmod(self.socket_path, 0o660)
+        threading.Thread(target=self._sweep_loop, name='daemon-sweep', daemon=True).start()
+
+        def stop(signum, frame):
+            logger.info(f"Sinal {signum} recebido, encerrando o daemon de conversão")
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        logger.info(f"✓ Daemon de conversão atendendo em {self.socket_path} (troca de arquivos em {self.shm_dir})")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+            shutdown_libreoffice_pool()
+            shutdown_profile_pool()
+            logger.info("Daemon de conversão encerrado")
+
+
+def main() -> None:
+    """Ponto de entrada do daemon (python conversion_daemon.py)"""
+    mark_as_daemon()
+    if METRICS_ENABLED:
+        registry.start()
+    if tracing.exporter is not None:
+        tracing.exporter.start()
+    ConversionDaemon().serve()
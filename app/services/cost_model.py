@@ -0,0 +1,194 @@
+"""
+Estimativa do custo de conversão de um documento
+
+Antes de converter, o custo (segundos de LibreOffice) é estimado a partir de
+características do DOCX - tamanho, número de parágrafos e tabelas, bytes de
+mídia embutida - e do histórico de conversões do mesmo template. A
+estimativa ordena a fila de conversões (menor trabalho primeiro) e define o
+timeout de cada conversão.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+from app.utils.logger import stage_logger
+from config.settings import (
+    COST_MODEL_WEIGHTS,
+    COST_MODEL_EWMA_ALPHA,
+    COST_MODEL_MAX_TEMPLATES,
+    CONVERSION_TIMEOUT,
+    CONVERSION_TIMEOUT_FACTOR,
+    CONVERSION_TIMEOUT_MIN,
+    CONVERSION_TIMEOUT_MAX
+)
+
+_PARAGRAPH = re.compile(rb'<w:p[ >/]')
+_TABLE = re.compile(rb'<w:tbl[ >]')
+_MEDIA_PREFIX = 'word/media/'
+_MB = 1024 * 1024
+
+
+class DocumentFeatures(NamedTuple):
+    """Características do DOCX usadas na estimativa de custo"""
+    size: int
+    paragraphs: int
+    tables: int
+    media_bytes: int
+    media_count: int
+
+
+class CostEstimate:
+    """Custo estimado de uma conversão e o timeout derivado dele"""
+
+    def __init__(self, seconds: float, basis: str, features: DocumentFeatures,
+                 template_id: Optional[str] = None, samples: int = 0,
+                 min_timeout: float = CONVERSION_TIMEOUT_MIN):
+        self.seconds = seconds
+        self.basis = basis  # 'history' (tempos do template) ou 'features'
+        self.features = features
+        self.template_id = template_id
+        self.samples = samples
+        self.actual: Optional[float] = None  # Duração real, registrada por CostModel.observe
+        self.timeout = min(CONVERSION_TIMEOUT_MAX, max(min_timeout, seconds * CONVERSION_TIMEOUT_FACTOR))
+
+    def info(self) -> Dict[str, Any]:
+        """Estimativa para as respostas da API"""
+        return {
+            'estimated_seconds': round(self.seconds, 3),
+            'timeout': round(self.timeout, 1),
+            'basis': self.basis,
+            'samples': self.samples,
+            'features': self.features._asdict(),
+        }
+
+
+def extract_features(doc_bytes: bytes) -> DocumentFeatures:
+    """
+    Extrai as características do DOCX sem parseá-lo com o python-docx
+
+    Lê o diretório do ZIP (tamanho da mídia) e conta parágrafos e tabelas
+    no XML do corpo com uma varredura por expressão regular.
+
+    Args:
+        doc_bytes: Bytes do DOCX
+
+    Returns:
+        DocumentFeatures (contagens zeradas se o ZIP for inválido)
+    """
+    paragraphs = tables = media_bytes = media_count = 0
+    try:
+        with zipfile.ZipFile(io.BytesIO(doc_bytes)) as zf:
+            for info in zf.infolist():
+                if info.filename.startswith(_MEDIA_PREFIX):
+                    media_bytes += info.file_size
+                    media_count += 1
+            body = zf.read('word/document.xml')
+        paragraphs = len(_PARAGRAPH.findall(body))
+        tables = len(_TABLE.findall(body))
+    except (zipfile.BadZipFile, KeyError):
+        pass
+    return DocumentFeatures(len(doc_bytes), paragraphs, tables, media_bytes, media_count)
+
+
+class CostModel:
+    """
+    Modelo de custo com calibração contínua
+
+    Sem histórico, o custo vem de uma soma ponderada das características
+    (COST_MODEL_WEIGHTS) multiplicada por um fator de calibração, a média
+    móvel da razão real/estimado de todas as conversões - os pesos dão a
+    proporção entre documentos, a calibração traz o resultado para o
+    hardware atual. Templates já convertidos usam a média móvel dos
+    próprios tempos.
+    """
+
+    def __init__(self, max_templates: int = COST_MODEL_MAX_TEMPLATES, alpha: float = COST_MODEL_EWMA_ALPHA):
+        self.max_templates = max(1, max_templates)
+        self.alpha = alpha
+        self.calibration = 1.0
+        self.observations = 0
+        self._history: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def feature_seconds(features: DocumentFeatures) -> float:
+        """Custo bruto (antes da calibração) pela soma ponderada das características"""
+        weights = COST_MODEL_WEIGHTS
+        return (
+            weights['base']
+            + weights['per_mb'] * features.size / _MB
+            + weights['per_paragraph'] * features.paragraphs
+            + weights['per_table'] * features.tables
+            + weights['per_media_mb'] * features.media_bytes / _MB
+        )
+
+    def estimate(self, features: DocumentFeatures, template_id: Optional[str] = None) -> CostEstimate:
+        """
+        Estima o custo de conversão de um documento
+
+        Args:
+            features: Características do DOCX (ver extract_features)
+            template_id: Hash do template de origem, para usar o histórico
+
+        Returns:
+            CostEstimate com os segundos estimados e o timeout da conversão
+        """
+        with self._lock:
+            history = self._history.get(template_id) if template_id else None
+            if history is not None:
+                self._history.move_to_end(template_id)
+                return CostEstimate(history['seconds'], 'history', features, template_id, int(history['samples']))
+            calibration = self.calibration
+            calibrated = self.observations > 0
+        # Sem nenhuma conversão observada (início a frio), os pesos padrão não dizem nada
+        # sobre este hardware: o timeout não fica abaixo do CONVERSION_TIMEOUT fixo
+        min_timeout = CONVERSION_TIMEOUT_MIN if calibrated else max(CONVERSION_TIMEOUT_MIN, CONVERSION_TIMEOUT)
+        return CostEstimate(self.feature_seconds(features) * calibration, 'features', features, template_id,
+                            min_timeout=min_timeout)
+
+    def observe(self, estimate: CostEstimate, seconds: float, calibrate: bool = True) -> None:
+        """
+        Registra o tempo real de uma conversão concluída
+
+        Args:
+            estimate: Estimativa feita antes da conversão
+            seconds: Duração real da conversão
+            calibrate: Se False, só atualiza o histórico do template (tempo já
+                contado na calibração, como o das partes de uma conversão dividida)
+        """
+        estimate.actual = seconds
+        raw = self.feature_seconds(estimate.features)
+        with self._lock:
+            if calibrate:
+                self.observations += 1
+                self.calibration += self.alpha * (seconds / raw - self.calibration)
+
+            if estimate.template_id is None:
+                return
+            history = self._history.get(estimate.template_id)
+            if history is None:
+                self._history[estimate.template_id] = {'seconds': seconds, 'samples': 1}
+                if len(self._history) > self.max_templates:
+                    self._history.popitem(last=False)
+            else:
+                history['seconds'] += self.alpha * (seconds - history['seconds'])
+                history['samples'] += 1
+                self._history.move_to_end(estimate.template_id)
+
+        if seconds > estimate.seconds * 2:
+            stage_logger.info("Conversão levou %.2fs (estimado %.2fs, base %s)", seconds, estimate.seconds, estimate.basis)
+
+    def status(self) -> Dict[str, Any]:
+        """Estado do modelo (para health check)"""
+        return {
+            'calibration': round(self.calibration, 3),
+            'observations': self.observations,
+            'templates': len(self._history),
+        }
+
+
+cost_model = CostModel()
@@ -0,0 +1,225 @@
+"""
+Pool de processos para a etapa DOCX (substituição de tags + gravação)
+
+A substituição e a serialização do DOCX são CPU em Python puro: com o
+gunicorn em gthread, as threads de um worker se revezam no GIL enquanto os
+núcleos livres esperam. Com DOCX_EXECUTOR=process essa etapa roda em um pool
+de processos com python-docx pré-importado (forkserver); o template, os
+replacements e o DOCX gerado trafegam como bytes. Cada processo mantém os
+templates registrados parseados e indexados, como o registro faz na
+aplicação.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+from app.utils.logger import logger
+from config.settings import (
+    DOCX_EXECUTOR,
+    DOCX_PROCESS_POOL_SIZE,
+    DOCX_PROCESS_MIN_BYTES,
+    DOCX_PROCESS_TEMPLATE_CACHE
+)
+
+# Módulos importados uma única vez no forkserver e herdados por cada processo
+PRELOAD_MODULES = ['docx', 'lxml.etree', 'app.services.docx_process_pool']
+
+# Templates registrados parseados neste processo (apenas nos processos do pool)
+_templates: "OrderedDict[str, Any]" = OrderedDict()
+
+
+def _warm_up() -> None:
+    """Inicializador dos processos: carrega o template padrão do python-docx"""
+    from docx import Document
+    Document()
+    # As etapas são registradas pelo processo da aplicação, com o contexto da requisição
+    logging.getLogger('doc2pdf.stages').setLevel(logging.WARNING)
+
+
+def _template(template_id: str, doc_bytes: bytes, registered: bool):
+    """Template do processo: registrados ficam em cache (LRU), avulsos são descartados"""
+    from app.services.template_registry import Template
+    if not registered:
+        return Template(doc_bytes)
+    template = _templates.get(template_id)
+    if template is None:
+        template = Template(doc_bytes, registered=True)
+        _templates[template_id] = template
+        while len(_templates) > DOCX_PROCESS_TEMPLATE_CACHE:
+            _templates.popitem(last=False)
+    else:
+        _templates.move_to_end(template_id)
+    return template
+
+
+def write_docx(
+    template_id: str,
+    doc_bytes: bytes,
+    registered: bool,
+    replacements: Dict[str, Any],
+    engine: str,
+    compression: str
+) -> Tuple[bytes, Dict[str, float], int]:
+    """
+    Substitui as tags e grava o DOCX (executado em um processo do pool)
+
+    Mesmas etapas de RenderService._write_docx; as durações voltam para o
+    processo da aplicação, que registra as métricas e os spans.
+
+    Args:
+        template_id: Id (SHA-256) do template
+        doc_bytes: Bytes do DOCX de origem
+        registered: Template registrado (usa o índice pré-compilado)
+        replacements: Dicionário com tags e valores
+        engine: 'docx' ou 'xml'
+        compression: Perfil de compressão ('stored', 'fast' ou 'default')
+
+    Returns:
+        Tupla (docx_bytes, durações por etapa, membros reaproveitados)
+
+    Raises:
+        ValueError: Se o documento for inválido
+    """
+    from app.services.docx_service import DocxService
+    from app.services.docx_xml_service import DocxXmlService
+
+    output = io.BytesIO()
+    if engine == 'xml':
+        start = time.time()
+        DocxXmlService.replace_tags(doc_bytes, replacements, output, compression)
+        return output.getvalue(), {'rewrite': time.time() - start}, 0
+
+    template = _template(template_id, doc_bytes, registered)
+    start = time.time()
+    document = template.fill(replacements)
+    timings = {'replace': time.time() - start}
+    start = time.time()
+    reused = DocxService.save_document(document, output, compression, doc_bytes)
+    timings['save'] = time.time() - start
+    return output.getvalue(), timings, reused
+
+
+class DocxProcessPool:
+    """Pool de processos para a etapa DOCX, recriado se um processo morrer"""
+
+    def __init__(self, size: int = DOCX_PROCESS_POOL_SIZE, min_bytes: int = DOCX_PROCESS_MIN_BYTES):
+        self.size = size if size > 0 else (os.cpu_count() or 1)
+        self.min_bytes = min_bytes
+        self.tasks = 0
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        methods = multiprocessing.get_all_start_methods()
+        # fork a partir de um processo com threads é inseguro: forkserver quando disponível
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        if context.get_start_method() == 'forkserver':
+            context.set_forkserver_preload(PRELOAD_MODULES)
+        return ProcessPoolExecutor(max_workers=self.size, mp_context=context, initializer=_warm_up)
+
+    def accepts(self, size: int) -> bool:
+        """Documentos pequenos ficam na thread: o IPC custaria mais que o ganho"""
+        return size >= self.min_bytes
+
+    def write_docx(
+        self,
+        template_id: str,
+        doc_bytes: bytes,
+        registered: bool,
+        replacements: Dict[str, Any],
+        engine: str,
+        compression: str
+    ) -> Tuple[bytes, Dict[str, float], int]:
+        """
+        Executa write_docx em um processo do pool
+
+        Um processo morto (BrokenProcessPool) recria o pool e a tarefa é
+        repetida uma vez.
+
+        Returns:
+            Tupla (docx_bytes, durações por etapa, membros reaproveitados)
+
+        Raises:
+            ValueError: Se o documento for inválido
+        """
+        args = (template_id, doc_bytes, registered, replacements, engine, compression)
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                result = executor.submit(write_docx, *args).result()
+                self.tasks += 1
+                return result
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                logger.warning("⚠ Processo do pool DOCX terminou inesperadamente, recriando o pool")
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = self._create_executor()
+                        self.restarts += 1
+
+    def shutdown(self) -> None:
+        """Encerra os processos do pool"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def status(self) -> Dict[str, Any]:
+        """Estado do pool (para health check)"""
+        return {
+            'enabled': True,
+            'processes': self.size,
+            'min_bytes': self.min_bytes,
+            'tasks': self.tasks,
+            'restarts': self.restarts,
+        }
+
+
+_pool: Optional[DocxProcessPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_docx_process_pool() -> Optional[DocxProcessPool]:
+    """
+    Retorna o pool global, iniciando-o na primeira chamada
+
+    Returns:
+        Pool de processos, ou None com DOCX_EXECUTOR=thread
+    """
+    global _pool
+
+    if DOCX_EXECUTOR != 'process':
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = DocxProcessPool()
+            logger.info(f"✓ Pool DOCX iniciado com {_pool.size} processos (documentos a partir de {_pool.min_bytes} bytes)")
+        return _pool
+
+
+def shutdown_docx_process_pool() -> None:
+    """Encerra o pool global (registrado com atexit)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _after_fork() -> None:
+    # Os processos do pool pertencem ao processo pai: o filho cria o seu no primeiro uso
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -4,16 +4,273 @@ Serviço de manipulação de documentos DOCX
 Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
 """
 import io
-from typing import Dict
+import logging
+import re
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple, Union
 from docx import Document
-from app.utils.logger import logger
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.pkgwriter import PackageWriter
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from lxml import etree
+from docx.table import _Cell
+from app.utils.logger import logger, stage_logger
 from app.utils.validators import validate_docx_format
+from app.utils.zip_utils import zip_compression, write_member
 from config.settings import TAG_OPEN, TAG_CLOSE
 
 
+class TagMatcher:
+    """
+    Matcher único para todas as tags de um conjunto de substituições
+
+    Compila as tags em uma só expressão regular, de modo que cada texto é
+    percorrido uma única vez independentemente do número de tags. As tags são
+    case-insensitive no dicionário e casam com {TAG} em maiúsculas no documento
+    (em caso de chaves repetidas, a primeira ocorrência vence). Valores
+    inseridos não são reprocessados.
+    """
+
+    def __init__(self, replacements: Dict[str, Any]):
+        self.values: Dict[str, str] = {}
+        for tag, value in replacements.items():
+            self.values.setdefault(tag.upper(), str(value))
+
+        delimiters = TAG_OPEN + TAG_CLOSE
+        generic = (
+            len(TAG_OPEN) == 1 and len(TAG_CLOSE) == 1
+            and not any(char in tag for tag in self.values for char in delimiters)
+        )
+        if generic:
+            # {QUALQUER_COISA} + lookup no dicionário: custo O(1) por ocorrência
+            self.pattern = re.compile(
+                f"{re.escape(TAG_OPEN)}([^{re.escape(delimiters)}]*){re.escape(TAG_CLOSE)}"
+            )
+        else:
+            alternation = '|'.join(re.escape(tag) for tag in sorted(self.values, key=len, reverse=True))
+            self.pattern = re.compile(f"{re.escape(TAG_OPEN)}({alternation}){re.escape(TAG_CLOSE)}")
+
+    def __bool__(self) -> bool:
+        return bool(self.values)
+
+    def sub(self, text: str) -> Tuple[str, int]:
+        """
+        Substitui todas as tags conhecidas no texto em uma única passada
+
+        Args:
+            text: Texto original
+
+        Returns:
+            Tupla (novo_texto, número de substituições)
+        """
+        count = 0
+        values = self.values
+
+        def _replace(match):
+            nonlocal count
+            value = values.get(match.group(1))
+            if value is None:
+                return match.group(0)
+            count += 1
+            return value
+
+        return self.pattern.sub(_replace, text), count
+
+
+class _ReusingPkgWriter:
+    """Writer físico para o PackageWriter do python-docx que reaproveita membros inalterados"""
+
+    def __init__(self, dst: zipfile.ZipFile, src: Optional[zipfile.ZipFile]):
+        self.dst = dst
+        self.src = src
+        self.reused = 0
+
+    def write(self, pack_uri, blob: bytes) -> None:
+        if write_member(self.dst, pack_uri.membername, blob, self.src):
+            self.reused += 1
+
+
 class DocxService:
     """Serviço para manipulação de documentos DOCX"""
 
+    @staticmethod
+    def load_document(doc_bytes: bytes) -> Document:
+        """
+        Valida e abre um documento DOCX a partir dos bytes
+
+        Args:
+            doc_bytes: Bytes do documento DOCX
+
+        Returns:
+            Documento Word (objeto Document)
+
+        Raises:
+            ValueError: Se o documento for inválido
+        """
+        # Valida o formato do documento antes de processar
+        is_valid, error_msg = validate_docx_format(doc_bytes)
+        if not is_valid:
+            logger.error(f"Validação de formato falhou: {error_msg}")
+            raise ValueError(error_msg)
+
+        try:
+            return Document(io.BytesIO(doc_bytes))
+        except Exception as e:
+            logger.error(f"Erro ao abrir documento: {str(e)}")
+            raise ValueError(f"Erro ao processar documento Word: {str(e)}")
+
+    @staticmethod
+    def iter_runs(doc: Document) -> Iterator:
+        """
+        Percorre os runs de todas as áreas onde tags são substituídas
+
+        Áreas: parágrafos, tabelas, cabeçalhos e rodapés (e tabelas neles)
+
+        Args:
+            doc: Documento Word (objeto Document)
+
+        Yields:
+            Runs do documento, na ordem de substituição
+        """
+        def paragraphs_of(container):
+            yield from container.paragraphs
+            for table in container.tables:
+                # Percorre os elementos <w:tc> diretamente: row.cells recalcula a
+                # grade da tabela a cada linha (O(linhas²)) e repete células mescladas
+                for tr in table._tbl.tr_lst:
+                    for tc in tr.tc_lst:
+                        yield from _Cell(tc, table).paragraphs
+
+        for paragraph in paragraphs_of(doc):
+            yield from paragraph.runs
+        for section in doc.sections:
+            for part in (section.header, section.footer):
+                for paragraph in paragraphs_of(part):
+                    yield from paragraph.runs
+
+    @staticmethod
+    def save_document(
+        doc: Document,
+        output: Union[str, BinaryIO],
+        compression: str = 'default',
+        source_bytes: Optional[bytes] = None
+    ) -> int:
+        """
+        Salva o documento com o perfil de compressão escolhido
+
+        Com o perfil 'default' equivale a doc.save(). Nos demais ('stored',
+        'fast'), usados no DOCX intermediário lido só pelo LibreOffice, as
+        partes são gravadas sem compressão (ou deflate nível 1) e as que não
+        mudaram em relação ao DOCX de origem (mídia, fontes...) são copiadas
+        com os bytes comprimidos originais.
+
+        Args:
+            doc: Documento Word (objeto Document)
+            output: Caminho ou arquivo binário de destino
+            compression: Perfil de compressão ('stored', 'fast' ou 'default')
+            source_bytes: Bytes do DOCX de origem, para reaproveitar membros inalterados
+
+        Returns:
+            Número de membros copiados sem recompressão
+        """
+        if compression == 'default':
+            doc.save(output)
+            return 0
+
+        package = doc.part.package
+        for part in package.parts:
+            part.before_marshal()
+
+        method, level = zip_compression(compression)
+        src = zipfile.ZipFile(io.BytesIO(source_bytes)) if source_bytes else None
+        try:
+            with zipfile.ZipFile(output, 'w', compression=method, compresslevel=level) as dst:
+                # Mesma sequência do PackageWriter.write() do python-docx
+                writer = _ReusingPkgWriter(dst, src)
+                PackageWriter._write_content_types_stream(writer, package.parts)
+                PackageWriter._write_pkg_rels(writer, package.rels)
+                PackageWriter._write_parts(writer, package.parts)
+                return writer.reused
+        finally:
+            if src is not None:
+                src.close()
+
+    @staticmethod
+    def append_document(master: Document, doc: Document) -> None:
+        """
+        Acrescenta o corpo de `doc` ao final de `master`, a partir de uma nova página
+
+        Usado para juntar vários preenchimentos do mesmo template em um único
+        DOCX. A última seção de `master` passa a terminar em uma quebra de
+        seção e as seções de `doc` vêm em seguida, com a mesma configuração
+        de página. A quebra fica no último parágrafo de `master` (um parágrafo
+        vazio a mais transbordaria documentos de página cheia, gerando uma
+        página em branco); só quando o corpo termina em tabela ou já em uma
+        quebra de seção é criado um parágrafo para ela. Como os dois
+        documentos vêm do mesmo template, as demais referências do corpo
+        (imagens, estilos, numeração) já existem em `master`; cabeçalhos e
+        rodapés que ficaram diferentes após o preenchimento ganham partes
+        próprias.
+
+        Args:
+            master: Documento que recebe o conteúdo (modificado)
+            doc: Documento preenchido a partir do mesmo template (consumido)
+        """
+        body = master.element.body
+        master_sectPr = body.sectPr
+        body.remove(master_sectPr)
+        last = body[-1] if len(body) else None
+        if last is not None and last.tag == qn('w:p') and last.get_or_add_pPr().sectPr is None:
+            last.get_or_add_pPr()._insert_sectPr(master_sectPr)
+        else:
+            paragraph = OxmlElement('w:p')
+            paragraph_properties = OxmlElement('w:pPr')
+            paragraph_properties.append(master_sectPr)
+            paragraph.append(paragraph_properties)
+            body.append(paragraph)
+
+        doc_body = doc.element.body
+        references = [
+            reference
+            for sectPr in doc_body.iter(qn('w:sectPr'))
+            for reference in sectPr.iterchildren(qn('w:headerReference'), qn('w:footerReference'))
+        ]
+        for child in list(doc_body):
+            if child.tag != qn('w:sectPr'):
+                body.append(child)  # lxml move o elemento (sem cópia)
+        body.append(doc_body.sectPr)
+
+        # Cabeçalhos/rodapés: reaproveita a parte de `master` quando o conteúdo é igual
+        remapped: Dict[str, str] = {}
+        for reference in references:
+            rId = reference.get(qn('r:id'))
+            if rId not in remapped:
+                remapped[rId] = DocxService._merge_header_footer(master, doc, rId, reference.tag)
+            reference.set(qn('r:id'), remapped[rId])
+
+    @staticmethod
+    def _merge_header_footer(master: Document, doc: Document, rId: str, reference_tag: str) -> str:
+        """Retorna o rId, em `master`, da parte com o cabeçalho/rodapé `rId` de `doc`"""
+        part = doc.part.related_parts.get(rId)
+        master_part = master.part.related_parts.get(rId)
+        if part is None or master_part is None:
+            return rId
+        if etree.tostring(part.element) == etree.tostring(master_part.element):
+            return rId
+
+        # Mesmos relacionamentos (imagens do cabeçalho etc.) da parte equivalente de `master`
+        is_header = reference_tag == qn('w:headerReference')
+        package = master.part.package
+        new_part = type(part)(
+            package.next_partname('/word/header%d.xml' if is_header else '/word/footer%d.xml'),
+            part.content_type, part.element, package
+        )
+        for rel in master_part.rels.values():
+            target = rel.target_ref if rel.is_external else rel.target_part
+            new_part.rels.add_relationship(rel.reltype, target, rel.rId, rel.is_external)
+        return master.part.relate_to(new_part, RT.HEADER if is_header else RT.FOOTER)
+
     @staticmethod
     def replace_tags_in_doc(doc_bytes: bytes, replacements: Dict[str, str]) -> Document:
         """
@@ -32,91 +289,50 @@ class DocxService:
         Raises:
             ValueError: Se o documento for inválido ou houver erro no processamento
         """
-        try:
-            logger.info(f"Iniciando substituição de tags no documento")
-            logger.info(f"Tags a substituir: {list(replacements.keys())}")
+        doc = DocxService.load_document(doc_bytes)
+        DocxService.replace_tags_in_document(doc, replacements)
+        return doc
+
+    @staticmethod
+    def replace_tags_in_document(doc: Document, replacements: Dict[str, str]) -> int:
+        """
+        Substitui tags em um documento Word já aberto (modifica o objeto)
+
+        Todas as tags são compiladas em um único TagMatcher e cada run é
+        percorrido uma só vez, em vez de um laço por tag em cada parágrafo.
+
+        Args:
+            doc: Documento Word (objeto Document)
+            replacements: Dicionário com tags e valores {TAG: valor}
 
-            # Valida o formato do documento antes de processar
-            is_valid, error_msg = validate_docx_format(doc_bytes)
-            if not is_valid:
-                logger.error(f"Validação de formato falhou: {error_msg}")
-                raise ValueError(error_msg)
+        Returns:
+            Número de ocorrências substituídas
 
-            # Abre o documento a partir dos bytes
-            doc = Document(io.BytesIO(doc_bytes))
+        Raises:
+            ValueError: Se houver erro no processamento
+        """
+        try:
+            stage_logger.info("Iniciando substituição de tags no documento")
+            if stage_logger.isEnabledFor(logging.DEBUG):
+                stage_logger.debug("Tags a substituir: %s", list(replacements))
 
+            matcher = TagMatcher(replacements)
             tags_replaced_count = 0
 
-            # Função auxiliar para substituir tags em runs
-            def replace_in_runs(runs, tag, value):
-                """Substitui tag em uma lista de runs, preservando formatação"""
-                replaced = False
-                tag_formatted = f"{TAG_OPEN}{tag.upper()}{TAG_CLOSE}"
-                for run in runs:
-                    if tag_formatted in run.text:
-                        run.text = run.text.replace(tag_formatted, str(value))
-                        replaced = True
-                return replaced
-
-            # 1. Substitui tags nos parágrafos principais
-            logger.info("Substituindo tags nos parágrafos...")
-            for paragraph in doc.paragraphs:
-                for tag, value in replacements.items():
-                    if replace_in_runs(paragraph.runs, tag, value):
-                        tags_replaced_count += 1
-
-            # 2. Substitui tags nas tabelas
-            logger.info("Substituindo tags nas tabelas...")
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for paragraph in cell.paragraphs:
-                            for tag, value in replacements.items():
-                                if replace_in_runs(paragraph.runs, tag, value):
-                                    tags_replaced_count += 1
-
-            # 3. Substitui tags nos cabeçalhos (headers)
-            logger.info("Substituindo tags nos cabeçalhos...")
-            for section in doc.sections:
-                # Header principal
-                if section.header:
-                    for paragraph in section.header.paragraphs:
-                        for tag, value in replacements.items():
-                            if replace_in_runs(paragraph.runs, tag, value):
-                                tags_replaced_count += 1
-                                logger.info(f"  ✓ Tag {TAG_OPEN}{tag.upper()}{TAG_CLOSE} substituída no cabeçalho")
-
-                    # Tabelas no header
-                    for table in section.header.tables:
-                        for row in table.rows:
-                            for cell in row.cells:
-                                for paragraph in cell.paragraphs:
-                                    for tag, value in replacements.items():
-                                        if replace_in_runs(paragraph.runs, tag, value):
-                                            tags_replaced_count += 1
-
-            # 4. Substitui tags nos rodapés (footers)
-            logger.info("Substituindo tags nos rodapés...")
-            for section in doc.sections:
-                # Footer principal
-                if section.footer:
-                    for paragraph in section.footer.paragraphs:
-                        for tag, value in replacements.items():
-                            if replace_in_runs(paragraph.runs, tag, value):
-                                tags_replaced_count += 1
-                                logger.info(f"  ✓ Tag {TAG_OPEN}{tag.upper()}{TAG_CLOSE} substituída no rodapé")
-
-                    # Tabelas no footer
-                    for table in section.footer.tables:
-                        for row in table.rows:
-                            for cell in row.cells:
-                                for paragraph in cell.paragraphs:
-                                    for tag, value in replacements.items():
-                                        if replace_in_runs(paragraph.runs, tag, value):
-                                            tags_replaced_count += 1
-
-            logger.info(f"✓ Substituição concluída: {tags_replaced_count} ocorrências substituídas")
-            return doc
+            # Passada única: cada run de parágrafos, tabelas, cabeçalhos e
+            # rodapés é visitado uma vez e todas as tags são substituídas nele
+            if matcher:
+                for run in DocxService.iter_runs(doc):
+                    text = run.text
+                    if TAG_OPEN not in text:
+                        continue
+                    new_text, count = matcher.sub(text)
+                    if count:
+                        run.text = new_text
+                        tags_replaced_count += count
+
+            stage_logger.info("✓ Substituição concluída: %s ocorrências substituídas", tags_replaced_count)
+            return tags_replaced_count
 
         except Exception as e:
             logger.error(f"Erro ao processar documento: {str(e)}")
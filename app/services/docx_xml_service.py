@@ -0,0 +1,472 @@
+"""
+Substituição de tags direto no pacote ZIP do DOCX (engine "xml")
+
+Alternativa ao python-docx para documentos grandes: em vez de montar o
+modelo de objetos completo e re-serializar todas as partes no save(), o DOCX
+é tratado como ZIP. Apenas as partes onde o DocxService substituiria tags
+(documento principal e cabeçalhos/rodapés padrão) são reescritas, com um
+parser expat em streaming e memória limitada; os demais membros (mídia,
+estilos, fontes...) são copiados byte a byte, sem recompressão.
+
+O resultado é equivalente ao da engine "docx": os mesmos runs são visitados
+e reescritos com as mesmas regras do setter Run.text do python-docx.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import posixpath
+import shutil
+import tempfile
+import zipfile
+from typing import Any, BinaryIO, Dict, List, Optional, Set, Tuple, Union
+from xml.etree import ElementTree
+from xml.parsers import expat
+from app.utils.logger import logger, stage_logger
+from app.utils.validators import validate_docx_format
+from app.utils.zip_utils import copy_member_raw, zip_compression
+from app.services.docx_service import TagMatcher
+from config.settings import TAG_OPEN, XML_ENGINE_CHUNK_SIZE, XML_ENGINE_SPOOL_MAX_BYTES
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+RT_OFFICE_DOCUMENT = R_NS + '/officeDocument'
+RT_HEADER = R_NS + '/header'
+RT_FOOTER = R_NS + '/footer'
+
+# Caminhos (nomes locais no namespace W) dos runs visitados pelo DocxService.iter_runs:
+# parágrafos e células de tabelas de primeiro nível do corpo e dos cabeçalhos/rodapés
+DOCUMENT_RUN_PATHS = {
+    ('document', 'body', 'p', 'r'),
+    ('document', 'body', 'tbl', 'tr', 'tc', 'p', 'r'),
+}
+HEADER_FOOTER_RUN_PATHS = {
+    (root, *path)
+    for root in ('hdr', 'ftr')
+    for path in (('p', 'r'), ('tbl', 'tr', 'tc', 'p', 'r'))
+}
+
+# Texto equivalente de cada elemento de conteúdo do run (como em CT_R.text)
+_RUN_CHILD_TEXT = {'tab': '\t', 'ptab': '\t', 'cr': '\n', 'noBreakHyphen': '-'}
+_BR_TEXT_TYPES = (None, 'textWrapping')
+
+_OUTPUT_FLUSH_SIZE = 64 * 1024
+
+
+def _escape_text(text: str) -> str:
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\r', '&#13;')
+
+
+def _escape_attr(value: str) -> str:
+    return (
+        _escape_text(value)
+        .replace('"', '&quot;')
+        .replace('\n', '&#10;')
+        .replace('\t', '&#9;')
+    )
+
+
+class _RawMarkup:
+    """Comentário ou instrução de processamento dentro de um run alvo"""
+    __slots__ = ('markup',)
+
+    def __init__(self, markup: str):
+        self.markup = markup
+
+
+class _RunElement:
+    """Elemento bufferizado de um run alvo (nome qualificado, atributos e filhos)"""
+    __slots__ = ('name', 'local', 'attrs', 'children')
+
+    def __init__(self, name: str, local: Optional[str], attrs: List[str]):
+        self.name = name
+        self.local = local  # Nome local se estiver no namespace W, senão None
+        self.attrs = attrs
+        self.children: List[Union["_RunElement", _RawMarkup, str]] = []
+
+
+class _PartRewriter:
+    """
+    Reescreve uma parte XML em streaming, substituindo tags nos runs alvo
+
+    Eventos fora dos runs alvo são re-emitidos imediatamente; apenas o
+    conteúdo de um <w:r> alvo (tipicamente poucos elementos) fica em memória
+    até o fechamento do run.
+    """
+
+    def __init__(self, out: BinaryIO, matcher: TagMatcher, run_paths: Set[Tuple[str, ...]]):
+        self.out = out
+        self.matcher = matcher
+        self.run_paths = run_paths
+        self.replaced = 0
+        self.default_references: List[str] = []  # r:id de cabeçalhos/rodapés padrão
+
+        self._w_prefix: Optional[str] = None
+        self._r_prefix: Optional[str] = None
+        self._path: List[Optional[str]] = []
+        self._run_stack: Optional[List[_RunElement]] = None
+        self._pending_start = False
+        self._buffer: List[str] = []
+        self._buffered = 0
+
+        parser = expat.ParserCreate()
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+        parser.XmlDeclHandler = self._xml_decl
+        parser.StartElementHandler = self._start
+        parser.EndElementHandler = self._end
+        parser.CharacterDataHandler = self._characters
+        parser.CommentHandler = lambda data: self._raw(f"<!--{data}-->")
+        parser.ProcessingInstructionHandler = lambda target, data: self._raw(f"<?{target} {data}?>")
+        self._parser = parser
+
+    # -- Saída -----------------------------------------------------------------
+
+    def _write(self, text: str) -> None:
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= _OUTPUT_FLUSH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self.out.write(''.join(self._buffer).encode('utf-8'))
+            self._buffer = []
+            self._buffered = 0
+
+    def _close_pending_start(self) -> None:
+        if self._pending_start:
+            self._write('>')
+            self._pending_start = False
+
+    def _raw(self, text: str) -> None:
+        if self._run_stack is not None:
+            self._run_stack[-1].children.append(_RawMarkup(text))
+            return
+        self._close_pending_start()
+        self._write(text)
+
+    @staticmethod
+    def _start_tag(name: str, attrs: List[str]) -> str:
+        parts = [f"<{name}"]
+        for i in range(0, len(attrs), 2):
+            parts.append(f' {attrs[i]}="{_escape_attr(attrs[i + 1])}"')
+        return ''.join(parts)
+
+    # -- Handlers do expat -----------------------------------------------------
+
+    def _xml_decl(self, version, encoding, standalone) -> None:
+        # A saída é sempre UTF-8, independentemente da codificação de origem
+        decl = f'<?xml version="{version or "1.0"}" encoding="UTF-8"'
+        if standalone != -1:
+            decl += f' standalone="{"yes" if standalone else "no"}"'
+        self._write(decl + '?>\r\n')
+
+    def _local_name(self, name: str) -> Optional[str]:
+        if self._w_prefix is None:
+            return None
+        prefix, _, local = name.rpartition(':')
+        return local if prefix == self._w_prefix else None
+
+    def _start(self, name: str, attrs: List[str]) -> None:
+        if not self._path:
+            # Elemento raiz: descobre os prefixos usados para os namespaces W e R
+            for i in range(0, len(attrs), 2):
+                key, value = attrs[i], attrs[i + 1]
+                if key == 'xmlns' or key.startswith('xmlns:'):
+                    prefix = key[6:]
+                    if value == W_NS:
+                        self._w_prefix = prefix
+                    elif value == R_NS:
+                        self._r_prefix = prefix
+
+        local = self._local_name(name)
+        self._path.append(local)
+
+        if self._run_stack is not None:
+            element = _RunElement(name, local, attrs)
+            self._run_stack[-1].children.append(element)
+            self._run_stack.append(element)
+            return
+
+        if local == 'r' and tuple(self._path) in self.run_paths:
+            self._close_pending_start()
+            self._run_stack = [_RunElement(name, local, attrs)]
+            return
+
+        if local in ('headerReference', 'footerReference'):
+            self._collect_reference(attrs)
+
+        self._close_pending_start()
+        self._write(self._start_tag(name, attrs))
+        self._pending_start = True
+
+    def _end(self, name: str) -> None:
+        self._path.pop()
+
+        if self._run_stack is not None:
+            element = self._run_stack.pop()
+            if not self._run_stack:
+                self._run_stack = None
+                self._emit_run(element)
+            return
+
+        if self._pending_start:
+            self._write('/>')
+            self._pending_start = False
+        else:
+            self._write(f"</{name}>")
+
+    def _characters(self, data: str) -> None:
+        if self._run_stack is not None:
+            self._run_stack[-1].children.append(data)
+            return
+        self._close_pending_start()
+        self._write(_escape_text(data))
+
+    def _collect_reference(self, attrs: List[str]) -> None:
+        """Registra o r:id de <w:headerReference>/<w:footerReference> do tipo padrão"""
+        values = dict(zip(attrs[::2], attrs[1::2]))
+        w_type = values.get(f"{self._w_prefix}:type" if self._w_prefix else 'type')
+        r_id = values.get(f"{self._r_prefix}:id") if self._r_prefix else None
+        if w_type == 'default' and r_id:
+            self.default_references.append(r_id)
+
+    # -- Runs ------------------------------------------------------------------
+
+    def _run_text(self, run: _RunElement) -> str:
+        """Texto do run, calculado como CT_R.text do python-docx"""
+        parts = []
+        for child in run.children:
+            if not isinstance(child, _RunElement) or child.local is None:
+                continue
+            if child.local == 't':
+                parts.append(''.join(c for c in child.children if isinstance(c, str)))
+            elif child.local == 'br':
+                br_type = self._attr(child, 'type')
+                parts.append('\n' if br_type in _BR_TEXT_TYPES else '')
+            elif child.local in _RUN_CHILD_TEXT:
+                parts.append(_RUN_CHILD_TEXT[child.local])
+        return ''.join(parts)
+
+    def _attr(self, element: _RunElement, local: str) -> Optional[str]:
+        name = f"{self._w_prefix}:{local}" if self._w_prefix else local
+        for i in range(0, len(element.attrs), 2):
+            if element.attrs[i] == name:
+                return element.attrs[i + 1]
+        return None
+
+    def _emit_run(self, run: _RunElement) -> None:
+        text = self._run_text(run)
+        if TAG_OPEN in text:
+            new_text, count = self.matcher.sub(text)
+            if count:
+                self.replaced += count
+                self._emit_replaced_run(run, new_text)
+                return
+        self._emit_element(run)
+
+    def _emit_element(self, element: _RunElement) -> None:
+        self._write(self._start_tag(element.name, element.attrs))
+        if not element.children:
+            self._write('/>')
+            return
+        self._write('>')
+        for child in element.children:
+            if isinstance(child, _RunElement):
+                self._emit_element(child)
+            elif isinstance(child, _RawMarkup):
+                self._write(child.markup)
+            else:
+                self._write(_escape_text(child))
+        self._write(f"</{element.name}>")
+
+    def _emit_replaced_run(self, run: _RunElement, text: str) -> None:
+        """
+        Emite o run com o novo texto, como o setter Run.text do python-docx
+
+        Mantém apenas <w:rPr>; tabulações viram <w:tab/>, quebras de linha
+        viram <w:br/> e os demais caracteres são agrupados em <w:t>.
+        """
+        prefix = f"{self._w_prefix}:" if self._w_prefix else ''
+        self._write(self._start_tag(run.name, run.attrs) + '>')
+        for child in run.children:
+            if isinstance(child, _RunElement) and child.local == 'rPr':
+                self._emit_element(child)
+
+        pending: List[str] = []
+
+        def flush_text():
+            if pending:
+                chunk = ''.join(pending)
+                space = ' xml:space="preserve"' if len(chunk.strip()) < len(chunk) else ''
+                self._write(f"<{prefix}t{space}>{_escape_text(chunk)}</{prefix}t>")
+                pending.clear()
+
+        for char in text:
+            if char == '\t':
+                flush_text()
+                self._write(f"<{prefix}tab/>")
+            elif char in '\r\n':
+                flush_text()
+                self._write(f"<{prefix}br/>")
+            else:
+                pending.append(char)
+        flush_text()
+        self._write(f"</{run.name}>")
+
+    # -- Execução --------------------------------------------------------------
+
+    def feed(self, source: BinaryIO, chunk_size: int) -> None:
+        """Processa a parte inteira lendo blocos de `chunk_size` bytes"""
+        while True:
+            chunk = source.read(chunk_size)
+            self._parser.Parse(chunk, not chunk)
+            if not chunk:
+                break
+        self._flush()
+
+
+class DocxXmlService:
+    """Serviço de substituição de tags no nível do ZIP/XML (sem python-docx)"""
+
+    @staticmethod
+    def _relationships(src: zipfile.ZipFile, rels_name: str) -> List[Tuple[str, str, str]]:
+        """Lê um arquivo .rels e retorna (id, tipo, alvo) de cada relacionamento interno"""
+        try:
+            root = ElementTree.fromstring(src.read(rels_name))
+        except KeyError:
+            return []
+        return [
+            (rel.get('Id'), rel.get('Type'), rel.get('Target'))
+            for rel in root.iter(f"{{{PKG_RELS_NS}}}Relationship")
+            if rel.get('TargetMode') != 'External'
+        ]
+
+    @staticmethod
+    def _resolve(base_dir: str, target: str) -> str:
+        """Converte o alvo de um relacionamento em nome de membro do ZIP"""
+        if target.startswith('/'):
+            return posixpath.normpath(target[1:])
+        return posixpath.normpath(posixpath.join(base_dir, target))
+
+    @staticmethod
+    def _rewrite_part(
+        src: zipfile.ZipFile,
+        dst: zipfile.ZipFile,
+        info: zipfile.ZipInfo,
+        matcher: TagMatcher,
+        run_paths: Set[Tuple[str, ...]]
+    ) -> _PartRewriter:
+        """
+        Reescreve uma parte XML; se nenhuma tag for substituída, copia o original
+
+        A parte reescrita é montada em um arquivo temporário (em memória até
+        XML_ENGINE_SPOOL_MAX_BYTES) para que partes sem substituições sejam
+        copiadas com os bytes comprimidos originais.
+        """
+        with tempfile.SpooledTemporaryFile(max_size=XML_ENGINE_SPOOL_MAX_BYTES) as spool:
+            rewriter = _PartRewriter(spool, matcher, run_paths)
+            with src.open(info) as source:
+                rewriter.feed(source, XML_ENGINE_CHUNK_SIZE)
+
+            if not rewriter.replaced:
+                copy_member_raw(src, dst, info)
+                return rewriter
+
+            # Grava com a compressão padrão do destino (perfil escolhido)
+            spool.seek(0)
+            with dst.open(info.filename, 'w') as target:
+                shutil.copyfileobj(spool, target, XML_ENGINE_CHUNK_SIZE)
+        return rewriter
+
+    @staticmethod
+    def replace_tags(
+        doc_bytes: bytes,
+        replacements: Dict[str, Any],
+        output: Union[str, BinaryIO],
+        compression: str = 'default'
+    ) -> int:
+        """
+        Substitui as tags e grava o DOCX resultante, sem python-docx
+
+        Args:
+            doc_bytes: Bytes do documento DOCX
+            replacements: Dicionário com tags e valores {TAG: valor}
+            output: Caminho ou arquivo binário onde gravar o DOCX
+            compression: Perfil de compressão das partes reescritas
+                ('stored', 'fast' ou 'default'); as demais mantêm os bytes originais
+
+        Returns:
+            Número de ocorrências substituídas
+
+        Raises:
+            ValueError: Se o documento for inválido ou houver erro no processamento
+        """
+        is_valid, error_msg = validate_docx_format(doc_bytes)
+        if not is_valid:
+            logger.error(f"Validação de formato falhou: {error_msg}")
+            raise ValueError(error_msg)
+
+        try:
+            matcher = TagMatcher(replacements)
+            with zipfile.ZipFile(io.BytesIO(doc_bytes)) as src:
+                main_part = next(
+                    (DocxXmlService._resolve('', target)
+                     for _, rel_type, target in DocxXmlService._relationships(src, '_rels/.rels')
+                     if rel_type == RT_OFFICE_DOCUMENT),
+                    None
+                )
+                if main_part is None or main_part not in src.NameToInfo:
+                    raise ValueError("Documento principal não encontrado no pacote DOCX")
+
+                main_dir, main_file = posixpath.split(main_part)
+                header_footer_parts = {
+                    r_id: DocxXmlService._resolve(main_dir, target)
+                    for r_id, rel_type, target in DocxXmlService._relationships(
+                        src, posixpath.join(main_dir, '_rels', f"{main_file}.rels"))
+                    if rel_type in (RT_HEADER, RT_FOOTER)
+                }
+
+                replaced = 0
+                default_parts: Optional[Set[str]] = None
+                deferred: List[zipfile.ZipInfo] = []
+
+                method, level = zip_compression(compression)
+                with zipfile.ZipFile(output, 'w', compression=method, compresslevel=level) as dst:
+                    def process(info: zipfile.ZipInfo) -> int:
+                        if info.filename in default_parts:
+                            return DocxXmlService._rewrite_part(
+                                src, dst, info, matcher, HEADER_FOOTER_RUN_PATHS).replaced
+                        copy_member_raw(src, dst, info)
+                        return 0
+
+                    for info in src.infolist():
+                        if info.filename == main_part and matcher:
+                            rewriter = DocxXmlService._rewrite_part(
+                                src, dst, info, matcher, DOCUMENT_RUN_PATHS)
+                            replaced += rewriter.replaced
+                            # Só cabeçalhos/rodapés padrão são visitados pelo DocxService
+                            default_parts = {
+                                header_footer_parts[r_id]
+                                for r_id in rewriter.default_references
+                                if r_id in header_footer_parts
+                            }
+                            for deferred_info in deferred:
+                                replaced += process(deferred_info)
+                        elif info.filename in header_footer_parts.values() and matcher:
+                            if default_parts is None:
+                                deferred.append(info)  # Aguarda o documento principal
+                            else:
+                                replaced += process(info)
+                        else:
+                            copy_member_raw(src, dst, info)
+
+            stage_logger.info("✓ Substituição (engine xml) concluída: %s ocorrências substituídas", replaced)
+            return replaced
+
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao processar documento: {str(e)}")
+            raise ValueError(f"Erro ao processar documento Word: {str(e)}")
@@ -0,0 +1,545 @@
+"""
+Jobs assíncronos de renderização
+
+A requisição HTTP apenas enfileira o job e retorna seu id; a conversão roda
+em threads de background (fila limitada) e o resultado fica em disco até ser
+baixado ou expirar. O documento de entrada também aguarda a vez em disco, e
+não na memória do worker. Opcionalmente, o cliente é notificado por um
+callback HTTP ao final. O estado de cada job é gravado em JOB_STORE_DIR, compartilhado
+pelos workers gunicorn: qualquer worker responde a consultas, downloads e
+remoções, enquanto a execução fica no worker que recebeu o job.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import http.client
+import json
+import os
+import queue
+import re
+import socket
+import threading
+import time
+import urllib.request
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+from app.utils.logger import logger
+from app.utils.metrics import job_queue_depth, jobs_running, pid_alive
+from app.utils.tracing import span, current_span
+from app.utils.validators import resolve_callback_url
+from app.services.admission import background_work, priority_lane, get_conversion_limiter
+from app.services.pdf_service import PdfService
+from config.settings import (
+    JOB_WORKERS,
+    JOB_QUEUE_MAX_SIZE,
+    JOB_STORE_DIR,
+    JOB_RESULT_TTL,
+    JOB_CALLBACK_TIMEOUT,
+    JOB_CALLBACK_RETRIES,
+    JOB_CALLBACK_WORKERS,
+    BULK_LANE,
+    ERROR_MESSAGES
+)
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Campos do estado gravado em disco (<job_id>.json)
+JOB_STATE_FIELDS = (
+    'job_id', 'status', 'priority', 'created_at', 'started_at', 'finished_at', 'result_url', 'size',
+    'error', 'stats', 'callback_status', 'callback_url', 'mimetype', 'filename', 'result_path', 'owner'
+)
+
+# Tarefa executada pelo worker: recebe o documento de entrada (None se o job
+# não tiver um) e retorna (conteúdo do resultado, stats)
+JobTask = Callable[[Optional[bytes]], Tuple[bytes, Dict[str, Any]]]
+
+
+class _RefuseRedirect(urllib.request.HTTPRedirectHandler):
+    """Não segue redirecionamentos: o destino final escaparia da validação do callback_url"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def _pinned_connection(connection_class, address: str):
+    """Conexão que vai sempre para `address`, mantendo o host da URL no header Host e no SNI"""
+
+    class PinnedConnection(connection_class):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._create_connection = (
+                lambda target, *rest: socket.create_connection((address, target[1]), *rest)
+            )
+
+    return PinnedConnection
+
+
+class _PinnedHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, address: str):
+        super().__init__()
+        self.address = address
+
+    def http_open(self, req):
+        return self.do_open(_pinned_connection(http.client.HTTPConnection, self.address), req)
+
+
+class _PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, address: str):
+        super().__init__()
+        self.address = address
+
+    def https_open(self, req):
+        return self.do_open(_pinned_connection(http.client.HTTPSConnection, self.address), req,
+                            context=self._context)
+
+
+def _callback_opener(address: str) -> urllib.request.OpenerDirector:
+    """
+    Opener do callback preso ao endereço validado (sem proxy nem redirecionamentos)
+
+    O urllib resolveria o host de novo na conexão, e o DNS poderia apontar
+    para um endereço interno depois da validação (DNS rebinding).
+    """
+    return urllib.request.build_opener(
+        urllib.request.ProxyHandler({}), _RefuseRedirect,
+        _PinnedHTTPHandler(address), _PinnedHTTPSHandler(address)
+    )
+
+
+class UnknownJobError(Exception):
+    """Job inexistente ou expirado"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        super().__init__(ERROR_MESSAGES['unknown_job'])
+
+
+class JobQueueFullError(Exception):
+    """Fila de jobs cheia (o cliente deve tentar novamente após retry_after segundos)"""
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(ERROR_MESSAGES['job_queue_full'])
+
+
+class Job:
+    """Um job de renderização e seu estado (queued, running, done, failed, cancelled)"""
+
+    def __init__(
+        self,
+        task: JobTask,
+        mimetype: str,
+        filename: str,
+        callback_url: Optional[str] = None,
+        result_url: Optional[str] = None,
+        priority: str = BULK_LANE,
+        document: Optional[bytes] = None
+    ):
+        self.job_id = uuid.uuid4().hex
+        self.task: Optional[JobTask] = task
+        self.document = document  # Entrada da tarefa, até o submit gravá-la em disco
+        self.input_path: Optional[str] = None
+        self.mimetype = mimetype
+        self.filename = filename
+        self.callback_url = callback_url
+        self.result_url = result_url
+        self.priority = priority
+        self.trace_parent = current_span()  # Span da requisição que criou o job
+        self.status = 'queued'
+        self.error: Optional[str] = None
+        self.stats: Optional[Dict[str, Any]] = None
+        self.size: Optional[int] = None
+        self.result_path: Optional[str] = None
+        self.callback_status: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.owner = os.getpid()  # Worker que executa o job
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def info(self) -> Dict[str, Any]:
+        """Estado do job para as respostas da API e para o callback"""
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'priority': self.priority,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'result_url': self.result_url if self.status == 'done' else None,
+            'size': self.size,
+            'error': self.error,
+            'stats': self.stats,
+            'callback_status': self.callback_status,
+        }
+
+    def state(self) -> Dict[str, Any]:
+        """Estado persistido em disco, lido por qualquer worker"""
+        return {name: getattr(self, name) for name in JOB_STATE_FIELDS}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "Job":
+        """Recria o job a partir do estado em disco (sem a tarefa)"""
+        job = cls(None, state['mimetype'], state['filename'])
+        for name in JOB_STATE_FIELDS:
+            setattr(job, name, state.get(name))
+        return job
+
+
+class JobManager:
+    """
+    Fila limitada de jobs processada por threads de background
+
+    A fila e as tarefas ficam no processo que recebeu o job; o estado fica em
+    `<store_dir>/<job_id>.json` e o resultado em `<store_dir>/<job_id>`, de
+    modo que consultas, downloads e remoções funcionam em qualquer worker. O
+    documento de entrada aguarda na fila em `<store_dir>/<job_id>.input`: a
+    memória de um worker com a fila cheia não cresce com JOB_QUEUE_MAX_SIZE x
+    MAX_FILE_SIZE.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_queue: int = JOB_QUEUE_MAX_SIZE,
+        store_dir: str = JOB_STORE_DIR,
+        ttl: int = JOB_RESULT_TTL
+    ):
+        self.workers = max(1, workers)
+        self.store_dir = store_dir
+        self.ttl = ttl
+        self._queue: "queue.Queue[Job]" = queue.Queue(maxsize=max(1, max_queue))
+        # Callbacks entregues por threads próprias: um endpoint lento não segura os workers de conversão
+        self._callbacks: "queue.Queue[Job]" = queue.Queue()
+        self._jobs: Dict[str, Job] = {}  # Jobs deste processo ainda não finalizados
+        self._lock = threading.Lock()
+        self._running = 0
+        self._threads = []
+        os.makedirs(store_dir, exist_ok=True)
+        # O diretório é compartilhado com os demais workers: remove só o que expirou
+        self._purge_expired()
+
+    def start(self) -> None:
+        """Inicia as threads de background"""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        for i in range(max(1, JOB_CALLBACK_WORKERS)):
+            thread = threading.Thread(target=self._callback_loop, name=f'job-callback-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"✓ Fila de jobs iniciada com {self.workers} workers (máximo {self._queue.maxsize} na fila)")
+
+    def submit(self, job: Job) -> Job:
+        """
+        Enfileira um job
+
+        Args:
+            job: Job recém-criado
+
+        Returns:
+            O próprio job (status 'queued')
+
+        Raises:
+            JobQueueFullError: Se a fila estiver cheia
+        """
+        self._purge_expired()
+        if job.document is not None:
+            job.input_path = self._input_path(job.job_id)
+            with open(job.input_path, 'wb') as f:
+                f.write(job.document)
+            job.document = None
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._save(job, create=True)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+            self._remove_state(job.job_id)
+            self._remove_input(job.job_id)
+            logger.warning(f"⚠ Fila de jobs cheia ({self._queue.maxsize}), job recusado")
+            raise JobQueueFullError(get_conversion_limiter().retry_after(self._queue.qsize() + self._running))
+        logger.info(f"Job {job.job_id[:12]} enfileirado ({self._queue.qsize()} na fila)")
+        return job
+
+    def _state_path(self, job_id: str) -> str:
+        return os.path.join(self.store_dir, f"{job_id}.json")
+
+    def _input_path(self, job_id: str) -> str:
+        return os.path.join(self.store_dir, f"{job_id}.input")
+
+    def _save(self, job: Job, create: bool = False) -> bool:
+        """
+        Grava o estado do job em disco (escrita atômica)
+
+        Args:
+            job: Job a gravar
+            create: Se False, só grava se o job ainda existir em disco
+
+        Returns:
+            False se o job foi removido (por este ou outro worker)
+        """
+        path = self._state_path(job.job_id)
+        if not create and not os.path.exists(path):
+            return False
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job.state(), f, default=str)
+        os.replace(tmp_path, path)
+        return True
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        """Lê o estado do job do disco; jobs de um worker encerrado são dados como falhos"""
+        # Consultado antes da leitura: um job deste processo só sai de _jobs depois
+        # de gravar o estado final, que então é o lido a seguir
+        with self._lock:
+            local = job_id in self._jobs
+        try:
+            with open(self._state_path(job_id), encoding='utf-8') as f:
+                job = Job.from_state(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+        if not job.finished and not local and (job.owner == os.getpid() or not pid_alive(job.owner)):
+            # A fila e a tarefa viviam no processo encerrado: o job nunca terminará
+            job.status = 'failed'
+            job.error = ERROR_MESSAGES['job_orphaned']
+            job.finished_at = time.time()
+            self._save(job)
+            self._remove_input(job_id)
+            logger.warning(f"⚠ Job {job_id[:12]} interrompido: worker {job.owner} encerrado")
+        return job
+
+    def _remove_state(self, job_id: str) -> bool:
+        try:
+            os.remove(self._state_path(job_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _read_input(job: Job) -> Optional[bytes]:
+        """Documento de entrada gravado pelo submit (None se o job não tiver um)"""
+        if job.input_path is None:
+            return None
+        with open(job.input_path, 'rb') as f:
+            return f.read()
+
+    def _remove_input(self, job_id: str) -> None:
+        try:
+            os.remove(self._input_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def get(self, job_id: str) -> Job:
+        """
+        Busca um job pelo id (de qualquer worker)
+
+        Raises:
+            UnknownJobError: Se o job não existe ou expirou
+        """
+        if not isinstance(job_id, str) or not JOB_ID_PATTERN.match(job_id):
+            raise UnknownJobError(job_id)
+        self._purge_expired()
+        job = self._load(job_id)
+        if job is None:
+            raise UnknownJobError(job_id)
+        return job
+
+    def delete(self, job_id: str) -> Job:
+        """
+        Remove um job e seu resultado; jobs ainda na fila são cancelados
+
+        O worker dono do job percebe a remoção pelo estado em disco: não
+        executa o job se ainda estiver na fila e descarta o resultado se
+        estiver rodando.
+
+        Raises:
+            UnknownJobError: Se o job não existe ou expirou
+        """
+        job = self.get(job_id)
+        if not self._remove_state(job_id):
+            raise UnknownJobError(job_id)
+        with self._lock:
+            local = self._jobs.get(job_id)
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            if local is not None:
+                local.status = 'cancelled'
+                local.task = None
+        self._remove_input(job_id)
+        self._remove_result(job)
+        return job
+
+    def _worker_loop(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                # Removido por este ou outro worker enquanto aguardava na fila
+                if job.status == 'cancelled' or not os.path.exists(self._state_path(job.job_id)):
+                    self._remove_input(job.job_id)
+                    continue
+                self._run(job)
+                if job.callback_url:
+                    self._callbacks.put(job)
+            except Exception as e:
+                logger.error(f"Erro inesperado no job {job.job_id[:12]}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._jobs.pop(job.job_id, None)
+                self._queue.task_done()
+
+    def _callback_loop(self) -> None:
+        while True:
+            job = self._callbacks.get()
+            try:
+                self._notify(job)
+            except Exception as e:
+                logger.error(f"Erro inesperado no callback do job {job.job_id[:12]}: {str(e)}")
+            finally:
+                self._callbacks.task_done()
+
+    def _run(self, job: Job) -> None:
+        """Executa a tarefa do job e grava o resultado em disco"""
+        job.status = 'running'
+        job.started_at = time.time()
+        self._save(job)
+        with self._lock:
+            self._running += 1
+        try:
+            # A fila de jobs já é limitada: espera por um slot de conversão sem ser recusado
+            with background_work(), priority_lane(job.priority), \
+                    span('job.run', job.trace_parent, **{'job.id': job.job_id, 'priority': job.priority}):
+                content, stats = job.task(self._read_input(job))
+            path = os.path.join(self.store_dir, job.job_id)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            job.result_path = path
+            job.size = len(content)
+            job.stats = stats
+            job.status = 'done'
+            logger.info(f"✓ Job {job.job_id[:12]} concluído ({job.size} bytes) em {time.time() - job.started_at:.3f}s")
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+            logger.error(f"❌ Job {job.job_id[:12]} falhou: {str(e)}")
+        finally:
+            job.task = None  # Libera o template e os replacements
+            self._remove_input(job.job_id)
+            job.finished_at = time.time()
+            with self._lock:
+                self._running -= 1
+            # Removido enquanto rodava (por qualquer worker): descarta o resultado
+            if not self._save(job):
+                self._remove_result(job)
+
+    def _notify(self, job: Job) -> None:
+        """Envia o estado final do job ao callback_url, com novas tentativas"""
+        if not job.callback_url:
+            return
+        # Validado de novo na entrega: o DNS do host pode ter mudado desde a criação do job.
+        # A conexão usa o endereço validado, sem resolver o host outra vez
+        address, error_msg = resolve_callback_url(job.callback_url)
+        if address is None:
+            logger.warning(f"⚠ Callback do job {job.job_id[:12]} não enviado: {error_msg}")
+            job.callback_status = 'failed'
+            self._save(job)
+            return
+        payload = json.dumps(job.info()).encode('utf-8')
+        opener = _callback_opener(address)
+        for attempt in range(1, JOB_CALLBACK_RETRIES + 1):
+            try:
+                callback = urllib.request.Request(
+                    job.callback_url, data=payload, method='POST',
+                    headers={'Content-Type': 'application/json', 'X-Job-Id': job.job_id}
+                )
+                with opener.open(callback, timeout=JOB_CALLBACK_TIMEOUT) as response:
+                    response.read()
+                job.callback_status = 'delivered'
+                self._save(job)
+                logger.info(f"✓ Callback do job {job.job_id[:12]} entregue")
+                return
+            except Exception as e:
+                logger.warning(f"⚠ Callback do job {job.job_id[:12]} falhou (tentativa {attempt}): {str(e)}")
+                if attempt < JOB_CALLBACK_RETRIES:
+                    time.sleep(2 ** (attempt - 1))
+        job.callback_status = 'failed'
+        self._save(job)
+
+    def _remove_result(self, job: Job) -> None:
+        if job.result_path:
+            try:
+                os.remove(job.result_path)
+            except FileNotFoundError:
+                pass
+            job.result_path = None
+
+    def _purge_expired(self) -> None:
+        """Remove jobs finalizados há mais de `ttl` segundos (de todos os workers) e seus resultados"""
+        limit = time.time() - self.ttl
+        for entry in os.scandir(self.store_dir):
+            try:
+                if entry.stat().st_mtime >= limit:
+                    continue
+                name = entry.name
+                if name.endswith('.json'):
+                    job = self._load(name[:-len('.json')])
+                    if job is not None and job.finished and job.finished_at < limit:
+                        self._remove_state(job.job_id)
+                        self._remove_result(job)
+                elif name.endswith('.tmp'):
+                    os.remove(entry.path)  # Escrita interrompida
+                else:
+                    job_id = name[:-len('.input')] if name.endswith('.input') else name
+                    if JOB_ID_PATTERN.match(job_id) and not os.path.exists(self._state_path(job_id)):
+                        os.remove(entry.path)  # Resultado ou entrada sem estado
+            except FileNotFoundError:
+                pass  # Removido em paralelo por outro worker
+
+    def status(self) -> Dict[str, Any]:
+        """Retorna o estado atual da fila (para health check)"""
+        return {
+            'workers': self.workers,
+            'queued': self._queue.qsize(),
+            'running': self._running,
+            'max_queue': self._queue.maxsize,
+            'callbacks_pending': self._callbacks.qsize(),
+            'jobs': sum(name.endswith('.json') for name in os.listdir(self.store_dir)),
+        }
+
+
+_job_manager: Optional[JobManager] = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Retorna a fila global de jobs, iniciando-a na primeira chamada"""
+    global _job_manager
+
+    with _job_manager_lock:
+        if _job_manager is None:
+            manager = JobManager(JOB_WORKERS if JOB_WORKERS > 0 else PdfService.conversion_capacity())
+            manager.start()
+            _job_manager = manager
+        return _job_manager
+
+
+def _after_fork() -> None:
+    # As threads da fila não sobrevivem ao fork (gunicorn --preload): o worker cria a sua no primeiro uso
+    global _job_manager, _job_manager_lock
+    _job_manager = None
+    _job_manager_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+job_queue_depth.set_function(lambda: _job_manager.status()['queued'] if _job_manager is not None else 0)
+jobs_running.set_function(lambda: _job_manager.status()['running'] if _job_manager is not None else 0)
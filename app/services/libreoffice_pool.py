@@ -0,0 +1,456 @@
+"""
+Pool de instâncias LibreOffice residentes (warm workers)
+
+Cada worker é um processo soffice headless de longa duração, com perfil de
+usuário próprio, que aceita conversões via UNO por um pipe nomeado. Assim o
+custo por requisição é apenas a renderização, sem o cold start do LibreOffice.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from app.utils.logger import logger, stage_logger
+from app.utils.metrics import libreoffice_timeouts, pid_alive
+from app.utils.tracing import span
+from config.settings import (
+    LIBREOFFICE_COMMAND,
+    LIBREOFFICE_OPTIONS,
+    LIBREOFFICE_POOL_ENABLED,
+    LIBREOFFICE_POOL_SIZE,
+    LIBREOFFICE_POOL_DIR,
+    LIBREOFFICE_POOL_STARTUP_TIMEOUT,
+    LIBREOFFICE_POOL_ACQUIRE_TIMEOUT,
+    LIBREOFFICE_POOL_HEALTH_INTERVAL,
+    LIBREOFFICE_POOL_MAX_CONVERSIONS,
+    ERROR_MESSAGES
+)
+
+# O módulo `uno` só existe quando o pacote python3-uno está instalado
+try:
+    import uno
+    import unohelper
+    from com.sun.star.io import XOutputStream
+except ImportError:  # pragma: no cover - depende do ambiente
+    uno = None
+
+
+class PoolUnavailableError(Exception):
+    """Pool indisponível: a conversão deve usar o caminho --convert-to"""
+
+
+if uno is not None:
+    class _BytesOutputStream(unohelper.Base, XOutputStream):
+        """XOutputStream UNO que acumula em memória os bytes exportados pelo soffice"""
+
+        def __init__(self):
+            self.buffer = io.BytesIO()
+
+        def writeBytes(self, data) -> None:
+            self.buffer.write(data.value)
+
+        def flush(self) -> None:
+            pass
+
+        def closeOutput(self) -> None:
+            pass
+
+
+class LibreOfficeWorker:
+    """Processo soffice residente acessado via UNO"""
+
+    def __init__(self, worker_id: int, base_dir: str):
+        self.worker_id = worker_id
+        self.pipe_name = f"doc2pdf_worker_{os.getpid()}_{worker_id}"
+        self.profile_dir = os.path.join(base_dir, f"worker_{worker_id}")
+        self.process: Optional[subprocess.Popen] = None
+        self.context = None
+        self.desktop = None
+        self.conversions = 0
+        self.restarts = 0
+        self.started_at = 0.0
+
+    def start(self) -> None:
+        """Inicia o processo soffice escutando no pipe UNO do worker"""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        cmd = [LIBREOFFICE_COMMAND] + LIBREOFFICE_OPTIONS + [
+            f"-env:UserInstallation=file://{self.profile_dir}",
+            f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext",
+        ]
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env={**os.environ, 'HOME': self.profile_dir}
+        )
+        self.context = None
+        self.desktop = None
+        self.conversions = 0
+        self.started_at = time.time()
+        logger.info(f"Worker LibreOffice #{self.worker_id} iniciado (PID {self.process.pid})")
+
+    def stop(self) -> None:
+        """Encerra o processo soffice do worker"""
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+        self.context = None
+        self.desktop = None
+
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def kill(self) -> None:
+        """Mata o processo imediatamente (usado pelo watchdog de timeout)"""
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+
+    def restart(self) -> None:
+        """Reinicia o worker (após crash, timeout ou reciclagem)"""
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def is_alive(self) -> bool:
+        """Verifica se o processo soffice ainda está rodando"""
+        return self.process is not None and self.process.poll() is None
+
+    def connect(self, timeout: float = LIBREOFFICE_POOL_STARTUP_TIMEOUT) -> None:
+        """Conecta ao worker via UNO, aguardando o pipe ficar disponível"""
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        url = f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+
+        deadline = time.time() + timeout
+        while True:
+            if not self.is_alive():
+                raise RuntimeError(f"Worker #{self.worker_id} encerrou durante a inicialização")
+            try:
+                ctx = resolver.resolve(url)
+                self.desktop = ctx.ServiceManager.createInstanceWithContext(
+                    "com.sun.star.frame.Desktop", ctx
+                )
+                self.context = ctx
+                return
+            except Exception:
+                if time.time() >= deadline:
+                    raise RuntimeError(f"Worker #{self.worker_id} não respondeu em {timeout}s")
+                time.sleep(0.25)
+
+    def is_healthy(self) -> bool:
+        """Health check: processo vivo e UNO respondendo"""
+        if not self.is_alive():
+            return False
+        if self.desktop is None:
+            return True  # Ainda não conectado; a conexão ocorre no próximo uso
+        try:
+            self.desktop.getComponents()
+            return True
+        except Exception:
+            return False
+
+    def _export_pdf(
+        self,
+        source_url: str,
+        target_url: str,
+        filter_options: Dict[str, Any],
+        load_args: Optional[Dict[str, Any]] = None,
+        store_args: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Carrega um documento no soffice residente e o exporta para PDF"""
+        if self.desktop is None:
+            self.connect()
+
+        with span('libreoffice.load', **{'worker.id': self.worker_id}):
+            document = self.desktop.loadComponentFromURL(
+                source_url,
+                "_blank",
+                0,
+                _properties(Hidden=True, ReadOnly=True, **(load_args or {}))
+            )
+        if document is None:
+            raise Exception(f"LibreOffice não conseguiu abrir o documento: {source_url}")
+
+        try:
+            filter_data = uno.Any(
+                "[]com.sun.star.beans.PropertyValue",
+                _properties(**filter_options)
+            )
+            # uno.invoke preserva o tipo do FilterData (sequência de PropertyValue)
+            with span('libreoffice.export', **{'worker.id': self.worker_id}):
+                uno.invoke(document, "storeToURL", (
+                    target_url,
+                    _properties(FilterName="writer_pdf_Export", FilterData=filter_data, **(store_args or {}))
+                ))
+        finally:
+            document.close(True)
+
+        self.conversions += 1
+
+    def convert_bytes(self, docx_bytes: bytes, filter_options: Dict[str, Any]) -> bytes:
+        """
+        Converte um DOCX para PDF inteiramente em memória
+
+        O documento entra por um SequenceInputStream e o PDF sai por um
+        XOutputStream (URLs private:stream), sem arquivos intermediários.
+        """
+        if self.desktop is None:
+            self.connect()
+
+        input_stream = self.context.ServiceManager.createInstanceWithArgumentsAndContext(
+            "com.sun.star.io.SequenceInputStream", (uno.ByteSequence(docx_bytes),), self.context
+        )
+        output_stream = _BytesOutputStream()
+        self._export_pdf(
+            "private:stream",
+            "private:stream",
+            filter_options,
+            load_args={'InputStream': input_stream, 'FilterName': 'MS Word 2007 XML'},
+            store_args={'OutputStream': output_stream}
+        )
+        return output_stream.buffer.getvalue()
+
+
+def process_dir(root: str) -> str:
+    """
+    Diretório de trabalho do processo atual dentro de `root`
+
+    Cada worker gunicorn (e o daemon de conversão) tem seus próprios perfis:
+    instâncias soffice de processos diferentes não podem compartilhar um
+    UserInstallation, e o encerramento de um processo não pode apagar os
+    perfis que outro ainda usa.
+
+    Args:
+        root: Diretório base configurado (compartilhado entre processos)
+
+    Returns:
+        Caminho root/pid_<pid>
+    """
+    return os.path.join(root, f"pid_{os.getpid()}")
+
+
+def remove_stale_process_dirs(root: str) -> None:
+    """Remove os diretórios de processos que já encerraram (ex.: worker morto por SIGKILL)"""
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    for name in names:
+        prefix, _, pid = name.partition('_')
+        if prefix == 'pid' and pid.isdigit() and int(pid) != os.getpid() and not pid_alive(int(pid)):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            logger.info(f"Perfis do processo encerrado {pid} removidos de {root}")
+
+
+def _properties(**kwargs) -> tuple:
+    """Monta uma tupla de PropertyValue UNO a partir de kwargs"""
+    props = []
+    for name, value in kwargs.items():
+        prop = uno.createUnoStruct("com.sun.star.beans.PropertyValue")
+        prop.Name = name
+        prop.Value = value
+        props.append(prop)
+    return tuple(props)
+
+
+class LibreOfficePool:
+    """Pool de workers LibreOffice residentes com health check e restart"""
+
+    def __init__(self, size: int = LIBREOFFICE_POOL_SIZE, base_dir: str = LIBREOFFICE_POOL_DIR):
+        self.size = max(1, size)
+        self.root_dir = base_dir
+        self.base_dir = process_dir(base_dir)  # Só deste processo
+        self.workers = [LibreOfficeWorker(i, self.base_dir) for i in range(self.size)]
+        self._idle: "queue.Queue[LibreOfficeWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._running = False
+        self._health_thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Inicia todos os workers e a thread de health check"""
+        with self._lock:
+            if self._running:
+                return
+            remove_stale_process_dirs(self.root_dir)
+            os.makedirs(self.base_dir, exist_ok=True)
+            for worker in self.workers:
+                worker.start()
+                self._idle.put(worker)
+            self._running = True
+
+        self._health_thread = threading.Thread(
+            target=self._health_loop, name='libreoffice-pool-health', daemon=True
+        )
+        self._health_thread.start()
+        logger.info(f"✓ Pool LibreOffice iniciado com {self.size} workers")
+
+    def shutdown(self) -> None:
+        """Encerra todos os workers do pool e remove os perfis deste processo"""
+        with self._lock:
+            self._running = False
+            for worker in self.workers:
+                worker.stop()
+        shutil.rmtree(self.base_dir, ignore_errors=True)
+        logger.info("Pool LibreOffice encerrado")
+
+    def convert_bytes(self, docx_bytes: bytes, filter_options: Dict[str, Any], timeout: float) -> bytes:
+        """
+        Converte um DOCX em memória usando um worker livre do pool (streams UNO)
+
+        Args:
+            docx_bytes: Bytes do DOCX
+            filter_options: FilterData do writer_pdf_Export
+            timeout: Tempo máximo da conversão em segundos
+
+        Returns:
+            Bytes do PDF gerado
+
+        Raises:
+            PoolUnavailableError: Se não houver worker disponível
+            Exception: Se houver erro ou timeout na conversão
+        """
+        return self._run(lambda worker: worker.convert_bytes(docx_bytes, filter_options), timeout)
+
+    def _run(self, job: Callable[[LibreOfficeWorker], Any], timeout: float) -> Any:
+        """Executa `job` em um worker livre, com watchdog de timeout e restart em falhas"""
+        if not self._running:
+            raise PoolUnavailableError("Pool LibreOffice não está em execução")
+
+        try:
+            worker = self._idle.get(timeout=LIBREOFFICE_POOL_ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise PoolUnavailableError("Nenhum worker LibreOffice livre")
+
+        # Watchdog: mata o soffice se a conversão exceder o timeout
+        timed_out = threading.Event()
+
+        def _on_timeout():
+            timed_out.set()
+            worker.kill()
+
+        watchdog = threading.Timer(timeout, _on_timeout)
+        try:
+            if not worker.is_alive():
+                logger.warning(f"Worker #{worker.worker_id} morto, reiniciando...")
+                with span('libreoffice.restart', **{'worker.id': worker.worker_id}):
+                    worker.restart()
+
+            watchdog.start()
+            start = time.time()
+            with span('libreoffice.pool', **{'worker.id': worker.worker_id, 'worker.conversions': worker.conversions}):
+                result = job(worker)
+            stage_logger.info("Worker #%s converteu em %.3fs", worker.worker_id, time.time() - start)
+
+            if worker.conversions >= LIBREOFFICE_POOL_MAX_CONVERSIONS:
+                logger.info(f"Reciclando worker #{worker.worker_id} após {worker.conversions} conversões")
+                worker.restart()
+
+            return result
+
+        except Exception as e:
+            logger.error(f"Falha no worker #{worker.worker_id}: {str(e)}")
+            try:
+                worker.restart()
+            except Exception as restart_error:
+                logger.error(f"Erro ao reiniciar worker #{worker.worker_id}: {str(restart_error)}")
+            if timed_out.is_set():
+                libreoffice_timeouts.inc(mode='pool')
+                raise Exception(ERROR_MESSAGES['conversion_timeout'])
+            raise
+        finally:
+            watchdog.cancel()
+            self._idle.put(worker)
+
+    def _health_loop(self) -> None:
+        """Verifica periodicamente os workers ociosos e reinicia os que falharam"""
+        while self._running:
+            time.sleep(LIBREOFFICE_POOL_HEALTH_INTERVAL)
+            idle_count = self._idle.qsize()
+            for _ in range(idle_count):
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    if self._running and not worker.is_healthy():
+                        logger.warning(f"Health check falhou no worker #{worker.worker_id}, reiniciando...")
+                        worker.restart()
+                except Exception as e:
+                    logger.error(f"Erro ao reiniciar worker #{worker.worker_id}: {str(e)}")
+                finally:
+                    self._idle.put(worker)
+
+    def status(self) -> Dict[str, Any]:
+        """Retorna o estado atual do pool (para health check)"""
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize(),
+            'running': self._running,
+            'workers': [
+                {
+                    'id': worker.worker_id,
+                    'alive': worker.is_alive(),
+                    'conversions': worker.conversions,
+                    'restarts': worker.restarts,
+                }
+                for worker in self.workers
+            ]
+        }
+
+
+_pool: Optional[LibreOfficePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_libreoffice_pool() -> Optional[LibreOfficePool]:
+    """
+    Retorna o pool global, iniciando-o na primeira chamada
+
+    Returns:
+        Pool em execução, ou None se desabilitado/indisponível
+        (sem o módulo `uno` ou sem o executável do LibreOffice)
+    """
+    global _pool
+
+    if not LIBREOFFICE_POOL_ENABLED or uno is None:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            if shutil.which(LIBREOFFICE_COMMAND) is None:
+                logger.warning(f"⚠ '{LIBREOFFICE_COMMAND}' não encontrado, pool LibreOffice desabilitado")
+                return None
+            pool = LibreOfficePool()
+            try:
+                pool.start()
+            except Exception as e:
+                logger.error(f"Erro ao iniciar pool LibreOffice: {str(e)}")
+                pool.shutdown()
+                return None
+            _pool = pool
+        return _pool
+
+
+def shutdown_libreoffice_pool() -> None:
+    """Encerra o pool global (registrado com atexit)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -5,14 +5,24 @@ Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
 """
 import os
 import subprocess
-from typing import Literal
-from app.utils.logger import logger
+import tempfile
+import time
+from typing import Any, Dict, Literal, Optional, Tuple
+from app.utils.logger import logger, stage_logger
 from app.utils.validators import validate_quality
+from app.utils.metrics import conversions, conversion_bytes, libreoffice_exit_codes, libreoffice_timeouts
+from app.utils.tracing import span, propagation_env
+from app.services.libreoffice_pool import get_libreoffice_pool, PoolUnavailableError
+from app.services.profile_pool import get_profile_pool
+from app.services.admission import get_conversion_limiter
+from app.services.conversion_client import get_conversion_daemon
+from app.services.cost_model import cost_model, CostEstimate
 from config.settings import (
     CONVERSION_TIMEOUT,
     PDF_QUALITY_PROFILES,
     LIBREOFFICE_COMMAND,
     LIBREOFFICE_OPTIONS,
+    PIPELINE_TMP_DIR,
     ERROR_MESSAGES
 )
 
@@ -21,104 +31,259 @@ class PdfService:
     """Serviço para conversão de documentos para PDF"""
 
     @staticmethod
-    def convert_docx_to_pdf(
-        docx_path: str,
-        pdf_path: str,
-        quality: Literal['high', 'medium', 'low'] = 'high'
-    ) -> None:
+    def conversion_capacity() -> int:
+        """
+        Número de conversões que podem rodar em paralelo
+
+        Returns:
+            Capacidade do controle de admissão (workers do pool LibreOffice ou,
+            sem o pool, slots de perfil do --convert-to)
+        """
+        return get_conversion_limiter().capacity
+
+    @staticmethod
+    def get_filter_options(quality: str) -> Dict[str, Any]:
+        """
+        Monta as opções do filtro writer_pdf_Export para o perfil de qualidade
+
+        Args:
+            quality: Qualidade do PDF já validada ('high', 'medium', 'low')
+
+        Returns:
+            Dicionário {opção: valor} usado tanto no --convert-to quanto via UNO
+        """
+        settings = PDF_QUALITY_PROFILES[quality]
+        return {
+            'SelectPdfVersion': 1,  # PDF 1.4 (compatível)
+            'UseTaggedPDF': True,   # PDF acessível com tags
+            'ExportBookmarks': True,  # Exporta marcadores/índice
+            'ExportNotes': False,   # Não exporta comentários
+            'Quality': settings['Quality'],  # Qualidade de compressão JPEG
+            'ReduceImageResolution': settings['ReduceImageResolution'],
+            'MaxImageResolution': settings['MaxImageResolution'],
+            'ExportFormFields': True,  # Exporta campos de formulário
+            'FormsType': 0,  # FDF format
+            'EmbedStandardFonts': False,  # Não embute fontes padrão (reduz tamanho)
+        }
+
+    @staticmethod
+    def _prepare_filter_options(quality: str) -> Dict[str, Any]:
+        """Valida a qualidade, registra o perfil escolhido e monta o FilterData"""
+        quality = validate_quality(quality)
+        stage_logger.info("Iniciando conversão PDF com qualidade: %s", quality)
+
+        # Obtém configurações do perfil selecionado
+        settings = PDF_QUALITY_PROFILES[quality]
+        stage_logger.info("Perfil selecionado: %s", settings['description'])
+        stage_logger.info("Resolução máxima: %s DPI", settings['MaxImageResolution'])
+        stage_logger.info("Qualidade JPEG: %s%%", settings['Quality'])
+
+        return PdfService.get_filter_options(quality)
+
+    @staticmethod
+    def convert_docx_bytes_to_pdf(
+        docx_bytes: bytes,
+        quality: Literal['high', 'medium', 'low'] = 'high',
+        timeout: Optional[float] = None,
+        estimate: Optional[CostEstimate] = None
+    ) -> bytes:
         """
-        Converte documento DOCX para PDF usando LibreOffice com opções avançadas de qualidade
+        Converte um DOCX em memória para PDF em memória
+
+        Com o pool, o documento vai e volta por streams UNO, sem nenhum
+        arquivo. Sem o pool, o --convert-to trabalha em um diretório do tmpfs
+        (PIPELINE_TMP_DIR, por padrão /dev/shm), também sem tocar o disco.
+
+        Com uma estimativa de custo, a conversão entra na fila de acordo com
+        ela (menor trabalho primeiro), o timeout é derivado dela e o tempo
+        real alimenta o modelo de custo.
 
         Args:
-            docx_path: Caminho do arquivo DOCX
-            pdf_path: Caminho onde salvar o PDF
+            docx_bytes: Bytes do DOCX
             quality: Qualidade do PDF ('high', 'medium', 'low')
-                - high: 300 DPI, sem compressão de imagem, ideal para impressão
-                - medium: 150 DPI, compressão moderada, balanceado (padrão)
-                - low: 75 DPI, alta compressão, menor tamanho de arquivo
+            timeout: Tempo máximo da conversão em segundos (padrão: o da
+                estimativa ou CONVERSION_TIMEOUT)
+            estimate: Custo estimado pelo modelo de custo
+
+        Returns:
+            Bytes do PDF gerado
 
         Raises:
+            ServerOverloadedError: Se não houver capacidade de conversão (429/503)
             Exception: Se houver erro na conversão
         """
-        try:
-            # Valida e normaliza qualidade
-            quality = validate_quality(quality)
-
-            logger.info(f"Iniciando conversão PDF com qualidade: {quality}")
-
-            # Obtém configurações do perfil selecionado
-            settings = PDF_QUALITY_PROFILES[quality]
-            logger.info(f"Perfil selecionado: {settings['description']}")
-            logger.info(f"Resolução máxima: {settings['MaxImageResolution']} DPI")
-            logger.info(f"Qualidade JPEG: {settings['Quality']}%")
-
-            # Monta filtro avançado para LibreOffice
-            # Formato: writer_pdf_Export:{opcao1:valor1,opcao2:valor2}
-            pdf_filter_options = [
-                f"SelectPdfVersion=1",  # PDF 1.4 (compatível)
-                f"UseTaggedPDF=true",   # PDF acessível com tags
-                f"ExportBookmarks=true",  # Exporta marcadores/índice
-                f"ExportNotes=false",   # Não exporta comentários
-                f"Quality={settings['Quality']}",  # Qualidade de compressão JPEG
-                f"ReduceImageResolution={str(settings['ReduceImageResolution']).lower()}",
-                f"MaxImageResolution={settings['MaxImageResolution']}",
-                f"ExportFormFields=true",  # Exporta campos de formulário
-                f"FormsType=0",  # FDF format
-                f"EmbedStandardFonts=false",  # Não embute fontes padrão (reduz tamanho)
-            ]
+        if timeout is None:
+            timeout = estimate.timeout if estimate is not None else CONVERSION_TIMEOUT
 
-            # Junta todas as opções em uma string
-            filter_data = ":".join(pdf_filter_options)
-            convert_format = f"pdf:writer_pdf_Export:{{{filter_data}}}"
+        attributes = {'document.size': len(docx_bytes), 'quality': quality, 'timeout': timeout}
+        if estimate is not None:
+            attributes.update({'cost.estimated_seconds': round(estimate.seconds, 3), 'cost.basis': estimate.basis})
+        cost = estimate.seconds if estimate is not None else None
 
-            logger.info(f"Executando LibreOffice com filtro customizado...")
+        with span('pdf.convert', **attributes) as convert_span:
+            daemon = get_conversion_daemon()
+            if daemon is not None:
+                stage_logger.info("Enviando conversão ao daemon (%s)...", daemon.socket_path)
+                pdf_bytes, seconds = daemon.convert(docx_bytes, quality, timeout, cost)
+            else:
+                pdf_bytes, seconds = PdfService.convert_locally(docx_bytes, quality, timeout, cost)
+            convert_span.set_attribute('output.size', len(pdf_bytes))
+            if estimate is not None:
+                cost_model.observe(estimate, seconds)
+            return pdf_bytes
+
+    @staticmethod
+    def convert_locally(
+        docx_bytes: bytes,
+        quality: str,
+        timeout: float,
+        cost: Optional[float] = None
+    ) -> Tuple[bytes, float]:
+        """
+        Converte neste processo, com o controle de admissão local
+
+        Usado diretamente pelo daemon de conversão; os workers web passam por
+        convert_docx_bytes_to_pdf.
+
+        Args:
+            docx_bytes: Bytes do DOCX
+            quality: Qualidade do PDF ('high', 'medium', 'low')
+            timeout: Tempo máximo da conversão em segundos
+            cost: Custo estimado em segundos (posição na fila da faixa)
+
+        Returns:
+            Tupla (pdf_bytes, segundos de conversão, sem a espera por slot)
+
+        Raises:
+            ServerOverloadedError: Se não houver capacidade de conversão (429/503)
+            Exception: Se houver erro na conversão
+        """
+        # Controle de admissão: no máximo `capacity` conversões simultâneas
+        with get_conversion_limiter().slot(cost):
+            try:
+                start = time.time()
+                pdf_bytes = PdfService._convert_bytes(docx_bytes, quality, timeout)
+                seconds = time.time() - start
+                conversions.inc(quality=quality, result='success')
+                conversion_bytes.inc(len(docx_bytes), direction='in')
+                conversion_bytes.inc(len(pdf_bytes), direction='out')
+                return pdf_bytes, seconds
+
+            except subprocess.TimeoutExpired:
+                conversions.inc(quality=quality, result='timeout')
+                logger.error(f"Timeout na conversão do documento (limite: {timeout}s)")
+                raise Exception(ERROR_MESSAGES['conversion_timeout'])
+            except Exception as e:
+                timed_out = str(e) == ERROR_MESSAGES['conversion_timeout']  # watchdog do pool
+                conversions.inc(quality=quality, result='timeout' if timed_out else 'error')
+                logger.error(f"Erro na conversão: {str(e)}")
+                raise
+
+    @staticmethod
+    def _convert_bytes(docx_bytes: bytes, quality: str, timeout: float) -> bytes:
+        """Converte pelo pool (streams UNO) ou, sem ele, pelo --convert-to no tmpfs"""
+        filter_options = PdfService._prepare_filter_options(quality)
+
+        pool = get_libreoffice_pool()
+        if pool is not None:
+            try:
+                stage_logger.info("Convertendo via pool LibreOffice (streams UNO, em memória)...")
+                pdf_bytes = pool.convert_bytes(docx_bytes, filter_options, timeout=timeout)
+                stage_logger.info("PDF gerado com sucesso: %.2f KB", len(pdf_bytes) / 1024)
+                return pdf_bytes
+            except PoolUnavailableError as e:
+                logger.warning(f"⚠ {str(e)}, usando conversão direta (--convert-to)")
+
+        with tempfile.TemporaryDirectory(dir=PIPELINE_TMP_DIR or None) as work_dir:
+            docx_path = os.path.join(work_dir, 'document.docx')
+            pdf_path = os.path.join(work_dir, 'document.pdf')
+            with open(docx_path, 'wb') as docx_file:
+                docx_file.write(docx_bytes)
+
+            PdfService._convert_with_soffice(docx_path, pdf_path, filter_options, timeout)
+
+            if not os.path.exists(pdf_path):
+                raise Exception(ERROR_MESSAGES['pdf_not_generated'])
+            with open(pdf_path, 'rb') as pdf_file:
+                return pdf_file.read()
+
+    @staticmethod
+    def _convert_with_soffice(
+        docx_path: str,
+        pdf_path: str,
+        filter_options: Dict[str, Any],
+        timeout: float = CONVERSION_TIMEOUT
+    ) -> None:
+        """
+        Converte via `soffice --convert-to` com um perfil exclusivo do ProfilePool
+
+        Raises:
+            subprocess.TimeoutExpired: Se a conversão exceder `timeout`
+            Exception: Se houver erro na conversão
+        """
+        # Monta filtro avançado para LibreOffice
+        # Formato: writer_pdf_Export:{opcao1:valor1,opcao2:valor2}
+        filter_data = ":".join(
+            f"{name}={str(value).lower() if isinstance(value, bool) else value}"
+            for name, value in filter_options.items()
+        )
+        convert_format = f"pdf:writer_pdf_Export:{{{filter_data}}}"
+
+        # Empresta um perfil exclusivo: conversões concorrentes não disputam
+        # o mesmo UserInstallation e rodam de fato em paralelo
+        with get_profile_pool().lease() as profile, \
+                span('libreoffice.convert_to', **{'profile.slot': profile.slot}) as soffice_span:
+            stage_logger.info("Executando LibreOffice com filtro customizado (slot %s)...", profile.slot)
 
             # Comando LibreOffice com opções avançadas
             cmd = [LIBREOFFICE_COMMAND] + LIBREOFFICE_OPTIONS + [
+                profile.env_option,
                 '--convert-to', convert_format,
                 '--outdir', os.path.dirname(pdf_path),
                 docx_path
             ]
 
             # Executa conversão
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=CONVERSION_TIMEOUT,
-                env={**os.environ, 'HOME': '/tmp'}  # Define HOME temporário
-            )
-
-            if result.returncode != 0:
-                logger.error(f"Erro LibreOffice (código {result.returncode})")
-                logger.error(f"STDOUT: {result.stdout}")
-                logger.error(f"STDERR: {result.stderr}")
-                raise Exception(f"Erro na conversão para PDF: {result.stderr}")
-
-            logger.info(f"LibreOffice output: {result.stdout}")
-
-            # LibreOffice salva com o mesmo nome base do arquivo de entrada
-            generated_pdf = os.path.join(
-                os.path.dirname(pdf_path),
-                os.path.splitext(os.path.basename(docx_path))[0] + '.pdf'
-            )
-
-            # Verifica se PDF foi gerado
-            if not os.path.exists(generated_pdf):
-                raise Exception(f"PDF não foi gerado. Arquivo esperado: {generated_pdf}")
-
-            # Obtém tamanho do PDF gerado
-            pdf_size = os.path.getsize(generated_pdf)
-            logger.info(f"PDF gerado com sucesso: {pdf_size / 1024:.2f} KB")
-
-            # Renomeia se necessário
-            if generated_pdf != pdf_path:
-                os.rename(generated_pdf, pdf_path)
-                logger.info(f"PDF renomeado para: {os.path.basename(pdf_path)}")
-
-        except subprocess.TimeoutExpired:
-            logger.error(f"Timeout na conversão do documento (limite: {CONVERSION_TIMEOUT}s)")
-            raise Exception(ERROR_MESSAGES['conversion_timeout'])
-        except Exception as e:
-            logger.error(f"Erro na conversão: {str(e)}")
-            raise
+            try:
+                result = subprocess.run(
+                    cmd,
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout,
+                    # HOME isolado por slot; id da requisição e traceparent para correlação
+                    env={**os.environ, 'HOME': profile.path, **propagation_env()}
+                )
+                soffice_span.set_attribute('exit_code', result.returncode)
+            except subprocess.TimeoutExpired:
+                # soffice morto no meio da conversão pode deixar o perfil inconsistente
+                profile.dirty = True
+                libreoffice_timeouts.inc(mode='convert_to')
+                raise
+
+        libreoffice_exit_codes.inc(code=result.returncode)
+        if result.returncode != 0:
+            logger.error(f"Erro LibreOffice (código {result.returncode})")
+            logger.error(f"STDOUT: {result.stdout}")
+            logger.error(f"STDERR: {result.stderr}")
+            raise Exception(f"Erro na conversão para PDF: {result.stderr}")
+
+        stage_logger.info("LibreOffice output: %s", result.stdout)
+
+        # LibreOffice salva com o mesmo nome base do arquivo de entrada
+        generated_pdf = os.path.join(
+            os.path.dirname(pdf_path),
+            os.path.splitext(os.path.basename(docx_path))[0] + '.pdf'
+        )
+
+        # Verifica se PDF foi gerado
+        if not os.path.exists(generated_pdf):
+            raise Exception(f"PDF não foi gerado. Arquivo esperado: {generated_pdf}")
+
+        # Obtém tamanho do PDF gerado
+        pdf_size = os.path.getsize(generated_pdf)
+        stage_logger.info("PDF gerado com sucesso: %.2f KB", pdf_size / 1024)
+
+        # Renomeia se necessário
+        if generated_pdf != pdf_path:
+            os.rename(generated_pdf, pdf_path)
+            stage_logger.info("PDF renomeado para: %s", os.path.basename(pdf_path))
@@ -0,0 +1,193 @@
+"""
+Pool de perfis de usuário LibreOffice isolados por slot de concorrência
+
+Cada conversão --convert-to recebe um perfil exclusivo via
+-env:UserInstallation. Os perfis são criados e inicializados (first-run)
+uma única vez no boot e emprestados por conversão, permitindo que N
+requisições convertam de fato em paralelo. Cada processo (worker gunicorn
+ou daemon de conversão) tem seus próprios slots.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import os
+import queue
+import shutil
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from app.utils.logger import logger
+from app.services.libreoffice_pool import process_dir, remove_stale_process_dirs
+from config.settings import (
+    CONVERSION_TIMEOUT,
+    LIBREOFFICE_COMMAND,
+    LIBREOFFICE_OPTIONS,
+    LIBREOFFICE_PROFILE_SLOTS,
+    LIBREOFFICE_PROFILE_DIR,
+    LIBREOFFICE_PROFILE_INIT_TIMEOUT
+)
+
+
+class LibreOfficeProfile:
+    """Diretório de perfil de usuário LibreOffice de um slot"""
+
+    def __init__(self, slot: int, base_dir: str):
+        self.slot = slot
+        self.path = os.path.join(base_dir, f"slot_{slot}")
+        self.initialized = False
+        self.dirty = False
+        self.leases = 0
+
+    @property
+    def url(self) -> str:
+        """URL file:// usada em -env:UserInstallation"""
+        return f"file://{self.path}"
+
+    @property
+    def env_option(self) -> str:
+        """Opção de linha de comando que seleciona este perfil"""
+        return f"-env:UserInstallation={self.url}"
+
+    def initialize(self) -> None:
+        """
+        Cria o perfil e executa o first-run do LibreOffice
+
+        --terminate_after_init faz o soffice criar toda a estrutura do perfil
+        (registrymodifications.xcu, cache de fontes etc.) e sair, de modo que a
+        primeira conversão real não pague esse custo.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+
+        if shutil.which(LIBREOFFICE_COMMAND) is None:
+            # Sem LibreOffice não há o que inicializar; o perfil é criado sob demanda
+            self.initialized = False
+            self.dirty = False
+            return
+
+        cmd = [LIBREOFFICE_COMMAND] + LIBREOFFICE_OPTIONS + [
+            self.env_option,
+            '--terminate_after_init',
+        ]
+        try:
+            subprocess.run(
+                cmd,
+                capture_output=True,
+                timeout=LIBREOFFICE_PROFILE_INIT_TIMEOUT,
+                env={**os.environ, 'HOME': self.path}
+            )
+            self.initialized = True
+        except Exception as e:
+            logger.warning(f"⚠ Falha ao inicializar perfil do slot {self.slot}: {str(e)}")
+            self.initialized = False
+        self.dirty = False
+
+
+class ProfilePool:
+    """Pool de perfis LibreOffice emprestados por conversão"""
+
+    def __init__(self, slots: int = LIBREOFFICE_PROFILE_SLOTS, base_dir: str = LIBREOFFICE_PROFILE_DIR):
+        self.slots = max(1, slots)
+        self.root_dir = base_dir
+        self.base_dir = process_dir(base_dir)  # Só deste processo
+        self.profiles: List[LibreOfficeProfile] = [
+            LibreOfficeProfile(slot, self.base_dir) for slot in range(self.slots)
+        ]
+        self._free: "queue.Queue[LibreOfficeProfile]" = queue.Queue()
+
+    def initialize(self) -> None:
+        """Cria e inicializa todos os perfis em paralelo"""
+        remove_stale_process_dirs(self.root_dir)
+        os.makedirs(self.base_dir, exist_ok=True)
+        threads = [
+            threading.Thread(target=profile.initialize, name=f'profile-init-{profile.slot}')
+            for profile in self.profiles
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for profile in self.profiles:
+            self._free.put(profile)
+
+        ready = sum(1 for profile in self.profiles if profile.initialized)
+        logger.info(f"✓ Perfis LibreOffice: {ready}/{self.slots} inicializados em {self.base_dir}")
+
+    @contextmanager
+    def lease(self, timeout: float = CONVERSION_TIMEOUT) -> Iterator[LibreOfficeProfile]:
+        """
+        Empresta um perfil exclusivo durante uma conversão
+
+        Args:
+            timeout: Tempo máximo aguardando um slot livre
+
+        Yields:
+            Perfil reservado para uso exclusivo
+
+        Raises:
+            Exception: Se nenhum slot ficar livre dentro do timeout
+        """
+        try:
+            profile = self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise Exception(f"Nenhum slot de conversão livre após {timeout}s")
+
+        profile.leases += 1
+        try:
+            yield profile
+        finally:
+            # Perfil marcado como sujo (ex.: soffice morto por timeout) é recriado
+            if profile.dirty:
+                logger.warning(f"Reinicializando perfil do slot {profile.slot}...")
+                profile.initialize()
+            self._free.put(profile)
+
+    def shutdown(self) -> None:
+        """Remove os perfis deste processo (os de outros processos não são tocados)"""
+        shutil.rmtree(self.base_dir, ignore_errors=True)
+
+    def status(self) -> Dict[str, Any]:
+        """Retorna o estado atual dos slots"""
+        return {
+            'slots': self.slots,
+            'free': self._free.qsize(),
+            'initialized': sum(1 for profile in self.profiles if profile.initialized),
+        }
+
+
+_profile_pool: Optional[ProfilePool] = None
+_profile_pool_lock = threading.Lock()
+
+
+def get_profile_pool() -> ProfilePool:
+    """Retorna o pool global de perfis, inicializando-o na primeira chamada"""
+    global _profile_pool
+
+    with _profile_pool_lock:
+        if _profile_pool is None:
+            pool = ProfilePool()
+            pool.initialize()
+            _profile_pool = pool
+        return _profile_pool
+
+
+def shutdown_profile_pool() -> None:
+    """Remove os perfis do pool global (registrado com atexit)"""
+    global _profile_pool
+    with _profile_pool_lock:
+        if _profile_pool is not None:
+            _profile_pool.shutdown()
+            _profile_pool = None
+
+
+def _after_fork() -> None:
+    global _profile_pool, _profile_pool_lock
+    # Perfis criados antes do fork (gunicorn --preload) pertencem ao master:
+    # o worker cria os seus, em pid_<pid>, no primeiro uso
+    _profile_pool = None
+    _profile_pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
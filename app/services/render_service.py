@@ -0,0 +1,253 @@
+"""
+Pipeline de renderização: substituição de tags -> DOCX -> PDF
+
+Centraliza as etapas compartilhadas pelas rotas /convert, /convert-file e
+/process, com o cache de resultados na frente de todo o pipeline.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import time
+from typing import Any, BinaryIO, Dict, Tuple, Union
+from app.utils.logger import logger, stage_logger
+from app.utils.metrics import stage_duration
+from app.utils.tracing import span
+from app.services.pdf_service import PdfService
+from app.services.docx_service import DocxService
+from app.services.docx_xml_service import DocxXmlService
+from app.services.docx_process_pool import DocxProcessPool, get_docx_process_pool
+from app.services.cache_service import result_cache, ResultCache
+from app.services.cost_model import cost_model
+from app.services.split_service import SplitService
+from app.services.template_registry import Template
+from config.settings import ERROR_MESSAGES, DEFAULT_DOCX_ENGINE, INTERMEDIATE_DOCX_COMPRESSION
+
+
+class RenderService:
+    """Serviço que executa o pipeline completo de renderização"""
+
+    @staticmethod
+    def _cache_lookup(key: str) -> Tuple[Any, Dict[str, Any]]:
+        """Consulta o cache e monta o bloco `cache` das estatísticas"""
+        if result_cache is None:
+            return None, {'enabled': False}
+        content = result_cache.get(key)
+        return content, {'enabled': True, 'hit': content is not None, **result_cache.stats()}
+
+    @staticmethod
+    def _write_docx(
+        template: Template,
+        replacements: Dict[str, Any],
+        engine: str,
+        output: Union[str, BinaryIO],
+        compression: str = 'default'
+    ) -> None:
+        """
+        Substitui as tags e grava o DOCX resultante com a engine escolhida
+
+        Args:
+            template: Documento de origem
+            replacements: Dicionário com tags e valores
+            engine: 'docx' (python-docx) ou 'xml' (reescrita em streaming do ZIP)
+            output: Caminho ou arquivo binário de destino
+            compression: Perfil de compressão ('stored', 'fast' ou 'default')
+        """
+        pool = get_docx_process_pool()
+        if pool is not None and pool.accepts(template.size):
+            RenderService._write_docx_in_process(pool, template, replacements, engine, output, compression)
+            return
+
+        if engine == 'xml':
+            stage_logger.info("Etapa 2/4: Substituindo tags e gravando DOCX (engine xml)...")
+            start_replace = time.time()
+            with span('docx.rewrite', engine='xml', tags=len(replacements), compression=compression):
+                DocxXmlService.replace_tags(template.doc_bytes, replacements, output, compression)
+            elapsed = time.time() - start_replace
+            stage_duration.observe(elapsed, stage='rewrite')
+            stage_logger.info("✓ DOCX gerado em %.3fs", elapsed)
+            return
+
+        # Substitui as tags no documento
+        stage_logger.info("Etapa 2/4: Substituindo tags no documento...")
+        start_replace = time.time()
+        with span('docx.replace', engine='docx', tags=len(replacements)):
+            modified_doc = template.fill(replacements)
+        elapsed = time.time() - start_replace
+        stage_duration.observe(elapsed, stage='replace')
+        stage_logger.info("✓ Tags substituídas em %.3fs", elapsed)
+
+        # Salva o documento modificado
+        stage_logger.info("Etapa 3/4: Salvando documento DOCX (compressão %s)...", compression)
+        start_save = time.time()
+        with span('docx.save', compression=compression) as save_span:
+            reused = DocxService.save_document(modified_doc, output, compression, template.doc_bytes)
+            save_span.set_attribute('docx.reused_members', reused)
+        elapsed = time.time() - start_save
+        stage_duration.observe(elapsed, stage='save')
+        stage_logger.info("✓ DOCX salvo em %.3fs (%s membros reaproveitados)", elapsed, reused)
+
+    @staticmethod
+    def _write_docx_in_process(
+        pool: DocxProcessPool,
+        template: Template,
+        replacements: Dict[str, Any],
+        engine: str,
+        output: Union[str, BinaryIO],
+        compression: str
+    ) -> None:
+        """Etapas de _write_docx em um processo do pool DOCX (fora do GIL desta thread)"""
+        stage_logger.info("Etapas 2-3/4: Substituindo tags e gravando DOCX (processo, engine %s)...", engine)
+        with span('docx.process', engine=engine, tags=len(replacements), compression=compression) as process_span:
+            docx_bytes, timings, reused = pool.write_docx(
+                template.template_id, template.doc_bytes, template.registered, replacements, engine, compression)
+            process_span.set_attribute('docx.reused_members', reused)
+        for stage, elapsed in timings.items():
+            stage_duration.observe(elapsed, stage=stage)
+        if isinstance(output, str):
+            with open(output, 'wb') as f:
+                f.write(docx_bytes)
+        else:
+            output.write(docx_bytes)
+        stage_logger.info("✓ DOCX gerado em processo (%s bytes) em %.3fs", len(docx_bytes), sum(timings.values()))
+
+    @staticmethod
+    def render_pdf(
+        template: Template,
+        replacements: Dict[str, Any],
+        quality: str,
+        engine: str = DEFAULT_DOCX_ENGINE,
+        split: bool = False
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Substitui as tags e converte o documento para PDF
+
+        Args:
+            template: Documento de origem (registrado ou enviado inline)
+            replacements: Dicionário com tags e valores
+            quality: Qualidade do PDF já validada
+            engine: Engine de substituição já validada ('docx' ou 'xml')
+            split: Divide documentos grandes e converte as partes em paralelo
+
+        Returns:
+            Tupla (pdf_bytes, stats)
+
+        Raises:
+            ValueError: Se o documento for inválido
+            Exception: Se houver erro na conversão
+        """
+        attributes = {
+            'template.id': template.template_id,
+            'document.size': template.size,
+            'tags': len(replacements),
+            'quality': quality,
+            'engine': engine,
+            'split': split,
+        }
+        with span('render.pdf', **attributes) as render_span:
+            pdf_bytes, stats = RenderService._render_pdf(template, replacements, quality, engine, split)
+            render_span.set_attribute('cache.hit', bool(stats['cache'].get('hit')))
+            render_span.set_attribute('output.size', len(pdf_bytes))
+        return pdf_bytes, stats
+
+    @staticmethod
+    def _render_pdf(
+        template: Template,
+        replacements: Dict[str, Any],
+        quality: str,
+        engine: str,
+        split: bool
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        key = ResultCache.make_key(template.template_id, replacements, quality, 'pdf')
+        pdf_bytes, cache_stats = RenderService._cache_lookup(key)
+        if pdf_bytes is not None:
+            stage_logger.info("✓ PDF servido do cache (%s bytes)", len(pdf_bytes))
+            return pdf_bytes, {
+                'input_size': template.size,
+                'output_size': len(pdf_bytes),
+                'quality': quality,
+                'replacements_count': len(replacements),
+                'cache': cache_stats
+            }
+
+        # DOCX intermediário em memória: lido só pelo LibreOffice, gravado com compressão mínima
+        buffer = io.BytesIO()
+        RenderService._write_docx(template, replacements, engine, buffer, INTERMEDIATE_DOCX_COMPRESSION)
+        docx_bytes = buffer.getvalue()
+        doc_size = len(docx_bytes)
+        stage_logger.info("DOCX intermediário: %s bytes", doc_size)
+
+        # Custo estimado pelo template: ordena a fila de conversões e define o timeout
+        estimate = cost_model.estimate(template.features, template.template_id)
+        stage_logger.info("Custo estimado: %.2fs (%s), timeout %.0fs", estimate.seconds, estimate.basis, estimate.timeout)
+
+        # Converte para PDF (streams UNO ou tmpfs, sem round trip pelo disco)
+        stage_logger.info("Etapa 4/4: Convertendo DOCX para PDF...")
+        start_convert = time.time()
+        split_stats = None
+        if split:
+            pdf_bytes, split_stats = SplitService.convert(docx_bytes, quality, estimate)
+        else:
+            pdf_bytes = PdfService.convert_docx_bytes_to_pdf(docx_bytes, quality=quality, estimate=estimate)
+        if not pdf_bytes:
+            logger.error("ERRO: PDF não foi gerado pelo LibreOffice")
+            raise Exception(ERROR_MESSAGES['pdf_not_generated'])
+        elapsed = time.time() - start_convert
+        stage_duration.observe(elapsed, stage='convert')
+        stage_logger.info("✓ PDF gerado (%s bytes) em %.3fs", len(pdf_bytes), elapsed)
+
+        if result_cache is not None:
+            result_cache.put(key, pdf_bytes)
+
+        stats = {
+            'input_size': template.size,  # Mesmo valor do cache hit: o DOCX recebido, não o intermediário
+            'output_size': len(pdf_bytes),
+            'quality': quality,
+            'replacements_count': len(replacements),
+            'cache': cache_stats
+        }
+        if split_stats is not None:
+            stats['split'] = split_stats
+        return pdf_bytes, stats
+
+    @staticmethod
+    def render_docx(
+        template: Template,
+        replacements: Dict[str, Any],
+        engine: str = DEFAULT_DOCX_ENGINE
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Substitui as tags e retorna o DOCX resultante (sem conversão)
+
+        Args:
+            template: Documento de origem (registrado ou enviado inline)
+            replacements: Dicionário com tags e valores
+            engine: Engine de substituição já validada ('docx' ou 'xml')
+
+        Returns:
+            Tupla (docx_bytes, stats)
+
+        Raises:
+            ValueError: Se o documento for inválido
+        """
+        key = ResultCache.make_key(template.template_id, replacements, '', 'docx')
+        docx_bytes, cache_stats = RenderService._cache_lookup(key)
+        if docx_bytes is not None:
+            stage_logger.info("✓ DOCX servido do cache (%s bytes)", len(docx_bytes))
+            return docx_bytes, {
+                'output_size': len(docx_bytes),
+                'replacements_count': len(replacements),
+                'cache': cache_stats
+            }
+
+        buffer = io.BytesIO()
+        RenderService._write_docx(template, replacements, engine, buffer)
+        docx_bytes = buffer.getvalue()
+
+        if result_cache is not None:
+            result_cache.put(key, docx_bytes)
+
+        return docx_bytes, {
+            'output_size': len(docx_bytes),
+            'replacements_count': len(replacements),
+            'cache': cache_stats
+        }
@@ -0,0 +1,401 @@
+"""
+Conversão de documentos grandes em partes paralelas
+
+O DOCX preenchido é dividido em quebras de seção ou de página, cada parte é
+convertida em um worker LibreOffice diferente e os PDFs são concatenados na
+ordem original. Quando a divisão poderia alterar o resultado (numeração de
+páginas, notas de rodapé, listas numeradas que atravessam o corte, índices e
+referências cruzadas), o documento é convertido inteiro.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import contextvars
+import copy
+import io
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+from lxml import etree
+from app.utils.logger import stage_logger
+from app.utils.metrics import stage_duration
+from app.utils.tracing import span
+from app.utils.zip_utils import copy_member_raw, zip_compression
+from app.services.admission import background_work, get_conversion_limiter
+from app.services.cost_model import cost_model, extract_features, CostEstimate
+from app.services.pdf_service import PdfService
+from config.settings import (
+    SPLIT_MIN_ESTIMATED_SECONDS,
+    SPLIT_MAX_CHUNKS,
+    INTERMEDIATE_DOCX_COMPRESSION
+)
+
+# O pacote pypdf é necessário apenas para concatenar os PDFs das partes
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # pragma: no cover - depende do ambiente
+    PdfWriter = None
+
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PR = 'http://schemas.openxmlformats.org/package/2006/relationships'
+DOCUMENT_PART = 'word/document.xml'
+
+# Campos que dependem do documento inteiro (total de páginas, referências, índices)
+_GLOBAL_FIELDS = re.compile(r'\b(NUMPAGES|SECTIONPAGES|PAGEREF|NOTEREF|REF|TOC|INDEX|SEQ)\b')
+_PAGE_FIELD = re.compile(r'\bPAGE\b')
+_RESTARTING_SECTION_TYPES = (None, 'nextPage')
+
+
+def _w(name: str) -> str:
+    return f'{{{W}}}{name}'
+
+
+class _SplitPlan:
+    """Resultado da análise: pontos de corte seguros ou o motivo para não dividir"""
+
+    def __init__(self, root: etree._Element, children: List[etree._Element],
+                 cuts: List[Tuple[int, int]], weights: List[int]):
+        self.root = root
+        self.children = children
+        self.cuts = cuts  # (fim da parte anterior, início da próxima)
+        self.weights = weights
+
+
+class SplitService:
+    """Serviço de conversão de documentos grandes em partes paralelas"""
+
+    @staticmethod
+    def _field_codes(xml: bytes) -> str:
+        """Códigos de campo (w:instrText e w:fldSimple) de uma parte XML"""
+        root = etree.fromstring(xml)
+        codes = [node.text or '' for node in root.iter(_w('instrText'))]
+        codes += [node.get(_w('instr'), '') for node in root.iter(_w('fldSimple'))]
+        return ' '.join(codes)
+
+    @staticmethod
+    def _counted_lists(zf: zipfile.ZipFile) -> Tuple[Set[str], Dict[str, str]]:
+        """
+        Listas numeradas (não marcadores) e estilos que aplicam numeração
+
+        Returns:
+            Tupla (numIds numerados, {styleId: numId})
+        """
+        counted: Set[str] = set()
+        style_numbering: Dict[str, str] = {}
+        if 'word/numbering.xml' in zf.NameToInfo:
+            numbering = etree.fromstring(zf.read('word/numbering.xml'))
+            numbered_abstracts = {
+                abstract.get(_w('abstractNumId'))
+                for abstract in numbering.iter(_w('abstractNum'))
+                if any(fmt.get(_w('val')) not in ('bullet', 'none') for fmt in abstract.iter(_w('numFmt')))
+            }
+            for num in numbering.iter(_w('num')):
+                abstract = num.find(_w('abstractNumId'))
+                if abstract is not None and abstract.get(_w('val')) in numbered_abstracts:
+                    counted.add(num.get(_w('numId')))
+        if 'word/styles.xml' in zf.NameToInfo:
+            for style in etree.fromstring(zf.read('word/styles.xml')).iter(_w('style')):
+                num_id = style.find(f'{_w("pPr")}/{_w("numPr")}/{_w("numId")}')
+                if num_id is not None:
+                    style_numbering[style.get(_w('styleId'))] = num_id.get(_w('val'))
+        return counted, style_numbering
+
+    @staticmethod
+    def _media_sizes(zf: zipfile.ZipFile) -> Dict[str, int]:
+        """Tamanho das imagens do corpo por rId (peso das partes)"""
+        rels_name = 'word/_rels/document.xml.rels'
+        if rels_name not in zf.NameToInfo:
+            return {}
+        sizes = {}
+        for rel in etree.fromstring(zf.read(rels_name)).iter(f'{{{PR}}}Relationship'):
+            info = zf.NameToInfo.get('word/' + rel.get('Target', '').lstrip('/').replace('word/', '', 1))
+            if info is not None:
+                sizes[rel.get('Id')] = info.file_size
+        return sizes
+
+    @staticmethod
+    def _plan(zf: zipfile.ZipFile) -> Tuple[Optional[_SplitPlan], Optional[str]]:
+        """
+        Encontra os pontos de corte que preservam o layout
+
+        Um corte é seguro em uma quebra de seção que inicia nova página
+        (nextPage) ou antes de um parágrafo com "quebra de página antes" /
+        após um parágrafo que só contém uma quebra de página. Cortes no meio
+        de uma seção exigem que ela não tenha primeira página diferente; com
+        campos PAGE, só valem cortes em seções que reiniciam a numeração.
+
+        Returns:
+            Tupla (plano, None) ou (None, motivo para converter inteiro)
+        """
+        root = etree.fromstring(zf.read(DOCUMENT_PART))
+        body = root.find(_w('body'))
+        if body is None or body.find(_w('sectPr')) is None:
+            return None, 'documento sem seção final'
+        if root.find(f'.//{_w("footnoteReference")}') is not None or root.find(f'.//{_w("endnoteReference")}') is not None:
+            return None, 'notas de rodapé/fim numeradas continuamente'
+
+        fields = SplitService._field_codes(zf.read(DOCUMENT_PART))
+        for name in zf.namelist():
+            if re.match(r'word/(header|footer)\d*\.xml$', name):
+                fields += ' ' + SplitService._field_codes(zf.read(name))
+        if _GLOBAL_FIELDS.search(fields):
+            return None, 'campos que dependem do documento inteiro (total de páginas, índice, referências)'
+        has_page_numbers = bool(_PAGE_FIELD.search(fields))
+
+        children = [child for child in body if child.tag != _w('sectPr')]
+        counted, style_numbering = SplitService._counted_lists(zf)
+        media = SplitService._media_sizes(zf)
+
+        # Seção de cada elemento: índice do parágrafo que a encerra (-1 = sectPr final)
+        section_end = [-1] * len(children)
+        owner = -1
+        for index in range(len(children) - 1, -1, -1):
+            if children[index].find(f'{_w("pPr")}/{_w("sectPr")}') is not None:
+                owner = index
+            section_end[index] = owner
+
+        def sect_pr(end: int) -> etree._Element:
+            if end == -1:
+                return body.find(_w('sectPr'))
+            return children[end].find(f'{_w("pPr")}/{_w("sectPr")}')
+
+        weights: List[int] = []
+        lists_by_element: List[Set[str]] = []
+        candidates: List[Tuple[int, int]] = []
+        for index, child in enumerate(children):
+            weight = len(etree.tostring(child))
+            weight += sum(media.get(blip.get(f'{{{R}}}embed'), 0) for blip in child.iter('{*}blip'))
+            weights.append(weight)
+
+            num_ids = set()
+            for paragraph in ([child] if child.tag == _w('p') else child.iter(_w('p'))):
+                num_id = paragraph.find(f'{_w("pPr")}/{_w("numPr")}/{_w("numId")}')
+                style = paragraph.find(f'{_w("pPr")}/{_w("pStyle")}')
+                if num_id is not None:
+                    num_ids.add(num_id.get(_w('val')))
+                elif style is not None and style.get(_w('val')) in style_numbering:
+                    num_ids.add(style_numbering[style.get(_w('val'))])
+            lists_by_element.append(num_ids & counted)
+
+            if index == 0:
+                continue
+            # Quebra de seção no parágrafo anterior: corte entre as seções
+            if section_end[index - 1] == index - 1:
+                following = sect_pr(section_end[index])
+                section_type = following.find(_w('type'))
+                restarts = following.find(_w('pgNumType')) is not None and \
+                    following.find(_w('pgNumType')).get(_w('start')) is not None
+                if (section_type.get(_w('val')) if section_type is not None else None) in _RESTARTING_SECTION_TYPES \
+                        and (restarts or not has_page_numbers):
+                    candidates.append((index, index))
+                continue
+            # Cortes no meio da seção: nunca com numeração de páginas nem primeira página diferente
+            if child.tag != _w('p') or has_page_numbers or sect_pr(section_end[index]).find(_w('titlePg')) is not None:
+                continue
+            properties = child.find(_w('pPr'))
+            if properties is not None and properties.find(_w('pageBreakBefore')) is not None:
+                candidates.append((index, index))
+            elif SplitService._is_page_break_only(child) and index + 1 < len(children) \
+                    and section_end[index] != index:
+                candidates.append((index, index + 1))
+
+        # Listas numeradas não podem atravessar o corte (a numeração recomeçaria)
+        if counted:
+            before: List[Set[str]] = []
+            seen: Set[str] = set()
+            for num_ids in lists_by_element:
+                seen = seen | num_ids
+                before.append(seen)
+            after: List[Set[str]] = [set()] * (len(children) + 1)
+            seen = set()
+            for index in range(len(children) - 1, -1, -1):
+                seen = seen | lists_by_element[index]
+                after[index] = seen
+            candidates = [(end, start) for end, start in candidates if not (before[end - 1] & after[start])]
+
+        if not candidates:
+            return None, 'nenhuma quebra de seção ou página segura para dividir'
+        return _SplitPlan(root, children, candidates, weights), None
+
+    @staticmethod
+    def _is_page_break_only(paragraph: etree._Element) -> bool:
+        """Parágrafo sem texto cujo único conteúdo é uma quebra de página"""
+        breaks = [br for br in paragraph.iter(_w('br')) if br.get(_w('type')) == 'page']
+        texts = [t for t in paragraph.iter(_w('t')) if t.text]
+        drawings = paragraph.find(f'.//{_w("drawing")}')
+        return len(breaks) == 1 and not texts and drawings is None
+
+    @staticmethod
+    def _choose_cuts(plan: _SplitPlan, chunks: int) -> List[Tuple[int, int]]:
+        """Escolhe até chunks-1 cortes que dividem o peso do documento em partes próximas"""
+        total = sum(plan.weights)
+        prefix = [0]
+        for weight in plan.weights:
+            prefix.append(prefix[-1] + weight)
+
+        chosen: List[Tuple[int, int]] = []
+        for part in range(1, chunks):
+            target = total * part / chunks
+            remaining = [cut for cut in plan.cuts if not chosen or cut[0] > chosen[-1][1]]
+            if not remaining:
+                break
+            best = min(remaining, key=lambda cut: abs(prefix[cut[0]] - target))
+            if not chosen or best != chosen[-1]:
+                chosen.append(best)
+        return chosen
+
+    @staticmethod
+    def _build_chunk(plan: _SplitPlan, start: int, end: int) -> bytes:
+        """XML do corpo com os elementos [start, end) e a seção que os encerra"""
+        root = plan.root
+        new_root = etree.Element(root.tag, root.attrib, nsmap=root.nsmap)
+        for child in root:
+            if child.tag != _w('body'):
+                new_root.append(copy.deepcopy(child))
+        body = etree.SubElement(new_root, _w('body'))
+        elements = [copy.deepcopy(element) for element in plan.children[start:end]]
+        body.extend(elements)
+
+        # A seção do último elemento vira a seção final da parte
+        last = elements[-1]
+        own = last.find(f'{_w("pPr")}/{_w("sectPr")}')
+        if own is not None:
+            own.getparent().remove(own)
+            body.append(own)
+        else:
+            following = next(
+                (child.find(f'{_w("pPr")}/{_w("sectPr")}') for child in plan.children[end:]
+                 if child.find(f'{_w("pPr")}/{_w("sectPr")}') is not None),
+                None
+            )
+            if following is None:
+                following = root.find(_w('body')).find(_w('sectPr'))
+            body.append(copy.deepcopy(following))
+        return etree.tostring(new_root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+    @staticmethod
+    def split(docx_bytes: bytes, max_chunks: int) -> Tuple[List[bytes], Optional[str]]:
+        """
+        Divide um DOCX em até `max_chunks` DOCX menores, na ordem original
+
+        Args:
+            docx_bytes: DOCX preenchido
+            max_chunks: Número máximo de partes
+
+        Returns:
+            Tupla (partes, None) ou ([], motivo para converter inteiro)
+        """
+        with zipfile.ZipFile(io.BytesIO(docx_bytes)) as zf:
+            plan, reason = SplitService._plan(zf)
+            if plan is None:
+                return [], reason
+
+            cuts = SplitService._choose_cuts(plan, max_chunks)
+            bounds = []
+            start = 0
+            for end, next_start in cuts:
+                bounds.append((start, end))
+                start = next_start
+            bounds.append((start, len(plan.children)))
+
+            method, level = zip_compression(INTERMEDIATE_DOCX_COMPRESSION)
+            parts = []
+            for start, end in bounds:
+                buffer = io.BytesIO()
+                with zipfile.ZipFile(buffer, 'w', compression=method, compresslevel=level) as dst:
+                    for info in zf.infolist():
+                        if info.filename == DOCUMENT_PART:
+                            dst.writestr(DOCUMENT_PART, SplitService._build_chunk(plan, start, end))
+                        else:
+                            copy_member_raw(zf, dst, info)
+                parts.append(buffer.getvalue())
+        return parts, None
+
+    @staticmethod
+    def concatenate(pdfs: List[bytes]) -> bytes:
+        """Junta os PDFs das partes em um só, na ordem recebida (marcadores preservados)"""
+        writer = PdfWriter()
+        for pdf_bytes in pdfs:
+            writer.append(PdfReader(io.BytesIO(pdf_bytes)))
+        output = io.BytesIO()
+        writer.write(output)
+        return output.getvalue()
+
+    @staticmethod
+    def _convert_part(docx_bytes: bytes, quality: str) -> Tuple[bytes, float]:
+        # As partes esperam por slots sem serem recusadas: a requisição já foi admitida
+        estimate = cost_model.estimate(extract_features(docx_bytes))
+        with background_work(), span('split.part', size=len(docx_bytes)):
+            pdf_bytes = PdfService.convert_docx_bytes_to_pdf(docx_bytes, quality=quality, estimate=estimate)
+        return pdf_bytes, estimate.actual
+
+    @staticmethod
+    def convert(
+        docx_bytes: bytes,
+        quality: str,
+        estimate: Optional[CostEstimate] = None
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Converte um DOCX em partes paralelas ou, se não for seguro/vantajoso, inteiro
+
+        Args:
+            docx_bytes: DOCX preenchido
+            quality: Qualidade do PDF já validada
+            estimate: Custo estimado do documento inteiro
+
+        Returns:
+            Tupla (pdf_bytes, stats da divisão: {"chunks", "reason"})
+
+        Raises:
+            ServerOverloadedError: Se não houver capacidade de conversão (429/503)
+            Exception: Se houver erro na conversão
+        """
+        def whole(reason: str) -> Tuple[bytes, Dict[str, Any]]:
+            stage_logger.info("Conversão sem divisão: %s", reason)
+            pdf_bytes = PdfService.convert_docx_bytes_to_pdf(docx_bytes, quality=quality, estimate=estimate)
+            return pdf_bytes, {'chunks': 1, 'reason': reason}
+
+        if PdfWriter is None:
+            return whole('pacote pypdf não instalado')
+        if estimate is not None and estimate.seconds < SPLIT_MIN_ESTIMATED_SECONDS:
+            return whole(f'custo estimado abaixo de {SPLIT_MIN_ESTIMATED_SECONDS:g}s')
+
+        max_chunks = SPLIT_MAX_CHUNKS if SPLIT_MAX_CHUNKS > 0 else PdfService.conversion_capacity()
+        if max_chunks < 2:
+            return whole('apenas uma conversão simultânea disponível')
+
+        start_split = time.time()
+        with span('split.plan', max_chunks=max_chunks) as plan_span:
+            try:
+                parts, reason = SplitService.split(docx_bytes, max_chunks)
+            except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError) as e:
+                parts, reason = [], f'documento não pôde ser analisado ({str(e)})'
+            plan_span.set_attribute('chunks', len(parts))
+        split_time = time.time() - start_split
+        stage_duration.observe(split_time, stage='split')
+        if len(parts) < 2:
+            return whole(reason or 'nenhuma divisão vantajosa')
+        stage_logger.info("✓ Documento dividido em %s partes em %.3fs", len(parts), split_time)
+
+        get_conversion_limiter().admit()
+        start_convert = time.time()
+        with ThreadPoolExecutor(max_workers=len(parts), thread_name_prefix='split') as executor:
+            # Cada parte herda o contexto da requisição (faixa de prioridade, span corrente)
+            futures = [
+                executor.submit(contextvars.copy_context().run, SplitService._convert_part, part, quality)
+                for part in parts
+            ]
+            results = [future.result() for future in futures]
+        convert_time = time.time() - start_convert
+        pdfs = [pdf for pdf, _ in results]
+        if estimate is not None:
+            # Histórico do template: custo do documento inteiro, somando as partes (a
+            # calibração já recebeu cada parte), para a próxima decisão de dividir
+            cost_model.observe(estimate, sum(seconds for _, seconds in results), calibrate=False)
+
+        with span('split.concatenate', chunks=len(pdfs)):
+            pdf_bytes = SplitService.concatenate(pdfs)
+        stage_logger.info("✓ %s partes convertidas em paralelo em %.3fs e concatenadas", len(pdfs), convert_time)
+        return pdf_bytes, {'chunks': len(pdfs), 'reason': None, 'conversion_time': round(convert_time, 3)}
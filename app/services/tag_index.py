@@ -0,0 +1,116 @@
+"""
+Índice pré-compilado das posições de tags em um template
+
+As posições dos placeholders {TAG} de um template não mudam entre
+renderizações. O índice é compilado uma única vez (parte, caminho do
+elemento e texto original de cada run com tag) e cada renderização aplica os
+valores diretamente nessas posições, sem percorrer o documento inteiro.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import re
+from typing import Any, Dict, List, NamedTuple, Set, Tuple
+from docx import Document
+from docx.opc.part import XmlPart
+from docx.text.run import Run
+from app.utils.logger import logger, stage_logger
+from app.services.docx_service import DocxService, TagMatcher
+from config.settings import TAG_OPEN, TAG_CLOSE, TAG_FORMAT
+
+
+class TagLocation(NamedTuple):
+    """Posição de um run com tag(s) dentro de uma parte do pacote DOCX"""
+    part_name: str  # Ex.: /word/document.xml, /word/header1.xml
+    path: Tuple[int, ...]  # Índices dos filhos desde a raiz da parte até o <w:r>
+    text: str  # Texto original do run no template
+
+
+def _xml_parts(doc: Document) -> Dict[str, Any]:
+    """Mapeia nome da parte -> elemento raiz, para as partes XML do documento"""
+    return {
+        str(part.partname): part.element
+        for part in doc.part.package.iter_parts()
+        if isinstance(part, XmlPart)
+    }
+
+
+class TagIndex:
+    """Localizações de todas as tags de um template"""
+
+    def __init__(self, locations: List[TagLocation]):
+        self.locations = locations
+
+    @classmethod
+    def compile(cls, doc: Document) -> "TagIndex":
+        """
+        Percorre o documento uma vez e registra onde há tags
+
+        São indexados os runs que o DocxService visitaria (parágrafos, tabelas,
+        cabeçalhos e rodapés) e cujo texto contém o delimitador de abertura,
+        de modo que aplicar o índice equivale a substituir no documento todo.
+
+        Args:
+            doc: Documento Word recém-aberto (não modificado)
+
+        Returns:
+            Índice compilado
+        """
+        part_names = {id(root): name for name, root in _xml_parts(doc).items()}
+        locations = []
+
+        for run in DocxService.iter_runs(doc):
+            text = run.text
+            if TAG_OPEN not in text:
+                continue
+
+            element = run._r
+            path = []
+            parent = element.getparent()
+            while parent is not None:
+                path.append(parent.index(element))
+                element, parent = parent, parent.getparent()
+
+            locations.append(TagLocation(part_names[id(element)], tuple(reversed(path)), text))
+
+        logger.info(f"✓ Índice de tags compilado: {len(locations)} runs com tags")
+        return cls(locations)
+
+    @property
+    def tags(self) -> Set[str]:
+        """Tags {TAG} presentes no template"""
+        pattern = re.compile(TAG_FORMAT)
+        return {
+            match[len(TAG_OPEN):-len(TAG_CLOSE)]
+            for location in self.locations
+            for match in pattern.findall(location.text)
+        }
+
+    def apply(self, doc: Document, replacements: Dict[str, Any]) -> int:
+        """
+        Aplica as substituições diretamente nas posições indexadas
+
+        Args:
+            doc: Cópia intacta do documento a partir do qual o índice foi compilado
+            replacements: Dicionário com tags e valores
+
+        Returns:
+            Número de ocorrências substituídas
+        """
+        matcher = TagMatcher(replacements)
+        if not matcher:
+            return 0
+
+        roots = _xml_parts(doc)
+        replaced = 0
+        for location in self.locations:
+            new_text, count = matcher.sub(location.text)
+            if not count:
+                continue
+            element = roots[location.part_name]
+            for position in location.path:
+                element = element[position]
+            Run(element, None).text = new_text
+            replaced += count
+
+        stage_logger.info("✓ Substituição via índice concluída: %s ocorrências substituídas", replaced)
+        return replaced
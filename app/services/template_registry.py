@@ -0,0 +1,250 @@
+"""
+Registro de templates DOCX
+
+Permite enviar um template uma única vez e renderizá-lo depois apenas pelo
+seu id (hash SHA-256 do conteúdo). Os templates ficam parseados e indexados
+em memória (LRU) com um armazenamento em disco por trás.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from docx import Document
+from app.utils.logger import logger
+from app.services.docx_service import DocxService
+from app.services.tag_index import TagIndex
+from app.services.cost_model import DocumentFeatures, extract_features
+from config.settings import (
+    TEMPLATE_CACHE_MAX_ENTRIES,
+    TEMPLATE_STORE_DIR,
+    ERROR_MESSAGES
+)
+
+TEMPLATE_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UnknownTemplateError(Exception):
+    """Template não registrado (o cliente deve enviá-lo e tentar novamente)"""
+
+    def __init__(self, template_id: str):
+        self.template_id = template_id
+        super().__init__(ERROR_MESSAGES['unknown_template'])
+
+
+class Template:
+    """
+    Documento DOCX de origem de uma renderização
+
+    Templates registrados mantêm o documento parseado em memória e entregam
+    uma cópia a cada renderização; documentos avulsos (enviados inline) são
+    parseados uma única vez, sem cópia.
+    """
+
+    def __init__(self, doc_bytes: bytes, registered: bool = False):
+        self.doc_bytes = doc_bytes
+        self.template_id = hashlib.sha256(doc_bytes).hexdigest()
+        self.size = len(doc_bytes)
+        self.registered = registered
+        self.created_at = time.time()
+        self._document: Optional[Document] = None
+        self._index: Optional[TagIndex] = None
+        self._features: Optional[DocumentFeatures] = None
+        self._lock = threading.Lock()
+
+    def _master(self) -> Document:
+        """
+        Documento parseado mantido pelo template, usado apenas como origem de cópias
+
+        O master nunca é navegado (doc.paragraphs, doc.sections...): o
+        python-docx guarda em cache objetos como o corpo do documento, e um
+        deepcopy feito depois disso copiaria esses objetos desligados da
+        árvore XML copiada.
+        """
+        with self._lock:
+            if self._document is None:
+                self._document = DocxService.load_document(self.doc_bytes)
+            return self._document
+
+    def new_document(self) -> Document:
+        """
+        Retorna um documento pronto para receber as substituições
+
+        Returns:
+            Cópia do documento parseado (registrados) ou documento recém-aberto
+        """
+        if not self.registered:
+            return DocxService.load_document(self.doc_bytes)
+        return copy.deepcopy(self._master())
+
+    @property
+    def index(self) -> TagIndex:
+        """Índice de posições das tags, compilado uma vez por template"""
+        if self._index is None:
+            index = TagIndex.compile(self.new_document())
+            with self._lock:
+                if self._index is None:
+                    self._index = index
+        return self._index
+
+    @property
+    def features(self) -> DocumentFeatures:
+        """Características usadas na estimativa de custo, extraídas uma vez por template"""
+        if self._features is None:
+            self._features = extract_features(self.doc_bytes)
+        return self._features
+
+    @property
+    def tags(self):
+        """Tags {TAG} encontradas no template"""
+        return self.index.tags
+
+    def fill(self, replacements: Dict[str, Any]) -> Document:
+        """
+        Retorna um documento com as substituições aplicadas
+
+        Templates registrados usam o índice pré-compilado (custo proporcional
+        ao número de tags); documentos avulsos passam pela substituição completa.
+
+        Args:
+            replacements: Dicionário com tags e valores
+
+        Returns:
+            Documento Word preenchido
+        """
+        doc = self.new_document()
+        if self.registered:
+            self.index.apply(doc, replacements)
+        else:
+            DocxService.replace_tags_in_document(doc, replacements)
+        return doc
+
+    def info(self) -> Dict[str, Any]:
+        """Metadados do template para as respostas da API"""
+        return {
+            'template_id': self.template_id,
+            'size': self.size,
+            'tags': sorted(self.tags),
+        }
+
+
+class TemplateRegistry:
+    """Registro de templates com LRU em memória e armazenamento em disco"""
+
+    def __init__(self, max_entries: int = TEMPLATE_CACHE_MAX_ENTRIES, store_dir: str = TEMPLATE_STORE_DIR):
+        self.max_entries = max(1, max_entries)
+        self.store_dir = store_dir
+        self._templates: "OrderedDict[str, Template]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+
+    @staticmethod
+    def is_valid_id(template_id: Any) -> bool:
+        """Verifica se o id tem o formato de um hash SHA-256"""
+        return isinstance(template_id, str) and bool(TEMPLATE_ID_PATTERN.match(template_id))
+
+    def _path(self, template_id: str) -> str:
+        return os.path.join(self.store_dir, f"{template_id}.docx")
+
+    def _remember(self, template: Template) -> None:
+        """Adiciona ao LRU em memória, descartando os menos usados"""
+        with self._lock:
+            self._templates[template.template_id] = template
+            self._templates.move_to_end(template.template_id)
+            while len(self._templates) > self.max_entries:
+                evicted_id, _ = self._templates.popitem(last=False)
+                logger.info(f"Template {evicted_id[:12]} removido da memória (LRU)")
+
+    def register(self, doc_bytes: bytes) -> Tuple[Template, bool]:
+        """
+        Registra um template (idempotente: o id é o hash do conteúdo)
+
+        Args:
+            doc_bytes: Bytes do documento DOCX
+
+        Returns:
+            Tupla (template, created) - created é False se já existia
+
+        Raises:
+            ValueError: Se o documento for inválido
+        """
+        template_id = hashlib.sha256(doc_bytes).hexdigest()
+        existing = self.get(template_id, required=False)
+        if existing is not None:
+            return existing, False
+
+        template = Template(doc_bytes, registered=True)
+        template.index  # Parseia e indexa já no registro (valida o DOCX)
+
+        path = self._path(template_id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(doc_bytes)
+        os.replace(tmp_path, path)
+
+        self._remember(template)
+        logger.info(f"✓ Template registrado: {template_id[:12]} ({template.size} bytes, {len(template.tags)} tags)")
+        return template, True
+
+    def get(self, template_id: str, required: bool = True) -> Optional[Template]:
+        """
+        Busca um template pelo id (memória, depois disco)
+
+        Args:
+            template_id: Hash SHA-256 do template
+            required: Se True, lança UnknownTemplateError quando não existe
+
+        Returns:
+            Template encontrado, ou None se não existe e required=False
+
+        Raises:
+            ValueError: Se o id não tiver o formato de um hash SHA-256
+            UnknownTemplateError: Se o template não existe e required=True
+        """
+        if not self.is_valid_id(template_id):
+            raise ValueError(ERROR_MESSAGES['invalid_template_id'])
+
+        with self._lock:
+            template = self._templates.get(template_id)
+            if template is not None:
+                self._templates.move_to_end(template_id)
+                return template
+
+        path = self._path(template_id)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                template = Template(f.read(), registered=True)
+            self._remember(template)
+            logger.info(f"Template {template_id[:12]} carregado do disco")
+            return template
+
+        if required:
+            raise UnknownTemplateError(template_id)
+        return None
+
+    def delete(self, template_id: str) -> bool:
+        """Remove um template da memória e do disco"""
+        with self._lock:
+            in_memory = self._templates.pop(template_id, None) is not None
+
+        path = self._path(template_id) if self.is_valid_id(template_id) else None
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+            return True
+        return in_memory
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado atual do registro"""
+        return {
+            'memory_entries': len(self._templates),
+            'max_entries': self.max_entries,
+        }
+
+
+# Registro global de templates da aplicação
+template_registry = TemplateRegistry()
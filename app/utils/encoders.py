@@ -4,9 +4,9 @@ Funções de codificação e decodificação
 Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
 """
 import base64
-from typing import Union
+from typing import BinaryIO, Iterator, Union
 from app.utils.logger import logger
-from config.settings import ERROR_MESSAGES
+from config.settings import ERROR_MESSAGES, BASE64_STREAM_CHUNK_SIZE
 
 
 def decode_base64_file(base64_string: str) -> bytes:
@@ -48,6 +48,54 @@ def encode_base64_file(file_bytes: bytes) -> str:
         raise ValueError(f"Erro ao codificar arquivo em Base64: {str(e)}")
 
 
+def base64_length(size: int) -> int:
+    """
+    Tamanho em caracteres da codificação Base64 (com padding) de `size` bytes
+
+    Args:
+        size: Tamanho do conteúdo em bytes
+
+    Returns:
+        Número de caracteres Base64
+    """
+    return (size + 2) // 3 * 4
+
+
+def iter_base64_chunks(content: Union[bytes, BinaryIO], chunk_size: int = BASE64_STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Codifica o conteúdo em Base64 bloco a bloco
+
+    Os blocos de entrada têm tamanho múltiplo de 3, de modo que a concatenação
+    das saídas é idêntica a base64.b64encode(conteúdo inteiro).
+
+    Args:
+        content: Bytes (fatiados sem cópia) ou arquivo binário aberto para leitura
+        chunk_size: Tamanho aproximado dos blocos de entrada
+
+    Yields:
+        Blocos ASCII em Base64
+    """
+    step = max(3, chunk_size - chunk_size % 3)
+
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        view = memoryview(content)
+        for start in range(0, len(view), step):
+            yield base64.b64encode(view[start:start + step])
+        return
+
+    while True:
+        chunk = content.read(step)
+        if not chunk:
+            return
+        # read() pode devolver menos que o pedido: completa o múltiplo de 3
+        while len(chunk) % 3:
+            more = content.read(3 - len(chunk) % 3)
+            if not more:
+                break
+            chunk += more
+        yield base64.b64encode(chunk)
+
+
 def is_valid_base64(s: str) -> bool:
     """
     Verifica se uma string é um Base64 válido
@@ -0,0 +1,402 @@
+"""
+Leitura das requisições de renderização (JSON, multipart ou DOCX bruto)
+
+O corpo é lido em streaming: o tamanho é verificado pelo Content-Length antes
+de qualquer leitura e, em JSON, o campo "document" é decodificado do Base64 em
+blocos direto para um buffer (em disco acima de INGEST_SPOOL_MAX_BYTES), sem
+materializar o corpo, a string Base64 e o dicionário JSON em memória. O pico
+de memória por requisição fica em torno de 1x o tamanho do documento.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import base64
+import binascii
+import json
+import re
+import tempfile
+import time
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+from flask import request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.utils.logger import logger, stage_logger
+from app.utils.metrics import stage_duration
+from app.utils.tracing import span
+from app.utils.validators import validate_priority
+from config.settings import (
+    MAX_FILE_SIZE,
+    MAX_CONTENT_LENGTH,
+    INGEST_CHUNK_SIZE,
+    INGEST_SPOOL_MAX_BYTES,
+    PIPELINE_TMP_DIR,
+    PRIORITY_HEADER,
+    ERROR_MESSAGES
+)
+
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# Campos enviados como JSON dentro de multipart/form-data ou da query string
+JSON_FIELDS = ('replacements', 'records')
+
+_WHITESPACE = b' \t\r\n'
+_STRING_SPECIAL = re.compile(rb'["\\]')
+_CONTAINER_SPECIAL = re.compile(rb'["{}\[\]]')
+_LITERAL_END = re.compile(rb'[,}\]\s]')
+# Bytes fora do alfabeto Base64 são descartados, como em base64.b64decode()
+_NON_BASE64 = bytes(
+    set(range(256)) - set(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=')
+)
+
+
+def payload_too_large_response(error: RequestEntityTooLarge):
+    """Resposta padrão para corpo/documento acima do limite"""
+    return jsonify({
+        'error': error.description or ERROR_MESSAGES['payload_too_large'],
+        'code': 'payload_too_large',
+        'max_file_size': MAX_FILE_SIZE
+    }), 413
+
+
+def _check_content_length(limit: int) -> None:
+    """Rejeita a requisição pelo Content-Length, antes de ler o corpo"""
+    if request.content_length is not None and request.content_length > limit:
+        logger.warning(f"⚠ Corpo de {request.content_length} bytes excede o limite de {limit} bytes")
+        raise RequestEntityTooLarge(ERROR_MESSAGES['payload_too_large'])
+
+
+def _check_document_size(size: int) -> None:
+    if size > MAX_FILE_SIZE:
+        logger.warning(f"⚠ Documento de {size} bytes excede MAX_FILE_SIZE ({MAX_FILE_SIZE} bytes)")
+        raise RequestEntityTooLarge(ERROR_MESSAGES['payload_too_large'])
+
+
+class _DocumentSpool:
+    """Buffer de destino do documento (memória até INGEST_SPOOL_MAX_BYTES, depois disco)"""
+
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(
+            max_size=INGEST_SPOOL_MAX_BYTES, dir=PIPELINE_TMP_DIR or None
+        )
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        _check_document_size(self.size)
+        self.file.write(data)
+
+    def getvalue(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _Base64Decoder:
+    """Decodificador Base64 incremental (blocos múltiplos de 4 caracteres)"""
+
+    def __init__(self, spool: _DocumentSpool):
+        self.spool = spool
+        self.pending = b''
+
+    def feed(self, data: bytes) -> None:
+        data = self.pending + data.translate(None, _NON_BASE64)
+        usable = len(data) // 4 * 4
+        self.pending = data[usable:]
+        if usable:
+            self._decode(data[:usable])
+
+    def close(self) -> None:
+        if self.pending:
+            self._decode(self.pending)
+            self.pending = b''
+
+    def _decode(self, data: bytes) -> None:
+        try:
+            self.spool.write(base64.b64decode(data))
+        except binascii.Error as e:
+            logger.error(f"Erro ao decodificar Base64: {str(e)}")
+            raise ValueError(ERROR_MESSAGES['invalid_base64'])
+
+
+class _JsonRequestReader:
+    """
+    Leitor incremental do objeto JSON de nível superior de uma requisição
+
+    Os campos comuns (replacements, quality...) são pequenos e decodificados
+    com json.loads; o valor string do campo "document" é consumido em blocos
+    e enviado ao decodificador Base64 (ou, com input_type "doc", gravado como
+    bytes), sem montar a string inteira.
+    """
+
+    def __init__(self, stream: BinaryIO, allow_raw_document: bool):
+        self.stream = stream
+        self.allow_raw_document = allow_raw_document
+        self.buffer = b''
+        self.pos = 0
+        self.spool: Optional[_DocumentSpool] = None
+
+    # -- Buffer ----------------------------------------------------------------
+
+    def _fill(self) -> None:
+        """Lê o próximo bloco do corpo (erro se o corpo terminar no meio do JSON)"""
+        chunk = self.stream.read(INGEST_CHUNK_SIZE)
+        if not chunk:
+            raise ValueError(ERROR_MESSAGES['invalid_json_body'])
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def _peek(self) -> int:
+        """Próximo byte significativo (pula espaços)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            self._fill()
+
+    def _expect(self, char: bytes) -> None:
+        if self._peek() != char[0]:
+            raise ValueError(ERROR_MESSAGES['invalid_json_body'])
+        self.pos += 1
+
+    # -- Valores ---------------------------------------------------------------
+
+    def _scan_string(self, on_text: Callable[[bytes], None], on_escape: Callable[[bytes], None]) -> None:
+        """Consome uma string JSON (o buffer deve estar na aspa de abertura)"""
+        self.pos += 1
+        while True:
+            match = _STRING_SPECIAL.search(self.buffer, self.pos)
+            if match is None:
+                on_text(self.buffer[self.pos:])
+                self.pos = len(self.buffer)
+                self._fill()
+                continue
+
+            on_text(self.buffer[self.pos:match.start()])
+            self.pos = match.start()
+            if self.buffer[self.pos] == ord('"'):
+                self.pos += 1
+                return
+
+            # Sequência de escape: \x ou \uXXXX
+            while len(self.buffer) - self.pos < 2:
+                self._fill()
+            length = 6 if self.buffer[self.pos + 1] == ord('u') else 2
+            while len(self.buffer) - self.pos < length:
+                self._fill()
+            on_escape(self.buffer[self.pos:self.pos + length])
+            self.pos += length
+
+    def _read_raw_value(self) -> bytes:
+        """Consome um valor JSON qualquer e retorna seu texto original"""
+        parts: List[bytes] = []
+        first = self._peek()
+
+        if first == ord('"'):
+            parts.append(b'"')
+            self._scan_string(parts.append, parts.append)
+            parts.append(b'"')
+            return b''.join(parts)
+
+        if first in b'{[':
+            depth = 0
+            while True:
+                match = _CONTAINER_SPECIAL.search(self.buffer, self.pos)
+                if match is None:
+                    parts.append(self.buffer[self.pos:])
+                    self.pos = len(self.buffer)
+                    self._fill()
+                    continue
+                parts.append(self.buffer[self.pos:match.start()])
+                self.pos = match.start()
+                char = self.buffer[self.pos]
+                if char == ord('"'):
+                    parts.append(b'"')
+                    self._scan_string(parts.append, parts.append)
+                    parts.append(b'"')
+                    continue
+                parts.append(self.buffer[self.pos:self.pos + 1])
+                self.pos += 1
+                depth += 1 if char in b'{[' else -1
+                if depth == 0:
+                    return b''.join(parts)
+
+        # Número, true, false ou null
+        while True:
+            match = _LITERAL_END.search(self.buffer, self.pos)
+            if match is not None:
+                parts.append(self.buffer[self.pos:match.start()])
+                self.pos = match.start()
+                return b''.join(parts)
+            parts.append(self.buffer[self.pos:])
+            self.pos = len(self.buffer)
+            self._fill()
+
+    def _read_document(self, raw: bool) -> None:
+        """Consome a string do campo "document" direto para o spool"""
+        self.spool = _DocumentSpool()
+        # input_type "doc": bytes da string (equivalente a document.encode());
+        # caso contrário, Base64 decodificado em blocos
+        decoder = None if raw else _Base64Decoder(self.spool)
+        write = self.spool.write if raw else decoder.feed
+
+        # Escapes consecutivos são decodificados juntos (pares substitutos \uD83D\uDE00)
+        escapes: List[bytes] = []
+
+        def flush_escapes():
+            if escapes:
+                write(json.loads(b'"' + b''.join(escapes) + b'"').encode('utf-8'))
+                escapes.clear()
+
+        def on_text(data: bytes):
+            if data:
+                flush_escapes()
+                write(data)
+
+        self._scan_string(on_text, escapes.append)
+        flush_escapes()
+        if decoder is not None:
+            decoder.close()
+
+    # -- Objeto ----------------------------------------------------------------
+
+    def read(self) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        """
+        Lê o objeto JSON inteiro
+
+        Returns:
+            Tupla (params, doc_bytes)
+        """
+        params: Dict[str, Any] = {}
+        try:
+            self._expect(b'{')
+            if self._peek() == ord('}'):
+                self.pos += 1
+                return params, None
+
+            while True:
+                if self._peek() != ord('"'):
+                    raise ValueError(ERROR_MESSAGES['invalid_json_body'])
+                key = json.loads(self._read_raw_value())
+                self._expect(b':')
+
+                if key == 'document' and self._peek() == ord('"'):
+                    raw = self.allow_raw_document and str(params.get('input_type', 'base64')).lower() == 'doc'
+                    self._read_document(raw)
+                else:
+                    value = json.loads(self._read_raw_value())
+                    if key == 'input_type' and self.spool is not None and str(value).lower() == 'doc' \
+                            and self.allow_raw_document:
+                        # O documento já foi decodificado como Base64
+                        raise ValueError('Com input_type "doc", o campo "input_type" deve vir antes de "document"')
+                    if key != 'document':
+                        params[key] = value
+
+                separator = self._peek()
+                self.pos += 1
+                if separator == ord('}'):
+                    break
+                if separator != ord(','):
+                    raise ValueError(ERROR_MESSAGES['invalid_json_body'])
+
+            if self.spool is None:
+                return params, None
+            return params, self.spool.getvalue()
+
+        except json.JSONDecodeError:
+            raise ValueError(ERROR_MESSAGES['invalid_json_body'])
+        finally:
+            if self.spool is not None:
+                self.spool.close()
+
+
+def _parse_json_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte os campos JSON (ex.: replacements) de formulário/query string"""
+    params = dict(fields)
+    for name in JSON_FIELDS:
+        if isinstance(params.get(name), str):
+            try:
+                params[name] = json.loads(params[name])
+            except json.JSONDecodeError:
+                raise ValueError(f'Campo "{name}" deve ser um JSON válido')
+    return params
+
+
+def read_render_request(allow_raw_document: bool = False) -> Tuple[Dict[str, Any], Optional[bytes]]:
+    """
+    Lê os parâmetros e o documento de uma requisição de renderização
+
+    Formatos aceitos:
+        - application/json: {"document": "BASE64", "replacements": {...}, ...}
+        - multipart/form-data: arquivo "document" + demais campos
+          ("replacements" como string JSON)
+        - DOCX bruto (Content-Type DOCX_MIMETYPE): parâmetros na query string
+          ("replacements" como string JSON)
+
+    Nos formatos binários o arquivo não passa por Base64 nem por strings
+    intermediárias: os bytes vão direto para o template. Em JSON o corpo é
+    lido incrementalmente e o Base64 decodificado em blocos.
+
+    Args:
+        allow_raw_document: Em JSON, aceita "input_type": "doc" (documento
+            como string de bytes, usado por /process)
+
+    Returns:
+        Tupla (params, doc_bytes) - doc_bytes é None quando o documento não foi
+        enviado (ex.: renderização por template_id)
+
+    Raises:
+        ValueError: Se o Content-Type não for suportado ou os dados forem inválidos
+        RequestEntityTooLarge: Se o corpo ou o documento excederem os limites
+    """
+    start = time.perf_counter()
+    with span('request.decode', content_type=request.mimetype) as decode_span:
+        params, doc_bytes = _read_request(allow_raw_document)
+        if doc_bytes is not None:
+            decode_span.set_attribute('document.size', len(doc_bytes))
+            stage_duration.observe(time.perf_counter() - start, stage='decode')
+    return params, doc_bytes
+
+
+def _read_request(allow_raw_document: bool) -> Tuple[Dict[str, Any], Optional[bytes]]:
+    if request.is_json:
+        _check_content_length(MAX_CONTENT_LENGTH)
+        params, doc_bytes = _JsonRequestReader(request.stream, allow_raw_document).read()
+        if doc_bytes is not None:
+            stage_logger.info("✓ Documento decodificado em streaming (%s bytes)", len(doc_bytes))
+        return params, doc_bytes
+
+    if request.mimetype == 'multipart/form-data':
+        _check_content_length(MAX_CONTENT_LENGTH)
+        params = _parse_json_fields(request.form.to_dict())
+        upload = request.files.get('document')
+        if upload is None:
+            return params, None
+        doc_bytes = upload.stream.read(MAX_FILE_SIZE + 1)
+        _check_document_size(len(doc_bytes))
+        stage_logger.info("✓ Documento recebido via multipart (%s bytes)", len(doc_bytes))
+        return params, doc_bytes
+
+    if request.mimetype == DOCX_MIMETYPE:
+        _check_content_length(MAX_FILE_SIZE)
+        params = _parse_json_fields(request.args.to_dict())
+        doc_bytes = request.stream.read(MAX_FILE_SIZE + 1)
+        _check_document_size(len(doc_bytes))
+        stage_logger.info("✓ Documento recebido como DOCX bruto (%s bytes)", len(doc_bytes))
+        return params, doc_bytes or None
+
+    raise ValueError(ERROR_MESSAGES['invalid_json'])
+
+
+def read_priority(params: Dict[str, Any], default: str) -> str:
+    """
+    Faixa de prioridade da requisição: campo "priority" ou header X-Priority
+
+    Args:
+        params: Parâmetros já lidos por read_render_request
+        default: Faixa padrão do endpoint (interactive ou bulk)
+
+    Returns:
+        Faixa validada
+    """
+    return validate_priority(params.get('priority') or request.headers.get(PRIORITY_HEADER), default)
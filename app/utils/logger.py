@@ -1,10 +1,131 @@
 """
 Configuração de logging para a aplicação
 
+Por padrão os registros são gravados por uma thread de background: o handler
+da aplicação só enfileira o registro (fila limitada, sem bloquear a
+requisição) e a formatação e a escrita em stderr acontecem fora do caminho
+da requisição. Com LOG_JSON, cada registro vira uma linha JSON com o id da
+requisição e os campos extras. As mensagens detalhadas por etapa vão para o
+logger `doc2pdf.stages` e são amostradas por requisição (LOG_STAGE_SAMPLE_RATE).
+
 Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
 """
+import atexit
+import datetime
+import json
 import logging
-from config.settings import LOG_LEVEL, LOG_FORMAT, LOG_DATE_FORMAT
+import logging.handlers
+import os
+import queue
+import random
+import zlib
+from typing import Any, Dict, Optional
+from config.settings import (
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_DATE_FORMAT,
+    LOG_JSON,
+    LOG_ASYNC,
+    LOG_QUEUE_SIZE,
+    LOG_STAGE_SAMPLE_RATE
+)
+
+# Atributos padrão de um LogRecord (o restante são campos passados em `extra`)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def _current_request_id() -> Optional[str]:
+    # Import tardio: o módulo de tracing usa este logger
+    from app.utils.tracing import current_request_id
+    return current_request_id()
+
+
+class RequestIdFilter(logging.Filter):
+    """Anota o registro com o id da requisição (na thread que o emitiu)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _current_request_id() or '-'
+        return True
+
+
+class StageSampler(logging.Filter):
+    """
+    Amostra as mensagens detalhadas por etapa
+
+    A decisão é por requisição (hash do id): uma requisição amostrada mantém
+    todas as suas etapas. Avisos e erros nunca são descartados.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = min(1.0, max(0.0, rate))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        request_id = _current_request_id()
+        if request_id is None:
+            return random.random() < self.rate
+        return zlib.crc32(request_id.encode()) % 10000 < self.rate * 10000
+
+
+class JsonFormatter(logging.Formatter):
+    """Um objeto JSON por linha, com o id da requisição e os campos extras"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'func': record.funcName,
+            'message': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', '-')
+        if request_id != '-':
+            entry['request_id'] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enfileira sem bloquear: com a fila cheia o registro é descartado e contado"""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Mesma memória, outra thread: a mensagem é formatada só no escritor
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue_handler: Optional[_NonBlockingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_stream_handler: Optional[logging.Handler] = None
+
+
+def _start_listener() -> None:
+    """(Re)cria a fila e a thread escritora (também no filho após um fork)"""
+    global _listener
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE))
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, _stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
 
 
 def setup_logger(name: str = 'doc2pdf') -> logging.Logger:
@@ -17,6 +138,8 @@ def setup_logger(name: str = 'doc2pdf') -> logging.Logger:
     Returns:
         Logger configurado
     """
+    global _queue_handler, _stream_handler
+
     logger = logging.getLogger(name)
     logger.setLevel(LOG_LEVEL)
 
@@ -24,18 +147,42 @@ def setup_logger(name: str = 'doc2pdf') -> logging.Logger:
     if logger.handlers:
         return logger
 
-    # Handler para console
+    # Handler para console (escrito pela thread de background no modo assíncrono)
     handler = logging.StreamHandler()
     handler.setLevel(LOG_LEVEL)
 
     # Formatter
-    formatter = logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT)
-    handler.setFormatter(formatter)
+    handler.setFormatter(JsonFormatter() if LOG_JSON else logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
 
+    if LOG_ASYNC:
+        _stream_handler = handler
+        _queue_handler = _NonBlockingQueueHandler(queue.Queue())
+        _start_listener()
+        atexit.register(_stop_listener)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_start_listener)
+        handler = _queue_handler
+
+    handler.addFilter(RequestIdFilter())
     logger.addHandler(handler)
 
     return logger
 
 
+def logging_status() -> Dict[str, Any]:
+    """Estado do logging (para health check)"""
+    return {
+        'async': _queue_handler is not None,
+        'json': LOG_JSON,
+        'stage_sample_rate': LOG_STAGE_SAMPLE_RATE,
+        'queued': _queue_handler.queue.qsize() if _queue_handler is not None else 0,
+        'dropped': _queue_handler.dropped if _queue_handler is not None else 0,
+    }
+
+
 # Logger padrão da aplicação
 logger = setup_logger()
+
+# Mensagens detalhadas por etapa do pipeline (amostradas por requisição)
+stage_logger = logging.getLogger('doc2pdf.stages')
+stage_logger.addFilter(StageSampler(LOG_STAGE_SAMPLE_RATE))
@@ -0,0 +1,389 @@
+"""
+Métricas da aplicação no formato de texto do Prometheus
+
+Registro em processo, sem dependências externas: contadores, gauges e
+histogramas com labels, cada um protegido por lock (seguros com as threads
+do gunicorn). Com vários workers, cada processo grava periodicamente um
+snapshot das suas métricas em METRICS_MULTIPROC_DIR e a exposição soma os
+snapshots de todos eles - contadores e histogramas de todos os processos,
+gauges apenas dos processos vivos.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import atexit
+import bisect
+import glob
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from app.utils.logger import logger
+from config.settings import METRICS_MULTIPROC_DIR, METRICS_FLUSH_INTERVAL, METRICS_BUCKETS
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    """Base das métricas: valores por combinação de labels, sob um lock"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Métrica {self.name} espera os labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _reset(self) -> None:
+        """Zera os valores (processo filho após fork: o lock pode ter sido copiado travado)"""
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _samples(self) -> List[List[Any]]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado serializável em JSON (para a exposição e o modo multiprocesso)"""
+        return {
+            'type': self.kind,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+            'samples': self._samples(),
+        }
+
+
+class Counter(_Metric):
+    """Contador monotônico"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Valor instantâneo, definido diretamente ou lido de uma função na coleta"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable[[], Union[float, Dict[LabelValues, float]]]] = None
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], Union[float, Dict[LabelValues, float]]]) -> None:
+        """
+        Lê o valor de `function` a cada coleta
+
+        Args:
+            function: Retorna o valor (gauge sem labels) ou um dicionário
+                {tupla de valores dos labels: valor}
+        """
+        self._function = function
+
+    def _samples(self) -> List[List[Any]]:
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception as e:
+                logger.warning(f"⚠ Falha ao coletar a métrica {self.name}: {str(e)}")
+                values = {}
+            if not isinstance(values, dict):
+                values = {(): values}
+            with self._lock:
+                self._values = {tuple(str(v) for v in key): float(value) for key, value in values.items()}
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    """Distribuição de valores em buckets cumulativos (le), com soma e contagem"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = METRICS_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(float(bound) for bound in buckets if bound != math.inf)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts_and_sum = self._values.get(key)
+            if counts_and_sum is None:
+                # Contagem por bucket (não cumulativa), o último é o +Inf
+                counts_and_sum = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts_and_sum[0][index] += 1
+            counts_and_sum[1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observa a duração do bloco em segundos"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[List[Any]]:
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**super().snapshot(), 'buckets': self.buckets}
+
+
+def pid_alive(pid: int) -> bool:
+    """Indica se o processo existe (snapshots de workers gunicorn encerrados)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(snapshots: List[Tuple[Dict[str, Any], bool]]) -> Dict[str, Dict[str, Any]]:
+    """Soma os snapshots de vários processos (gauges só dos vivos)"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for metrics, alive in snapshots:
+        for name, metric in metrics.items():
+            target = merged.setdefault(name, {**metric, 'samples': {}})
+            if metric['type'] == 'gauge' and not alive:
+                continue
+            samples = target['samples']
+            for sample in metric['samples']:
+                key = tuple(sample[0])
+                if metric['type'] != 'histogram':
+                    samples[key] = samples.get(key, 0.0) + sample[1]
+                    continue
+                counts, total = samples.get(key, ([0] * len(sample[1]), 0.0))
+                samples[key] = ([a + b for a, b in zip(counts, sample[1])], total + sample[2])
+    return merged
+
+
+def _render(merged: Dict[str, Dict[str, Any]]) -> str:
+    """Formato de texto 0.0.4 do Prometheus"""
+    lines = []
+    for name, metric in merged.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric['labelnames']
+        for key, value in sorted(metric['samples'].items()):
+            if metric['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric['buckets'] + [math.inf], counts):
+                cumulative += count
+                le = _format_labels(labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{name}_bucket{le} {_format_value(cumulative)}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labelnames, key)} {_format_value(cumulative)}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsRegistry:
+    """
+    Registro das métricas do processo
+
+    Sem diretório multiprocesso, a exposição lê apenas o próprio processo.
+    Com ele, o processo grava `<pid>.json` a cada `flush_interval` segundos
+    (e a cada exposição e ao encerrar) e a exposição soma os arquivos de
+    todos os workers. Após um fork (gunicorn --preload), o filho recomeça
+    com as métricas zeradas e seu próprio arquivo.
+    """
+
+    def __init__(self, multiproc_dir: str = '', flush_interval: float = 5.0):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = max(0.5, flush_interval)
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._flusher: Optional[threading.Thread] = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = METRICS_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """Snapshot de todas as métricas do processo"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.multiproc_dir, f'{pid}.json')
+
+    def flush(self, snapshot: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """Grava o snapshot do processo no diretório multiprocesso (escrita atômica)"""
+        if not self.multiproc_dir:
+            return
+        path = self._path(os.getpid())
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as snapshot_file:
+            json.dump(snapshot if snapshot is not None else self.collect(), snapshot_file)
+        os.replace(temporary, path)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"⚠ Falha ao gravar snapshot de métricas: {str(e)}")
+
+    def start(self) -> None:
+        """Inicia a gravação periódica do snapshot (apenas no modo multiprocesso)"""
+        self._started = True
+        if not self.multiproc_dir or self._flusher is not None:
+            return
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        self.flush()
+        self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+        logger.info(f"✓ Métricas multiprocesso em {self.multiproc_dir} (snapshot a cada {self.flush_interval:g}s)")
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric._reset()
+        self._flusher = None
+        if self._started:
+            self.start()
+
+    def expose(self) -> str:
+        """Todas as métricas no formato de texto do Prometheus"""
+        own = self.collect()
+        if not self.multiproc_dir:
+            return _render(_merge([(own, True)]))
+
+        self.flush(own)
+        snapshots = [(own, True)]
+        for path in glob.glob(os.path.join(self.multiproc_dir, '*.json')):
+            try:
+                pid = int(os.path.basename(path)[:-len('.json')])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            try:
+                with open(path, encoding='utf-8') as snapshot_file:
+                    snapshots.append((json.load(snapshot_file), pid_alive(pid)))
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠ Snapshot de métricas ilegível ({path}): {str(e)}")
+        return _render(_merge(snapshots))
+
+
+registry = MetricsRegistry(METRICS_MULTIPROC_DIR, METRICS_FLUSH_INTERVAL)
+
+# Pipeline
+stage_duration = registry.histogram(
+    'doc2pdf_stage_duration_seconds',
+    'Duração de cada etapa do pipeline (decode, replace, save, rewrite, merge, split, convert, encode)',
+    ('stage',))
+
+# HTTP
+http_requests = registry.counter(
+    'doc2pdf_http_requests_total', 'Requisições HTTP atendidas', ('endpoint', 'method', 'status'))
+http_request_duration = registry.histogram(
+    'doc2pdf_http_request_duration_seconds', 'Tempo de resposta das requisições HTTP', ('endpoint',))
+http_request_bytes = registry.counter(
+    'doc2pdf_http_request_bytes_total', 'Bytes recebidos nos corpos das requisições', ('endpoint',))
+http_response_bytes = registry.counter(
+    'doc2pdf_http_response_bytes_total', 'Bytes enviados nos corpos das respostas', ('endpoint',))
+http_requests_in_flight = registry.gauge(
+    'doc2pdf_http_requests_in_flight', 'Requisições HTTP em andamento')
+
+# Conversões LibreOffice
+conversions = registry.counter(
+    'doc2pdf_conversions_total', 'Conversões DOCX -> PDF por perfil de qualidade e resultado',
+    ('quality', 'result'))
+conversion_bytes = registry.counter(
+    'doc2pdf_conversion_bytes_total', 'Bytes de DOCX convertidos (in) e de PDF gerados (out)', ('direction',))
+libreoffice_exit_codes = registry.counter(
+    'doc2pdf_libreoffice_exit_codes_total', 'Códigos de saída do soffice --convert-to', ('code',))
+libreoffice_timeouts = registry.counter(
+    'doc2pdf_libreoffice_timeouts_total', 'Conversões interrompidas por timeout', ('mode',))
+
+# Admissão e filas
+admission_wait = registry.histogram(
+    'doc2pdf_admission_wait_seconds', 'Espera por um slot de conversão', ('lane',))
+admission_rejected = registry.counter(
+    'doc2pdf_admission_rejected_total', 'Conversões recusadas pelo controle de admissão', ('lane', 'status'))
+conversions_in_flight = registry.gauge(
+    'doc2pdf_conversions_in_flight', 'Conversões em andamento', ('lane',))
+conversion_queue_depth = registry.gauge(
+    'doc2pdf_conversion_queue_depth', 'Conversões aguardando slot (request ou background)', ('lane', 'kind'))
+conversion_capacity = registry.gauge(
+    'doc2pdf_conversion_capacity', 'Conversões simultâneas permitidas')
+job_queue_depth = registry.gauge(
+    'doc2pdf_job_queue_depth', 'Jobs assíncronos aguardando um worker')
+jobs_running = registry.gauge(
+    'doc2pdf_jobs_running', 'Jobs assíncronos em execução')
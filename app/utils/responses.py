@@ -0,0 +1,102 @@
+"""
+Respostas JSON com arquivos em Base64
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import json
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional, Union
+from flask import Response, current_app, jsonify
+from app.utils.metrics import stage_duration
+from app.utils.tracing import span
+from app.utils.encoders import encode_base64_file, base64_length, iter_base64_chunks
+from app.services.admission import ServerOverloadedError
+from config.settings import BASE64_STREAM_MIN_BYTES
+
+
+def json_head(envelope: Dict[str, Any], field: str, dumps: Callable[[Any], str] = json.dumps) -> bytes:
+    """Objeto JSON serializado até a abertura da string do campo `field` (incluída)"""
+    head = dumps(envelope).rstrip()
+    return f'{head[:-1]}{"," if envelope else ""}{json.dumps(field)}:"'.encode('utf-8')
+
+
+def iter_base64_json(head: bytes, content: Union[bytes, BinaryIO]) -> Iterator[bytes]:
+    """
+    Objeto JSON com o arquivo em Base64 no último campo, em blocos
+
+    Args:
+        head: Início do objeto, gerado por json_head
+        content: Bytes do arquivo ou arquivo binário posicionado no início
+
+    Yields:
+        Início do objeto, blocos Base64 e fechamento da string e do objeto
+    """
+    yield head
+    # Só o tempo de codificação: o envio acontece com o gerador suspenso
+    encoding = 0.0
+    chunks = iter_base64_chunks(content)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        encoding += time.perf_counter() - start
+        if chunk is None:
+            break
+        yield chunk
+    stage_duration.observe(encoding, stage='encode')
+    yield b'"}'
+
+
+def base64_json_response(
+    envelope: Dict[str, Any],
+    field: str,
+    content: Union[bytes, BinaryIO],
+    size: Optional[int] = None,
+    status: int = 200
+) -> Response:
+    """
+    Monta a resposta JSON com `content` em Base64 no campo `field`
+
+    Acima de BASE64_STREAM_MIN_BYTES o corpo é gerado em streaming: o envelope
+    é serializado uma vez e o arquivo é codificado em blocos de tamanho fixo,
+    sem montar a string Base64 nem o corpo inteiro em memória. O JSON
+    resultante é o mesmo da resposta via jsonify (o campo vem por último) e o
+    Content-Length é calculado antecipadamente.
+
+    Args:
+        envelope: Demais campos da resposta (serializáveis em JSON)
+        field: Nome do campo com o arquivo (ex.: "pdf", "document")
+        content: Bytes do arquivo ou arquivo binário posicionado no início
+        size: Tamanho do arquivo (obrigatório se `content` for um arquivo)
+        status: Código HTTP
+
+    Returns:
+        Resposta Flask
+    """
+    if size is None:
+        size = len(content)
+
+    if size < BASE64_STREAM_MIN_BYTES:
+        data = content if isinstance(content, (bytes, bytearray)) else content.read()
+        with span('response.encode', size=len(data)), stage_duration.time(stage='encode'):
+            encoded = encode_base64_file(data)
+        response = jsonify({**envelope, field: encoded})
+        response.status_code = status
+        return response
+
+    head = json_head(envelope, field, current_app.json.dumps)
+    response = Response(iter_base64_json(head, content), status=status, mimetype=current_app.json.mimetype)
+    response.content_length = len(head) + base64_length(size) + 2
+    return response
+
+
+def overloaded_response(error: ServerOverloadedError):
+    """Resposta padrão para capacidade de conversão esgotada (429/503 com Retry-After)"""
+    response = jsonify({
+        'error': str(error),
+        'code': 'server_busy',
+        'retry_after': error.retry_after,
+        'admission': error.load
+    })
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
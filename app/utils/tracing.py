@@ -0,0 +1,349 @@
+"""
+Rastreamento de requisições com spans por etapa
+
+Cada requisição recebe um id (header X-Request-ID, gerado se ausente) e um
+trace (continuado do header traceparent W3C, se presente). As etapas do
+pipeline abrem spans aninhados com atributos (tamanho do documento, número
+de tags, qualidade...). O span corrente acompanha a requisição por
+contextvars e é repassado explicitamente às threads de lotes, jobs e
+conversões divididas; o LibreOffice recebe o contexto no ambiente do
+subprocesso (DOC2PDF_REQUEST_ID, TRACEPARENT).
+
+Os spans concluídos vão para uma fila e são exportados em background no
+formato OTLP/JSON: uma linha por lote em TRACING_FILE (formato lido pelo
+receiver otlpjsonfile do OpenTelemetry Collector) e/ou POST em
+TRACING_OTLP_ENDPOINT (ex.: http://localhost:4318/v1/traces).
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import atexit
+import contextvars
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from app.utils.logger import logger
+from config.settings import (
+    TRACING_ENABLED,
+    TRACING_FILE,
+    TRACING_FILE_MAX_BYTES,
+    TRACING_OTLP_ENDPOINT,
+    TRACING_SERVICE_NAME,
+    TRACING_QUEUE_SIZE,
+    TRACING_BATCH_SIZE,
+    TRACING_FLUSH_INTERVAL
+)
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+_TRACE_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# OTLP: SPAN_KIND_INTERNAL / SPAN_KIND_SERVER e STATUS_CODE_UNSET / STATUS_CODE_ERROR
+_KIND_INTERNAL = 1
+_KIND_SERVER = 2
+_STATUS_UNSET = 0
+_STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar('tracing_span', default=None)
+_request_id = contextvars.ContextVar('tracing_request_id', default=None)
+
+
+class Span:
+    """Uma etapa cronometrada de um trace"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'request_id', 'kind',
+                 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], request_id: Optional[str],
+                 attributes: Dict[str, Any], kind: int = _KIND_INTERNAL):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.request_id = request_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        """Contexto no formato W3C traceparent"""
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Span no formato OTLP/JSON"""
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': [{'key': key, 'value': _any_value(value)} for key, value in self.attributes.items()],
+            'status': {'code': _STATUS_ERROR, 'message': self.error} if self.error else {'code': _STATUS_UNSET},
+        }
+
+
+class _NoopSpan:
+    """Span descartado (tracing desabilitado)"""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def _any_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class SpanExporter:
+    """
+    Exporta os spans concluídos em background, em lotes OTLP/JSON
+
+    A fila é limitada: se o destino não der conta, spans são descartados
+    (contados em `dropped`) em vez de atrasar as requisições.
+    """
+
+    def __init__(self, path: str = TRACING_FILE, endpoint: str = TRACING_OTLP_ENDPOINT,
+                 max_bytes: int = TRACING_FILE_MAX_BYTES):
+        self.path = path
+        self.endpoint = endpoint
+        self.max_bytes = max_bytes
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(1, TRACING_QUEUE_SIZE))
+        self._thread: Optional[threading.Thread] = None
+        self._write_lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def submit(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span.to_otlp())
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self) -> None:
+        """Inicia a thread de exportação"""
+        if self._thread is not None:
+            return
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._thread = threading.Thread(target=self._loop, name='tracing-export', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+        destinations = ', '.join(filter(None, [self.path, self.endpoint])) or 'nenhum destino'
+        logger.info(f"✓ Tracing habilitado: spans exportados para {destinations}")
+
+    def _after_fork(self) -> None:
+        # Filho de um fork: a thread de exportação não existe aqui
+        started = self._thread is not None
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._write_lock = threading.Lock()
+        self._thread = None
+        if started:
+            self.start()
+
+    def _drain(self, first: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        batch = [first] if first is not None else []
+        while len(batch) < TRACING_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=TRACING_FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            self._export(self._drain(first))
+
+    def flush(self) -> None:
+        """Exporta o que estiver na fila (no encerramento do processo)"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._export(batch)
+
+    def _export(self, spans: List[Dict[str, Any]]) -> None:
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': TRACING_SERVICE_NAME}},
+                {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}},
+            ]},
+            'scopeSpans': [{'scope': {'name': 'doc2pdf'}, 'spans': spans}],
+        }]}
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+        try:
+            if self.path:
+                self._append((body + '\n').encode('utf-8'))
+            if self.endpoint:
+                request = urllib.request.Request(
+                    self.endpoint, data=body.encode('utf-8'), headers={'Content-Type': 'application/json'}
+                )
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    response.read()
+            self.exported += len(spans)
+        except Exception as e:
+            self.failed += len(spans)
+            logger.warning(f"⚠ Falha ao exportar {len(spans)} spans: {str(e)}")
+
+    def _append(self, line: bytes) -> None:
+        """Acrescenta a linha com uma única escrita em O_APPEND (vários workers no mesmo arquivo)"""
+        with self._write_lock:
+            try:
+                if self.max_bytes > 0 and os.path.getsize(self.path) >= self.max_bytes:
+                    os.replace(self.path, f'{self.path}.1')
+            except FileNotFoundError:
+                pass
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    def status(self) -> Dict[str, Any]:
+        """Contadores da exportação (para health check)"""
+        return {
+            'enabled': True,
+            'file': self.path or None,
+            'otlp_endpoint': self.endpoint or None,
+            'queued': self._queue.qsize(),
+            'exported': self.exported,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+
+exporter: Optional[SpanExporter] = SpanExporter() if TRACING_ENABLED else None
+
+
+def current_span() -> Optional[Span]:
+    """Span corrente da thread (None fora de um trace ou com tracing desabilitado)"""
+    return _current_span.get()
+
+
+def current_request_id() -> Optional[str]:
+    """Id da requisição corrente (também em threads que receberam o span dela)"""
+    return _request_id.get()
+
+
+def new_request_id(header_value: Optional[str] = None) -> str:
+    """Id da requisição: o enviado pelo cliente, se válido, ou um novo"""
+    if header_value and _REQUEST_ID.match(header_value):
+        return header_value
+    return secrets.token_hex(16)
+
+
+def start_span(name: str, parent: Optional[Span] = None, traceparent: Optional[str] = None,
+               request_id: Optional[str] = None, server: bool = False, **attributes: Any) -> Optional[Span]:
+    """
+    Cria um span (sem torná-lo corrente; ver span() e use_span())
+
+    Args:
+        name: Nome da etapa
+        parent: Span pai (padrão: o corrente)
+        traceparent: Contexto W3C recebido, para continuar um trace externo
+        request_id: Id da requisição (padrão: o do pai ou o corrente)
+        server: Span raiz de uma requisição HTTP
+        **attributes: Atributos do span
+
+    Returns:
+        O span, ou None com tracing desabilitado
+    """
+    if exporter is None:
+        return None
+    parent = parent or _current_span.get()
+    request_id = request_id or (parent.request_id if parent is not None else None) or _request_id.get()
+    match = _TRACEPARENT.match(traceparent or '')
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    elif match:
+        trace_id, parent_id = match.group(1), match.group(2)
+    else:
+        # Sem contexto recebido: um id de requisição no formato de trace id vira o próprio trace
+        trace_id = request_id if request_id and _TRACE_ID.match(request_id) else secrets.token_hex(16)
+        parent_id = None
+    return Span(name, trace_id, parent_id, request_id, attributes, _KIND_SERVER if server else _KIND_INTERNAL)
+
+
+def end_span(span: Optional[Span], error: Optional[BaseException] = None) -> None:
+    """Encerra o span e o envia para exportação"""
+    if span is None or span.end_ns is not None:
+        return
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.error = f'{type(error).__name__}: {error}'
+    exporter.submit(span)
+
+
+@contextmanager
+def use_span(span: Optional[Span], request_id: Optional[str] = None) -> Iterator[None]:
+    """Torna `span` (e o id da sua requisição) correntes na thread durante o bloco"""
+    span_token = _current_span.set(span)
+    request_token = _request_id.set(request_id or (span.request_id if span is not None else None))
+    try:
+        yield
+    finally:
+        _request_id.reset(request_token)
+        _current_span.reset(span_token)
+
+
+@contextmanager
+def span(name: str, parent: Optional[Span] = None, **attributes: Any) -> Iterator[Any]:
+    """
+    Cronometra o bloco como um span filho do corrente (ou de `parent`)
+
+    Exceções são registradas no status do span e propagadas.
+
+    Yields:
+        O span (para atributos conhecidos só ao final) ou um span nulo
+    """
+    current = start_span(name, parent, **attributes)
+    if current is None:
+        yield _NOOP
+        return
+    with use_span(current):
+        try:
+            yield current
+        except BaseException as e:
+            end_span(current, e)
+            raise
+    end_span(current)
+
+
+def propagation_env() -> Dict[str, str]:
+    """Variáveis de ambiente com o contexto do trace, para subprocessos"""
+    env = {}
+    request_id = _request_id.get()
+    if request_id:
+        env['DOC2PDF_REQUEST_ID'] = request_id
+    current = _current_span.get()
+    if current is not None:
+        env['TRACEPARENT'] = current.traceparent
+    return env
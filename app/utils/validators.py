@@ -3,10 +3,17 @@ Funções de validação
 
 Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
 """
-from typing import Tuple, Dict, Any
-from app.utils.logger import logger
+import ipaddress
+import socket
+from typing import Tuple, Dict, Any, Optional
+from urllib.parse import urlparse
+from app.utils.logger import logger, stage_logger
 from config.settings import (
     PDF_QUALITY_PROFILES,
+    DOCX_ENGINES,
+    DEFAULT_DOCX_ENGINE,
+    PRIORITY_LANES,
+    JOB_CALLBACK_ALLOWED_HOSTS,
     ERROR_MESSAGES,
     MAX_REPLACEMENTS
 )
@@ -33,7 +40,7 @@ def validate_docx_format(doc_bytes: bytes) -> Tuple[bool, str]:
 
     # Verifica assinatura ZIP (DOCX files são arquivos ZIP)
     if doc_bytes[0:2] == b'PK':
-        logger.info("✓ Formato DOCX detectado (arquivo ZIP)")
+        stage_logger.info("✓ Formato DOCX detectado (arquivo ZIP)")
         return True, None
 
     # Verifica assinatura de arquivo DOC antigo (D0 CF 11 E0)
@@ -77,6 +84,76 @@ def validate_quality(quality: str) -> str:
     return quality
 
 
+def validate_engine(engine: str) -> str:
+    """
+    Valida e normaliza o parâmetro de engine de substituição
+
+    Args:
+        engine: String da engine ('docx', 'xml')
+
+    Returns:
+        Engine validada (sempre em lowercase)
+        Se inválida, retorna DEFAULT_DOCX_ENGINE
+    """
+    if not engine or not isinstance(engine, str):
+        return DEFAULT_DOCX_ENGINE
+
+    engine = engine.lower().strip()
+
+    if engine not in DOCX_ENGINES:
+        logger.warning(f"Engine inválida '{engine}', usando '{DEFAULT_DOCX_ENGINE}' como padrão")
+        return DEFAULT_DOCX_ENGINE
+
+    return engine
+
+
+def validate_priority(priority: str, default: str) -> str:
+    """
+    Valida e normaliza a faixa de prioridade da conversão
+
+    Args:
+        priority: String da faixa ('interactive', 'bulk')
+        default: Faixa padrão do endpoint
+
+    Returns:
+        Faixa validada (sempre em lowercase)
+        Se ausente ou inválida, retorna a faixa padrão
+    """
+    if not priority or not isinstance(priority, str):
+        return default
+
+    priority = priority.lower().strip()
+
+    if priority not in PRIORITY_LANES:
+        logger.warning(f"Prioridade inválida '{priority}', usando '{default}' como padrão")
+        return default
+
+    return priority
+
+
+def validate_boolean(value: Any, default: bool = False) -> bool:
+    """
+    Normaliza um parâmetro booleano (JSON, formulário ou query string)
+
+    Args:
+        value: true/false, "true"/"false", "1"/"0", "yes"/"no"
+
+    Returns:
+        Valor booleano (default se ausente ou não reconhecido)
+    """
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return default
+    text = str(value).lower().strip()
+    if text in ('true', '1', 'yes', 'sim'):
+        return True
+    if text in ('false', '0', 'no', 'nao', 'não'):
+        return False
+    logger.warning(f"Valor booleano inválido '{value}', usando {default}")
+    return default
+
+
 def validate_replacements(replacements: Any) -> Tuple[bool, str]:
     """
     Valida o objeto de substituições
@@ -105,10 +182,73 @@ def validate_replacements(replacements: Any) -> Tuple[bool, str]:
         if not isinstance(key, str):
             return False, f"Tag inválida: '{key}' - Todas as tags devem ser strings"
 
-    logger.info(f"✓ {len(replacements)} substituições validadas")
+    stage_logger.info("✓ %s substituições validadas", len(replacements))
     return True, None
 
 
+def validate_callback_url(url: Any) -> Tuple[bool, str]:
+    """
+    Valida o callback_url de um job (o servidor fará um POST para ele)
+
+    Aceita apenas http(s). Com JOB_CALLBACK_ALLOWED_HOSTS, o host precisa
+    estar na lista; sem ela, todos os endereços do host precisam ser públicos,
+    para que o callback não alcance serviços internos (loopback, redes
+    privadas, metadados da nuvem em 169.254.169.254).
+
+    Args:
+        url: URL informada pelo cliente
+
+    Returns:
+        Tupla (is_valid, error_message)
+    """
+    address, error_msg = resolve_callback_url(url)
+    return address is not None, error_msg
+
+
+def resolve_callback_url(url: Any) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Valida o callback_url e retorna o endereço IP validado
+
+    A entrega deve conectar nesse endereço, e não resolver o host de novo:
+    entre a validação e a conexão o DNS poderia passar a apontar para um
+    endereço interno (DNS rebinding).
+
+    Args:
+        url: URL informada pelo cliente
+
+    Returns:
+        Tupla (endereço IP, error_message); endereço None se a URL for recusada
+    """
+    parsed = urlparse(str(url))
+    host = (parsed.hostname or '').rstrip('.')
+    if parsed.scheme not in ('http', 'https') or not host:
+        return None, ERROR_MESSAGES['invalid_callback_url']
+
+    allowed_host = False
+    if JOB_CALLBACK_ALLOWED_HOSTS:
+        for allowed in JOB_CALLBACK_ALLOWED_HOSTS:
+            if host == allowed or (allowed.startswith('.') and host.endswith(allowed)):
+                allowed_host = True
+                break
+        else:
+            logger.warning(f"⚠ callback_url recusado: host '{host}' fora de JOB_CALLBACK_ALLOWED_HOSTS")
+            return None, ERROR_MESSAGES['callback_host_not_allowed']
+
+    try:
+        addresses = socket.getaddrinfo(host, parsed.port or 80, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, ValueError, UnicodeError):
+        return None, ERROR_MESSAGES['callback_host_unresolved']
+    if not allowed_host:
+        for address in {info[4][0] for info in addresses}:
+            ip = ipaddress.ip_address(address.split('%')[0])
+            if ip.version == 6 and ip.ipv4_mapped is not None:
+                ip = ip.ipv4_mapped
+            if not ip.is_global or ip.is_multicast:
+                logger.warning(f"⚠ callback_url recusado: '{host}' resolve para endereço não público {ip}")
+                return None, ERROR_MESSAGES['callback_host_not_allowed']
+    return addresses[0][4][0], None
+
+
 def validate_filename(filename: str, extension: str = '.pdf') -> str:
     """
     Valida e normaliza um nome de arquivo
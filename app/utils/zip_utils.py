@@ -0,0 +1,100 @@
+"""
+Funções auxiliares para manipulação de arquivos ZIP (pacotes DOCX)
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import copy
+import struct
+import zipfile
+import zlib
+from typing import Optional, Tuple
+
+# Tamanho dos blocos copiados entre arquivos
+ZIP_COPY_CHUNK_SIZE = 64 * 1024
+
+# Perfis de compressão: (método, nível)
+# - stored: sem compressão (arquivo intermediário lido só pelo LibreOffice)
+# - fast: deflate nível 1
+# - default: deflate padrão (DOCX entregue ao cliente)
+ZIP_COMPRESSION_PROFILES = {
+    'stored': (zipfile.ZIP_STORED, None),
+    'fast': (zipfile.ZIP_DEFLATED, 1),
+    'default': (zipfile.ZIP_DEFLATED, None),
+}
+
+
+def zip_compression(profile: str) -> Tuple[int, Optional[int]]:
+    """
+    Retorna (compression, compresslevel) de um perfil de compressão
+
+    Args:
+        profile: 'stored', 'fast' ou 'default' (desconhecido -> 'default')
+
+    Returns:
+        Tupla para os argumentos de zipfile.ZipFile
+    """
+    return ZIP_COMPRESSION_PROFILES.get(profile, ZIP_COMPRESSION_PROFILES['default'])
+
+
+def copy_member_raw(src: zipfile.ZipFile, dst: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """
+    Copia um membro de um ZIP para outro sem descomprimir/recomprimir
+
+    Os bytes comprimidos do membro são transferidos byte a byte; apenas o
+    cabeçalho local é regravado com o novo offset. O membro entra no diretório
+    central do destino normalmente ao fechar o arquivo.
+
+    Args:
+        src: ZIP de origem (aberto para leitura)
+        dst: ZIP de destino (aberto para escrita, sem membro aberto)
+        info: Membro de origem a copiar
+    """
+    # Localiza o início dos dados, após o cabeçalho local do membro
+    src.fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, src.fp.read(zipfile.sizeFileHeader))
+    name_length = header[zipfile._FH_FILENAME_LENGTH]
+    extra_length = header[zipfile._FH_EXTRA_FIELD_LENGTH]
+    src.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+
+    new_info = copy.copy(info)
+    new_info.flag_bits &= ~0x08  # Tamanhos e CRC vão no cabeçalho (sem data descriptor)
+    new_info.extra = b''
+
+    dst.fp.seek(dst.start_dir)
+    new_info.header_offset = dst.fp.tell()
+    dst.fp.write(new_info.FileHeader())
+
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = src.fp.read(min(ZIP_COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Membro truncado: {info.filename}")
+        dst.fp.write(chunk)
+        remaining -= len(chunk)
+
+    dst.filelist.append(new_info)
+    dst.NameToInfo[new_info.filename] = new_info
+    dst.start_dir = dst.fp.tell()
+
+
+def write_member(dst: zipfile.ZipFile, name: str, data: bytes, src: Optional[zipfile.ZipFile] = None) -> bool:
+    """
+    Grava um membro, reaproveitando os bytes comprimidos de `src` se o conteúdo não mudou
+
+    Args:
+        dst: ZIP de destino (a compressão usada é a padrão do arquivo)
+        name: Nome do membro
+        data: Conteúdo descomprimido
+        src: ZIP de origem opcional onde procurar um membro idêntico
+
+    Returns:
+        True se o membro foi copiado de `src` sem recompressão
+    """
+    if src is not None:
+        info = src.NameToInfo.get(name)
+        if info is not None and info.file_size == len(data) and info.CRC == zlib.crc32(data):
+            copy_member_raw(src, dst, info)
+            return True
+
+    dst.writestr(name, data)
+    return False
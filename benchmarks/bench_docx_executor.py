@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark da etapa DOCX: thread da requisição x pool de processos
+
+Simula um worker gunicorn gthread: `--threads` threads renderizam o mesmo
+template (substituição de tags + gravação do DOCX intermediário) em paralelo,
+primeiro na própria thread (disputando o GIL) e depois no pool de processos
+(DOCX_EXECUTOR=process). Mede vazão e latência para as duas engines, com
+template registrado (índice pré-compilado) e avulso, e confere que os DOCX
+gerados são idênticos.
+
+Uso:
+    python benchmarks/bench_docx_executor.py
+    python benchmarks/bench_docx_executor.py --threads 8 --renders 64 --processes 4
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Caminho na thread como referência: o pool é criado explicitamente abaixo
+os.environ['DOCX_EXECUTOR'] = 'thread'
+
+from bench_replace_tags import build_document  # noqa: E402
+from app.services.docx_process_pool import DocxProcessPool  # noqa: E402
+from app.services.render_service import RenderService  # noqa: E402
+from app.services.template_registry import Template  # noqa: E402
+
+
+def render_in_thread(template, replacements, engine) -> bytes:
+    buffer = io.BytesIO()
+    RenderService._write_docx(template, replacements, engine, buffer, 'stored')
+    return buffer.getvalue()
+
+
+def render_in_process(pool, template, replacements, engine) -> bytes:
+    buffer = io.BytesIO()
+    RenderService._write_docx_in_process(pool, template, replacements, engine, buffer, 'stored')
+    return buffer.getvalue()
+
+
+def parts(docx_bytes: bytes) -> dict:
+    """Conteúdo descomprimido de cada membro, para comparar os resultados"""
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as z:
+        return {name: z.read(name) for name in z.namelist()}
+
+
+def bench(label, render, threads, renders):
+    """Executa `renders` renderizações com `threads` threads; retorna (vazão, p50, resultado)"""
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        result = render()
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(one, range(renders)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    throughput = renders / elapsed
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:<34} {throughput:8.1f} docs/s   p50 {p50 * 1000:8.1f} ms   p99 {p99 * 1000:8.1f} ms")
+    return throughput, results[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tags', type=int, default=100)
+    parser.add_argument('--paragraphs', type=int, default=400)
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=4, help='threads do worker gunicorn (gthread)')
+    parser.add_argument('--renders', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=0, help='processos do pool (0 = núcleos da CPU)')
+    args = parser.parse_args()
+
+    # Silencia o log da aplicação durante as medições
+    logging.getLogger('doc2pdf').setLevel(logging.WARNING)
+
+    doc_bytes = build_document(args.tags, args.paragraphs, args.rows)
+    replacements = {f"tag_{i}": f"valor {i}" for i in range(args.tags)}
+    pool = DocxProcessPool(size=args.processes, min_bytes=0)
+    print(f"Documento: {len(doc_bytes)} bytes, {args.tags} tags | {args.threads} threads, "
+          f"{args.renders} renderizações, {pool.size} processos, {os.cpu_count()} CPUs")
+
+    # Aquece os processos (imports, template padrão, cache de templates)
+    for _ in range(pool.size):
+        render_in_process(pool, Template(doc_bytes, registered=True), replacements, 'docx')
+
+    try:
+        for engine in ('docx', 'xml'):
+            for registered in ((True, False) if engine == 'docx' else (False,)):
+                template = Template(doc_bytes, registered=registered)
+                kind = 'registrado' if registered else 'avulso'
+                thread_rate, thread_doc = bench(f"{engine}/{kind} na thread",
+                                                lambda: render_in_thread(template, replacements, engine),
+                                                args.threads, args.renders)
+                process_rate, process_doc = bench(f"{engine}/{kind} no pool de processos",
+                                                  lambda: render_in_process(pool, template, replacements, engine),
+                                                  args.threads, args.renders)
+                identical = parts(thread_doc) == parts(process_doc)
+                print(f"  speedup {process_rate / thread_rate:.2f}x, resultados idênticos: {'sim' if identical else 'NÃO'}")
+    finally:
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
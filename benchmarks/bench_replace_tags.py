@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark da substituição de tags: laços aninhados (legado) x passada única
+
+Gera um DOCX sintético com muitas tags (parágrafos, tabelas, cabeçalho e
+rodapé) e compara o tempo do algoritmo legado - um laço por tag em cada
+parágrafo - com o DocxService atual (TagMatcher, passada única) e com a
+aplicação via índice pré-compilado usada pelos templates registrados.
+
+Uso:
+    python benchmarks/bench_replace_tags.py
+    python benchmarks/bench_replace_tags.py --tags 300 --paragraphs 500 --rows 200
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document  # noqa: E402
+from app.services.docx_service import DocxService  # noqa: E402
+from app.services.tag_index import TagIndex  # noqa: E402
+from config.settings import TAG_OPEN, TAG_CLOSE  # noqa: E402
+
+
+def build_document(tags: int, paragraphs: int, rows: int) -> bytes:
+    """Monta um DOCX com tags espalhadas em todas as áreas suportadas"""
+    doc = Document()
+    names = [f"TAG_{i}" for i in range(tags)]
+
+    for i in range(paragraphs):
+        doc.add_paragraph(f"Parágrafo {i}: {{{names[i % tags]}}} e {{{names[(i * 7) % tags]}}} texto fixo")
+
+    table = doc.add_table(rows=rows, cols=3)
+    for r, row in enumerate(table.rows):
+        for c, cell in enumerate(row.cells):
+            cell.text = f"{{{names[(r * 3 + c) % tags]}}}"
+
+    doc.sections[0].header.paragraphs[0].text = f"Cabeçalho {{{names[0]}}}"
+    doc.sections[0].footer.paragraphs[0].text = f"Rodapé {{{names[-1]}}}"
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def legacy_replace_tags(doc, replacements) -> int:
+    """Implementação anterior (O(parágrafos x runs x tags)), mantida para comparação"""
+    count = 0
+
+    def replace_in_runs(runs, tag, value):
+        replaced = False
+        tag_formatted = f"{TAG_OPEN}{tag.upper()}{TAG_CLOSE}"
+        for run in runs:
+            if tag_formatted in run.text:
+                run.text = run.text.replace(tag_formatted, str(value))
+                replaced = True
+        return replaced
+
+    def paragraphs_of(container):
+        yield from container.paragraphs
+        for table in container.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    yield from cell.paragraphs
+
+    containers = [doc] + [s.header for s in doc.sections] + [s.footer for s in doc.sections]
+    for container in containers:
+        for paragraph in paragraphs_of(container):
+            for tag, value in replacements.items():
+                if replace_in_runs(paragraph.runs, tag, value):
+                    count += 1
+    return count
+
+
+def all_text(doc) -> list:
+    """Texto de todas as áreas, para conferir que os resultados são idênticos"""
+    return [run.text for run in DocxService.iter_runs(doc)]
+
+
+def bench(label, func, doc_bytes, replacements, repeat):
+    """Executa func `repeat` vezes em documentos recém-abertos e retorna o melhor tempo"""
+    best = float('inf')
+    result_doc = None
+    for _ in range(repeat):
+        doc = Document(io.BytesIO(doc_bytes))
+        start = time.perf_counter()
+        func(doc, replacements)
+        best = min(best, time.perf_counter() - start)
+        result_doc = doc
+    print(f"{label:<28} {best * 1000:10.1f} ms")
+    return best, result_doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tags', type=int, default=300)
+    parser.add_argument('--paragraphs', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # Silencia o log da aplicação durante as medições
+    logging.getLogger('doc2pdf').setLevel(logging.WARNING)
+
+    doc_bytes = build_document(args.tags, args.paragraphs, args.rows)
+    replacements = {f"tag_{i}": f"valor {i}" for i in range(args.tags)}
+    print(f"Documento: {len(doc_bytes)} bytes, {args.tags} tags, "
+          f"{args.paragraphs} parágrafos, tabela {args.rows}x3")
+
+    legacy_time, legacy_doc = bench("Legado (laços aninhados)", legacy_replace_tags,
+                                    doc_bytes, replacements, args.repeat)
+    single_time, single_doc = bench("Passada única (TagMatcher)", DocxService.replace_tags_in_document,
+                                    doc_bytes, replacements, args.repeat)
+
+    index = TagIndex.compile(Document(io.BytesIO(doc_bytes)))
+    index_time, index_doc = bench("Índice pré-compilado", index.apply,
+                                  doc_bytes, replacements, args.repeat)
+
+    identical = all_text(legacy_doc) == all_text(single_doc) == all_text(index_doc)
+    print(f"Resultados idênticos: {'sim' if identical else 'NÃO'}")
+    print(f"Speedup passada única: {legacy_time / single_time:.1f}x")
+    print(f"Speedup índice: {legacy_time / index_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
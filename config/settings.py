@@ -11,7 +11,7 @@ API_NAME = "DOC2PDF Converter API"
 API_DESCRIPTION = "API REST profissional para conversão de documentos Word para PDF com substituição inteligente de tags"
 
 # Configurações de conversão
-CONVERSION_TIMEOUT = 60  # segundos
+CONVERSION_TIMEOUT = 60  # segundos (conversões sem estimativa de custo)
 DEFAULT_PDF_QUALITY: Literal['high', 'medium', 'low'] = 'high'
 
 # Perfis de qualidade de PDF
@@ -49,6 +49,194 @@ LIBREOFFICE_OPTIONS = [
     '--norestore',          # Não restaura sessão anterior
 ]
 
+# Pool de instâncias LibreOffice residentes (conversão via UNO)
+# Evita o cold start do soffice (1.5-4s) a cada requisição. Requer o módulo
+# Python `uno` (pacote python3-uno); sem ele a conversão usa --convert-to.
+LIBREOFFICE_POOL_ENABLED = os.getenv('LIBREOFFICE_POOL_ENABLED', 'true').lower() == 'true'
+LIBREOFFICE_POOL_SIZE = int(os.getenv('LIBREOFFICE_POOL_SIZE', '2'))
+# Cada processo (worker gunicorn ou daemon) usa o subdiretório pid_<pid>
+LIBREOFFICE_POOL_DIR = os.getenv('LIBREOFFICE_POOL_DIR', '/tmp/doc2pdf/pool')
+LIBREOFFICE_POOL_STARTUP_TIMEOUT = 30  # segundos para o worker aceitar conexões
+LIBREOFFICE_POOL_ACQUIRE_TIMEOUT = 30  # segundos aguardando um worker livre
+LIBREOFFICE_POOL_HEALTH_INTERVAL = 30  # segundos entre health checks
+LIBREOFFICE_POOL_MAX_CONVERSIONS = 200  # recicla o worker após N conversões
+
+# Perfis de usuário isolados por slot de concorrência (-env:UserInstallation)
+# Um perfil por thread do gunicorn evita que conversões --convert-to
+# concorrentes disputem o mesmo perfil e se serializem (ou falhem).
+LIBREOFFICE_PROFILE_SLOTS = int(os.getenv('LIBREOFFICE_PROFILE_SLOTS', '4'))
+# Cada processo (worker gunicorn ou daemon) usa o subdiretório pid_<pid>
+LIBREOFFICE_PROFILE_DIR = os.getenv('LIBREOFFICE_PROFILE_DIR', '/tmp/doc2pdf/profiles')
+LIBREOFFICE_PROFILE_INIT_TIMEOUT = 60  # segundos para inicializar cada perfil
+
+# Pipeline em memória: com o pool, DOCX e PDF trafegam por streams UNO; no
+# caminho --convert-to, os arquivos de trabalho ficam em um tmpfs (RAM) em vez
+# do disco efêmero. Vazio = diretório temporário padrão do sistema.
+PIPELINE_TMP_DIR = os.getenv(
+    'PIPELINE_TMP_DIR',
+    '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else ''
+)
+
+# Cache de resultados (PDF/DOCX) endereçado por conteúdo
+# Chave: hash do DOCX + replacements normalizados + qualidade
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+RESULT_CACHE_MEMORY_MAX_BYTES = int(os.getenv('RESULT_CACHE_MEMORY_MAX_BYTES', str(64 * 1024 * 1024)))  # 64 MB
+RESULT_CACHE_MEMORY_TTL = int(os.getenv('RESULT_CACHE_MEMORY_TTL', '3600'))  # segundos
+RESULT_CACHE_DISK_ENABLED = os.getenv('RESULT_CACHE_DISK_ENABLED', 'false').lower() == 'true'
+RESULT_CACHE_DISK_DIR = os.getenv('RESULT_CACHE_DISK_DIR', '/tmp/doc2pdf/cache')
+RESULT_CACHE_DISK_MAX_BYTES = int(os.getenv('RESULT_CACHE_DISK_MAX_BYTES', str(512 * 1024 * 1024)))  # 512 MB
+RESULT_CACHE_DISK_TTL = int(os.getenv('RESULT_CACHE_DISK_TTL', '86400'))  # segundos
+
+# Registro de templates (upload único, renderização por template_id)
+TEMPLATE_CACHE_MAX_ENTRIES = int(os.getenv('TEMPLATE_CACHE_MAX_ENTRIES', '32'))  # templates parseados em memória
+TEMPLATE_STORE_DIR = os.getenv('TEMPLATE_STORE_DIR', '/tmp/doc2pdf/templates')
+
+# Engine de substituição de tags
+# - docx: python-docx (modelo de objetos completo, re-serializa todas as partes)
+# - xml: reescrita em streaming só das partes com tags; demais membros copiados sem recompressão
+DOCX_ENGINES = ['docx', 'xml']
+DEFAULT_DOCX_ENGINE = os.getenv('DEFAULT_DOCX_ENGINE', 'docx')
+XML_ENGINE_CHUNK_SIZE = 64 * 1024  # Bytes lidos por vez de cada parte XML
+XML_ENGINE_SPOOL_MAX_BYTES = int(os.getenv('XML_ENGINE_SPOOL_MAX_BYTES', str(8 * 1024 * 1024)))  # acima disso, parte reescrita vai para disco
+
+# Compressão do DOCX intermediário (lido apenas pelo LibreOffice)
+# - stored: sem compressão | fast: deflate nível 1 | default: deflate padrão
+# Partes inalteradas reaproveitam os bytes comprimidos do original em qualquer perfil
+# O DOCX entregue ao cliente (output_type doc/base64_doc) usa sempre 'default'
+INTERMEDIATE_DOCX_COMPRESSION = os.getenv('INTERMEDIATE_DOCX_COMPRESSION', 'stored')
+
+# Onde rodam a substituição de tags e a gravação do DOCX (CPU em Python puro)
+# - thread: na thread da requisição (as threads do gunicorn disputam o GIL)
+# - process: pool de processos com python-docx pré-importado; o template, os
+#   replacements e o DOCX gerado trafegam como bytes
+DOCX_EXECUTORS = ['thread', 'process']
+DOCX_EXECUTOR = os.getenv('DOCX_EXECUTOR', 'thread')
+DOCX_PROCESS_POOL_SIZE = int(os.getenv('DOCX_PROCESS_POOL_SIZE', '0'))  # 0 = núcleos da CPU
+DOCX_PROCESS_MIN_BYTES = int(os.getenv('DOCX_PROCESS_MIN_BYTES', str(32 * 1024)))  # menores ficam na thread (IPC > ganho)
+DOCX_PROCESS_TEMPLATE_CACHE = 8  # templates registrados mantidos parseados em cada processo
+
+# Controle de admissão: conversões simultâneas limitadas à capacidade do
+# LibreOffice, com sala de espera limitada. Espera cheia -> 429; espera acima
+# de ADMISSION_WAIT_TIMEOUT -> 503; ambos com Retry-After estimado pelos
+# tempos recentes de conversão
+ADMISSION_MAX_CONCURRENCY = int(os.getenv('ADMISSION_MAX_CONCURRENCY', '0'))  # 0 = workers do pool ou slots de perfil
+ADMISSION_MAX_WAITING = int(os.getenv('ADMISSION_MAX_WAITING', '8'))
+ADMISSION_WAIT_TIMEOUT = float(os.getenv('ADMISSION_WAIT_TIMEOUT', '30'))  # segundos
+ADMISSION_SAMPLE_SIZE = 50  # conversões recentes usadas na estimativa do Retry-After
+ADMISSION_DEFAULT_CONVERSION_TIME = 5.0  # segundos, até haver amostras
+
+# Faixas de prioridade: chamadas de um documento (interactive) e lotes/jobs
+# (bulk) disputam os slots de conversão por pesos; a faixa é escolhida pelo
+# campo "priority" ou pelo header X-Priority. PRIORITY_INTERACTIVE_RESERVED_SLOTS
+# slots só são ocupados pela faixa bulk enquanto não há requisições
+# interativas na fila (mínimo garantido à interativa sem deixar slots ociosos)
+INTERACTIVE_LANE = 'interactive'
+BULK_LANE = 'bulk'
+PRIORITY_LANES = [INTERACTIVE_LANE, BULK_LANE]
+PRIORITY_HEADER = 'X-Priority'
+PRIORITY_LANE_WEIGHTS = {
+    INTERACTIVE_LANE: int(os.getenv('PRIORITY_INTERACTIVE_WEIGHT', '4')),
+    BULK_LANE: int(os.getenv('PRIORITY_BULK_WEIGHT', '1')),
+}
+PRIORITY_INTERACTIVE_RESERVED_SLOTS = int(os.getenv('PRIORITY_INTERACTIVE_RESERVED_SLOTS', '1'))
+
+# Modelo de custo: antes de converter, estima os segundos de LibreOffice pelas
+# características do DOCX (pesos abaixo, calibrados pelos tempos reais) ou
+# pelo histórico do template. A estimativa ordena a fila de cada faixa (menor
+# trabalho primeiro) e define o timeout: estimativa x FACTOR, entre MIN e MAX
+COST_MODEL_WEIGHTS = {
+    'base': 1.0,            # segundos por conversão
+    'per_mb': 0.5,          # por MB de DOCX
+    'per_paragraph': 0.002,
+    'per_table': 0.02,
+    'per_media_mb': 0.3,    # por MB de imagens embutidas
+}
+COST_MODEL_EWMA_ALPHA = 0.2  # peso de cada nova conversão nas médias móveis
+COST_MODEL_MAX_TEMPLATES = 1000  # templates com histórico de tempos (LRU)
+CONVERSION_TIMEOUT_FACTOR = float(os.getenv('CONVERSION_TIMEOUT_FACTOR', '4'))
+CONVERSION_TIMEOUT_MIN = float(os.getenv('CONVERSION_TIMEOUT_MIN', str(CONVERSION_TIMEOUT)))  # segundos
+CONVERSION_TIMEOUT_MAX = float(os.getenv('CONVERSION_TIMEOUT_MAX', '300'))  # segundos
+# Envelhecimento: a cada segundo na fila, a prioridade de uma conversão melhora
+# como se ela custasse SCHEDULER_AGING_RATE segundos a menos (evita inanição)
+SCHEDULER_AGING_RATE = float(os.getenv('SCHEDULER_AGING_RATE', '1.0'))
+
+# Conversão dividida (opt-in pelo campo "split"): documentos grandes são
+# divididos em quebras de seção/página e as partes convertidas em paralelo.
+# Só divide documentos com custo estimado a partir de SPLIT_MIN_ESTIMATED_SECONDS;
+# SPLIT_MAX_CHUNKS = 0 usa a capacidade de conversão. Requer o pacote pypdf
+SPLIT_MIN_ESTIMATED_SECONDS = float(os.getenv('SPLIT_MIN_ESTIMATED_SECONDS', '10'))
+SPLIT_MAX_CHUNKS = int(os.getenv('SPLIT_MAX_CHUNKS', '0'))
+
+# Daemon de conversão compartilhado (python conversion_daemon.py): um único
+# processo dono do LibreOffice, do controle de admissão e das filas atende
+# todos os workers gunicorn do container por um socket Unix. Os DOCX e PDFs
+# trafegam por arquivos em CONVERSION_DAEMON_SHM_DIR (tmpfs); pelo socket vai
+# só o pedido. Com CONVERSION_DAEMON_ENABLED, os workers web não iniciam
+# LibreOffice e o número de workers independe da capacidade de conversão
+CONVERSION_DAEMON_ENABLED = os.getenv('CONVERSION_DAEMON_ENABLED', 'false').lower() == 'true'
+CONVERSION_DAEMON_SOCKET = os.getenv('CONVERSION_DAEMON_SOCKET', '/tmp/doc2pdf/convert.sock')
+CONVERSION_DAEMON_SHM_DIR = os.getenv('CONVERSION_DAEMON_SHM_DIR', '/dev/shm/doc2pdf-daemon')
+CONVERSION_DAEMON_STARTUP_TIMEOUT = float(os.getenv('CONVERSION_DAEMON_STARTUP_TIMEOUT', '30'))  # segundos aguardando o daemon no boot
+CONVERSION_DAEMON_CONNECT_TIMEOUT = 5  # segundos para conectar e para pedidos de status
+CONVERSION_DAEMON_ORPHAN_MAX_AGE = 600  # segundos: arquivos de troca mais antigos são órfãos (lidos logo após gravados)
+CONVERSION_DAEMON_ORPHAN_SWEEP_INTERVAL = 60  # segundos entre as limpezas de órfãos no tmpfs
+
+# Lotes (mail merge): um template, vários conjuntos de replacements
+# As conversões do lote são distribuídas pela capacidade do LibreOffice
+# (workers do pool ou slots de perfil); BATCH_MAX_WORKERS > 0 fixa o limite
+BATCH_MAX_RECORDS = int(os.getenv('BATCH_MAX_RECORDS', '1000'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '0'))
+BATCH_ZIP_SPOOL_MAX_BYTES = 16 * 1024 * 1024  # ZIP de resposta acima disso vai para PIPELINE_TMP_DIR
+# output_type merged_pdf: registros concatenados em um único DOCX, convertido de uma vez
+BATCH_MERGE_TIMEOUT = int(os.getenv('BATCH_MERGE_TIMEOUT', '600'))  # segundos
+
+# Jobs assíncronos (POST /jobs): a conversão roda em threads de background
+# e o resultado fica em disco até ser baixado ou expirar. JOB_STORE_DIR guarda
+# também o estado dos jobs e é compartilhado pelos workers gunicorn
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '0'))  # 0 = capacidade de conversão do LibreOffice
+JOB_QUEUE_MAX_SIZE = int(os.getenv('JOB_QUEUE_MAX_SIZE', '100'))
+JOB_STORE_DIR = os.getenv('JOB_STORE_DIR', '/tmp/doc2pdf/jobs')
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', '3600'))  # segundos após a conclusão
+JOB_CALLBACK_TIMEOUT = 10  # segundos por tentativa de callback
+JOB_CALLBACK_RETRIES = int(os.getenv('JOB_CALLBACK_RETRIES', '3'))
+JOB_CALLBACK_WORKERS = int(os.getenv('JOB_CALLBACK_WORKERS', '4'))  # threads de entrega, separadas das de conversão
+# Hosts aceitos em callback_url, separados por vírgula (".dominio" aceita os
+# subdomínios). Vazio: qualquer host cujos endereços sejam todos públicos -
+# loopback, redes privadas e link-local (ex.: 169.254.169.254) são recusados
+JOB_CALLBACK_ALLOWED_HOSTS = [
+    host.strip().lower() for host in os.getenv('JOB_CALLBACK_ALLOWED_HOSTS', '').split(',') if host.strip()
+]
+
+# Métricas no formato de texto do Prometheus (GET /metrics)
+# Com vários workers gunicorn, defina METRICS_MULTIPROC_DIR (ex.: /dev/shm/doc2pdf-metrics,
+# esvaziado a cada início do container): cada processo grava ali um snapshot
+# das suas métricas a cada METRICS_FLUSH_INTERVAL segundos e o /metrics soma
+# os snapshots de todos os workers
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_PATH = '/metrics'
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', os.getenv('PROMETHEUS_MULTIPROC_DIR', ''))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))  # segundos
+# Limites superiores (segundos) dos buckets dos histogramas de latência
+METRICS_BUCKETS = [
+    float(bound) for bound in
+    os.getenv('METRICS_BUCKETS', '0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120,300').split(',')
+]
+
+# Tracing: cada requisição recebe um id (header X-Request-ID, devolvido na
+# resposta) e, com TRACING_ENABLED, as etapas do pipeline viram spans
+# aninhados exportados em OTLP/JSON - uma linha por lote em TRACING_FILE
+# (receiver otlpjsonfile do OpenTelemetry Collector) e/ou POST em
+# TRACING_OTLP_ENDPOINT (ex.: http://localhost:4318/v1/traces)
+REQUEST_ID_HEADER = 'X-Request-ID'
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+TRACING_FILE = os.getenv('TRACING_FILE', '/tmp/doc2pdf/traces.jsonl')
+TRACING_FILE_MAX_BYTES = int(os.getenv('TRACING_FILE_MAX_BYTES', str(100 * 1024 * 1024)))  # rotaciona para .1
+TRACING_OTLP_ENDPOINT = os.getenv('TRACING_OTLP_ENDPOINT', '')
+TRACING_SERVICE_NAME = os.getenv('TRACING_SERVICE_NAME', 'doc2pdf')
+TRACING_QUEUE_SIZE = 10000  # spans aguardando exportação (excedentes são descartados)
+TRACING_BATCH_SIZE = 256  # spans por linha / POST
+TRACING_FLUSH_INTERVAL = 1.0  # segundos
+
 # Formatos suportados
 SUPPORTED_INPUT_FORMATS = ['docx']  # .DOC (antigo) não é suportado
 SUPPORTED_OUTPUT_FORMATS = ['pdf']
@@ -59,13 +247,36 @@ TAG_OPEN = '{'
 TAG_CLOSE = '}'
 
 # Limites de tamanho
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', str(10 * 1024 * 1024)))  # 10 MB (documento decodificado)
+# Corpo máximo da requisição: documento em Base64 (+33%) e demais campos.
+# Verificado pelo Content-Length antes de ler o corpo.
+MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', str(MAX_FILE_SIZE * 4 // 3 + 1024 * 1024)))
+
+# Leitura incremental das requisições JSON: o campo "document" é decodificado
+# em blocos para um buffer que vai para disco (PIPELINE_TMP_DIR) acima do limite
+INGEST_CHUNK_SIZE = 64 * 1024
+INGEST_SPOOL_MAX_BYTES = int(os.getenv('INGEST_SPOOL_MAX_BYTES', str(1024 * 1024)))  # 1 MB
+
+# Respostas JSON com arquivo em Base64 (pdf/document): acima do limite, o
+# envelope é enviado em streaming e o arquivo codificado em blocos, sem montar
+# a string Base64 nem o corpo JSON inteiros em memória. 0 = sempre streaming
+BASE64_STREAM_MIN_BYTES = int(os.getenv('BASE64_STREAM_MIN_BYTES', str(1024 * 1024)))  # 1 MB
+BASE64_STREAM_CHUNK_SIZE = 48 * 1024  # Múltiplo de 3: blocos Base64 sem padding intermediário
 MAX_REPLACEMENTS = 1000  # Máximo de substituições por documento
 
 # Configurações de logging
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(funcName)s] - %(message)s'
 LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Escrita assíncrona: o handler só enfileira (fila limitada; com a fila cheia
+# o registro é descartado e contado) e uma thread de background grava em stderr
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() == 'true'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Um objeto JSON por linha (com request_id e campos extras) em vez de texto
+LOG_JSON = os.getenv('LOG_JSON', 'false').lower() == 'true'
+# Fração das requisições cujas mensagens detalhadas por etapa são registradas
+# (decisão por requisição; avisos, erros e o registro de acesso são sempre mantidos)
+LOG_STAGE_SAMPLE_RATE = float(os.getenv('LOG_STAGE_SAMPLE_RATE', '1.0'))
 
 # CORS
 CORS_ORIGINS = '*'  # Em produção, especifique domínios permitidos
@@ -84,14 +295,29 @@ SECURITY_HEADERS = {
 
 # Mensagens de erro padrão
 ERROR_MESSAGES = {
-    'invalid_json': 'Content-Type deve ser application/json',
-    'missing_document': 'Campo "document" é obrigatório',
+    'invalid_json': 'Content-Type deve ser application/json, multipart/form-data ou application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'missing_document': 'Campo "document" (ou "template_id") é obrigatório',
+    'invalid_template_id': 'Campo "template_id" deve ser um hash SHA-256 (64 caracteres hexadecimais)',
+    'unknown_template': 'Template desconhecido. Registre o documento via POST /templates e tente novamente',
     'missing_replacements': 'Campo "replacements" é obrigatório',
     'invalid_replacements': 'Campo "replacements" deve ser um objeto JSON',
     'invalid_quality': 'Campo "quality" deve ser "high", "medium" ou "low"',
     'invalid_base64': 'String Base64 inválida',
+    'missing_records': 'Campo "records" é obrigatório e deve ser uma lista não vazia de objetos de replacements',
+    'too_many_records': f'O lote excede o máximo de {BATCH_MAX_RECORDS} registros',
+    'unknown_job': 'Job inexistente ou expirado',
+    'job_queue_full': 'Fila de jobs cheia. Tente novamente em instantes',
+    'job_not_ready': 'Resultado ainda não disponível',
+    'job_orphaned': 'Job interrompido: o worker que o processava foi encerrado',
+    'invalid_callback_url': 'Campo "callback_url" deve ser uma URL http(s)',
+    'callback_host_not_allowed': 'Campo "callback_url" aponta para um endereço não permitido',
+    'callback_host_unresolved': 'Campo "callback_url": host não encontrado',
+    'server_busy': 'Servidor sem capacidade de conversão no momento. Tente novamente após o tempo indicado em Retry-After',
+    'invalid_json_body': 'Corpo JSON inválido: esperado um objeto JSON',
     'invalid_docx': 'Arquivo DOCX inválido',
     'doc_not_supported': 'Formato .DOC (Word 97-2003) não suportado. Por favor, converta para .DOCX primeiro',
     'conversion_timeout': 'Timeout na conversão do documento. O documento pode ser muito grande ou complexo.',
     'pdf_not_generated': 'PDF não foi gerado pelo LibreOffice',
+    'conversion_daemon_unavailable': 'Serviço de conversão indisponível no momento. Tente novamente após o tempo indicado em Retry-After',
+    'payload_too_large': f'Requisição excede o tamanho máximo permitido (documento até {MAX_FILE_SIZE // (1024 * 1024)} MB)',
 }
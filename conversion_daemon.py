@@ -0,0 +1,19 @@
+"""
+DOC2PDF Converter - Daemon de conversão compartilhado (entry point)
+
+Processo único que mantém o LibreOffice e a fila global de conversões e
+atende todos os workers gunicorn pelo socket Unix. Suba-o antes (ou junto)
+do gunicorn, com CONVERSION_DAEMON_ENABLED=true nos dois:
+
+    python conversion_daemon.py &
+    gunicorn --workers 4 --threads 4 --worker-class gthread app:app
+
+Autor: Maxwell da Silva Oliveira
+Email: maxwbh@gmail.com
+Empresa: M&S do Brasil LTDA
+LinkedIn: /maxwbh
+"""
+from app.services.conversion_daemon import main
+
+if __name__ == '__main__':
+    main()
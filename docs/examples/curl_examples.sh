@@ -62,4 +62,44 @@ curl -X POST "$API_URL/process" \
     \"quality\": \"low\"
   }" | jq .
 
+# Upload binário (sem Base64): multipart/form-data
+echo -e "\n5. Endpoint /convert-file (multipart/form-data)"
+curl -X POST "$API_URL/convert-file" \
+  -F "document=@template.docx" \
+  -F 'replacements={"NOME": "João Silva"}' \
+  -F "quality=high" \
+  -o "output_multipart.pdf"
+
+# Upload binário (sem Base64): DOCX bruto no corpo, parâmetros na query string
+echo -e "\n6. Endpoint /convert-file (DOCX bruto)"
+REPLACEMENTS_QS=$(jq -rn --arg r '{"NOME": "João Silva"}' '$r|@uri')
+curl -X POST "$API_URL/convert-file?quality=high&replacements=$REPLACEMENTS_QS" \
+  -H "Content-Type: application/vnd.openxmlformats-officedocument.wordprocessingml.document" \
+  --data-binary "@template.docx" \
+  -o "output_raw.pdf"
+
+# Lote (mail merge): um PDF por registro, devolvidos em um ZIP
+echo -e "\n7. Endpoint /batch (ZIP)"
+curl -X POST "$API_URL/batch" \
+  -F "document=@template.docx" \
+  -F 'records=[{"NOME": "Ana Souza"}, {"NOME": "Bruno Lima"}]' \
+  -F "filename=certificado" \
+  -o "certificados.zip"
+
+# Lote em streaming: uma linha NDJSON por documento, assim que fica pronto
+echo -e "\n8. Endpoint /batch (NDJSON)"
+curl -N -X POST "$API_URL/batch" \
+  -F "document=@template.docx" \
+  -F 'records=[{"NOME": "Ana Souza"}, {"NOME": "Bruno Lima"}]' \
+  -F "output_type=ndjson" | jq -c '{index, success, filename}'
+
+# Dry run: custo estimado, timeout e espera prevista, sem converter
+echo -e "\n9. Endpoint /estimate"
+curl -X POST "$API_URL/estimate" \
+  -F "document=@template.docx" | jq '{estimated_seconds, timeout, basis, estimated_wait}'
+
+# Métricas no formato Prometheus (latência por etapa do pipeline)
+echo -e "\n10. Endpoint /metrics"
+curl -s "$API_URL/metrics" | grep '^doc2pdf_stage_duration_seconds_count'
+
 echo -e "\n✓ Exemplos concluídos!"
@@ -0,0 +1,78 @@
+"""
+Configuração comum dos testes
+
+Os diretórios de trabalho da aplicação (templates, jobs, cache, perfis) são
+apontados para um diretório temporário antes de qualquer import de `config`,
+pois as configurações são lidas do ambiente uma única vez.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import os
+import tempfile
+
+_WORK_DIR = tempfile.mkdtemp(prefix='doc2pdf-tests-')
+for _name in ('TEMPLATE_STORE_DIR', 'JOB_STORE_DIR', 'RESULT_CACHE_DISK_DIR',
+              'LIBREOFFICE_PROFILE_DIR', 'LIBREOFFICE_POOL_DIR'):
+    os.environ.setdefault(_name, os.path.join(_WORK_DIR, _name.lower()))
+os.environ.setdefault('RESULT_CACHE_ENABLED', 'false')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import pytest  # noqa: E402
+from docx import Document  # noqa: E402
+
+
+def build_docx(paragraphs=('Olá {NOME}',), table=None, header=None, footer=None) -> bytes:
+    """
+    Monta um DOCX em memória
+
+    Args:
+        paragraphs: Textos dos parágrafos do corpo
+        table: Linhas (listas de textos) de uma tabela após os parágrafos
+        header: Texto do cabeçalho
+        footer: Texto do rodapé
+
+    Returns:
+        Bytes do DOCX
+    """
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    if table:
+        grid = doc.add_table(rows=len(table), cols=len(table[0]))
+        for row, values in zip(grid.rows, table):
+            for cell, value in zip(row.cells, values):
+                cell.text = value
+    if header is not None:
+        doc.sections[0].header.paragraphs[0].text = header
+    if footer is not None:
+        doc.sections[0].footer.paragraphs[0].text = footer
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def docx_text(doc_bytes: bytes) -> str:
+    """Texto do corpo, tabelas, cabeçalho e rodapé de um DOCX (uma linha por parágrafo)"""
+    doc = Document(io.BytesIO(doc_bytes))
+    lines = [paragraph.text for paragraph in doc.paragraphs]
+    for table in doc.tables:
+        lines.extend(cell.text for row in table.rows for cell in row.cells)
+    for section in doc.sections:
+        lines.extend(paragraph.text for paragraph in section.header.paragraphs)
+        lines.extend(paragraph.text for paragraph in section.footer.paragraphs)
+    return '\n'.join(lines)
+
+
+@pytest.fixture(scope='session')
+def app():
+    """Aplicação Flask (uma por sessão: as filas e pools são globais)"""
+    from app import create_app
+    application = create_app()
+    application.config['TESTING'] = True
+    return application
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
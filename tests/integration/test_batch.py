@@ -0,0 +1,207 @@
+"""
+Testes de integração do endpoint /batch (mail merge)
+
+A conversão para PDF depende do LibreOffice; salvo onde indicado, ela é
+trocada por um PDF falso por registro, pois o que se verifica aqui é a
+montagem das respostas do lote.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import base64
+import io
+import json
+import shutil
+import zipfile
+
+import pytest
+from docx import Document
+from docx.enum.section import WD_SECTION
+
+from app.services.pdf_service import PdfService
+from app.services.render_service import RenderService
+from config.settings import LIBREOFFICE_COMMAND
+from tests.conftest import build_docx
+
+TEMPLATE = build_docx(['Certificado de {NOME}'], header='Empresa {EMPRESA}')
+RECORDS = [{'NOME': 'Ana'}, {'NOME': 'ERRO'}, 'registro inválido', {'NOME': 'Carla'}]
+
+
+def _fake_pdf(name):
+    return f'%PDF-1.4 {name} %%EOF'.encode()
+
+
+@pytest.fixture
+def fake_render(monkeypatch):
+    def render_pdf(template, replacements, quality, engine='docx', split=False):
+        if replacements['NOME'] == 'ERRO':
+            raise Exception('falha na conversão')
+        pdf_bytes = _fake_pdf(replacements['NOME'])
+        return pdf_bytes, {'output_size': len(pdf_bytes), 'cache': {'hit': False}}
+
+    monkeypatch.setattr(RenderService, 'render_pdf', staticmethod(render_pdf))
+
+
+def _batch(client, records=RECORDS, **fields):
+    body = {
+        'document': base64.b64encode(TEMPLATE).decode(),
+        'records': records,
+        'filename': 'certificado',
+        **fields,
+    }
+    return client.post('/batch', json=body)
+
+
+def test_zip_with_manifest(client, fake_render):
+    response = _batch(client)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert (response.headers['X-Batch-Total'], response.headers['X-Batch-Succeeded']) == ('4', '2')
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert zf.testzip() is None
+        manifest = json.loads(zf.read('manifest.json'))
+        assert [item['index'] for item in manifest] == [0, 1, 2, 3]
+        assert [item['success'] for item in manifest] == [True, False, False, True]
+        assert manifest[1]['error'] == 'falha na conversão'
+        assert zf.read('certificado_1.pdf') == _fake_pdf('Ana')
+        assert zf.read('certificado_4.pdf') == _fake_pdf('Carla')
+        assert sorted(zf.namelist()) == ['certificado_1.pdf', 'certificado_4.pdf', 'manifest.json']
+
+
+def test_base64_results_in_record_order(client, fake_render):
+    body = _batch(client, output_type='base64_pdf').get_json()
+
+    assert (body['total'], body['succeeded'], body['failed']) == (4, 2, 2)
+    assert [item['index'] for item in body['results']] == [0, 1, 2, 3]
+    assert base64.b64decode(body['results'][3]['pdf']) == _fake_pdf('Carla')
+    assert 'pdf' not in body['results'][2]
+
+
+@pytest.mark.parametrize('fields, status', [
+    ({'records': []}, 400),
+    ({'records': {'NOME': 'Ana'}}, 400),
+    ({'output_type': 'tar'}, 400),
+    ({'document': base64.b64encode(b'nao sou um docx').decode()}, 400),
+])
+def test_invalid_batches(client, fake_render, fields, status):
+    assert _batch(client, **fields).status_code == status
+
+
+def test_ndjson_lines(client, fake_render):
+    response = _batch(client, output_type='ndjson')
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.data.endswith(b'\n')
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    items, summary = lines[:-1], lines[-1]
+
+    assert sorted(item['index'] for item in items) == [0, 1, 2, 3]
+    by_index = {item['index']: item for item in items}
+    assert base64.b64decode(by_index[0]['pdf']) == _fake_pdf('Ana')
+    assert by_index[0]['filename'] == 'certificado_1.pdf'
+    assert by_index[1] == {'index': 1, 'success': False, 'error': 'falha na conversão'}
+    assert by_index[2]['success'] is False
+    assert (summary['total'], summary['succeeded'], summary['failed']) == (4, 2, 2)
+
+
+def _multipart_parts(response):
+    boundary = response.mimetype_params['boundary'].encode()
+    closing = b'--' + boundary + b'--\r\n'
+    assert response.data.endswith(closing)
+    parts = []
+    for chunk in response.data[:-len(closing)].split(b'--' + boundary + b'\r\n')[1:]:
+        head, _, content = chunk.partition(b'\r\n\r\n')
+        headers = dict(line.split(': ', 1) for line in head.decode().split('\r\n'))
+        assert content.endswith(b'\r\n')
+        content = content[:-2]
+        if 'Content-Length' in headers:
+            assert int(headers['Content-Length']) == len(content)
+        parts.append((headers, content))
+    return parts
+
+
+def test_multipart_parts(client, fake_render):
+    response = _batch(client, output_type='multipart')
+
+    assert response.mimetype == 'multipart/mixed'
+    parts = _multipart_parts(response)
+    items, (summary_headers, summary) = parts[:-1], parts[-1]
+
+    pdfs = {int(headers['X-Index']): content for headers, content in items
+            if headers['Content-Type'] == 'application/pdf'}
+    failures = {int(headers['X-Index']): json.loads(content) for headers, content in items
+                if headers['Content-Type'] == 'application/json'}
+    assert pdfs == {0: _fake_pdf('Ana'), 3: _fake_pdf('Carla')}
+    assert sorted(failures) == [1, 2]
+    assert failures[1]['error'] == 'falha na conversão'
+    assert summary_headers['Content-Type'] == 'application/json'
+    assert json.loads(summary)['succeeded'] == 2
+
+
+def test_multipart_keeps_binary_pdf_bytes(client, monkeypatch):
+    # Quebras de linha e hífens dentro do PDF não podem ser confundidos com o enquadramento
+    def render_pdf(template, replacements, quality, engine='docx', split=False):
+        return b'\r\n--x\r\n\r\n' * 3, {'cache': {'hit': False}}
+
+    monkeypatch.setattr(RenderService, 'render_pdf', staticmethod(render_pdf))
+    parts = _multipart_parts(_batch(client, records=[{'NOME': 'Ana'}], output_type='multipart'))
+    assert parts[0][1] == b'\r\n--x\r\n\r\n' * 3
+
+
+MERGED_RECORDS = [
+    {'NOME': 'Ana', 'EMPRESA': 'A'},
+    {'NOME': 'Bruno', 'EMPRESA': 'A'},
+    {'NOME': 'Carla', 'EMPRESA': 'C'},
+]
+
+
+@pytest.fixture
+def merged_docx(monkeypatch):
+    """Captura o DOCX concatenado que seria convertido pelo LibreOffice"""
+    captured = []
+
+    def convert_docx_bytes_to_pdf(docx_bytes, quality='high', timeout=None, estimate=None):
+        captured.append(docx_bytes)
+        return _fake_pdf('lote')
+
+    monkeypatch.setattr(PdfService, 'convert_docx_bytes_to_pdf',
+                        staticmethod(convert_docx_bytes_to_pdf))
+    return captured
+
+
+def test_merged_pdf_converts_one_document_with_a_section_per_record(client, merged_docx):
+    response = _batch(client, records=MERGED_RECORDS, output_type='merged_pdf')
+
+    assert response.status_code == 200
+    assert response.data == _fake_pdf('lote')
+    assert response.headers['X-Batch-Total'] == '3'
+    assert 'certificado.pdf' in response.headers['Content-Disposition']
+
+    (docx_bytes,) = merged_docx
+    doc = Document(io.BytesIO(docx_bytes))
+    assert [paragraph.text for paragraph in doc.paragraphs] == [
+        'Certificado de Ana', 'Certificado de Bruno', 'Certificado de Carla'
+    ]
+    assert len(doc.sections) == 3
+    assert [section.start_type for section in doc.sections[1:]] == [WD_SECTION.NEW_PAGE] * 2
+    headers = [section.header.paragraphs[0].text for section in doc.sections]
+    assert headers == ['Empresa A', 'Empresa A', 'Empresa C']
+
+
+def test_merged_pdf_rejects_invalid_records(client, merged_docx):
+    records = [{'NOME': 'Ana'}, 'registro inválido']
+    response = _batch(client, records=records, output_type='merged_pdf')
+
+    assert response.status_code == 400
+    assert 'registros 1' in response.get_json()['error']
+    assert merged_docx == []
+
+
+@pytest.mark.skipif(shutil.which(LIBREOFFICE_COMMAND) is None, reason='LibreOffice não instalado')
+def test_merged_pdf_has_one_page_per_record(client):
+    from pypdf import PdfReader
+
+    response = _batch(client, records=MERGED_RECORDS, output_type='merged_pdf')
+
+    assert response.status_code == 200
+    assert len(PdfReader(io.BytesIO(response.data)).pages) == len(MERGED_RECORDS)
@@ -0,0 +1,34 @@
+"""
+Testes de integração do endpoint /estimate
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import base64
+
+import pytest
+
+from tests.conftest import build_docx
+
+DOCUMENT = build_docx(['Olá {NOME}'], table=[['{CIDADE}', 'fixo']])
+
+
+def test_estimate_for_inline_document(client):
+    response = client.post('/estimate', json={'document': base64.b64encode(DOCUMENT).decode()})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] is True
+    assert body['estimated_seconds'] > 0
+    assert body['features']['size'] == len(DOCUMENT)
+
+
+@pytest.mark.parametrize('document', [
+    b'abc',
+    b'\xD0\xCF\x11\xE0' + b'\x00' * 60,
+    b'%PDF-1.4 nao sou um docx',
+])
+def test_invalid_document_is_rejected(client, document):
+    response = client.post('/estimate', json={'document': base64.b64encode(document).decode()})
+
+    assert response.status_code == 400
+    assert response.get_json()['error']
@@ -0,0 +1,335 @@
+"""
+Testes de integração dos jobs assíncronos (POST /jobs e callback)
+
+O callback é recebido por um servidor HTTP local que faz o papel do cliente.
+Os jobs usam output_type "doc" para não depender do LibreOffice.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from app.services.job_service import Job, JobManager, UnknownJobError, get_job_manager
+from tests.conftest import build_docx, docx_text
+
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+
+class CallbackReceiver:
+    """Servidor HTTP local que registra os callbacks recebidos"""
+
+    def __init__(self, status: int = 204, location: str = None):
+        self.received = []
+        self.paths = []
+        self.event = threading.Event()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                receiver.paths.append(self.path)
+                receiver.received.append((dict(self.headers), json.loads(body)))
+                self.send_response(status)
+                if location:
+                    self.send_header('Location', location)
+                self.end_headers()
+                receiver.event.set()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path: str = '/hook') -> str:
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def receiver(monkeypatch):
+    # O receptor local só é aceito porque está na lista de hosts permitidos
+    monkeypatch.setattr('app.utils.validators.JOB_CALLBACK_ALLOWED_HOSTS', ['127.0.0.1'])
+    server = CallbackReceiver()
+    yield server
+    server.close()
+
+
+def _submit(client, **fields):
+    body = {
+        'document': base64.b64encode(build_docx(['Olá {NOME}'])).decode(),
+        'replacements': {'NOME': 'Ana'},
+        'output_type': 'doc',
+        **fields,
+    }
+    return client.post('/jobs', json=body)
+
+
+def _wait_finished(client, job_id, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        info = client.get(f'/jobs/{job_id}').get_json()
+        if info['status'] in ('done', 'failed'):
+            return info
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} não terminou em {timeout}s')
+
+
+def test_job_lifecycle_with_callback(client, receiver):
+    response = _submit(client, callback_url=receiver.url())
+    assert response.status_code == 202
+    created = response.get_json()
+    assert created['status'] == 'queued'
+    assert response.headers['Location'].endswith(f"/jobs/{created['job_id']}")
+
+    info = _wait_finished(client, created['job_id'])
+    assert info['status'] == 'done'
+    assert info['result_url'].endswith(f"/jobs/{created['job_id']}/result")
+
+    result = client.get(f"/jobs/{created['job_id']}/result")
+    assert result.status_code == 200
+    assert result.mimetype == DOCX_MIMETYPE
+    assert 'Olá Ana' in docx_text(result.data)
+
+    assert receiver.event.wait(5)
+    headers, payload = receiver.received[0]
+    assert headers['X-Job-Id'] == created['job_id']
+    assert payload['status'] == 'done'
+    assert payload['result_url'] == info['result_url']
+
+    deadline = time.time() + 5
+    while client.get(f"/jobs/{created['job_id']}").get_json()['callback_status'] != 'delivered':
+        assert time.time() < deadline
+        time.sleep(0.02)
+
+
+def test_delete_job_removes_result(client):
+    job_id = _submit(client).get_json()['job_id']
+    _wait_finished(client, job_id)
+
+    assert client.delete(f'/jobs/{job_id}').status_code == 200
+    assert client.get(f'/jobs/{job_id}').status_code == 404
+    assert client.get(f'/jobs/{job_id}/result').status_code == 404
+    assert client.delete(f'/jobs/{job_id}').status_code == 404
+
+
+def test_result_removed_during_download_is_404(client):
+    job_id = _submit(client).get_json()['job_id']
+    _wait_finished(client, job_id)
+    # Simula um DELETE ou a expiração entre a leitura do estado e o envio do arquivo
+    os.remove(get_job_manager().get(job_id).result_path)
+
+    response = client.get(f'/jobs/{job_id}/result')
+    assert response.status_code == 404
+    assert response.get_json()['code'] == 'unknown_job'
+
+
+def test_download_survives_removal_after_open(client):
+    job_id = _submit(client).get_json()['job_id']
+    _wait_finished(client, job_id)
+
+    response = client.get(f'/jobs/{job_id}/result', buffered=False)
+    assert client.delete(f'/jobs/{job_id}').status_code == 200
+    assert 'Olá Ana' in docx_text(response.get_data())
+    response.close()
+
+
+def test_unknown_and_malformed_job_ids(client):
+    assert client.get('/jobs/' + 'f' * 32).get_json()['code'] == 'unknown_job'
+    assert client.get('/jobs/..%2F..%2Fetc%2Fpasswd').status_code == 404
+    assert client.get('/jobs/abc/result').status_code == 404
+
+
+@pytest.mark.parametrize('url', [
+    'ftp://example.com/hook',
+    'http://127.0.0.1:8080/hook',
+    'http://localhost/hook',
+    'http://169.254.169.254/latest/meta-data',
+    'http://10.0.0.1/hook',
+    'http://[::1]/hook',
+])
+def test_callback_to_internal_addresses_is_refused(client, url):
+    response = _submit(client, callback_url=url)
+    assert response.status_code == 400
+
+
+def test_callback_redirect_is_not_followed(client, monkeypatch):
+    monkeypatch.setattr('app.utils.validators.JOB_CALLBACK_ALLOWED_HOSTS', ['127.0.0.1'])
+    internal = CallbackReceiver()
+    redirecting = CallbackReceiver(status=307, location=internal.url('/internal'))
+    try:
+        job_id = _submit(client, callback_url=redirecting.url()).get_json()['job_id']
+        _wait_finished(client, job_id)
+        deadline = time.time() + 15
+        while client.get(f'/jobs/{job_id}').get_json()['callback_status'] is None:
+            assert time.time() < deadline
+            time.sleep(0.05)
+        assert client.get(f'/jobs/{job_id}').get_json()['callback_status'] == 'failed'
+        assert redirecting.paths and not internal.paths
+    finally:
+        internal.close()
+        redirecting.close()
+
+
+def test_callback_connects_to_the_validated_address(client, monkeypatch):
+    """O host só resolve na validação: o urllib não pode resolvê-lo de novo (DNS rebinding)"""
+    def validation_dns(host, port, *args, **kwargs):
+        return socket.getaddrinfo('127.0.0.1' if host == 'callback.invalid' else host, port, *args, **kwargs)
+
+    # Só o validador enxerga o host; para o resto do processo ele não resolve
+    validation_socket = types.SimpleNamespace(
+        getaddrinfo=validation_dns, gaierror=socket.gaierror, IPPROTO_TCP=socket.IPPROTO_TCP
+    )
+    monkeypatch.setattr('app.utils.validators.JOB_CALLBACK_ALLOWED_HOSTS', ['callback.invalid'])
+    monkeypatch.setattr('app.utils.validators.socket', validation_socket)
+    server = CallbackReceiver()
+    try:
+        callback_url = f'http://callback.invalid:{server.server.server_port}/hook'
+        job_id = _submit(client, callback_url=callback_url).get_json()['job_id']
+        assert server.event.wait(15)
+        headers, _ = server.received[0]
+        assert headers['Host'] == f'callback.invalid:{server.server.server_port}'
+        assert client.get(f'/jobs/{job_id}').get_json()['callback_status'] in (None, 'delivered')
+    finally:
+        server.close()
+
+
+def _docx_job(text='documento'):
+    return Job(lambda document: (text.encode(), {}), DOCX_MIMETYPE, 'documento.docx')
+
+
+def _foreign(job):
+    # Os dois JobManager rodam no mesmo processo; o dono passa a ser outro
+    # processo vivo para que o leitor não trate o job como órfão
+    job.owner = os.getppid()
+    return job
+
+
+def _wait_status(manager, job_id, status, timeout=5.0):
+    deadline = time.time() + timeout
+    while manager.get(job_id).status != status:
+        assert time.time() < deadline, f'job não chegou a {status}'
+        time.sleep(0.01)
+
+
+def test_jobs_are_shared_between_workers(tmp_path):
+    """Dois JobManager no mesmo diretório fazem o papel de dois workers gunicorn"""
+    owner = JobManager(1, store_dir=str(tmp_path))
+    other = JobManager(1, store_dir=str(tmp_path))
+    owner.start()
+
+    job = owner.submit(_foreign(_docx_job('resultado')))
+    _wait_status(other, job.job_id, 'done')
+    seen = other.get(job.job_id)
+    with open(seen.result_path, 'rb') as f:
+        assert f.read() == b'resultado'
+
+    other.delete(job.job_id)
+    with pytest.raises(UnknownJobError):
+        owner.get(job.job_id)
+    assert not os.path.exists(seen.result_path)
+
+
+def test_job_deleted_by_another_worker_while_queued_is_not_run(tmp_path):
+    owner = JobManager(1, store_dir=str(tmp_path))
+    other = JobManager(1, store_dir=str(tmp_path))
+    ran = []
+    job = owner.submit(_foreign(Job(lambda document: ran.append(1) or (b'x', {}), DOCX_MIMETYPE, 'a.docx')))
+
+    assert other.delete(job.job_id).status == 'cancelled'
+    owner.start()
+    owner._queue.join()
+    assert ran == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_queued_input_document_waits_on_disk(tmp_path):
+    manager = JobManager(1, store_dir=str(tmp_path))
+    received = []
+    job = manager.submit(Job(lambda document: received.append(document) or (b'x', {}), DOCX_MIMETYPE, 'a.docx',
+                             document=b'entrada'))
+
+    assert job.document is None
+    with open(os.path.join(tmp_path, f'{job.job_id}.input'), 'rb') as f:
+        assert f.read() == b'entrada'
+
+    manager.start()
+    _wait_status(manager, job.job_id, 'done')
+    assert received == [b'entrada']
+    assert not os.path.exists(os.path.join(tmp_path, f'{job.job_id}.input'))
+
+
+def test_deleting_queued_job_removes_input_document(tmp_path):
+    manager = JobManager(1, store_dir=str(tmp_path))
+    job = manager.submit(Job(lambda document: (b'x', {}), DOCX_MIMETYPE, 'a.docx', document=b'entrada'))
+
+    manager.delete(job.job_id)
+    assert os.listdir(tmp_path) == []
+
+
+def test_job_of_dead_worker_is_reported_failed(tmp_path):
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    job = _docx_job()
+    job.owner = dead.pid
+    manager = JobManager(1, store_dir=str(tmp_path))
+    manager._save(job, create=True)
+
+    info = manager.get(job.job_id)
+    assert info.status == 'failed'
+    assert info.error
+
+
+def test_job_finishing_while_its_state_is_read_is_not_reported_failed(tmp_path, monkeypatch):
+    manager = JobManager(1, store_dir=str(tmp_path))
+    job = manager.submit(_docx_job())
+    job.status = 'running'
+    manager._save(job)
+    from_state = Job.from_state
+
+    def finish_during_read(state):
+        # O worker conclui o job entre a leitura do arquivo e a verificação de órfão
+        if job.job_id in manager._jobs:
+            job.status = 'done'
+            job.finished_at = time.time()
+            manager._save(job)
+            manager._jobs.pop(job.job_id)
+        return from_state(state)
+
+    monkeypatch.setattr(Job, 'from_state', finish_during_read)
+    assert manager.get(job.job_id).status == 'running'
+    assert manager.get(job.job_id).status == 'done'
+
+
+def test_hanging_callback_does_not_hold_job_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr('app.utils.validators.JOB_CALLBACK_ALLOWED_HOSTS', ['127.0.0.1'])
+    silent = socket.socket()
+    silent.bind(('127.0.0.1', 0))
+    silent.listen(16)  # Aceita conexões e nunca responde
+    try:
+        manager = JobManager(1, store_dir=str(tmp_path))
+        manager.start()
+        url = f'http://127.0.0.1:{silent.getsockname()[1]}/hook'
+        jobs = []
+        for _ in range(3):
+            job = _docx_job()
+            job.callback_url = url
+            jobs.append(manager.submit(job))
+
+        for job in jobs:
+            _wait_status(manager, job.job_id, 'done', timeout=3.0)
+    finally:
+        silent.close()
@@ -0,0 +1,51 @@
+"""
+Testes de integração dos limites de tamanho (413) nos endpoints de renderização
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import base64
+
+import pytest
+
+from app.utils import ingestion
+from app.utils.ingestion import DOCX_MIMETYPE
+from tests.conftest import build_docx
+
+DOCUMENT = build_docx(['Olá {NOME}'])
+ENDPOINTS = ['/process', '/convert', '/convert-file', '/estimate', '/jobs', '/batch', '/templates']
+
+
+@pytest.fixture(autouse=True)
+def small_limit(monkeypatch):
+    monkeypatch.setattr(ingestion, 'MAX_FILE_SIZE', 1000)
+
+
+def _assert_too_large(response):
+    assert response.status_code == 413
+    body = response.get_json()
+    assert body['code'] == 'payload_too_large'
+    assert body['max_file_size'] == 1000
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_decoded_json_document_over_limit(client, endpoint):
+    response = client.post(endpoint, json={
+        'document': base64.b64encode(DOCUMENT).decode(),
+        'replacements': {'NOME': 'Ana'},
+    })
+    _assert_too_large(response)
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_raw_docx_over_limit(client, endpoint):
+    _assert_too_large(client.post(endpoint, data=DOCUMENT, content_type=DOCX_MIMETYPE))
+
+
+def test_document_within_limit_is_accepted(client, monkeypatch):
+    monkeypatch.setattr(ingestion, 'MAX_FILE_SIZE', len(DOCUMENT))
+    response = client.post('/process', json={
+        'document': base64.b64encode(DOCUMENT).decode(),
+        'replacements': {'NOME': 'Ana'},
+        'output_type': 'doc',
+    })
+    assert response.status_code == 200
@@ -0,0 +1,44 @@
+"""
+Testes de integração do endpoint /process
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import base64
+
+import pytest
+
+from app.services.render_service import RenderService
+from tests.conftest import build_docx
+
+DOCUMENT = build_docx(['Olá {NOME}'])
+PDF = b'%PDF-1.4\n%%EOF\n'
+
+
+def _process(client, **fields):
+    body = {
+        'document': base64.b64encode(DOCUMENT).decode(),
+        'replacements': {'NOME': 'Ana'},
+        **fields,
+    }
+    return client.post('/process', json=body)
+
+
+@pytest.mark.parametrize('split_stats', [None, {'chunks': 3, 'reason': None, 'conversion_time': 0.5}])
+def test_base64_pdf_reports_split_only_when_requested(client, monkeypatch, split_stats):
+    # A conversão em si depende do LibreOffice; aqui só interessa o corpo da resposta
+    def render_pdf(template, replacements, quality, engine, split):
+        stats = {'output_size': len(PDF), 'cache': {'hit': False}}
+        if split_stats is not None:
+            stats['split'] = split_stats
+        return PDF, stats
+
+    monkeypatch.setattr(RenderService, 'render_pdf', staticmethod(render_pdf))
+    response = _process(client, output_type='base64_pdf', split=split_stats is not None)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert base64.b64decode(body['pdf']) == PDF
+    if split_stats is None:
+        assert 'split' not in body['stats']
+    else:
+        assert body['stats']['split'] == split_stats
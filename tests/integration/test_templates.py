@@ -0,0 +1,91 @@
+"""
+Testes de integração do registro de templates e da renderização por template_id
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import base64
+import io
+
+import pytest
+
+from app.services.template_registry import TemplateRegistry
+from tests.conftest import build_docx, docx_text
+
+TEMPLATE = build_docx(['Olá {NOME}', 'CPF {CPF}'], header='Cabeçalho {EMPRESA}')
+REPLACEMENTS = {'NOME': 'Ana', 'cpf': '123', 'EMPRESA': 'M&S <do Brasil>'}
+UNKNOWN_ID = 'f' * 64
+
+
+def _register(client, document=TEMPLATE):
+    return client.post('/templates', json={'document': base64.b64encode(document).decode()})
+
+
+def _render(client, **fields):
+    return client.post('/process', json={'replacements': REPLACEMENTS, 'output_type': 'doc', **fields})
+
+
+def _save(doc):
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def test_register_is_idempotent(client):
+    first = _register(client)
+    again = _register(client)
+
+    assert first.status_code in (200, 201)
+    assert again.status_code == 200
+    assert again.get_json()['created'] is False
+    assert again.get_json()['template_id'] == first.get_json()['template_id']
+    assert again.get_json()['tags'] == ['CPF', 'EMPRESA', 'NOME']
+
+
+@pytest.mark.parametrize('engine', ['docx', 'xml'])
+def test_render_by_template_id_matches_inline_document(client, engine):
+    template_id = _register(client).get_json()['template_id']
+
+    by_id = _render(client, template_id=template_id, engine=engine)
+    inline = _render(client, document=base64.b64encode(TEMPLATE).decode(), engine=engine)
+
+    assert by_id.status_code == inline.status_code == 200
+    assert docx_text(by_id.data) == docx_text(inline.data)
+    assert 'Olá Ana\nCPF 123' in docx_text(by_id.data)
+    assert 'Cabeçalho M&S <do Brasil>' in docx_text(by_id.data)
+
+
+@pytest.mark.parametrize('endpoint', ['/process', '/convert', '/estimate', '/jobs'])
+def test_unknown_template_id_is_404(client, endpoint):
+    response = client.post(endpoint, json={'template_id': UNKNOWN_ID, 'replacements': {}})
+
+    assert response.status_code == 404
+    assert response.get_json()['code'] == 'unknown_template'
+    assert response.get_json()['template_id'] == UNKNOWN_ID
+
+
+def test_malformed_template_id_is_400(client):
+    assert _render(client, template_id='../../etc/passwd').status_code == 400
+    assert client.get('/templates/abc').status_code == 400
+    assert client.delete('/templates/abc').status_code == 400
+
+
+def test_delete_template(client):
+    document = build_docx(['Removível {X}'])
+    template_id = _register(client, document).get_json()['template_id']
+
+    assert client.get(f'/templates/{template_id}').status_code == 200
+    assert client.delete(f'/templates/{template_id}').status_code == 200
+    assert client.get(f'/templates/{template_id}').get_json()['code'] == 'unknown_template'
+    assert client.delete(f'/templates/{template_id}').status_code == 404
+
+
+def test_evicted_template_is_reloaded_from_disk(tmp_path):
+    registry = TemplateRegistry(max_entries=1, store_dir=str(tmp_path))
+    first, _ = registry.register(build_docx(['Primeiro {A}']))
+    registry.register(build_docx(['Segundo {B}']))
+    assert registry.stats()['memory_entries'] == 1
+
+    reloaded = registry.get(first.template_id)
+    assert reloaded is not first
+    assert reloaded.tags == {'A'}
+    assert 'Primeiro 1' in docx_text(_save(reloaded.fill({'A': 1})))
@@ -0,0 +1,161 @@
+"""
+Testes do controle de admissão das conversões (ConversionLimiter)
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import threading
+import time
+
+import pytest
+
+from app.services.admission import (
+    ConversionLimiter,
+    ServerOverloadedError,
+    background_work,
+    priority_lane
+)
+from config.settings import INTERACTIVE_LANE
+
+
+class Conversion(threading.Thread):
+    """Conversão simulada: ocupa um slot do limitador até ser liberada"""
+
+    def __init__(self, limiter, cost=1.0, lane=INTERACTIVE_LANE, background=False, log=None):
+        super().__init__(daemon=True)
+        self.limiter = limiter
+        self.cost = cost
+        self.lane = lane
+        self.background = background
+        self.log = log if log is not None else []
+        self.granted = threading.Event()
+        self.release = threading.Event()
+        self.error = None
+
+    def run(self):
+        try:
+            with priority_lane(self.lane):
+                if self.background:
+                    with background_work(), self.limiter.slot(self.cost):
+                        self._hold()
+                else:
+                    with self.limiter.slot(self.cost):
+                        self._hold()
+        except ServerOverloadedError as e:
+            self.error = e
+
+    def _hold(self):
+        self.log.append((self.lane, self.cost))
+        self.granted.set()
+        self.release.wait(5)
+
+
+def start(limiter, **kwargs):
+    """Inicia uma conversão simulada e espera ela ocupar um slot ou entrar na fila"""
+    queued = sum(info['waiting'] + info['background_waiting'] for info in limiter.status()['lanes'].values())
+    conversion = Conversion(limiter, **kwargs)
+    conversion.start()
+    deadline = time.time() + 5
+    while not conversion.granted.is_set():
+        lanes = limiter.status()['lanes'].values()
+        if sum(info['waiting'] + info['background_waiting'] for info in lanes) > queued:
+            break
+        assert time.time() < deadline, 'conversão não entrou no limitador'
+        time.sleep(0.005)
+    return conversion
+
+
+def finish(*conversions):
+    for conversion in conversions:
+        conversion.release.set()
+    for conversion in conversions:
+        conversion.join(5)
+
+
+def test_in_flight_never_exceeds_capacity():
+    limiter = ConversionLimiter(3, max_waiting=20, wait_timeout=5)
+    peak = []
+
+    def convert():
+        with limiter.slot(0.01):
+            peak.append(limiter.in_flight)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=convert) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(peak) == 12
+    assert max(peak) == 3
+    assert limiter.in_flight == 0
+
+
+def test_full_waiting_room_is_rejected_with_retry_after():
+    limiter = ConversionLimiter(1, max_waiting=1, wait_timeout=5)
+    running = start(limiter)
+    waiting = start(limiter)
+    assert running.granted.is_set() and not waiting.granted.is_set()
+    assert limiter.saturated()
+
+    with pytest.raises(ServerOverloadedError) as rejected:
+        with limiter.slot(1.0):
+            pass
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after >= 1
+    assert rejected.value.load['waiting'] == 1
+
+    with pytest.raises(ServerOverloadedError):
+        limiter.admit()
+    assert limiter.rejected == 2
+
+    finish(running, waiting)
+    assert waiting.granted.is_set() and waiting.error is None
+    assert not limiter.saturated()
+
+
+def test_wait_timeout_is_rejected_with_503():
+    limiter = ConversionLimiter(1, max_waiting=5, wait_timeout=0.1)
+    running = start(limiter)
+
+    with pytest.raises(ServerOverloadedError) as rejected:
+        with limiter.slot(1.0):
+            pass
+    assert rejected.value.status_code == 503
+    assert limiter.status()['waiting'] == 0
+
+    finish(running)
+
+
+def test_background_work_waits_without_being_rejected():
+    limiter = ConversionLimiter(1, max_waiting=0, wait_timeout=0.05)
+    running = start(limiter)
+    job = start(limiter, background=True)
+    time.sleep(0.1)  # Mais que o wait_timeout das requisições
+
+    status = limiter.status()
+    assert status['waiting'] == 0 and status['background_waiting'] == 1
+    finish(running)
+    assert job.granted.wait(5) and job.error is None
+    finish(job)
+
+
+def test_shortest_conversion_goes_first():
+    limiter = ConversionLimiter(1, max_waiting=10, wait_timeout=5)
+    log = []
+    running = start(limiter, log=log)
+    queued = [start(limiter, cost=cost, log=log) for cost in (5.0, 1.0, 3.0)]
+
+    finish(running, *queued)
+    assert [cost for _, cost in log[1:]] == [1.0, 3.0, 5.0]
+
+
+def test_retry_after_follows_recent_conversion_times():
+    limiter = ConversionLimiter(2, max_waiting=10, wait_timeout=5)
+    with limiter.slot(0.2):
+        time.sleep(0.2)
+
+    assert limiter.average_conversion_time() == pytest.approx(0.2, abs=0.1)
+    # 9 à frente + esta, em 2 slots: 5 rodadas de ~0,2s
+    assert limiter.retry_after(queued=9) in (1, 2)
+    assert limiter.retry_after(queued=39) == pytest.approx(4, abs=2)
@@ -0,0 +1,72 @@
+"""
+Testes da concatenação de documentos (DocxService.append_document)
+
+Usada pelo /batch com output_type merged_pdf: cada registro preenchido a
+partir do mesmo template vira uma seção nova do DOCX final.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+
+from docx import Document
+from docx.enum.section import WD_SECTION
+from docx.oxml.ns import qn
+
+from app.services.docx_service import DocxService
+from tests.conftest import build_docx
+
+
+def _open(doc_bytes):
+    return Document(io.BytesIO(doc_bytes))
+
+
+def _merge(*documents):
+    master = _open(documents[0])
+    for doc_bytes in documents[1:]:
+        DocxService.append_document(master, _open(doc_bytes))
+    buffer = io.BytesIO()
+    master.save(buffer)
+    return _open(buffer.getvalue())
+
+
+def test_break_goes_in_the_last_paragraph():
+    merged = _merge(build_docx(['Primeiro']), build_docx(['Segundo']), build_docx(['Terceiro']))
+
+    # Sem parágrafos vazios a mais: uma página cheia não transborda para uma em branco
+    texts = [paragraph.text for paragraph in merged.paragraphs]
+    assert texts == ['Primeiro', 'Segundo', 'Terceiro']
+    assert len(merged.sections) == 3
+    assert all(section.start_type == WD_SECTION.NEW_PAGE for section in merged.sections[1:])
+
+
+def test_body_ending_in_table():
+    merged = _merge(
+        build_docx(['Antes'], table=[['A', 'B']]),
+        build_docx(['Depois'], table=[['C', 'D']]),
+    )
+
+    body = merged.element.body
+    tables = body.findall(qn('w:tbl'))
+    assert len(tables) == 2
+    # A quebra de seção fica em um parágrafo criado logo após a primeira tabela
+    break_paragraph = tables[0].getnext()
+    assert break_paragraph.tag == qn('w:p') and break_paragraph.pPr.sectPr is not None
+    assert len(merged.sections) == 2
+    assert [paragraph.text for paragraph in merged.paragraphs] == ['Antes', '', 'Depois']
+    assert [table.cell(0, 0).text for table in merged.tables] == ['A', 'C']
+
+
+def test_equal_headers_share_a_part_and_different_ones_get_their_own():
+    merged = _merge(
+        build_docx(['1'], header='Empresa A', footer='Rodapé'),
+        build_docx(['2'], header='Empresa A', footer='Rodapé'),
+        build_docx(['3'], header='Empresa C', footer='Rodapé'),
+    )
+
+    headers = [section.header for section in merged.sections]
+    texts = [header.paragraphs[0].text for header in headers]
+    assert texts == ['Empresa A', 'Empresa A', 'Empresa C']
+    assert headers[0].part is headers[1].part
+    assert headers[2].part is not headers[0].part
+    footers = {section.footer.part for section in merged.sections}
+    assert len(footers) == 1
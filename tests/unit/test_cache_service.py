@@ -0,0 +1,108 @@
+"""
+Testes do cache de resultados endereçado por conteúdo
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import os
+
+import pytest
+
+from app.services import cache_service, render_service
+from app.services.cache_service import DiskCache, MemoryLRUCache, ResultCache
+from app.services.render_service import RenderService
+from app.services.template_registry import Template
+from tests.conftest import build_docx, docx_text
+
+DOC_HASH = 'a' * 64
+
+
+@pytest.mark.parametrize('equivalent', [
+    {'nome': 'Ana', 'VALOR': '10'},
+    {'VALOR': 10, 'NOME': 'Ana'},
+    {'Nome': 'Ana', 'valor': '10', 'NOME': 'ignorada'},
+])
+def test_equivalent_replacements_share_the_key(equivalent):
+    expected = ResultCache.make_key(DOC_HASH, {'NOME': 'Ana', 'VALOR': '10'}, 'high')
+    assert ResultCache.make_key(DOC_HASH, equivalent, 'high') == expected
+
+
+@pytest.mark.parametrize('changed', [
+    ('b' * 64, {'NOME': 'Ana'}, 'high', 'pdf'),
+    (DOC_HASH, {'NOME': 'Bia'}, 'high', 'pdf'),
+    (DOC_HASH, {'NOME': 'Ana', 'CPF': ''}, 'high', 'pdf'),
+    (DOC_HASH, {'NOME': 'Ana'}, 'low', 'pdf'),
+    (DOC_HASH, {'NOME': 'Ana'}, 'high', 'docx'),
+])
+def test_different_inputs_get_different_keys(changed):
+    assert ResultCache.make_key(*changed) != ResultCache.make_key(DOC_HASH, {'NOME': 'Ana'}, 'high', 'pdf')
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryLRUCache(max_bytes=10, ttl=60)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    assert cache.get('a') == b'1234'  # 'b' passa a ser o menos usado
+    cache.put('c', b'1234')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1234' and cache.get('c') == b'1234'
+    assert cache.size == 8
+
+
+def test_memory_cache_ttl_and_oversized_values():
+    expired = MemoryLRUCache(max_bytes=10, ttl=0)
+    expired.put('a', b'x')
+    assert expired.get('a') is None
+    assert expired.size == 0
+
+    cache = MemoryLRUCache(max_bytes=10, ttl=60)
+    cache.put('grande', b'x' * 11)
+    assert cache.get('grande') is None
+    assert len(cache) == 0
+
+
+def test_disk_cache_eviction_and_size_after_restart(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10, ttl=60)
+    cache.put('a', b'1234')
+    os.utime(tmp_path / 'a', (1, 1))  # 'a' é o menos usado
+    cache.put('b', b'1234')
+    cache.put('c', b'1234')
+
+    assert cache.get('a') is None
+    assert cache.get('b') == b'1234' and cache.get('c') == b'1234'
+    assert DiskCache(str(tmp_path), max_bytes=10, ttl=60).size == cache.size == 8
+
+
+def test_disk_cache_ttl(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10, ttl=0)
+    cache.put('a', b'1234')
+    assert cache.get('a') is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_hit_miss_counters_and_promotion_from_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_service, 'RESULT_CACHE_DISK_ENABLED', True)
+    monkeypatch.setattr(cache_service, 'RESULT_CACHE_DISK_DIR', str(tmp_path))
+    cache = ResultCache()
+
+    assert cache.get('chave') is None
+    cache.put('chave', b'resultado')
+    cache.memory = MemoryLRUCache(cache.memory.max_bytes, cache.memory.ttl)  # Outro worker, memória vazia
+    assert cache.get('chave') == b'resultado'
+    assert cache.memory.get('chave') == b'resultado'
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_render_docx_is_served_from_cache(monkeypatch):
+    monkeypatch.setattr(render_service, 'result_cache', ResultCache())
+    template = Template(build_docx(['Olá {NOME}']))
+
+    first, first_stats = RenderService.render_docx(template, {'NOME': 'Ana'})
+    second, second_stats = RenderService.render_docx(Template(template.doc_bytes), {'nome': 'Ana'})
+    other, other_stats = RenderService.render_docx(template, {'NOME': 'Bia'})
+
+    assert first_stats['cache']['hit'] is False
+    assert second_stats['cache']['hit'] is True
+    assert second == first
+    assert other_stats['cache']['hit'] is False
+    assert 'Olá Bia' in docx_text(other)
@@ -0,0 +1,144 @@
+"""
+Testes do daemon de conversão compartilhado (ida e volta pelo socket Unix)
+
+O daemon atende em um socket temporário, em uma thread do próprio teste.
+A conversão pelo LibreOffice (PdfService._convert_bytes) é trocada por um
+PDF falso, pois o executável não está disponível aqui; o restante do
+caminho - socket, arquivos de troca, controle de admissão, faixa de
+prioridade e exceções - é o real.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from app.services import conversion_daemon
+from app.services.admission import (
+    ServerOverloadedError, background_work, current_lane, is_background, priority_lane
+)
+from app.services.conversion_client import ConversionDaemonClient
+from app.services.conversion_daemon import ConversionDaemon, _Handler, _Server
+from app.services.pdf_service import PdfService
+from app.services.profile_pool import ProfilePool
+
+DOCUMENT = b'PK docx de teste'
+
+
+@pytest.fixture
+def daemon():
+    # Caminho curto: sockets Unix aceitam no máximo ~108 caracteres
+    root = tempfile.mkdtemp(prefix='d2p-', dir='/tmp')
+    daemon = ConversionDaemon(os.path.join(root, 'convert.sock'), os.path.join(root, 'shm'))
+    os.makedirs(daemon.shm_dir)
+    server = _Server(daemon.socket_path, _Handler)
+    server.conversion_daemon = daemon
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield daemon
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(root, ignore_errors=True)
+
+
+@pytest.fixture
+def daemon_client(daemon):
+    return ConversionDaemonClient(daemon.socket_path, daemon.shm_dir)
+
+
+@pytest.fixture
+def conversions(monkeypatch):
+    """Substitui o LibreOffice e registra o que o daemon recebeu"""
+    received = []
+
+    def convert_bytes(docx_bytes, quality, timeout):
+        received.append({'docx': docx_bytes, 'quality': quality, 'timeout': timeout,
+                         'lane': current_lane(), 'background': is_background()})
+        if docx_bytes == b'invalido':
+            raise ValueError('documento inválido')
+        if docx_bytes == b'falha':
+            raise Exception('LibreOffice terminou com código 1')
+        return b'%PDF-1.4 ' + docx_bytes
+
+    monkeypatch.setattr(PdfService, '_convert_bytes', staticmethod(convert_bytes))
+    return received
+
+
+def test_ping(daemon_client):
+    assert daemon_client.request({'op': 'ping'})['pid'] == os.getpid()
+    assert daemon_client.wait_until_ready(1)
+
+
+def test_convert_round_trip(daemon, daemon_client, conversions):
+    with priority_lane('bulk'), background_work():
+        pdf_bytes, seconds = daemon_client.convert(DOCUMENT, 'medium', 30, cost=1.5)
+
+    assert pdf_bytes == b'%PDF-1.4 ' + DOCUMENT
+    assert seconds >= 0
+    assert conversions == [{'docx': DOCUMENT, 'quality': 'medium', 'timeout': 30.0,
+                            'lane': 'bulk', 'background': True}]
+    assert daemon.conversions == 1
+    # Os arquivos de troca são removidos pelo cliente
+    assert os.listdir(daemon.shm_dir) == []
+
+
+@pytest.mark.parametrize('document, error', [
+    (b'invalido', ValueError),
+    (b'falha', Exception),
+])
+def test_conversion_errors_are_raised_in_the_client(daemon_client, conversions, document, error):
+    with pytest.raises(error) as raised:
+        daemon_client.convert(document, 'high', 30)
+    assert type(raised.value) is error
+
+
+def test_overload_is_raised_in_the_client(daemon_client, monkeypatch):
+    def overloaded(docx_bytes, quality, timeout, cost=None):
+        raise ServerOverloadedError('Servidor ocupado', 7, 429, {'queued': 3})
+
+    monkeypatch.setattr(PdfService, 'convert_locally', staticmethod(overloaded))
+    with pytest.raises(ServerOverloadedError) as raised:
+        daemon_client.convert(DOCUMENT, 'high', 30)
+    error = raised.value
+    assert (error.status_code, error.retry_after, error.load) == (429, 7, {'queued': 3})
+
+
+def test_files_outside_the_exchange_directory_are_refused(daemon_client, conversions):
+    with pytest.raises(ValueError, match='fora do diretório de troca'):
+        daemon_client.request(
+            {'op': 'convert', 'input': '/etc/hostname', 'output': '/tmp/saida.pdf'})
+    assert conversions == []
+
+
+@pytest.mark.parametrize('payload', [
+    {'op': 'apagar'},
+    {'op': 'limiter', 'method': 'slot'},
+])
+def test_unknown_operations_are_refused(daemon_client, payload):
+    with pytest.raises(ValueError):
+        daemon_client.request(payload)
+
+
+def test_remote_limiter_and_health(daemon_client, monkeypatch, tmp_path):
+    profiles = ProfilePool(1, base_dir=str(tmp_path))
+    monkeypatch.setattr(conversion_daemon, 'get_profile_pool', lambda: profiles)
+
+    assert daemon_client.limiter.capacity >= 1
+    assert daemon_client.limiter.saturated() is False
+    assert daemon_client.limiter.retry_after() >= 1
+    health = daemon_client.health()
+    assert health['pid'] == os.getpid()
+    assert health['admission']['capacity'] == daemon_client.limiter.capacity
+
+
+def test_daemon_down(tmp_path):
+    client = ConversionDaemonClient(str(tmp_path / 'ausente.sock'), str(tmp_path / 'shm'))
+
+    with pytest.raises(ServerOverloadedError) as raised:
+        client.convert(DOCUMENT, 'high', 30)
+    assert raised.value.status_code == 503
+    assert client.limiter.saturated() is True
+    assert os.listdir(tmp_path / 'shm') == []
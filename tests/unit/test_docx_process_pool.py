@@ -0,0 +1,97 @@
+"""
+Testes do pool de processos da etapa DOCX (DocxProcessPool)
+
+O DOCX gerado em um processo do pool deve ser o mesmo gerado na thread da
+requisição, para as duas engines, com templates registrados ou avulsos.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import zipfile
+
+import pytest
+
+from app.services import render_service
+from app.services.docx_process_pool import DocxProcessPool
+from app.services.render_service import RenderService
+from app.services.template_registry import Template
+from tests.conftest import build_docx
+
+TEMPLATE = build_docx(
+    ['Olá {NOME}', 'Cidade: {CIDADE}'],
+    table=[['{NOME}', '{VALOR}']],
+    header='Empresa {EMPRESA}',
+)
+REPLACEMENTS = {'NOME': 'Ana & <Souza>', 'CIDADE': 'Campinas', 'VALOR': 10, 'EMPRESA': 'M&S'}
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = DocxProcessPool(size=1, min_bytes=0)
+    yield pool
+    pool.shutdown()
+
+
+def _members(docx_bytes):
+    """Conteúdo e compressão de cada membro (a data de gravação muda a cada save)"""
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as zf:
+        return [(info.filename, info.compress_type, zf.read(info)) for info in zf.infolist()]
+
+
+def _write(monkeypatch, pool, template, engine, compression):
+    monkeypatch.setattr(render_service, 'get_docx_process_pool', lambda: pool)
+    output = io.BytesIO()
+    RenderService._write_docx(template, REPLACEMENTS, engine, output, compression)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('engine', ['docx', 'xml'])
+@pytest.mark.parametrize('registered', [False, True])
+@pytest.mark.parametrize('compression', ['stored', 'default'])
+def test_process_and_thread_produce_the_same_document(
+    monkeypatch, pool, engine, registered, compression
+):
+    template = Template(TEMPLATE, registered=registered)
+    in_thread = _write(monkeypatch, None, template, engine, compression)
+    tasks = pool.tasks
+    in_process = _write(monkeypatch, pool, template, engine, compression)
+
+    assert pool.tasks == tasks + 1
+    assert _members(in_process) == _members(in_thread)
+
+
+def test_registered_template_is_reused_by_the_process(pool):
+    template = Template(TEMPLATE, registered=True)
+    for name in ('Ana', 'Bruno'):
+        docx_bytes, timings, _ = pool.write_docx(
+            template.template_id, TEMPLATE, True, {'NOME': name}, 'docx', 'stored')
+        with zipfile.ZipFile(io.BytesIO(docx_bytes)) as zf:
+            assert f'Olá {name}'.encode() in zf.read('word/document.xml')
+        assert set(timings) == {'replace', 'save'}
+
+
+def test_small_documents_stay_in_the_thread():
+    pool = DocxProcessPool.__new__(DocxProcessPool)
+    pool.min_bytes = 1024
+    assert not pool.accepts(1023)
+    assert pool.accepts(1024)
+
+
+def test_invalid_document_raises_value_error(pool):
+    with pytest.raises(ValueError):
+        pool.write_docx('x', b'nao e um docx', False, {}, 'docx', 'stored')
+
+
+def test_dead_process_recreates_the_pool():
+    pool = DocxProcessPool(size=1, min_bytes=0)
+    try:
+        pool.write_docx('x', TEMPLATE, False, REPLACEMENTS, 'docx', 'stored')
+        for process in list(pool._executor._processes.values()):
+            process.kill()
+            process.join()
+
+        docx_bytes, _, _ = pool.write_docx('x', TEMPLATE, False, REPLACEMENTS, 'docx', 'stored')
+        assert zipfile.ZipFile(io.BytesIO(docx_bytes)).testzip() is None
+        assert pool.restarts == 1
+    finally:
+        pool.shutdown()
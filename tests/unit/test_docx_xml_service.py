@@ -0,0 +1,83 @@
+"""
+Testes da engine de substituição "xml" (DocxXmlService)
+
+A engine em streaming deve gerar, nas partes que reescreve (documento
+principal, cabeçalhos e rodapés), o mesmo XML que a engine python-docx, e
+contar as mesmas substituições.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import zipfile
+
+import pytest
+from lxml import etree
+
+from app.services.docx_service import DocxService
+from app.services.docx_xml_service import DocxXmlService
+from tests.conftest import build_docx
+from tests.unit.test_tag_index import REPLACEMENTS, TEMPLATE
+
+REWRITTEN_PARTS = ('word/document.xml', 'word/header1.xml', 'word/footer1.xml')
+
+
+def _canonical_parts(doc_bytes):
+    with zipfile.ZipFile(io.BytesIO(doc_bytes)) as package:
+        return {
+            name: etree.tostring(etree.fromstring(package.read(name)), method='c14n')
+            for name in REWRITTEN_PARTS
+        }
+
+
+def _render_docx(template, replacements):
+    doc = DocxService.load_document(template)
+    count = DocxService.replace_tags_in_document(doc, replacements)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue(), count
+
+
+def _render_xml(template, replacements, compression='default'):
+    buffer = io.BytesIO()
+    count = DocxXmlService.replace_tags(template, replacements, buffer, compression)
+    return buffer.getvalue(), count
+
+
+@pytest.mark.parametrize('replacements', [
+    REPLACEMENTS,
+    {'NOME': 'Ana & "Bia" <Souza>', 'DATA': "d'Ávila"},
+    {'NOME': 'linha 1\nlinha 2', 'CPF': 'a\tb'},
+    {'INEXISTENTE': 'x'},
+    {},
+])
+def test_xml_engine_matches_docx_engine(replacements):
+    by_docx, docx_count = _render_docx(TEMPLATE, replacements)
+    by_xml, xml_count = _render_xml(TEMPLATE, replacements)
+
+    assert xml_count == docx_count
+    assert _canonical_parts(by_xml) == _canonical_parts(by_docx)
+
+
+def test_untouched_members_are_copied():
+    by_xml, _ = _render_xml(TEMPLATE, REPLACEMENTS, compression='stored')
+    original = zipfile.ZipFile(io.BytesIO(TEMPLATE))
+    with original, zipfile.ZipFile(io.BytesIO(by_xml)) as rendered:
+        assert rendered.namelist() == original.namelist()
+        assert rendered.testzip() is None
+        for name in original.namelist():
+            if name not in REWRITTEN_PARTS:
+                assert rendered.read(name) == original.read(name)
+        assert rendered.getinfo('word/document.xml').compress_type == zipfile.ZIP_STORED
+
+
+def test_invalid_document_is_rejected():
+    with pytest.raises(ValueError):
+        DocxXmlService.replace_tags(b'nao e um docx', {'NOME': 'Ana'}, io.BytesIO())
+
+
+def test_document_without_header_and_footer():
+    template = build_docx(['{NOME}'])
+    by_xml, count = _render_xml(template, {'NOME': 'Ana'})
+    assert count == 1
+    with zipfile.ZipFile(io.BytesIO(by_xml)) as package:
+        assert b'>Ana<' in package.read('word/document.xml')
@@ -0,0 +1,148 @@
+"""
+Testes da leitura em streaming das requisições de renderização
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import base64
+import io
+import json
+
+import pytest
+from flask import Flask
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from app.utils import ingestion
+from app.utils.ingestion import DOCX_MIMETYPE, read_render_request
+from tests.conftest import build_docx
+
+DOCUMENT = build_docx(['Olá {NOME}'])
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Blocos pequenos fazem strings, escapes e Base64 cruzarem as fronteiras de leitura
+    monkeypatch.setattr(ingestion, 'INGEST_CHUNK_SIZE', 7)
+
+
+@pytest.fixture
+def read():
+    app = Flask(__name__)
+
+    def read(data, content_type='application/json', allow_raw_document=False, **kwargs):
+        with app.test_request_context('/', method='POST', data=data, content_type=content_type, **kwargs):
+            return read_render_request(allow_raw_document)
+    return read
+
+
+def test_json_base64_document(read):
+    body = json.dumps({
+        'replacements': {'NOME': 'Ana "Maria"', 'LISTA': [1, {'a': None}]},
+        'document': base64.b64encode(DOCUMENT).decode(),
+        'quality': 'high',
+        'split': True,
+    })
+    params, doc_bytes = read(body)
+
+    assert doc_bytes == DOCUMENT
+    assert params == {
+        'replacements': {'NOME': 'Ana "Maria"', 'LISTA': [1, {'a': None}]},
+        'quality': 'high',
+        'split': True,
+    }
+
+
+def test_base64_with_line_breaks_and_escaped_slashes(read):
+    encoded = base64.encodebytes(DOCUMENT).decode()  # Quebras de linha a cada 76 caracteres
+    assert '/' in encoded
+    body = json.dumps({'document': encoded}).replace('/', '\\/')
+
+    params, doc_bytes = read(body)
+    assert doc_bytes == DOCUMENT
+    assert params == {}
+
+
+def test_json_without_document(read):
+    assert read('{"template_id": "abc"}') == ({'template_id': 'abc'}, None)
+    assert read(' { } ') == ({}, None)
+
+
+def test_raw_string_document_with_input_type_doc(read):
+    body = json.dumps({'input_type': 'doc', 'document': 'conteúdo é 😀'})
+    params, doc_bytes = read(body, allow_raw_document=True)
+
+    assert params == {'input_type': 'doc'}
+    assert doc_bytes == 'conteúdo é 😀'.encode('utf-8')
+
+
+def test_input_type_doc_after_document_is_rejected(read):
+    body = json.dumps({'document': 'YWJj', 'input_type': 'doc'})
+    with pytest.raises(ValueError, match='input_type'):
+        read(body, allow_raw_document=True)
+
+
+@pytest.mark.parametrize('body', [
+    '{"document": "YWJ", "x": 1}',
+    '{"document": "YWJjZA"',
+    '{"replacements": {"NOME": "Ana"}',
+    '{"a": 1 "b": 2}',
+    '[1, 2]',
+])
+def test_invalid_bodies(read, body):
+    with pytest.raises(ValueError):
+        read(body)
+
+
+def test_multipart_upload(read):
+    params, doc_bytes = read(
+        {'document': (io.BytesIO(DOCUMENT), 'modelo.docx'), 'replacements': '{"NOME": "Ana"}', 'quality': 'low'},
+        content_type='multipart/form-data'
+    )
+    assert doc_bytes == DOCUMENT
+    assert params == {'replacements': {'NOME': 'Ana'}, 'quality': 'low'}
+
+
+def test_raw_docx_with_query_string(read):
+    params, doc_bytes = read(DOCUMENT, content_type=DOCX_MIMETYPE, query_string={'replacements': '{"NOME": "Ana"}'})
+    assert doc_bytes == DOCUMENT
+    assert params == {'replacements': {'NOME': 'Ana'}}
+
+
+def test_invalid_json_field_in_query_string(read):
+    with pytest.raises(ValueError, match='replacements'):
+        read(DOCUMENT, content_type=DOCX_MIMETYPE, query_string={'replacements': '{NOME'})
+
+
+def test_unsupported_content_type(read):
+    with pytest.raises(ValueError):
+        read('document=abc', content_type='text/plain')
+
+
+def test_decoded_document_over_limit(read, monkeypatch):
+    monkeypatch.setattr(ingestion, 'MAX_FILE_SIZE', 100)
+    body = json.dumps({'document': base64.b64encode(b'x' * 101).decode()})
+    with pytest.raises(RequestEntityTooLarge):
+        read(body)
+
+
+def test_multipart_document_over_limit(read, monkeypatch):
+    monkeypatch.setattr(ingestion, 'MAX_FILE_SIZE', 100)
+    with pytest.raises(RequestEntityTooLarge):
+        read({'document': (io.BytesIO(b'x' * 101), 'modelo.docx')}, content_type='multipart/form-data')
+
+
+class _UnreadableBody(io.BytesIO):
+    """Corpo que falha se for lido (o Content-Length vem do seu tamanho)"""
+
+    def read(self, *args):
+        raise AssertionError('o corpo não deveria ser lido')
+
+    readline = readinto = read
+
+
+@pytest.mark.parametrize('content_type', ['application/json', DOCX_MIMETYPE])
+def test_content_length_is_checked_before_reading(read, monkeypatch, content_type):
+    monkeypatch.setattr(ingestion, 'MAX_FILE_SIZE', 100)
+    monkeypatch.setattr(ingestion, 'MAX_CONTENT_LENGTH', 100)
+    with pytest.raises(RequestEntityTooLarge):
+        read(None, content_type=content_type, input_stream=_UnreadableBody(b'x' * 101))
+
@@ -0,0 +1,52 @@
+"""
+Testes dos diretórios de perfis do pool LibreOffice (um por processo)
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import os
+import subprocess
+import sys
+
+from app.services.libreoffice_pool import LibreOfficePool, process_dir, remove_stale_process_dirs
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_worker_profiles_are_namespaced_by_process(tmp_path):
+    pool = LibreOfficePool(2, base_dir=str(tmp_path))
+
+    assert pool.base_dir == os.path.join(str(tmp_path), f'pid_{os.getpid()}')
+    assert [worker.profile_dir for worker in pool.workers] == [
+        os.path.join(pool.base_dir, 'worker_0'),
+        os.path.join(pool.base_dir, 'worker_1'),
+    ]
+
+
+def test_shutdown_keeps_other_processes_profiles(tmp_path):
+    other = tmp_path / f'pid_{os.getppid()}' / 'worker_0'
+    other.mkdir(parents=True)
+    pool = LibreOfficePool(1, base_dir=str(tmp_path))
+    os.makedirs(pool.workers[0].profile_dir)
+
+    pool.shutdown()
+
+    assert not os.path.exists(pool.base_dir)
+    assert other.is_dir()
+
+
+def test_stale_process_dirs_are_removed(tmp_path):
+    dead = tmp_path / f'pid_{_dead_pid()}'
+    alive = tmp_path / f'pid_{os.getppid()}'
+    own = tmp_path / f'pid_{os.getpid()}'
+    unrelated = tmp_path / 'outro'
+    for path in (dead, alive, own, unrelated):
+        path.mkdir()
+
+    remove_stale_process_dirs(str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path)) == sorted([alive.name, own.name, unrelated.name])
+    assert process_dir(str(tmp_path)) == str(own)
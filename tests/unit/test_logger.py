@@ -0,0 +1,100 @@
+"""
+Testes do logging (fila não bloqueante, registros JSON e amostragem por requisição)
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import json
+import logging
+import queue
+import sys
+
+from app.utils.logger import JsonFormatter, RequestIdFilter, StageSampler, _NonBlockingQueueHandler
+from app.utils.tracing import use_span
+
+
+def _record(message='mensagem', level=logging.INFO, **extra):
+    record = logging.LogRecord('doc2pdf', level, __file__, 1, message, (), None, func='etapa')
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_full_queue_drops_and_counts_records():
+    handler = _NonBlockingQueueHandler(queue.Queue(maxsize=2))
+    records = [_record(f'registro {n}') for n in range(3)]
+    for record in records:
+        handler.emit(record)
+
+    assert handler.dropped == 1
+    # O registro vai intacto para a fila: a formatação acontece só na thread escritora
+    assert handler.queue.get_nowait() is records[0]
+    assert handler.queue.get_nowait() is records[1]
+
+
+def test_request_id_filter():
+    record = _record()
+    RequestIdFilter().filter(record)
+    assert record.request_id == '-'
+
+    with use_span(None, 'pedido-123'):
+        RequestIdFilter().filter(record)
+    assert record.request_id == 'pedido-123'
+
+
+def test_json_record_with_extra_fields():
+    record = _record('%s %s', path='/process', status=200, duration=0.25, started=object)
+    record.args = ('POST', '/process')
+    record.request_id = 'pedido-123'
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'POST /process'
+    assert (entry['level'], entry['logger'], entry['func']) == ('INFO', 'doc2pdf', 'etapa')
+    assert entry['request_id'] == 'pedido-123'
+    assert (entry['path'], entry['status'], entry['duration']) == ('/process', 200, 0.25)
+    assert entry['started'] == str(object)
+    assert entry['ts'].endswith('+00:00')
+
+
+def test_json_record_without_request_id_and_with_exception():
+    try:
+        raise ValueError('falhou')
+    except ValueError:
+        record = _record(level=logging.ERROR)
+        record.exc_info = sys.exc_info()
+    record.request_id = '-'
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert 'request_id' not in entry
+    assert 'ValueError: falhou' in entry['exception']
+
+
+def test_access_log_record(client, caplog):
+    with caplog.at_level(logging.INFO, logger='doc2pdf'):
+        client.post('/estimate', json={}, headers={'X-Request-ID': 'pedido-123'})
+
+    (access,) = [record for record in caplog.records if getattr(record, 'event', None) == 'request']
+    entry = json.loads(JsonFormatter().format(access))
+    assert (entry['method'], entry['path'], entry['status']) == ('POST', '/estimate', 400)
+    assert entry['request_bytes'] == 2
+    assert entry['response_bytes'] > 0
+
+
+def test_stage_sampler_keeps_or_drops_whole_requests():
+    sampler = StageSampler(0.5)
+    decisions = {}
+    for n in range(200):
+        with use_span(None, f'pedido-{n}'):
+            decisions[n] = [sampler.filter(_record()) for _ in range(3)]
+
+    # Todas as etapas de uma requisição têm a mesma decisão
+    assert all(len(set(decision)) == 1 for decision in decisions.values())
+    kept = sum(decision[0] for decision in decisions.values())
+    assert 60 < kept < 140
+
+
+def test_stage_sampler_never_drops_warnings():
+    sampler = StageSampler(0.0)
+    with use_span(None, 'pedido-123'):
+        assert not sampler.filter(_record())
+        assert sampler.filter(_record(level=logging.WARNING))
+    assert StageSampler(1.0).filter(_record())
@@ -0,0 +1,103 @@
+"""
+Testes das métricas no formato de texto do Prometheus
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import json
+import os
+
+from app.utils import metrics
+from app.utils.metrics import CONTENT_TYPE, MetricsRegistry
+
+
+def _lines(registry):
+    return registry.expose().splitlines()
+
+
+def test_counter_and_gauge_exposition():
+    registry = MetricsRegistry()
+    requests = registry.counter('app_requests_total', 'Requisições', ('endpoint', 'status'))
+    requests.inc(endpoint='/process', status=200)
+    requests.inc(2, endpoint='/process', status=200)
+    requests.inc(endpoint='/a"b\\c\nd', status=500)
+    registry.gauge('app_capacity', 'Capacidade').set(4)
+
+    assert _lines(registry) == [
+        '# HELP app_requests_total Requisições',
+        '# TYPE app_requests_total counter',
+        'app_requests_total{endpoint="/a\\"b\\\\c\\nd",status="500"} 1.0',
+        'app_requests_total{endpoint="/process",status="200"} 3.0',
+        '# HELP app_capacity Capacidade',
+        '# TYPE app_capacity gauge',
+        'app_capacity 4.0',
+    ]
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    registry = MetricsRegistry()
+    duration = registry.histogram('app_duration_seconds', 'Duração', ('stage',), buckets=[0.1, 1])
+    for value in (0.05, 0.1, 0.5, 3):
+        duration.observe(value, stage='convert')
+
+    assert _lines(registry) == [
+        '# HELP app_duration_seconds Duração',
+        '# TYPE app_duration_seconds histogram',
+        'app_duration_seconds_bucket{stage="convert",le="0.1"} 2.0',
+        'app_duration_seconds_bucket{stage="convert",le="1.0"} 3.0',
+        'app_duration_seconds_bucket{stage="convert",le="+Inf"} 4.0',
+        'app_duration_seconds_sum{stage="convert"} 3.65',
+        'app_duration_seconds_count{stage="convert"} 4.0',
+    ]
+
+
+def test_gauge_function_is_read_at_collection():
+    registry = MetricsRegistry()
+    depth = registry.gauge('app_queue_depth', 'Fila', ('lane',))
+    values = {('interactive',): 1}
+    depth.set_function(lambda: values)
+
+    assert 'app_queue_depth{lane="interactive"} 1.0' in _lines(registry)
+    values = {('bulk',): 5}
+    lines = _lines(registry)
+    assert 'app_queue_depth{lane="bulk"} 5.0' in lines
+    assert not any('interactive' in line for line in lines)
+
+
+def test_same_name_returns_the_registered_metric():
+    registry = MetricsRegistry()
+    assert registry.counter('app_total', 'x') is registry.counter('app_total', 'x')
+
+
+def test_multiprocess_sums_workers_and_drops_gauges_of_dead_ones(tmp_path, monkeypatch):
+    registry = MetricsRegistry(str(tmp_path))
+    registry.counter('app_total', 'Total').inc(2)
+    registry.gauge('app_in_flight', 'Em andamento').set(1)
+    registry.histogram('app_seconds', 'Tempo', buckets=[1]).observe(0.5)
+
+    other = MetricsRegistry()
+    other.counter('app_total', 'Total').inc(3)
+    other.gauge('app_in_flight', 'Em andamento').set(7)
+    other.histogram('app_seconds', 'Tempo', buckets=[1]).observe(2)
+    for pid in (1000001, 1000002):
+        (tmp_path / f'{pid}.json').write_text(json.dumps(other.collect()))
+    monkeypatch.setattr(metrics, 'pid_alive', lambda pid: pid == 1000001)
+
+    lines = _lines(registry)
+    assert 'app_total 8.0' in lines
+    assert 'app_in_flight 8.0' in lines  # 1 deste processo + 7 do worker vivo
+    assert 'app_seconds_bucket{le="1.0"} 1.0' in lines
+    assert 'app_seconds_bucket{le="+Inf"} 3.0' in lines
+    assert 'app_seconds_count 3.0' in lines
+    assert os.path.exists(tmp_path / f'{os.getpid()}.json')
+
+
+def test_metrics_endpoint(client):
+    client.get('/health')
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == CONTENT_TYPE
+    body = response.get_data(as_text=True)
+    assert '# TYPE doc2pdf_http_requests_total counter' in body
+    assert 'doc2pdf_http_requests_total{endpoint="/health",method="GET",status="200"}' in body
+    assert '# TYPE doc2pdf_stage_duration_seconds histogram' in body
@@ -0,0 +1,61 @@
+"""
+Testes das faixas de prioridade do controle de admissão
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+from app.services.admission import ConversionLimiter
+from config.settings import BULK_LANE, INTERACTIVE_LANE
+from tests.unit.test_admission import finish, start
+
+
+def _limiter(capacity=2, reserved=1, interactive=4, bulk=1):
+    return ConversionLimiter(
+        capacity, max_waiting=50, wait_timeout=5,
+        weights={INTERACTIVE_LANE: interactive, BULK_LANE: bulk}, reserved=reserved
+    )
+
+
+def test_bulk_uses_reserved_slot_without_interactive_waiting():
+    limiter = _limiter()
+    first = start(limiter, lane=BULK_LANE)
+    second = start(limiter, lane=BULK_LANE)
+
+    assert first.granted.is_set() and second.granted.is_set()
+    assert limiter.status()['lanes'][BULK_LANE]['in_flight'] == 2
+
+    finish(first, second)
+
+
+def test_reserved_slot_goes_to_waiting_interactive():
+    # Mesmo com peso muito maior, o bulk não toma o slot reservado
+    limiter = _limiter(bulk=100)
+    running = [start(limiter, lane=BULK_LANE) for _ in range(2)]
+    queued_bulk = start(limiter, lane=BULK_LANE)
+    interactive = start(limiter, lane=INTERACTIVE_LANE)
+
+    finish(running[0])
+    assert interactive.granted.wait(5)
+    assert not queued_bulk.granted.is_set()
+
+    status = limiter.status()['lanes']
+    assert status[INTERACTIVE_LANE]['in_flight'] == 1
+    assert status[BULK_LANE] == {'weight': 100, 'in_flight': 1, 'waiting': 1, 'background_waiting': 0}
+
+    finish(running[1])
+    assert queued_bulk.granted.wait(5)
+    finish(interactive, queued_bulk)
+
+
+def test_slots_are_shared_by_lane_weights():
+    limiter = _limiter(capacity=1, reserved=0, interactive=4, bulk=1)
+    log = []
+    running = start(limiter, log=log)
+    queued = []
+    for _ in range(10):
+        queued.append(start(limiter, lane=BULK_LANE, log=log))
+        queued.append(start(limiter, lane=INTERACTIVE_LANE, log=log))
+
+    finish(running, *queued)
+    first = [lane for lane, _ in log[1:11]]
+    assert first.count(INTERACTIVE_LANE) == 8
+    assert first.count(BULK_LANE) == 2
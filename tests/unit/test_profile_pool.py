@@ -0,0 +1,44 @@
+"""
+Testes do pool de perfis LibreOffice (slots isolados por processo)
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import os
+
+import pytest
+
+from app.services import profile_pool
+from app.services.profile_pool import ProfilePool
+
+
+@pytest.fixture(autouse=True)
+def no_libreoffice(monkeypatch):
+    # Sem o executável, initialize() só cria os diretórios dos perfis
+    monkeypatch.setattr(profile_pool, 'LIBREOFFICE_COMMAND', 'soffice-inexistente')
+
+
+def test_slots_are_namespaced_by_process(tmp_path):
+    pool = ProfilePool(2, base_dir=str(tmp_path))
+
+    own = os.path.join(str(tmp_path), f'pid_{os.getpid()}')
+    assert [profile.path for profile in pool.profiles] == [
+        os.path.join(own, 'slot_0'),
+        os.path.join(own, 'slot_1'),
+    ]
+
+
+def test_dirty_profile_reset_and_shutdown_spare_other_processes(tmp_path):
+    other_slot = tmp_path / f'pid_{os.getppid()}' / 'slot_0'
+    other_slot.mkdir(parents=True)
+    (other_slot / 'registrymodifications.xcu').write_text('em uso')
+
+    pool = ProfilePool(1, base_dir=str(tmp_path))
+    pool.initialize()
+    with pool.lease(timeout=1) as profile:
+        assert profile.path != str(other_slot)
+        profile.dirty = True
+    assert os.path.isdir(profile.path) and not profile.dirty
+
+    pool.shutdown()
+    assert not os.path.exists(pool.base_dir)
+    assert (other_slot / 'registrymodifications.xcu').read_text() == 'em uso'
@@ -0,0 +1,80 @@
+"""
+Testes das respostas JSON com arquivos em Base64 (buffer único e streaming)
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import base64
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+from app.utils import responses
+from app.utils.encoders import base64_length, iter_base64_chunks
+from app.utils.responses import base64_json_response
+from tests.conftest import build_docx
+
+CONTENT = os.urandom(10_007)
+
+
+@pytest.mark.parametrize('size', [0, 1, 2, 3, 4, 5, 6, 100, 10_007])
+@pytest.mark.parametrize('chunk_size', [1, 3, 4, 64])
+def test_chunks_concatenate_to_the_full_encoding(size, chunk_size):
+    content = CONTENT[:size]
+    expected = base64.b64encode(content)
+
+    assert b''.join(iter_base64_chunks(content, chunk_size)) == expected
+    assert b''.join(iter_base64_chunks(io.BytesIO(content), chunk_size)) == expected
+    assert base64_length(size) == len(expected)
+
+
+def _body(app, monkeypatch, stream, envelope, content, **kwargs):
+    monkeypatch.setattr(responses, 'BASE64_STREAM_MIN_BYTES', 0 if stream else 1 << 40)
+    with app.test_request_context('/'):
+        response = base64_json_response(envelope, 'pdf', content, **kwargs)
+        assert response.is_streamed == stream
+        body = b''.join(response.response)
+        assert response.content_length == len(body)
+        return json.loads(body)
+
+
+@pytest.mark.parametrize('envelope', [
+    {},
+    {'success': True, 'message': 'Conversão concluída ✓', 'stats': {'cache': {'hit': False}, 'split': None}},
+])
+@pytest.mark.parametrize('size', [0, 1, 10_007])
+def test_streamed_body_equals_buffered_body(app, monkeypatch, envelope, size):
+    content = CONTENT[:size]
+    buffered = _body(app, monkeypatch, False, envelope, content)
+    streamed = _body(app, monkeypatch, True, envelope, content)
+    from_file = _body(app, monkeypatch, True, envelope, io.BytesIO(content), size=size)
+
+    assert streamed == buffered == from_file
+    assert base64.b64decode(streamed['pdf']) == content
+    assert {key: value for key, value in streamed.items() if key != 'pdf'} == envelope
+
+
+def test_process_base64_doc_is_the_same_streamed_or_buffered(client, monkeypatch):
+    body = {
+        'document': base64.b64encode(build_docx(['Olá {NOME}'])).decode(),
+        'replacements': {'NOME': 'Ana'},
+        'output_type': 'base64_doc',
+    }
+    monkeypatch.setattr(responses, 'BASE64_STREAM_MIN_BYTES', 1 << 40)
+    buffered = client.post('/process', json=body)
+    monkeypatch.setattr(responses, 'BASE64_STREAM_MIN_BYTES', 0)
+    streamed = client.post('/process', json=body)
+
+    assert streamed.status_code == buffered.status_code == 200
+    streamed, buffered = json.loads(streamed.get_data()), json.loads(buffered.get_data())
+    # Cada requisição salva um DOCX novo: a data dos membros do ZIP pode mudar entre as duas
+    documents = [_members(base64.b64decode(body.pop('document'))) for body in (streamed, buffered)]
+    assert documents[0] == documents[1]
+    assert streamed == buffered
+
+
+def _members(docx_bytes):
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as zf:
+        return {info.filename: zf.read(info) for info in zf.infolist()}
@@ -0,0 +1,130 @@
+"""
+Testes da divisão de documentos grandes em partes (SplitService)
+
+A divisão só pode acontecer onde o layout é preservado; documentos com
+notas de rodapé, campos que dependem do documento inteiro ou sem quebras
+seguras são convertidos inteiros.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+
+import pytest
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from pypdf import PdfReader, PdfWriter
+
+from app.services.split_service import SplitService
+
+NO_SAFE_BREAK = 'nenhuma quebra de seção ou página segura para dividir'
+
+
+def _save(doc):
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _pages(*pages, style=None):
+    """DOCX com um parágrafo por página, separados por quebras de página"""
+    doc = Document()
+    for number, text in enumerate(pages):
+        if number:
+            doc.add_page_break()
+        doc.add_paragraph(text, style=style)
+    return doc
+
+
+def _texts(docx_bytes):
+    paragraphs = Document(io.BytesIO(docx_bytes)).paragraphs
+    return [paragraph.text for paragraph in paragraphs if paragraph.text]
+
+
+def _field_runs(instr):
+    """Runs de um campo complexo (begin, código, end)"""
+    return [parse_xml(f'<w:r {nsdecls("w")}>{content}</w:r>') for content in (
+        '<w:fldChar w:fldCharType="begin"/>',
+        f'<w:instrText xml:space="preserve"> {instr} </w:instrText>',
+        '<w:fldChar w:fldCharType="end"/>',
+    )]
+
+
+def test_page_breaks_split_in_order():
+    parts, reason = SplitService.split(_save(_pages('Parte 1', 'Parte 2', 'Parte 3')), 3)
+
+    assert reason is None
+    assert [_texts(part) for part in parts] == [['Parte 1'], ['Parte 2'], ['Parte 3']]
+
+
+def test_parts_never_exceed_max_chunks():
+    parts, _ = SplitService.split(_save(_pages(*[f'Página {n}' for n in range(6)])), 2)
+
+    assert len(parts) == 2
+    assert sum((_texts(part) for part in parts), []) == [f'Página {n}' for n in range(6)]
+
+
+def test_footnote_reference_is_refused():
+    doc = _pages('Parte 1', 'Parte 2')
+    reference = parse_xml(f'<w:r {nsdecls("w")}><w:footnoteReference w:id="1"/></w:r>')
+    doc.paragraphs[0]._p.append(reference)
+
+    assert SplitService.split(_save(doc), 2) == ([], 'notas de rodapé/fim numeradas continuamente')
+
+
+@pytest.mark.parametrize('instr', ['NUMPAGES', 'REF _Ref123 \\h', 'TOC \\o "1-3"'])
+def test_global_field_in_body_is_refused(instr):
+    doc = _pages('Parte 1', 'Parte 2')
+    doc.paragraphs[-1]._p.extend(_field_runs(instr))
+
+    parts, reason = SplitService.split(_save(doc), 2)
+    assert parts == []
+    assert reason.startswith('campos que dependem do documento inteiro')
+
+
+def test_global_field_in_footer_is_refused():
+    doc = _pages('Parte 1', 'Parte 2')
+    footer = doc.sections[0].footer.paragraphs[0]
+    footer._p.append(parse_xml(f'<w:fldSimple {nsdecls("w")} w:instr=" NUMPAGES "/>'))
+
+    parts, reason = SplitService.split(_save(doc), 2)
+    assert parts == []
+    assert reason.startswith('campos que dependem do documento inteiro')
+
+
+def test_page_numbers_forbid_cuts_inside_a_section():
+    doc = _pages('Parte 1', 'Parte 2')
+    doc.sections[0].footer.paragraphs[0]._p.extend(_field_runs('PAGE'))
+
+    assert SplitService.split(_save(doc), 2) == ([], NO_SAFE_BREAK)
+
+
+def test_document_without_breaks_is_refused():
+    doc = Document()
+    doc.add_paragraph('Uma única página')
+
+    assert SplitService.split(_save(doc), 2) == ([], NO_SAFE_BREAK)
+
+
+def test_numbered_list_is_not_cut():
+    doc = _pages('Item 1', 'Item 2', style='List Number')
+    doc.add_page_break()
+    doc.add_paragraph('Depois da lista')
+
+    # Só o corte após a lista é seguro: a numeração recomeçaria na segunda parte
+    parts, reason = SplitService.split(_save(doc), 3)
+    assert reason is None
+    assert [_texts(part) for part in parts] == [['Item 1', 'Item 2'], ['Depois da lista']]
+
+
+def test_concatenate_keeps_part_order():
+    pdfs = []
+    for width in (100, 200, 300):
+        writer = PdfWriter()
+        writer.add_blank_page(width=width, height=100)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        pdfs.append(buffer.getvalue())
+
+    pages = PdfReader(io.BytesIO(SplitService.concatenate(pdfs))).pages
+    assert [float(page.mediabox.width) for page in pages] == [100, 200, 300]
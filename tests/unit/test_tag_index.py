@@ -0,0 +1,106 @@
+"""
+Testes do índice pré-compilado de tags (TagIndex)
+
+O índice pré-compilado deve produzir exatamente o mesmo documento que a
+substituição pelo DocxService, e ambos o mesmo que a substituição ingênua
+(um replace por tag em cada run) sempre que os valores não contêm tags.
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+
+import pytest
+from docx import Document
+from lxml import etree
+
+from app.services.docx_service import DocxService
+from app.services.tag_index import TagIndex, _xml_parts
+from tests.conftest import build_docx
+
+TEMPLATE = build_docx(
+    paragraphs=['Olá {NOME}, CPF {CPF}', 'Sem tags', '{NOME}{NOME} {DESCONHECIDA} {nome}', 'Chaves soltas { e }'],
+    table=[['{CIDADE}', 'fixo'], ['{UF} - {CIDADE}', '{VALOR_TOTAL}']],
+    header='Cabeçalho {EMPRESA}',
+    footer='Rodapé {EMPRESA} {DATA}',
+)
+
+REPLACEMENTS = {
+    'NOME': 'Ana Souza',
+    'cpf': '123.456.789-00',
+    'Cidade': 'Campinas',
+    'UF': 'SP',
+    'VALOR_TOTAL': 'R$ 1.000,00',
+    'EMPRESA': 'M&S <do Brasil>',
+    'DATA': '',
+    'NAO_USADA': 'x',
+}
+
+
+def _open(doc_bytes=TEMPLATE):
+    return Document(io.BytesIO(doc_bytes))
+
+
+def _xml(doc):
+    return {name: etree.tostring(root) for name, root in _xml_parts(doc).items()}
+
+
+def _reference_replace(doc, replacements):
+    """Substituição ingênua: um str.replace por tag em cada run"""
+    count = 0
+    for run in DocxService.iter_runs(doc):
+        text = run.text
+        for tag, value in replacements.items():
+            placeholder = '{' + tag.upper() + '}'
+            count += text.count(placeholder)
+            text = text.replace(placeholder, str(value))
+        if text != run.text:
+            run.text = text
+    return count
+
+
+@pytest.mark.parametrize('replacements', [
+    REPLACEMENTS,
+    {'NOME': 'Ana'},
+    {'INEXISTENTE': 'x'},
+    {},
+])
+def test_index_docx_service_and_reference_agree(replacements):
+    index = TagIndex.compile(_open())
+
+    by_reference = _open()
+    by_service = _open()
+    by_index = _open()
+    expected = _reference_replace(by_reference, replacements)
+
+    assert DocxService.replace_tags_in_document(by_service, replacements) == expected
+    assert index.apply(by_index, replacements) == expected
+    assert _xml(by_service) == _xml(by_reference)
+    assert _xml(by_index) == _xml(by_reference)
+
+
+def test_replaced_text_everywhere():
+    doc = _open()
+    TagIndex.compile(_open()).apply(doc, REPLACEMENTS)
+
+    assert doc.paragraphs[0].text == 'Olá Ana Souza, CPF 123.456.789-00'
+    assert doc.paragraphs[2].text == 'Ana SouzaAna Souza {DESCONHECIDA} {nome}'
+    assert doc.paragraphs[3].text == 'Chaves soltas { e }'
+    cells = [cell.text for row in doc.tables[0].rows for cell in row.cells]
+    assert cells == ['Campinas', 'fixo', 'SP - Campinas', 'R$ 1.000,00']
+    assert doc.sections[0].header.paragraphs[0].text == 'Cabeçalho M&S <do Brasil>'
+    assert doc.sections[0].footer.paragraphs[0].text == 'Rodapé M&S <do Brasil> '
+
+
+def test_index_tags():
+    assert TagIndex.compile(_open()).tags == {
+        'NOME', 'CPF', 'DESCONHECIDA', 'CIDADE', 'UF', 'VALOR_TOTAL', 'EMPRESA', 'DATA'
+    }
+
+
+def test_index_survives_repeated_renders():
+    index = TagIndex.compile(_open())
+    for name in ('Ana', 'Bruno', 'Carla'):
+        doc = _open()
+        index.apply(doc, {'NOME': name})
+        assert doc.paragraphs[0].text == f'Olá {name}, CPF {{CPF}}'
+
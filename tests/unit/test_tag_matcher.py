@@ -0,0 +1,32 @@
+"""
+Testes do TagMatcher (substituição de todas as tags em uma passada)
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+from app.services.docx_service import TagMatcher
+
+
+def test_matcher_keys_are_case_insensitive_and_first_wins():
+    matcher = TagMatcher({'nome': 'primeiro', 'NOME': 'segundo', 'Idade': 30})
+    assert matcher.sub('{NOME} tem {IDADE} anos') == ('primeiro tem 30 anos', 2)
+
+
+def test_matcher_does_not_reprocess_inserted_values():
+    matcher = TagMatcher({'A': '{B}', 'B': 'b'})
+    assert matcher.sub('{A} {B}') == ('{B} b', 2)
+
+
+def test_matcher_leaves_unknown_and_lowercase_tags():
+    matcher = TagMatcher({'NOME': 'Ana'})
+    assert matcher.sub('{OUTRA} {nome} {} {NOME') == ('{OUTRA} {nome} {} {NOME', 0)
+
+
+def test_matcher_with_delimiters_inside_tags():
+    matcher = TagMatcher({'A}B': 'x', 'A': 'y'})
+    assert matcher.sub('{A}B} {A}') == ('x y', 2)
+
+
+def test_empty_matcher():
+    matcher = TagMatcher({})
+    assert not matcher
+    assert matcher.sub('{NOME}') == ('{NOME}', 0)
@@ -0,0 +1,116 @@
+"""
+Testes do rastreamento de requisições (ids, spans aninhados e exportação OTLP/JSON)
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import json
+import re
+
+import pytest
+
+from app.utils import tracing
+from app.utils.tracing import SpanExporter, span, start_span, current_span, propagation_env
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch):
+    """Tracing habilitado, exportando para um arquivo temporário (sem a thread de background)"""
+    exporter = SpanExporter(path=str(tmp_path / 'traces.jsonl'), endpoint='')
+    monkeypatch.setattr(tracing, 'exporter', exporter)
+    return exporter
+
+
+def _exported(exporter):
+    exporter.flush()
+    with open(exporter.path, encoding='utf-8') as traces:
+        return [
+            exported
+            for line in traces
+            for resource in json.loads(line)['resourceSpans']
+            for scope in resource['scopeSpans']
+            for exported in scope['spans']
+        ]
+
+
+def test_request_id_is_echoed_or_generated(client):
+    response = client.get('/health', headers={'X-Request-ID': 'pedido-123'})
+    assert response.headers['X-Request-ID'] == 'pedido-123'
+    for headers in ({}, {'X-Request-ID': 'id com espaços'}):
+        response = client.get('/health', headers=headers)
+        assert re.fullmatch(r'[0-9a-f]{32}', response.headers['X-Request-ID'])
+
+
+def test_request_continues_the_received_trace(client, exporter):
+    client.get('/health', headers={'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-01'})
+
+    (root,) = _exported(exporter)
+    assert (root['traceId'], root['parentSpanId']) == (TRACE_ID, PARENT_ID)
+    assert root['name'] == 'GET /health'
+    assert root['kind'] == 2
+    attributes = {attribute['key']: attribute['value'] for attribute in root['attributes']}
+    assert attributes['http.status_code'] == {'intValue': '200'}
+
+
+def test_nested_spans_share_the_trace(exporter):
+    with span('pipeline', size=10) as outer:
+        with span('convert', quality='high') as inner:
+            assert current_span() is inner
+            assert propagation_env()['TRACEPARENT'] == f'00-{inner.trace_id}-{inner.span_id}-01'
+        assert current_span() is outer
+    assert current_span() is None
+
+    exported = {item['name']: item for item in _exported(exporter)}
+    assert exported['convert']['parentSpanId'] == exported['pipeline']['spanId']
+    assert exported['convert']['traceId'] == exported['pipeline']['traceId']
+    assert exported['pipeline']['parentSpanId'] == ''
+    assert exported['pipeline']['attributes'] == [{'key': 'size', 'value': {'intValue': '10'}}]
+
+
+def test_exception_is_recorded_and_propagated(exporter):
+    with pytest.raises(ValueError):
+        with span('render'):
+            raise ValueError('documento inválido')
+
+    (exported,) = _exported(exporter)
+    assert exported['status'] == {'code': 2, 'message': 'ValueError: documento inválido'}
+
+
+def test_trace_id_shaped_request_id_becomes_the_trace(exporter):
+    assert start_span('x', request_id=TRACE_ID).trace_id == TRACE_ID
+    assert start_span('x', request_id='pedido-123').trace_id != TRACE_ID
+
+
+def test_disabled_tracing_is_a_noop(monkeypatch):
+    monkeypatch.setattr(tracing, 'exporter', None)
+
+    assert start_span('x') is None
+    with span('x') as disabled:
+        disabled.set_attribute('a', 1)
+        assert current_span() is None
+
+
+def test_full_queue_drops_spans(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACING_QUEUE_SIZE', 2)
+    exporter = SpanExporter(path=str(tmp_path / 'traces.jsonl'), endpoint='')
+    monkeypatch.setattr(tracing, 'exporter', exporter)
+    for name in ('a', 'b', 'c'):
+        with span(name):
+            pass
+
+    assert exporter.dropped == 1
+    assert [item['name'] for item in _exported(exporter)] == ['a', 'b']
+    assert exporter.status()['exported'] == 2
+
+
+def test_trace_file_is_rotated(tmp_path, exporter):
+    exporter.max_bytes = 1
+    for name in ('a', 'b'):
+        with span(name):
+            pass
+        exporter.flush()
+
+    assert [item['name'] for item in _exported(exporter)] == ['b']
+    assert (tmp_path / 'traces.jsonl.1').exists()
@@ -0,0 +1,100 @@
+"""
+Testes da gravação do DOCX intermediário ('stored'/'fast') com reaproveitamento de membros
+
+Autor: Maxwell da Silva Oliveira - M&S do Brasil LTDA
+"""
+import io
+import zipfile
+
+import pytest
+from docx import Document
+
+from app.services.docx_service import DocxService
+from app.utils.zip_utils import copy_member_raw, write_member
+from tests.conftest import build_docx, docx_text
+
+TEMPLATE = build_docx(['Olá {NOME}'], table=[['{CIDADE}', 'fixo']], header='Cabeçalho {EMPRESA}')
+REPLACEMENTS = {'NOME': 'Ana', 'CIDADE': 'Campinas', 'EMPRESA': 'M&S'}
+
+
+def _save(compression):
+    doc = DocxService.replace_tags_in_doc(TEMPLATE, REPLACEMENTS)
+    buffer = io.BytesIO()
+    reused = DocxService.save_document(doc, buffer, compression, TEMPLATE)
+    return buffer.getvalue(), reused
+
+
+def _members(docx_bytes):
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as zf:
+        return {info.filename: zf.read(info) for info in zf.infolist()}
+
+
+@pytest.mark.parametrize('compression', ['stored', 'fast'])
+def test_intermediate_docx_matches_default_save(compression):
+    expected, reused_default = _save('default')
+    docx_bytes, reused = _save(compression)
+
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as zf:
+        assert zf.testzip() is None
+    assert _members(docx_bytes) == _members(expected)
+    assert docx_text(docx_bytes) == docx_text(expected)
+    assert reused_default == 0
+    assert reused > 0
+    Document(io.BytesIO(docx_bytes))
+
+
+def test_stored_save_keeps_original_compression_of_reused_members():
+    docx_bytes, reused = _save('stored')
+    with zipfile.ZipFile(io.BytesIO(TEMPLATE)) as source, zipfile.ZipFile(io.BytesIO(docx_bytes)) as zf:
+        changed = [info for info in zf.infolist() if info.compress_type == zipfile.ZIP_STORED]
+        copied = [info for info in zf.infolist() if info.compress_type != zipfile.ZIP_STORED]
+
+        assert 'word/document.xml' in {info.filename for info in changed}
+        assert len(copied) == reused
+        for info in copied:
+            original = source.getinfo(info.filename)
+            assert (info.CRC, info.compress_size) == (original.CRC, original.compress_size)
+
+
+def test_copy_member_raw_with_data_descriptor():
+    class Unseekable(io.RawIOBase):
+        def __init__(self):
+            self.buffer = io.BytesIO()
+
+        def writable(self):
+            return True
+
+        def write(self, data):
+            return self.buffer.write(data)
+
+    # Em um destino sem seek, o zipfile grava tamanhos e CRC em um data descriptor
+    stream = Unseekable()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as src:
+        src.writestr('a.xml', b'<a>' + b'x' * 1000 + b'</a>')
+    source_bytes = stream.buffer.getvalue()
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(source_bytes)) as src:
+        assert src.getinfo('a.xml').flag_bits & 0x08
+        with zipfile.ZipFile(output, 'w') as dst:
+            copy_member_raw(src, dst, src.getinfo('a.xml'))
+            dst.writestr('b.xml', b'<b/>')
+
+    with zipfile.ZipFile(output) as zf:
+        assert zf.testzip() is None
+        assert zf.read('a.xml') == b'<a>' + b'x' * 1000 + b'</a>'
+        assert zf.read('b.xml') == b'<b/>'
+
+
+def test_write_member_reuses_only_identical_content():
+    output = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(TEMPLATE)) as src, zipfile.ZipFile(output, 'w') as dst:
+        styles = src.read('word/styles.xml')
+        assert write_member(dst, 'word/styles.xml', styles, src) is True
+        assert write_member(dst, 'word/document.xml', b'<novo/>', src) is False
+        assert write_member(dst, 'word/extra.xml', b'<x/>', src) is False
+
+    with zipfile.ZipFile(output) as zf:
+        assert zf.testzip() is None
+        assert zf.read('word/styles.xml') == styles
+        assert zf.read('word/document.xml') == b'<novo/>'